@@ -0,0 +1,224 @@
+"""
+Gestión de conexiones WebSocket con colas de salida por cliente.
+
+Cada cliente tiene una cola acotada y su propia tarea de escritura, así un
+cliente lento no retrasa al resto. Los mensajes se codifican una sola vez por
+formato (JSON o MessagePack) y se reutilizan para todos los clientes.
+"""
+from fastapi import WebSocket
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Union
+from app.config import config
+import asyncio
+import itertools
+import logging
+import orjson
+
+try:
+    import msgpack
+except ImportError:  # MessagePack es opcional
+    msgpack = None
+
+logger = logging.getLogger(__name__)
+
+Frame = Union[str, bytes]
+
+ENCODING_JSON = "json"
+ENCODING_MSGPACK = "msgpack"
+
+POLICY_DROP = "drop"
+POLICY_DISCONNECT = "disconnect"
+
+
+def _default(value: Any) -> Any:
+    """Serializa tipos que orjson/msgpack no conocen (p. ej. Decimal)."""
+    return str(value)
+
+
+def encode_message(message: dict, encoding: str = ENCODING_JSON) -> Frame:
+    """Codifica un mensaje en el formato del cliente: texto JSON o bytes MessagePack."""
+    if encoding == ENCODING_MSGPACK and msgpack is not None:
+        return msgpack.packb(message, default=_default, use_bin_type=True)
+    return orjson.dumps(message, default=_default).decode("utf-8")
+
+
+def supported_encodings() -> List[str]:
+    """Formatos disponibles en este entorno."""
+    return [ENCODING_JSON, ENCODING_MSGPACK] if msgpack is not None else [ENCODING_JSON]
+
+
+class ClientChannel:
+    """
+    Cola de salida de un cliente.
+
+    Los mensajes con `key` se fusionan: si ya hay uno pendiente con la misma
+    clave, el nuevo lo reemplaza (solo importa el más reciente). Cuando la cola
+    está llena se aplica la política: descartar el más antiguo o desconectar.
+    """
+
+    def __init__(self, websocket: WebSocket, encoding: str = ENCODING_JSON,
+                 max_pending: int = 64, policy: str = POLICY_DROP,
+                 send_timeout: float = 10.0):
+        self.websocket = websocket
+        self.encoding = encoding
+        self.max_pending = max_pending
+        self.policy = policy
+        self.send_timeout = send_timeout
+        self.pending: "OrderedDict[Any, Frame]" = OrderedDict()
+        self.sent = 0
+        self.coalesced = 0
+        self.dropped = 0
+        self.closed = False
+        self.sending = False
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self, on_failure) -> None:
+        """Arranca la tarea de escritura; `on_failure` se llama si el envío falla."""
+        self._task = asyncio.create_task(self._writer(on_failure))
+
+    def offer(self, frame: Frame, key: Optional[str] = None) -> bool:
+        """
+        Encola un frame ya codificado.
+        Devuelve False si el cliente debe desconectarse por ir demasiado atrasado.
+        """
+        if self.closed:
+            return False
+
+        if key is not None and key in self.pending:
+            # Fusionar: reemplazar el pendiente y moverlo al final
+            self.pending[key] = frame
+            self.pending.move_to_end(key)
+            self.coalesced += 1
+        else:
+            if len(self.pending) >= self.max_pending:
+                if self.policy == POLICY_DISCONNECT:
+                    return False
+                self.pending.popitem(last=False)
+                self.dropped += 1
+            self.pending[key if key is not None else ("seq", next(self._seq))] = frame
+
+        self._wakeup.set()
+        return True
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self.pending)
+
+    async def _writer(self, on_failure) -> None:
+        """Envía los frames pendientes en orden, de uno en uno."""
+        try:
+            while not self.closed:
+                await self._wakeup.wait()
+                self._wakeup.clear()
+                while self.pending and not self.closed:
+                    _, frame = self.pending.popitem(last=False)
+                    if isinstance(frame, bytes):
+                        send = self.websocket.send_bytes(frame)
+                    else:
+                        send = self.websocket.send_text(frame)
+                    self.sending = True
+                    await asyncio.wait_for(send, timeout=self.send_timeout)
+                    self.sending = False
+                    self.sent += 1
+        except asyncio.CancelledError:
+            pass
+        except Exception as e:
+            logger.warning(f"Error sending to client, dropping connection: {e}")
+            on_failure(self.websocket)
+
+    def stop(self) -> None:
+        """Detiene la tarea de escritura y descarta lo pendiente."""
+        self.closed = True
+        self.pending.clear()
+        self._wakeup.set()
+        if self._task is not None and self._task is not asyncio.current_task():
+            self._task.cancel()
+
+
+class ConnectionManager:
+    """Maneja conexiones WebSocket - una cola y un escritor por cliente."""
+
+    def __init__(self, max_pending: int = None, policy: str = None, send_timeout: float = None):
+        self.channels: Dict[WebSocket, ClientChannel] = {}
+        self.max_pending = max_pending or config.WS_SEND_QUEUE_SIZE
+        self.policy = policy or config.WS_SLOW_CLIENT_POLICY
+        self.send_timeout = send_timeout or config.WS_SEND_TIMEOUT
+
+    @property
+    def active_connections(self) -> List[WebSocket]:
+        return list(self.channels)
+
+    async def connect(self, websocket: WebSocket, encoding: str = ENCODING_JSON, accept: bool = True):
+        if accept:
+            await websocket.accept()
+        if encoding not in supported_encodings():
+            encoding = ENCODING_JSON
+        channel = ClientChannel(
+            websocket,
+            encoding=encoding,
+            max_pending=self.max_pending,
+            policy=self.policy,
+            send_timeout=self.send_timeout,
+        )
+        self.channels[websocket] = channel
+        channel.start(self._on_send_failure)
+        logger.info(f"Client connected ({encoding}). Total connections: {len(self.channels)}")
+
+    def disconnect(self, websocket: WebSocket):
+        channel = self.channels.pop(websocket, None)
+        if channel is not None:
+            channel.stop()
+        logger.info(f"Client disconnected. Total connections: {len(self.channels)}")
+
+    def _on_send_failure(self, websocket: WebSocket):
+        if websocket in self.channels:
+            self.disconnect(websocket)
+            asyncio.create_task(self._close_socket(websocket))
+
+    async def _close_socket(self, websocket: WebSocket):
+        try:
+            await websocket.close(code=1013)  # Try again later
+        except Exception:
+            pass
+
+    def send(self, websocket: WebSocket, message: dict, key: Optional[str] = None) -> bool:
+        """Encola un mensaje para un solo cliente."""
+        channel = self.channels.get(websocket)
+        if channel is None:
+            return False
+        if not channel.offer(encode_message(message, channel.encoding), key):
+            self._on_send_failure(websocket)
+            return False
+        return True
+
+    async def broadcast(self, message: dict, key: Optional[str] = None):
+        """
+        Envía mensaje a todos los clientes conectados.
+        El mensaje se codifica una vez por formato y se encola sin esperar a nadie.
+        """
+        frames: Dict[str, Frame] = {}
+        lagging = []
+        for websocket, channel in list(self.channels.items()):
+            frame = frames.get(channel.encoding)
+            if frame is None:
+                frame = frames[channel.encoding] = encode_message(message, channel.encoding)
+            if not channel.offer(frame, key):
+                lagging.append(websocket)
+
+        # Desconectar clientes que superaron la cola (política "disconnect")
+        for websocket in lagging:
+            logger.warning("Client too far behind, disconnecting")
+            self._on_send_failure(websocket)
+
+    def stats(self) -> Dict[str, Any]:
+        """Profundidad de colas y contadores, útil para monitoreo."""
+        channels = list(self.channels.values())
+        return {
+            "connections": len(channels),
+            "queue_depth_total": sum(c.queue_depth for c in channels),
+            "queue_depth_max": max((c.queue_depth for c in channels), default=0),
+            "coalesced": sum(c.coalesced for c in channels),
+            "dropped": sum(c.dropped for c in channels),
+        }
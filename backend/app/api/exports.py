@@ -0,0 +1,77 @@
+"""
+Exportaciones masivas (ver `app.etl.exports`).
+
+Crear y cancelar pasan por el proceso de cómputo (dueño de Spark y de la cola);
+el estado y la descarga se leen del disco, desde cualquier worker.
+"""
+from fastapi import APIRouter, HTTPException, Request
+from app.models.signal import ExportRequest
+from app.services.exports import export_store
+from app.services.filters import SignalFilter
+from app.etl.compute import ComputeError, compute
+from app import http_cache
+import asyncio
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
+
+router = APIRouter()
+
+
+def _public(status: dict) -> dict:
+    """Estado + URL de descarga cuando el zip está listo."""
+    if status.get("status") == "done":
+        status = {**status, "download_url": f"/api/exports/{status['id']}/download"}
+    return status
+
+
+async def _run(job: str, **args) -> dict:
+    try:
+        result = orjson.loads(await asyncio.to_thread(compute.run, job, **args))
+    except ComputeError as e:
+        logger.error(f"Compute error in {job}: {e}")
+        raise HTTPException(status_code=e.status, detail=str(e))
+    if not result.get("success"):
+        raise HTTPException(status_code=result.get("code", 500), detail=result.get("error"))
+    return result
+
+
+@router.post("/exports", status_code=202)
+async def create_export(body: ExportRequest):
+    """Encola una exportación de las señales filtradas (Parquet o CSV gzip, zip final)."""
+    filters = SignalFilter.coerce(body.model_dump(exclude={"format", "partition_by"}, exclude_none=True))
+    result = await _run("export_start", filters=filters.to_key(),
+                        format=body.format, partition_by=body.partition_by)
+    logger.info(f"📦 Export {result['id']} queued ({body.format})")
+    return _public(result)
+
+
+@router.get("/exports")
+async def list_exports():
+    """Exportaciones guardadas (más recientes primero)."""
+    return {"success": True, "exports": [_public(s) for s in export_store.list()]}
+
+
+@router.get("/exports/{export_id}")
+async def get_export(export_id: str):
+    """Estado y progreso de una exportación."""
+    status = export_store.read(export_id)
+    if status is None:
+        raise HTTPException(status_code=404, detail="Export not found")
+    return {"success": True, **_public(status)}
+
+
+@router.get("/exports/{export_id}/download")
+async def download_export(export_id: str, request: Request):
+    """Zip de la exportación; admite `Range` para reanudar descargas."""
+    path = export_store.archive(export_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Export not found or not finished")
+    return http_cache.file_response(request, path, "application/zip", f"signals-{export_id}.zip")
+
+
+@router.delete("/exports/{export_id}")
+async def delete_export(export_id: str):
+    """Cancela una exportación en curso o borra una terminada."""
+    return await _run("export_cancel", export_id=export_id)
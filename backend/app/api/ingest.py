@@ -0,0 +1,61 @@
+"""
+Endpoint de ingesta de reportes de dispositivos.
+"""
+from fastapi import APIRouter, HTTPException, Request
+from fastapi.responses import ORJSONResponse
+from app.config import config
+from app.services.ingest_service import ingest_service, validate_reports
+import logging
+import orjson
+
+logger = logging.getLogger(__name__)
+router = APIRouter()
+
+
+@router.post("/ingest", response_class=ORJSONResponse, status_code=202)
+async def ingest_signals(request: Request):
+    """
+    Recibe un lote de reportes de dispositivos.
+
+    Body: `{"device_name": "...", "device_id": "...", "reports": [{...}, ...]}`
+    o directamente una lista de reportes. El cuerpo se parsea con orjson y se
+    valida sin modelos Pydantic por fila; la escritura en base de datos es diferida.
+    """
+    try:
+        body = orjson.loads(await request.body())
+    except orjson.JSONDecodeError:
+        raise HTTPException(status_code=400, detail="Invalid JSON")
+
+    if isinstance(body, list):
+        reports, device_name, device_id = body, None, None
+    elif isinstance(body, dict) and isinstance(body.get("reports"), list):
+        reports, device_name, device_id = body["reports"], body.get("device_name"), body.get("device_id")
+    else:
+        raise HTTPException(status_code=400, detail="Expected a list of reports or {'reports': [...]}")
+
+    if len(reports) > config.INGEST_MAX_REPORTS:
+        raise HTTPException(status_code=413, detail=f"Too many reports (max {config.INGEST_MAX_REPORTS})")
+
+    if not ingest_service.has_capacity(len(reports)):
+        # Backpressure: el buffer de escritura está lleno
+        raise HTTPException(status_code=503, detail="Ingest buffer full, retry later")
+
+    rows, rejected, errors = validate_reports(reports, device_name, device_id)
+    accepted = ingest_service.submit(rows)
+
+    return {
+        "success": True,
+        "accepted": accepted,
+        "rejected": rejected,
+        "errors": errors,
+    }
+
+
+@router.get("/ingest/stats")
+async def get_ingest_stats():
+    """Estado del buffer de ingesta de este worker y agregados en vivo (de todos los workers)."""
+    return {
+        "success": True,
+        **ingest_service.stats(),
+        "aggregates": ingest_service.live_aggregates(),
+    }
@@ -0,0 +1,13 @@
+"""
+Endpoint de métricas Prometheus.
+"""
+from fastapi import APIRouter, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
+
+router = APIRouter()
+
+
+@router.get("/metrics", include_in_schema=False)
+async def get_metrics():
+    """Exposición de métricas en formato de texto Prometheus."""
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,35 @@
+"""
+Descarga de perfiles de peticiones (ver `app.profiling`).
+"""
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import FileResponse
+from app.config import config
+from app import profiling
+
+router = APIRouter()
+
+
+def _require_enabled():
+    if not config.PROFILING_ENABLED:
+        raise HTTPException(status_code=404, detail="Profiling disabled")
+
+
+@router.get("/debug/profiles")
+async def list_profiles():
+    """Lista los perfiles guardados (más recientes primero)."""
+    _require_enabled()
+    ids = [name[len("profile-"):-len(".zip")] for name in profiling.list_artifacts()]
+    return {
+        "success": True,
+        "profiles": [{"id": pid, "url": f"/api/debug/profiles/{pid}"} for pid in ids],
+    }
+
+
+@router.get("/debug/profiles/{profile_id}")
+async def download_profile(profile_id: str):
+    """Descarga el zip de un perfil (stacks.folded, plans.txt, report.json)."""
+    _require_enabled()
+    path = profiling.artifact_path(profile_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="application/zip", filename=f"profile-{profile_id}.zip")
@@ -1,22 +1,43 @@
 """
 Endpoints REST de la API.
 """
-from fastapi import APIRouter, HTTPException, Query
+from fastapi import APIRouter, HTTPException, Query, Request, Response
 from fastapi.responses import ORJSONResponse
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Callable
 from datetime import datetime, timedelta
 from app.models.signal import FilterParams, AggregatedData
 from app.services.supabase_service import supabase_service
-from app.etl.spark_pipeline import spark_etl_service
+from app.services.boundaries import boundary_index
+from app.services.boundary_levels import boundary_levels
+from app.services.filters import SignalFilter, parse_bbox
+from app.services import heatmap
+from app.services.coverage import Grid, coverage_store
+from app.services.data_source import PageKey
+from app.services.pagination import decode_cursor, encode_cursor
+from app.services.point_index import point_index
+from app.services.admission import AdmissionRejected, admission
+from app.etl.compute import ComputeError, compute
+from app.shared_cache import shared_cache
+from app import metrics, http_cache
+from app.config import config
+import asyncio
 import logging
 import hashlib
 import json
+import orjson
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-# Caché simple en memoria
+# Caché simple en memoria, una por ruta: cuerpos ya codificados (ver app.http_cache).
+# Con caché compartida (serve.py) guarda vistas de las entradas de app.shared_cache.
 _cache: Dict[str, tuple[Any, datetime]] = {}
+_points_cache: Dict[str, tuple[Any, datetime]] = {}
+_heatmap_cache: Dict[str, tuple[Any, datetime]] = {}
+_coverage_cache: Dict[str, tuple[Any, datetime]] = {}
+_boundaries_cache: Dict[str, tuple[Any, datetime]] = {}
+_caches = {"aggregate": _cache, "map_points": _points_cache, "heatmap": _heatmap_cache,
+           "coverage": _coverage_cache, "boundaries": _boundaries_cache}
 CACHE_TTL = timedelta(seconds=30)  # 30 segundos de caché
 
 
@@ -26,147 +47,208 @@ def get_cache_key(filters: dict) -> str:
     return hashlib.md5(filter_str.encode()).hexdigest()
 
 
-def get_from_cache(key: str) -> Optional[Any]:
+def get_from_cache(key: str, cache: str = "aggregate") -> Optional[Any]:
     """Get data from cache if not expired"""
-    if key in _cache:
-        data, timestamp = _cache[key]
+    store = _caches[cache]
+    if key in store:
+        data, timestamp = store[key]
         if datetime.now() - timestamp < CACHE_TTL:
-            logger.info(f"✓ Cache HIT for key: {key[:8]}...")
+            logger.info(f"✓ Cache HIT for key: {key[:12]}...")
+            metrics.cache_result(cache, "hit")
             return data
         else:
             # Expired, remove from cache
-            del _cache[key]
-            logger.info(f"✗ Cache EXPIRED for key: {key[:8]}...")
+            del store[key]
+            metrics.CACHE_ENTRIES.labels(cache=cache).set(len(store))
+            logger.info(f"✗ Cache EXPIRED for key: {key[:12]}...")
+            metrics.cache_result(cache, "expired")
+            return None
+    metrics.cache_result(cache, "miss")
     return None
 
 
-def save_to_cache(key: str, data: Any):
-    """Save data to cache"""
-    _cache[key] = (data, datetime.now())
-    logger.info(f"✓ Saved to cache: {key[:8]}... (cache size: {len(_cache)})")
+def save_to_cache(key: str, data: Any, cache: str = "aggregate"):
+    """Save data to cache (acotada: se descartan las entradas más antiguas)"""
+    store = _caches[cache]
+    store.pop(key, None)
+    store[key] = (data, datetime.now())
+    while len(store) > config.RESPONSE_CACHE_MAX_ENTRIES:
+        del store[next(iter(store))]
+    metrics.CACHE_ENTRIES.labels(cache=cache).set(len(store))
+    logger.info(f"✓ Saved to cache: {key[:12]}... (cache size: {len(store)})")
+
+
+def shared_body(key: str, produce: Callable[[], http_cache.EncodedBody]) -> http_cache.EncodedBody:
+    """Cuerpo de la caché compartida entre workers; si falta, lo calcula un solo worker."""
+    if shared_cache is None:
+        return produce()
+    return http_cache.EncodedBody.from_shared(shared_cache.fill(key, lambda: produce().to_shared()))
+
+
+def rejected(e: AdmissionRejected) -> HTTPException:
+    """503 del control de admisión, con `Retry-After`."""
+    return HTTPException(status_code=e.status, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 
 @router.get("/signals", response_class=ORJSONResponse)
 async def get_signals(
+    response: Response,
     limit: int = Query(300000, description="Límite de registros"),
-    offset: int = Query(0, description="Desplazamiento de registros"),
+    cursor: Optional[str] = Query(None, description="Cursor opaco de la página anterior (`next_cursor`)"),
+    offset: int = Query(0, description="Desplazamiento de registros (obsoleto: usar cursor)"),
     provincia: Optional[str] = None,
     municipio: Optional[str] = None,
     empresa: Optional[str] = None,
-    tipo_senal: Optional[str] = None
+    tipo_senal: Optional[str] = None,
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None,
+    format: str = Query("rows", description="rows | columnar (columnas + diccionarios)")
 ):
     """
-    Obtiene señales con filtros opcionales.
-    KISS: endpoint simple y directo.
+    Obtiene señales con filtros opcionales, paginadas por cursor: cada
+    respuesta trae `next_cursor` (null en la última página), ordenadas por
+    (timestamp, id). `offset` se mantiene para clientes antiguos. Si el coste
+    estimado supera el máximo, la página se acorta (`X-Admission: degraded`).
     """
+    signal_filter = query_filter(provincia, municipio, empresa, tipo_senal, bbox, fecha_inicio, fecha_fin)
+    filter_key = signal_filter.to_key()
+    after = None
+    if cursor:
+        try:
+            after = decode_cursor(cursor, filter_key)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
     try:
-        filters = {}
-        if provincia:
-            filters["provincias"] = [provincia]
-        if municipio:
-            filters["municipios"] = [municipio]
-        if empresa:
-            filters["empresas"] = [empresa]
-        if tipo_senal:
-            filters["tipos_senal"] = [tipo_senal]
-        
-        if filters:
-            data = supabase_service.get_signals_with_filters(filters)
-        else:
-            data = supabase_service.get_all_signals(limit, offset)
-        
-        return {
-            "success": True,
-            "count": len(data),
-            "data": data
-        }
+        ticket = await admission.admit("signals", signal_filter, limit)
+    except AdmissionRejected as e:
+        raise rejected(e)
+    response.headers.update(ticket.headers())
+    try:
+        # Fuera del event loop: una página grande no retrasa a las peticiones baratas
+        if offset and after is None:
+            return await asyncio.to_thread(_signals_by_offset, signal_filter, ticket.limit, offset, format)
+        return await asyncio.to_thread(_signals_page, signal_filter, filter_key, ticket.limit, after, format)
     except Exception as e:
         logger.error(f"Error in get_signals: {e}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        ticket.release()
+
+
+def _signals_page(signal_filter: SignalFilter, filter_key: Dict[str, Any], limit: int,
+                  after: Optional[PageKey], format: str) -> Dict[str, Any]:
+    """Página por cursor (keyset) y su `next_cursor`."""
+    batch, last = supabase_service.get_signal_page(signal_filter, limit, after)
+    next_cursor = encode_cursor(last, filter_key) if last is not None else None
+    if format == "columnar":
+        # Sin filas dict: columnas tipadas y texto codificado por diccionario
+        return {
+            "success": True,
+            "count": len(batch),
+            "next_cursor": next_cursor,
+            **batch.to_columnar()
+        }
+    
+    data = batch.to_rows()
+    return {
+        "success": True,
+        "count": len(data),
+        "next_cursor": next_cursor,
+        "data": data
+    }
+
+
+def _signals_by_offset(signal_filter: SignalFilter, limit: int, offset: int, format: str) -> Dict[str, Any]:
+    """Paginación heredada por desplazamiento (orden por id, cada página más cara)."""
+    if format == "columnar":
+        batch = supabase_service.get_signal_batch(signal_filter, limit=limit, offset=offset)
+        return {
+            "success": True,
+            "count": len(batch),
+            **batch.to_columnar()
+        }
+    
+    if not signal_filter.is_empty():
+        data = supabase_service.get_signal_batch(signal_filter, limit=limit, offset=offset).to_rows()
+    else:
+        data = supabase_service.get_all_signals(limit, offset)
+    
+    return {
+        "success": True,
+        "count": len(data),
+        "data": data
+    }
+
+
+def query_filter(provincia: Optional[str] = None, municipio: Optional[str] = None,
+                 empresa: Optional[str] = None, tipo_senal: Optional[str] = None,
+                 bbox: Optional[str] = None, fecha_inicio: Optional[datetime] = None,
+                 fecha_fin: Optional[datetime] = None) -> SignalFilter:
+    """SignalFilter desde query params; 400 si el bbox no es válido."""
+    try:
+        return SignalFilter.from_query(provincia, municipio, empresa, tipo_senal, bbox, fecha_inicio, fecha_fin)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
 
 
 @router.post("/analytics/aggregate")
-async def get_aggregated_data(filters: FilterParams):
+async def get_aggregated_data(filters: FilterParams, request: Request):
     """
     Procesa y agrega datos usando Spark ETL.
-    Con caché para evitar procesamiento redundante.
+    Con caché para evitar procesamiento redundante y ETag para responder 304
+    si el dataset y el filtro no cambiaron. Los fallos de caché pasan por el
+    control de admisión (ver `app.services.admission`).
     """
     try:
-        # Obtener datos de Supabase
-        filter_dict = {k: v for k, v in filters.dict().items() if v is not None}
+        # Filtro canónico (incluye provincias/municipios/empresas del frontend)
+        signal_filter = SignalFilter.coerce(filters)
         
-        # Generar clave de caché
-        cache_key = get_cache_key(filter_dict)
+        # Versión = watermark del dataset + filtro; también es la clave de caché
+        etag = http_cache.make_etag(supabase_service.watermark(), "aggregate", signal_filter.to_key())
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag)
+        cache_key = etag
         
-        # Intentar obtener de caché
-        cached_result = get_from_cache(cache_key)
-        if cached_result is not None:
-            return cached_result
+        # Intentar obtener de caché (cuerpo ya serializado y comprimido)
+        cached_body = get_from_cache(cache_key)
+        if cached_body is not None:
+            return cached_body.response(request)
         
-        # Si no está en caché, procesar
-        logger.info(f"✗ Cache MISS - Processing data for key: {cache_key[:8]}...")
+        # Si no está en caché, procesar (aquí o en el proceso de cómputo compartido)
+        logger.info(f"✗ Cache MISS - Processing data for key: {cache_key[:12]}...")
+        ticket = await admission.admit("aggregate", signal_filter)
+        try:
+            if ticket.sample > 1:
+                # Resultado aproximado: su propia versión en ETag y caché
+                etag = http_cache.make_etag(supabase_service.watermark(), "aggregate",
+                                            [signal_filter.to_key(), ticket.sample])
+                if http_cache.etag_matches(request, etag):
+                    return http_cache.not_modified(etag)
+                cache_key = etag
+                body = get_from_cache(cache_key)
+            else:
+                body = None
+            
+            def produce() -> http_cache.EncodedBody:
+                # Comprimir una sola vez (el JSON ya viene serializado)
+                payload = compute.run("aggregate", ticket.lane, filters=signal_filter.to_key(), sample=ticket.sample)
+                return http_cache.EncodedBody.from_json(payload, etag)
+            
+            if body is None:
+                body = await asyncio.to_thread(shared_body, f"aggregate:{cache_key}", produce)
+                save_to_cache(cache_key, body)
+        finally:
+            ticket.release()
         
-        if filter_dict:
-            raw_data = supabase_service.get_signals_with_filters(filter_dict)
-        else:
-            # Limitar a 100k para análisis rápido inicial
-            # Los usuarios pueden cargar más datos incrementalmente en el mapa
-            raw_data = supabase_service.get_all_signals(limit=100000)
-        
-        if not raw_data:
-            return {
-                "success": True,
-                "total_signals": 0,
-                "average_battery": 0,
-                "signals_by_company": {},
-                "signals_by_type": {},
-                "geographic_distribution": {}
-            }
-        
-        # Procesar con Spark
-        df = spark_etl_service.create_dataframe(raw_data)
-        
-        # Aplicar filtros adicionales si es necesario
-        if filter_dict:
-            df = spark_etl_service.filter_dataframe(df, filter_dict)
-        
-        # Calcular agregaciones básicas
-        stats = spark_etl_service.calculate_statistics(df)
-        by_company = spark_etl_service.aggregate_by_company(df)
-        by_type = spark_etl_service.aggregate_by_signal_type(df)
-        by_geography = spark_etl_service.aggregate_by_geography(df)
-        
-        # Análisis avanzados
-        speed_by_operator = spark_etl_service.analyze_speed_by_operator(df)
-        signal_heatmap = spark_etl_service.analyze_signal_by_district(df)
-        coverage_analysis = spark_etl_service.analyze_coverage_by_operator(df)
-        district_analysis = spark_etl_service.analyze_by_district(df)
-        
-        # Si no hay filtros, usar el conteo total real de la base de datos
-        if not filter_dict:
-            real_total = supabase_service.get_total_count()
-            if real_total > 0:
-                stats["total_signals"] = real_total
-        
-        result = {
-            "success": True,
-            "total_signals": stats["total_signals"],
-            "average_battery": stats["average_battery"],
-            "signals_by_company": by_company,
-            "signals_by_type": by_type,
-            "geographic_distribution": by_geography,
-            "statistics": stats,
-            # Análisis avanzados
-            "speed_by_operator": speed_by_operator,
-            "signal_heatmap": signal_heatmap,
-            "coverage_analysis": coverage_analysis,
-            "district_analysis": district_analysis
-        }
-        
-        # Guardar en caché
-        save_to_cache(cache_key, result)
-        
-        return result
+        response = body.response(request)
+        response.headers.update(ticket.headers())
+        return response
+    except AdmissionRejected as e:
+        raise rejected(e)
+    except ComputeError as e:
+        logger.error(f"Compute error in get_aggregated_data: {e}")
+        raise HTTPException(status_code=e.status, detail=str(e))
     except Exception as e:
         logger.error(f"Error in get_aggregated_data: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -174,62 +256,253 @@ async def get_aggregated_data(filters: FilterParams):
 
 @router.get("/map/points")
 async def get_map_points(
-    limit: int = Query(60000, description="Límite de puntos en el mapa"),
+    request: Request,
+    limit: int = Query(60000, ge=1, description="Presupuesto máximo de puntos en la respuesta"),
+    zoom: Optional[float] = Query(None, ge=0, le=22, description="Zoom del mapa (celda de pantalla del muestreo)"),
+    seed: int = Query(42, description="Semilla del muestreo (misma semilla = misma muestra)"),
     provincia: Optional[str] = None,
-    municipio: Optional[str] = None
+    municipio: Optional[str] = None,
+    empresa: Optional[str] = None,
+    tipo_senal: Optional[str] = None,
+    bbox: Optional[str] = Query(None, description="Viewport: min_lng,min_lat,max_lng,max_lat")
 ):
     """
-    Obtiene puntos geográficos para visualización en mapa.
+    Obtiene puntos geográficos del viewport para visualización en mapa.
+    Responde desde el almacén de puntos mapeado en memoria (sin Spark), con
+    ETag ligada a la versión publicada del almacén.
     """
+    signal_filter = query_filter(provincia, municipio, empresa, tipo_senal, bbox)
     try:
-        filters = {}
-        if provincia:
-            filters["provincias"] = [provincia]
-        if municipio:
-            filters["municipios"] = [municipio]
+        # Fuera del event loop: remapear o reconstruir el almacén lee disco
+        view = await asyncio.to_thread(point_index.view)
+        etag = http_cache.make_etag(view.version, "map/points",
+                                    [signal_filter.to_key(), zoom, limit, seed])
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag)
         
-        if filters:
-            raw_data = supabase_service.get_signals_with_filters(filters)
-        else:
-            raw_data = supabase_service.get_all_signals(limit)
+        body = get_from_cache(etag, cache="map_points")
+        if body is None:
+            result = await asyncio.to_thread(point_index.query, signal_filter, zoom, limit, seed, view=view)
+            body = http_cache.EncodedBody.encode({"success": True, "zoom": zoom, **result}, etag)
+            save_to_cache(etag, body, cache="map_points")
+        return body.response(request)
+    except Exception as e:
+        logger.error(f"Error in get_map_points: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.get("/map/heatmap")
+async def get_heatmap(
+    request: Request,
+    bbox: str = Query(..., description="Extensión: min_lng,min_lat,max_lng,max_lat"),
+    width: int = Query(256, ge=1, le=heatmap.MAX_GRID, description="Celdas por fila"),
+    height: int = Query(256, ge=1, le=heatmap.MAX_GRID, description="Filas"),
+    metric: str = Query("density", description="density | signal | speed"),
+    format: str = Query("f32", description="f32 (float32 crudo) | png"),
+    sigma: float = Query(2.0, ge=0.5, le=32, description="Radio del núcleo en celdas"),
+    max: float = Query(heatmap.DENSITY_MAX, gt=0, description="Densidad que satura el color (png)"),
+    provincia: Optional[str] = None,
+    municipio: Optional[str] = None,
+    empresa: Optional[str] = None,
+    tipo_senal: Optional[str] = None,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None
+):
+    """
+    Rejilla de densidad o de señal/velocidad media sobre todo el almacén de
+    puntos, de tamaño fijo sea cual sea el número de filas.
+    """
+    try:
+        extent = parse_bbox(bbox)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if extent[0] == extent[2] or extent[1] == extent[3]:
+        raise HTTPException(status_code=400, detail="bbox must have a non-zero area")
+    signal_filter = query_filter(provincia, municipio, empresa, tipo_senal, None, fecha_inicio, fecha_fin)
+    return await heatmap_response(request, signal_filter, extent, width, height, metric, format, sigma, max)
+
+
+@router.get("/map/heatmap/{z}/{x}/{y}.png")
+async def get_heatmap_tile(
+    request: Request,
+    z: int,
+    x: int,
+    y: int,
+    metric: str = Query("density", description="density | signal | speed"),
+    sigma: float = Query(2.0, ge=0.5, le=32, description="Radio del núcleo en celdas"),
+    max: float = Query(heatmap.DENSITY_MAX, gt=0, description="Densidad que satura el color"),
+    provincia: Optional[str] = None,
+    municipio: Optional[str] = None,
+    empresa: Optional[str] = None,
+    tipo_senal: Optional[str] = None,
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None
+):
+    """Tesela XYZ del mapa de calor (PNG, para una capa de teselas de Leaflet)."""
+    if not 0 <= z <= 22 or not (0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        raise HTTPException(status_code=400, detail="Invalid tile coordinates")
+    signal_filter = query_filter(provincia, municipio, empresa, tipo_senal, None, fecha_inicio, fecha_fin)
+    return await heatmap_response(request, signal_filter, heatmap.tile_bbox(z, x, y),
+                                  heatmap.TILE_GRID, heatmap.TILE_GRID, metric, "png", sigma, max)
+
+
+async def heatmap_response(request: Request, signal_filter: SignalFilter, extent: tuple, width: int,
+                           height: int, metric: str, format: str, sigma: float, density_max: float):
+    """Respuesta cacheada por versión del almacén + filtro + rejilla (ETag / 304)."""
+    if metric not in heatmap.METRICS:
+        raise HTTPException(status_code=400, detail=f"metric must be one of {', '.join(heatmap.METRICS)}")
+    if format not in ("f32", "png"):
+        raise HTTPException(status_code=400, detail="format must be f32 or png")
+    try:
+        view = await asyncio.to_thread(point_index.view)
+        etag = http_cache.make_etag(view.version, "map/heatmap", [
+            signal_filter.to_key(), extent, width, height, metric, format, sigma,
+            density_max if format == "png" else None,
+        ])
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag)
         
-        # Procesar con Spark para optimizar
-        df = spark_etl_service.create_dataframe(raw_data)
-        points = spark_etl_service.get_geographic_points(df, limit)
+        body = get_from_cache(etag, cache="heatmap")
+        if body is None:
+            def produce() -> http_cache.EncodedBody:
+                raster = point_index.heatmap(signal_filter, extent, width, height, metric, sigma, view=view)
+                if format == "png":
+                    return http_cache.EncodedBody.from_bytes(
+                        raster.to_png(density_max), etag, "image/png", compress=False)
+                low, high = raster.range()
+                headers = {
+                    "X-Heatmap-Width": str(width),
+                    "X-Heatmap-Height": str(height),
+                    "X-Heatmap-Bbox": ",".join(f"{v:.6f}" for v in extent),
+                    "X-Heatmap-Range": f"{low:.6g},{high:.6g}",
+                }
+                return http_cache.EncodedBody.from_bytes(
+                    raster.to_float32(), etag, "application/octet-stream", headers)
+            
+            body = await asyncio.to_thread(shared_body, f"heatmap:{etag}", produce)
+            save_to_cache(etag, body, cache="heatmap")
+        return body.response(request)
+    except Exception as e:
+        logger.error(f"Error in heatmap: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def refresh_coverage(force: bool = False) -> Dict[str, Any]:
+    """Refresco incremental de la cobertura en el proceso de cómputo."""
+    try:
+        result = orjson.loads(await asyncio.to_thread(compute.run, "coverage_refresh", force=force))
+    except ComputeError as e:
+        logger.error(f"Compute error in coverage refresh: {e}")
+        raise HTTPException(status_code=e.status, detail=str(e))
+    if not result.get("success"):
+        raise HTTPException(status_code=result.get("code", 500), detail=result.get("error"))
+    return result
+
+
+@router.post("/map/coverage/refresh")
+async def post_coverage_refresh(force: bool = Query(False, description="Recalcular todas las teselas")):
+    """Recalcula las teselas de cobertura cercanas a mediciones nuevas (o todas con `force`)."""
+    return await refresh_coverage(force)
+
+
+@router.get("/map/coverage")
+async def get_coverage(
+    request: Request,
+    operator: str = Query(..., description="Operadora (sim_operator)"),
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat (por defecto, toda la rejilla)"),
+    format: str = Query("png", description="png | f32 (float32 crudo)")
+):
+    """
+    Señal estimada (IDW) de una operadora sobre la rejilla de Santa Cruz,
+    también donde no hay mediciones. Si el almacén de puntos cambió, antes se
+    recalculan las teselas cercanas a las mediciones nuevas.
+    """
+    if format not in ("f32", "png"):
+        raise HTTPException(status_code=400, detail="format must be f32 or png")
+    try:
+        extent = parse_bbox(bbox) if bbox else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    
+    manifest = coverage_store.manifest()
+    view = await asyncio.to_thread(point_index.view)
+    if manifest is None or manifest["version"] != view.version:
+        try:
+            await refresh_coverage()
+        except HTTPException:
+            if manifest is None:
+                raise
+            logger.warning("Coverage refresh failed: serving the previous surface")
+        manifest = coverage_store.manifest() or manifest
+    if operator not in manifest["tiles"]:
+        raise HTTPException(status_code=404, detail=f"No coverage for operator {operator} "
+                                                    f"(available: {', '.join(sorted(manifest['tiles']))})")
+    if extent is not None and Grid.from_dict(manifest["grid"]).window(extent) is None:
+        raise HTTPException(status_code=400, detail="bbox is outside the coverage area")
+    
+    try:
+        etag = http_cache.make_etag(manifest["build"], "map/coverage", [operator, extent, format])
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag)
         
-        return {
-            "success": True,
-            "count": len(points),
-            "points": points
-        }
+        body = get_from_cache(etag, cache="coverage")
+        if body is None:
+            def produce() -> http_cache.EncodedBody:
+                raster = coverage_store.raster(manifest, operator, extent)
+                low, high = raster.range()
+                headers = {
+                    "X-Coverage-Width": str(raster.width),
+                    "X-Coverage-Height": str(raster.height),
+                    "X-Coverage-Bbox": ",".join(f"{v:.6f}" for v in raster.bbox),
+                    "X-Coverage-Range": f"{low:.6g},{high:.6g}",
+                }
+                if format == "png":
+                    return http_cache.EncodedBody.from_bytes(
+                        raster.to_png(), etag, "image/png", headers, compress=False)
+                return http_cache.EncodedBody.from_bytes(
+                    raster.to_float32(), etag, "application/octet-stream", headers)
+            
+            body = await asyncio.to_thread(shared_body, f"coverage:{etag}", produce)
+            save_to_cache(etag, body, cache="coverage")
+        return body.response(request)
     except Exception as e:
-        logger.error(f"Error in get_map_points: {e}")
+        logger.error(f"Error in coverage: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 
 @router.get("/analytics/timeseries")
 async def get_time_series(
     interval: str = Query("hour", description="Intervalo de tiempo: hour, day"),
-    provincia: Optional[str] = None
+    provincia: Optional[str] = None,
+    municipio: Optional[str] = None,
+    empresa: Optional[str] = None,
+    tipo_senal: Optional[str] = None,
+    bbox: Optional[str] = Query(None, description="min_lng,min_lat,max_lng,max_lat"),
+    fecha_inicio: Optional[datetime] = None,
+    fecha_fin: Optional[datetime] = None
 ):
     """
     Obtiene serie temporal de señales.
     """
+    signal_filter = query_filter(provincia, municipio, empresa, tipo_senal, bbox, fecha_inicio, fecha_fin)
     try:
-        filters = {}
-        if provincia:
-            filters["provincias"] = [provincia]
-        
-        raw_data = supabase_service.get_signals_with_filters(filters) if filters else supabase_service.get_all_signals()
-        
-        df = spark_etl_service.create_dataframe(raw_data)
-        time_series = spark_etl_service.time_series_aggregation(df, interval)
-        
-        return {
-            "success": True,
-            "interval": interval,
-            "data": time_series
-        }
+        ticket = await admission.admit("timeseries", signal_filter)
+        try:
+            # El JSON llega serializado y en trozos: se reenvía tal cual
+            chunks = await asyncio.to_thread(
+                compute.open, "timeseries", ticket.lane,
+                filters=signal_filter.to_key(), interval=interval, sample=ticket.sample
+            )
+        except BaseException:
+            ticket.release()
+            raise
+        # El turno se devuelve al terminar de enviar
+        return ticket.response(chunks, "application/json")
+    except AdmissionRejected as e:
+        raise rejected(e)
+    except ComputeError as e:
+        logger.error(f"Compute error in get_time_series: {e}")
+        raise HTTPException(status_code=e.status, detail=str(e))
     except Exception as e:
         logger.error(f"Error in get_time_series: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -242,10 +515,11 @@ async def get_filter_options():
     YAGNI: solo valores únicos necesarios para los filtros.
     """
     try:
-        provincias = supabase_service.get_unique_values("provincia")
-        municipios = supabase_service.get_unique_values("municipio")
-        empresas = supabase_service.get_unique_values("empresa")
-        tipos_senal = supabase_service.get_unique_values("tipo_senal")
+        # Provincias/municipios vienen de los límites; empresa/tipo son columnas reales
+        provincias = boundary_index.names("provincia")
+        municipios = boundary_index.names("municipio")
+        empresas = supabase_service.get_unique_values("sim_operator")
+        tipos_senal = supabase_service.get_unique_values("network_type")
         
         return {
             "success": True,
@@ -259,10 +533,87 @@ async def get_filter_options():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@router.post("/dashboard")
+async def get_dashboard(
+    filters: FilterParams,
+    interval: str = Query("hour", description="Intervalo de la serie temporal: hour, day"),
+    points_limit: int = Query(60000, ge=0, description="Presupuesto de puntos de la muestra del mapa"),
+    seed: int = Query(42, description="Semilla del muestreo")
+):
+    """
+    Todo el dashboard en una petición: la fuente se lee y se ingiere en Spark
+    una sola vez y cada sección (facets, stats, points, timeseries) se envía
+    como una línea NDJSON en cuanto está lista.
+    """
+    signal_filter = SignalFilter.coerce(filters)
+    try:
+        ticket = await admission.admit("dashboard", signal_filter)
+        try:
+            # Espera la primera sección: los errores previos aún pueden ser un 5xx
+            lines = await asyncio.to_thread(
+                compute.stream, "dashboard", ticket.lane, filters=signal_filter.to_key(),
+                interval=interval, points_limit=points_limit, seed=seed, sample=ticket.sample
+            )
+        except BaseException:
+            ticket.release()
+            raise
+        return ticket.response(lines, "application/x-ndjson")
+    except AdmissionRejected as e:
+        raise rejected(e)
+    except ComputeError as e:
+        logger.error(f"Compute error in get_dashboard: {e}")
+        raise HTTPException(status_code=e.status, detail=str(e))
+    except Exception as e:
+        logger.error(f"Error in get_dashboard: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@router.post("/compaction")
+async def post_compaction(full: bool = Query(False, description="Vaciar la tabla compactada y rehacerla")):
+    """Compacta los reportes crudos nuevos en `locations_compacted` y devuelve la reducción."""
+    try:
+        result = orjson.loads(await asyncio.to_thread(compute.run, "compaction", full=full))
+    except ComputeError as e:
+        logger.error(f"Compute error in compaction: {e}")
+        raise HTTPException(status_code=e.status, detail=str(e))
+    if not result.get("success"):
+        raise HTTPException(status_code=result.get("code", 500), detail=result.get("error"))
+    return result
+
+
+@router.get("/boundaries")
+async def get_boundaries(request: Request, zoom: float = Query(12, ge=0, le=24, description="Zoom del mapa")):
+    """
+    Distritos, municipios y provincias como TopoJSON cuantizado, simplificado
+    para el zoom pedido (ver app.services.boundary_levels).
+    """
+    try:
+        level = await asyncio.to_thread(boundary_levels.level, zoom)
+        etag = http_cache.make_etag(level["etag"], "boundaries", level["zoom"])
+        if http_cache.etag_matches(request, etag):
+            return http_cache.not_modified(etag)
+        
+        body = get_from_cache(etag, cache="boundaries")
+        if body is None:
+            data = await asyncio.to_thread(boundary_levels.read, level)
+            body = http_cache.EncodedBody.from_bytes(data, etag, headers={"X-Boundary-Level": str(level["zoom"])})
+            save_to_cache(etag, body, cache="boundaries")
+        return body.response(request)
+    except Exception as e:
+        logger.error(f"Error in get_boundaries: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+
 @router.get("/health")
 async def health_check():
-    """Health check endpoint."""
-    return {
-        "status": "healthy",
-        "service": "Santa Cruz Signal Analytics API"
+    """Health check endpoint (incluye el estado del proceso de cómputo)."""
+    compute_health = await asyncio.to_thread(compute.health)
+    health = {
+        "status": "healthy" if compute_health.get("status") == "ok" else "degraded",
+        "service": "Santa Cruz Signal Analytics API",
+        "compute": compute_health
     }
+    if shared_cache is not None:
+        health["shared_cache"] = shared_cache.stats()
+    health["admission"] = admission.describe()
+    return health
@@ -1,63 +1,41 @@
 """
 WebSocket para datos en tiempo real.
 """
-from fastapi import APIRouter, WebSocket, WebSocketDisconnect
-from typing import List
+from fastapi import APIRouter, WebSocket, WebSocketDisconnect, Query
 import asyncio
 import json
 import logging
+from app.api.connections import ConnectionManager, ENCODING_JSON
+from app.config import config
+from app import metrics
 from app.services.supabase_service import supabase_service
-from app.etl.spark_pipeline import spark_etl_service
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
-
-class ConnectionManager:
-    """Maneja conexiones WebSocket - KISS: gestión simple de clientes."""
-    
-    def __init__(self):
-        self.active_connections: List[WebSocket] = []
-    
-    async def connect(self, websocket: WebSocket):
-        await websocket.accept()
-        self.active_connections.append(websocket)
-        logger.info(f"Client connected. Total connections: {len(self.active_connections)}")
-    
-    def disconnect(self, websocket: WebSocket):
-        self.active_connections.remove(websocket)
-        logger.info(f"Client disconnected. Total connections: {len(self.active_connections)}")
-    
-    async def broadcast(self, message: dict):
-        """Envía mensaje a todos los clientes conectados."""
-        disconnected = []
-        for connection in self.active_connections:
-            try:
-                await connection.send_json(message)
-            except Exception as e:
-                logger.error(f"Error sending to client: {e}")
-                disconnected.append(connection)
-        
-        # Limpiar conexiones muertas
-        for conn in disconnected:
-            if conn in self.active_connections:
-                self.active_connections.remove(conn)
-
-
 manager = ConnectionManager()
 
+# Métricas calculadas al momento del scrape
+metrics.WS_CONNECTIONS.set_function(lambda: len(manager.channels))
+metrics.WS_QUEUE_DEPTH.labels(aggregate="total").set_function(lambda: manager.stats()["queue_depth_total"])
+metrics.WS_QUEUE_DEPTH.labels(aggregate="max").set_function(lambda: manager.stats()["queue_depth_max"])
+metrics.WS_DROPPED.labels(reason="dropped").set_function(lambda: manager.stats()["dropped"])
+metrics.WS_DROPPED.labels(reason="coalesced").set_function(lambda: manager.stats()["coalesced"])
+
 
 @router.websocket("/ws/signals")
-async def websocket_endpoint(websocket: WebSocket):
+async def websocket_endpoint(websocket: WebSocket, format: str = Query(ENCODING_JSON)):
     """
     WebSocket endpoint para streaming de datos en tiempo real.
+    `?format=msgpack` pide frames binarios MessagePack en lugar de JSON.
+    Todos los envíos pasan por la cola del cliente (un solo escritor por socket).
     """
-    await manager.connect(websocket)
+    await manager.connect(websocket, encoding=format)
     
     try:
         # Enviar datos iniciales
         initial_data = supabase_service.get_all_signals(limit=100)
-        await websocket.send_json({
+        manager.send(websocket, {
             "type": "initial",
             "data": initial_data
         })
@@ -66,31 +44,31 @@ async def websocket_endpoint(websocket: WebSocket):
         while True:
             try:
                 # Esperar mensaje del cliente o timeout
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=30.0)
+                data = await asyncio.wait_for(websocket.receive_text(), timeout=config.WS_HEARTBEAT_INTERVAL)
                 
                 # Procesar peticiones del cliente
                 request = json.loads(data)
                 
                 if request.get("action") == "refresh":
-                    # Enviar datos actualizados
+                    # Enviar datos actualizados; refrescos pendientes se fusionan
                     filters = request.get("filters", {})
                     fresh_data = supabase_service.get_signals_with_filters(filters) if filters else supabase_service.get_all_signals()
                     
-                    await websocket.send_json({
+                    manager.send(websocket, {
                         "type": "update",
                         "data": fresh_data,
                         "timestamp": asyncio.get_event_loop().time()
-                    })
+                    }, key="update")
                 
             except asyncio.TimeoutError:
                 # Heartbeat - enviar ping
-                await websocket.send_json({
+                manager.send(websocket, {
                     "type": "ping",
                     "timestamp": asyncio.get_event_loop().time()
-                })
+                }, key="ping")
             
             except json.JSONDecodeError:
-                await websocket.send_json({
+                manager.send(websocket, {
                     "type": "error",
                     "message": "Invalid JSON"
                 })
@@ -113,3 +91,43 @@ async def broadcast_new_signal(signal_data: dict):
         "type": "new_signal",
         "data": signal_data
     })
+
+
+def _points(rows: list) -> list:
+    """Puntos de un delta (formato de /map/points); el delta ya llega con tope."""
+    return [
+        {
+            "lat": row["latitude"],
+            "lng": row["longitude"],
+            "network_type": row["network_type"],
+            "sim_operator": row["sim_operator"],
+            "battery": row["battery"],
+            "device_name": row["device_name"],
+            "signal": row["signal"]
+        }
+        for row in rows
+    ]
+
+
+async def broadcast_signal_batch(delta: dict):
+    """
+    Publica un delta de ingesta: puntos nuevos (con tope), los ya publicados
+    que la base de datos rechazó y agregados en vivo.
+    Los agregados se fusionan en la cola: un cliente atrasado solo recibe el último.
+    """
+    if delta["count"]:
+        await manager.broadcast({
+            "type": "new_signals",
+            "count": delta["count"],
+            "data": _points(delta["rows"])
+        })
+    if delta["rejected_count"]:
+        await manager.broadcast({
+            "type": "rejected_signals",
+            "count": delta["rejected_count"],
+            "data": _points(delta["rejected"])
+        })
+    await manager.broadcast({
+        "type": "live_stats",
+        "data": delta["aggregates"]
+    }, key="live_stats")
@@ -2,6 +2,7 @@
 Configuración centralizada de la aplicación.
 """
 import os
+import tempfile
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -14,6 +15,25 @@ class Config:
     SUPABASE_URL: str = os.getenv("SUPABASE_URL", "")
     SUPABASE_KEY: str = os.getenv("SUPABASE_KEY", "")
     
+    # Fuente de datos: supabase (REST) | postgres (directo) | sqlite (sustituto local)
+    DATA_SOURCE: str = os.getenv("DATA_SOURCE", "supabase")
+    DATABASE_URL: str = os.getenv("DATABASE_URL", "")
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", "1"))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", "8"))
+    SQLITE_PATH: str = os.getenv("SQLITE_PATH", ":memory:")
+    
+    # Límites de provincias/municipios (filtros por región)
+    BOUNDARIES_PATH: str = os.getenv(
+        "BOUNDARIES_PATH",
+        os.path.join(os.path.dirname(__file__), "..", "..", "frontend", "public", "santa-cruz-districts.geojson"),
+    )
+    # Provincias de un GeoJSON nacional (p. ej. geoBoundaries ADM2); vacío = se disuelven de los distritos
+    BOUNDARY_PROVINCES_PATH: str = os.getenv("BOUNDARY_PROVINCES_PATH", "")
+    BOUNDARY_LEVELS_DIR: str = os.getenv(
+        "BOUNDARY_LEVELS_DIR",
+        os.path.join(os.path.dirname(__file__), "..", "data", "boundaries"),
+    )
+    
     # API
     API_HOST: str = os.getenv("API_HOST", "0.0.0.0")
     API_PORT: int = int(os.getenv("API_PORT", "8000"))
@@ -21,15 +41,118 @@ class Config:
     # Spark
     SPARK_APP_NAME: str = "SantaCruzSignalETL"
     SPARK_MASTER: str = "local[*]"
+    SPARK_METRICS_LISTENER: bool = os.getenv("SPARK_METRICS_LISTENER", "true").lower() == "true"
+    # Dataset base persistido una vez por versión de los datos (filas máximas; si la tabla
+    # tiene más, las consultas filtradas leen de la fuente)
+    SPARK_DATASET_MAX_ROWS: int = int(os.getenv("SPARK_DATASET_MAX_ROWS", "500000"))
+    SPARK_CACHE_BATCH_ROWS: int = int(os.getenv("SPARK_CACHE_BATCH_ROWS", "10000"))  # filas por lote columnar
+    
+    # Cómputo: local (Spark en el proceso de la API) | remote (proceso de cómputo compartido, serve.py)
+    COMPUTE_MODE: str = os.getenv("COMPUTE_MODE", "local")
+    COMPUTE_SOCKET: str = os.getenv("COMPUTE_SOCKET", os.path.join(tempfile.gettempdir(), "signal-compute.sock"))
+    COMPUTE_AUTHKEY: str = os.getenv("COMPUTE_AUTHKEY", "")
+    COMPUTE_CONCURRENCY: int = int(os.getenv("COMPUTE_CONCURRENCY", "2"))  # jobs simultáneos en Spark
+    COMPUTE_QUEUE_SIZE: int = int(os.getenv("COMPUTE_QUEUE_SIZE", "32"))
+    COMPUTE_HEAVY_CONCURRENCY: int = int(os.getenv("COMPUTE_HEAVY_CONCURRENCY", "1"))  # hilos del carril heavy
+    COMPUTE_TIMEOUT: float = float(os.getenv("COMPUTE_TIMEOUT", "300"))  # segundos por trabajo
+    COMPUTE_METRICS_PORT: int = int(os.getenv("COMPUTE_METRICS_PORT", "0"))  # 0 = sin /metrics propio
+    API_WORKERS: int = int(os.getenv("API_WORKERS", "4"))
     
     # WebSocket
     WS_HEARTBEAT_INTERVAL: int = 30
+    WS_SEND_QUEUE_SIZE: int = int(os.getenv("WS_SEND_QUEUE_SIZE", "64"))
+    WS_SLOW_CLIENT_POLICY: str = os.getenv("WS_SLOW_CLIENT_POLICY", "drop")  # drop | disconnect
+    WS_SEND_TIMEOUT: float = float(os.getenv("WS_SEND_TIMEOUT", "10"))
+    
+    # Ingesta
+    INGEST_BATCH_SIZE: int = int(os.getenv("INGEST_BATCH_SIZE", "5000"))
+    INGEST_FLUSH_INTERVAL: float = float(os.getenv("INGEST_FLUSH_INTERVAL", "0.5"))
+    INGEST_MAX_BUFFER: int = int(os.getenv("INGEST_MAX_BUFFER", "500000"))
+    INGEST_MAX_REPORTS: int = int(os.getenv("INGEST_MAX_REPORTS", "50000"))  # por petición
+    INGEST_MAX_RETRIES: int = int(os.getenv("INGEST_MAX_RETRIES", "3"))  # después se aíslan las filas rechazadas
+    INGEST_DEAD_LETTER_SIZE: int = int(os.getenv("INGEST_DEAD_LETTER_SIZE", "1000"))  # descartes guardados
+    WS_DELTA_MAX_POINTS: int = int(os.getenv("WS_DELTA_MAX_POINTS", "2000"))
+    
+    # Respuestas condicionales (ETag) y caché de cuerpos precomprimidos
+    WATERMARK_TTL: float = float(os.getenv("WATERMARK_TTL", "5"))  # segundos entre lecturas de la marca de cambios de la fuente
+    RESPONSE_CACHE_MAX_ENTRIES: int = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "128"))
+    
+    # Caché compartida entre workers (memoria compartida; serve.py la activa)
+    SHARED_CACHE_ENABLED: bool = os.getenv("SHARED_CACHE_ENABLED", "false").lower() == "true"
+    SHARED_CACHE_DIR: str = os.getenv(
+        "SHARED_CACHE_DIR",
+        os.path.join("/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir(), "signal-cache")
+    )
+    SHARED_CACHE_MAX_BYTES: int = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+    # La ingesta cambia la versión del dataset (y vacía la caché) como mucho una vez por intervalo
+    DATASET_VERSION_INTERVAL: float = float(os.getenv("DATASET_VERSION_INTERVAL", "30"))
+    
+    # Índice espacial de /map/points
+    MAP_INDEX_MAX_POINTS: int = int(os.getenv("MAP_INDEX_MAX_POINTS", "500000"))
+    MAP_INDEX_TTL: float = float(os.getenv("MAP_INDEX_TTL", "60"))  # segundos
+    MAP_INDEX_CELL_DEG: float = float(os.getenv("MAP_INDEX_CELL_DEG", "0.01"))  # ~1.1 km
+    POINT_STORE_DIR: str = os.getenv(
+        "POINT_STORE_DIR",
+        os.path.join(os.path.dirname(__file__), "..", "data", "point-store"),
+    )
+    POINT_STORE_COMPACT_ROWS: int = int(os.getenv("POINT_STORE_COMPACT_ROWS", "50000"))  # cola sin ordenar
+    
+    # Cobertura interpolada por operadora (IDW, /map/coverage)
+    COVERAGE_DIR: str = os.getenv(
+        "COVERAGE_DIR",
+        os.path.join(os.path.dirname(__file__), "..", "data", "coverage"),
+    )
+    COVERAGE_BBOX: str = os.getenv("COVERAGE_BBOX", "")  # vacío = bbox de los límites de Santa Cruz
+    COVERAGE_CELL_DEG: float = float(os.getenv("COVERAGE_CELL_DEG", "0.002"))  # ~220 m
+    COVERAGE_TILE_CELLS: int = int(os.getenv("COVERAGE_TILE_CELLS", "32"))
+    COVERAGE_RADIUS_KM: float = float(os.getenv("COVERAGE_RADIUS_KM", "1.5"))
+    COVERAGE_NEIGHBORS: int = int(os.getenv("COVERAGE_NEIGHBORS", "12"))
+    COVERAGE_POWER: float = float(os.getenv("COVERAGE_POWER", "2"))
+    COVERAGE_WORKERS: int = int(os.getenv("COVERAGE_WORKERS", "4"))  # procesos del pool (1 = sin pool)
+    
+    # Compactación de reportes casi duplicados (tabla locations_compacted)
+    COMPACTION_DISTANCE_M: float = float(os.getenv("COMPACTION_DISTANCE_M", "25"))  # lado de la celda
+    COMPACTION_WINDOW_S: int = int(os.getenv("COMPACTION_WINDOW_S", "60"))  # ventana de tiempo
+    COMPACTION_CHUNK_ROWS: int = int(os.getenv("COMPACTION_CHUNK_ROWS", "50000"))  # filas crudas por trozo
+    # Segundos antes de compactar una fila (PostgreSQL): más que la transacción de inserción más larga
+    COMPACTION_GRACE_S: float = float(os.getenv("COMPACTION_GRACE_S", "60"))
+    # Los análisis leen la tabla compactada (+ filas crudas aún sin compactar)
+    ANALYTICS_COMPACTED: bool = os.getenv("ANALYTICS_COMPACTED", "true").lower() == "true"
+    
+    # Control de admisión por coste (app.services.admission); turnos por worker
+    ADMISSION_ENABLED: bool = os.getenv("ADMISSION_ENABLED", "true").lower() == "true"
+    ADMISSION_CHEAP_COST: float = float(os.getenv("ADMISSION_CHEAP_COST", "50000"))  # filas x peso; sin cola
+    ADMISSION_MAX_COST: float = float(os.getenv("ADMISSION_MAX_COST", "2000000"))  # por encima se degrada
+    ADMISSION_SLOTS: int = int(os.getenv("ADMISSION_SLOTS", "2"))  # peticiones caras simultáneas por ruta
+    ADMISSION_QUEUE_SIZE: int = int(os.getenv("ADMISSION_QUEUE_SIZE", "8"))  # en espera por ruta; llena -> 503
+    ADMISSION_QUEUE_TIMEOUT: float = float(os.getenv("ADMISSION_QUEUE_TIMEOUT", "30"))  # segundos -> 503
+    # Catálogo de estadísticas (muestra del almacén de puntos)
+    STATS_SAMPLE_ROWS: int = int(os.getenv("STATS_SAMPLE_ROWS", "20000"))
+    STATS_REFRESH_FRACTION: float = float(os.getenv("STATS_REFRESH_FRACTION", "0.1"))  # reanalizar si cambian más
+    
+    # Exportaciones masivas (Spark -> Parquet / CSV gzip, en segundo plano)
+    EXPORT_DIR: str = os.getenv(
+        "EXPORT_DIR",
+        os.path.join(os.path.dirname(__file__), "..", "data", "exports"),
+    )
+    EXPORT_QUEUE_SIZE: int = int(os.getenv("EXPORT_QUEUE_SIZE", "8"))
+    EXPORT_CHUNK_ROWS: int = int(os.getenv("EXPORT_CHUNK_ROWS", "200000"))  # filas leídas por trozo
+    EXPORT_RETENTION_HOURS: float = float(os.getenv("EXPORT_RETENTION_HOURS", "24"))
+    
+    # Perfilado bajo demanda (desactivado por defecto)
+    PROFILING_ENABLED: bool = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+    PROFILING_TOKEN: str = os.getenv("PROFILING_TOKEN", "")
+    PROFILING_INTERVAL_MS: float = float(os.getenv("PROFILING_INTERVAL_MS", "5"))
+    PROFILING_DIR: str = os.getenv("PROFILING_DIR", os.path.join(tempfile.gettempdir(), "signal-profiles"))
+    PROFILING_MAX_ARTIFACTS: int = int(os.getenv("PROFILING_MAX_ARTIFACTS", "20"))
     
     @classmethod
     def validate(cls):
         """Valida que las configuraciones críticas estén presentes."""
-        if not cls.SUPABASE_URL or not cls.SUPABASE_KEY:
+        if cls.DATA_SOURCE == "supabase" and (not cls.SUPABASE_URL or not cls.SUPABASE_KEY):
             raise ValueError("SUPABASE_URL and SUPABASE_KEY must be set")
+        if cls.DATA_SOURCE == "postgres" and not cls.DATABASE_URL:
+            raise ValueError("DATABASE_URL must be set when DATA_SOURCE=postgres")
 
 
 config = Config()
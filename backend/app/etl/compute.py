@@ -0,0 +1,317 @@
+"""
+Cliente de cómputo: ejecuta los trabajos de `app.etl.jobs`.
+
+- `COMPUTE_MODE=local` (por defecto, desarrollo): en este mismo proceso; la
+  SparkSession se crea con el primer trabajo.
+- `COMPUTE_MODE=remote` (producción, `serve.py`): el trabajo viaja por un
+  socket Unix al proceso de cómputo (`compute_server`), dueño de la única
+  SparkSession. Los workers de la API no importan Spark.
+
+En ambos modos el resultado llega como JSON ya serializado, en trozos. Los
+trabajos de `jobs.STREAMS` (`stream`) devuelven secciones sueltas: una línea
+NDJSON por sección, enviada en cuanto el trabajo la produce.
+
+Cada trabajo va a un carril: `interactive` (por defecto) o `heavy`, el de
+las peticiones caras según el control de admisión (`app.services.admission`).
+Los carriles tienen hilos y pool FAIR de Spark propios: las caras no dejan
+sin núcleos a las baratas.
+
+Protocolo (mensajes `send_bytes` con JSON, sin pickle):
+    petición:  {"op": "run" | "stream", "job": ..., "lane": ..., "args": {...}, "profile": bool} | {"op": "health"}
+               {"op": "publish", ...delta de ingesta} | {"op": "subscribe"}
+    respuesta: {"status": 200, "chunks": n, ...} + n trozos de bytes
+               {"status": 200, "stream": true} + una línea por sección + b"" al final
+               {"status": 200, "live": true} + un delta por mensaje mientras dure la conexión
+               {"status": 4xx/5xx, "error": "..."}
+La cabecera de un stream se envía con la primera sección: un fallo anterior
+llega como error; uno posterior, como sección `error` antes del final.
+Con `"profile": true` (petición perfilada, ver `app.profiling`) el perfil del
+trabajo en el proceso de cómputo vuelve en la cabecera (`"profile"`) de un
+`run`, o en un mensaje más tras el final de un stream.
+"""
+from typing import Any, Callable, Dict, Iterable, Iterator, Optional, Tuple
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Client, Connection
+from app.config import config
+from app import profiling
+import logging
+import sys
+import threading
+import orjson
+
+logger = logging.getLogger(__name__)
+
+CHUNK_SIZE = 1 << 20  # 1 MiB por mensaje
+
+INTERACTIVE, HEAVY = "interactive", "heavy"
+LANES = (INTERACTIVE, HEAVY)
+
+
+class ComputeError(Exception):
+    """Fallo al ejecutar un trabajo; `status` es el código HTTP a devolver."""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+
+def split_chunks(payload: bytes, size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    for start in range(0, len(payload), size):
+        yield payload[start:start + size]
+
+
+def error_line(message: str) -> bytes:
+    return orjson.dumps({"section": "error", "error": message}) + b"\n"
+
+
+def section_lines(sections: Iterable[Dict[str, Any]]) -> Iterator[bytes]:
+    """
+    Secciones de un trabajo de `STREAMS` como líneas NDJSON. Un fallo antes de
+    la primera se propaga; después se convierte en una sección `error`.
+    """
+    sent = False
+    try:
+        for section in sections:
+            yield orjson.dumps(section) + b"\n"
+            sent = True
+    except Exception as e:
+        if not sent:
+            raise
+        logger.error(f"Compute stream failed: {e}")
+        yield error_line(str(e))
+
+
+class Closing:
+    """
+    Iterador que al cerrarse libera también `release` (la conexión, el stream
+    ya empezado), aunque no se haya llegado a iterar: cerrar un generador sin
+    empezar no ejecuta su `finally`.
+    """
+
+    def __init__(self, items: Iterator[bytes], release: Callable[[], None]):
+        self.items = items
+        self.release = release
+
+    def __iter__(self) -> Iterator[bytes]:
+        return self
+
+    def __next__(self) -> bytes:
+        return next(self.items)
+
+    def close(self):
+        try:
+            close = getattr(self.items, "close", None)
+            if close is not None:
+                close()
+        finally:
+            self.release()
+
+
+def prefetch(lines: Iterator[bytes]) -> Iterator[bytes]:
+    """Calcula ya la primera línea (sus errores se lanzan aquí) y devuelve el stream completo."""
+    first = next(lines, None)
+    if first is None:
+        return iter(())
+
+    def rest() -> Iterator[bytes]:
+        yield first
+        yield from lines
+    return Closing(rest(), lines.close)
+
+
+class Compute:
+    """
+    Interfaz común: `open` devuelve los trozos del resultado, `run` el
+    resultado entero y `stream` las líneas de un trabajo de `STREAMS`.
+    `lane` es el carril del trabajo (no llega al trabajo como argumento).
+    """
+
+    mode = ""
+
+    def open(self, job: str, lane: str = INTERACTIVE, **args) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def stream(self, job: str, lane: str = INTERACTIVE, **args) -> Iterator[bytes]:
+        raise NotImplementedError
+
+    def run(self, job: str, lane: str = INTERACTIVE, **args) -> bytes:
+        return b"".join(self.open(job, lane, **args))
+
+    def health(self) -> Dict[str, Any]:
+        raise NotImplementedError
+
+    def publish(self, delta: Dict[str, Any]):
+        """Reparte un delta de ingesta a los suscriptores de todos los workers."""
+        raise NotImplementedError
+
+    def subscribe(self, stopping: threading.Event) -> Iterator[Dict[str, Any]]:
+        """Deltas de ingesta de todos los workers hasta que `stopping` se activa."""
+        raise NotImplementedError
+
+    def stop(self):
+        pass
+
+
+class LocalCompute(Compute):
+    """Trabajos en el proceso de la API (un solo worker)."""
+
+    mode = "local"
+
+    def open(self, job: str, lane: str = INTERACTIVE, **args) -> Iterator[bytes]:
+        from app.etl import jobs  # Importa Spark con el primer trabajo
+
+        if job not in jobs.JOBS:
+            raise ComputeError(404, f"Unknown compute job: {job}")
+        jobs.use_pool(lane)
+        profiling.attach()  # Corre en un hilo del pool: también se muestrea
+        return iter([orjson.dumps(jobs.JOBS[job](**args))])
+
+    def stream(self, job: str, lane: str = INTERACTIVE, **args) -> Iterator[bytes]:
+        from app.etl import jobs
+
+        if job not in jobs.STREAMS:
+            raise ComputeError(404, f"Unknown compute stream: {job}")
+        return prefetch(section_lines(self._pooled(jobs, lane, jobs.STREAMS[job](**args))))
+
+    @staticmethod
+    def _pooled(jobs, lane: str, sections: Iterator[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """Cada sección puede calcularse en otro hilo del pool: el pool de Spark se fija en cada paso."""
+        try:
+            while True:
+                jobs.use_pool(lane)
+                profiling.attach()
+                try:
+                    section = next(sections)
+                except StopIteration:
+                    return
+                yield section
+        finally:
+            sections.close()
+
+    def health(self) -> Dict[str, Any]:
+        health = {"status": "ok", "mode": self.mode}
+        if "app.etl.jobs" in sys.modules:  # Sin trabajos aún no hay SparkSession
+            try:
+                health["spark"] = sys.modules["app.etl.jobs"].storage()
+            except Exception as e:
+                health["spark"] = {"error": str(e)}
+        return health
+
+    def stop(self):
+        if "app.etl.jobs" in sys.modules:
+            sys.modules["app.etl.jobs"].stop()
+
+
+class RemoteCompute(Compute):
+    """Trabajos enviados al proceso de cómputo compartido (una conexión por trabajo)."""
+
+    mode = "remote"
+
+    def __init__(self, address: str, authkey: Optional[bytes], timeout: float):
+        self.address = address
+        self.authkey = authkey
+        self.timeout = timeout
+
+    def _request(self, message: Dict[str, Any]) -> Tuple[Connection, Dict[str, Any]]:
+        """Envía la petición y espera la cabecera de respuesta (el trabajo ya terminó)."""
+        try:
+            conn = Client(self.address, family="AF_UNIX", authkey=self.authkey)
+        except (OSError, EOFError, AuthenticationError) as e:
+            raise ComputeError(503, f"Compute process unavailable: {e}")
+        try:
+            conn.send_bytes(orjson.dumps(message))
+            if not conn.poll(self.timeout):
+                raise ComputeError(504, f"Compute job timed out after {self.timeout:.0f}s")
+            header = orjson.loads(conn.recv_bytes())
+        except (OSError, EOFError) as e:
+            conn.close()
+            raise ComputeError(503, f"Compute process connection lost: {e}")
+        except Exception:
+            conn.close()
+            raise
+        if header.get("status") != 200:
+            conn.close()
+            raise ComputeError(header.get("status", 500), header.get("error", "Compute job failed"))
+        return conn, header
+
+    def open(self, job: str, lane: str = INTERACTIVE, **args) -> Iterator[bytes]:
+        """Ejecuta el trabajo; los errores se lanzan aquí, los trozos se leen al iterar."""
+        session = profiling.current()
+        conn, header = self._request({"op": "run", "job": job, "lane": lane, "args": args,
+                                      "profile": session is not None})
+        if session is not None and header.get("profile"):
+            profiling.merge(session, header["profile"])
+        return Closing(self._chunks(conn, header["chunks"]), conn.close)
+
+    @staticmethod
+    def _chunks(conn: Connection, count: int) -> Iterator[bytes]:
+        try:
+            for _ in range(count):
+                yield conn.recv_bytes()
+        finally:
+            conn.close()
+
+    def stream(self, job: str, lane: str = INTERACTIVE, **args) -> Iterator[bytes]:
+        """Espera la primera sección; el resto se lee al iterar (cada una con `timeout`)."""
+        session = profiling.current()
+        conn, _ = self._request({"op": "stream", "job": job, "lane": lane, "args": args,
+                                 "profile": session is not None})
+        return Closing(self._lines(conn, session), conn.close)
+
+    def _lines(self, conn: Connection, session: Optional[profiling.ProfileSession] = None) -> Iterator[bytes]:
+        try:
+            while True:
+                if not conn.poll(self.timeout):
+                    yield error_line(f"Compute stream timed out after {self.timeout:.0f}s")
+                    return
+                line = conn.recv_bytes()
+                if not line:
+                    if session is not None and conn.poll(self.timeout):
+                        profiling.merge(session, orjson.loads(conn.recv_bytes()))
+                    return
+                yield line
+        except (OSError, EOFError) as e:
+            yield error_line(f"Compute process connection lost: {e}")
+        finally:
+            conn.close()
+
+    def health(self) -> Dict[str, Any]:
+        try:
+            conn, header = self._request({"op": "health"})
+            conn.close()
+            return {**header["health"], "mode": self.mode}
+        except ComputeError as e:
+            return {"status": "unavailable", "mode": self.mode, "error": str(e)}
+
+    def publish(self, delta: Dict[str, Any]):
+        conn, _ = self._request({**delta, "op": "publish"})
+        conn.close()
+
+    def subscribe(self, stopping: threading.Event) -> Iterator[Dict[str, Any]]:
+        """El primer delta trae solo los agregados actuales; un corte lanza ComputeError."""
+        conn, _ = self._request({"op": "subscribe"})
+        try:
+            while not stopping.is_set():
+                if conn.poll(1.0):
+                    yield orjson.loads(conn.recv_bytes())
+        except (OSError, EOFError) as e:
+            raise ComputeError(503, f"Compute process connection lost: {e}")
+        finally:
+            conn.close()
+
+    def stop(self):
+        """El proceso de cómputo lo detiene `serve.py`."""
+
+
+def create_compute(mode: str = None) -> Compute:
+    mode = mode or config.COMPUTE_MODE
+    if mode == "local":
+        return LocalCompute()
+    if mode == "remote":
+        authkey = config.COMPUTE_AUTHKEY.encode() if config.COMPUTE_AUTHKEY else None
+        return RemoteCompute(config.COMPUTE_SOCKET, authkey, config.COMPUTE_TIMEOUT)
+    raise ValueError(f"Unknown COMPUTE_MODE: {mode}")
+
+
+# Singleton instance
+compute = create_compute()
@@ -0,0 +1,350 @@
+"""
+Proceso de cómputo: la única SparkSession en modo producción.
+
+Atiende a los workers de la API por un socket Unix (`COMPUTE_SOCKET`): cada
+trabajo entra en la cola acotada de su carril (`COMPUTE_QUEUE_SIZE`; llena ->
+503) y lo ejecuta uno de los hilos del carril sobre la misma SparkSession
+(Spark reparte los jobs concurrentes entre los núcleos):
+- `interactive`: `COMPUTE_CONCURRENCY` hilos, pool FAIR `default`
+- `heavy` (peticiones caras, ver `app.services.admission`):
+  `COMPUTE_HEAVY_CONCURRENCY` hilos, pool FAIR `heavy`, de menos peso
+
+El resultado de un trabajo se serializa una vez y se devuelve en trozos (ver `compute` para el protocolo); el de un
+stream, sección a sección mientras el trabajo avanza. La petición `health` se
+responde sin pasar por la cola. Un trabajo de una petición perfilada se
+ejecuta bajo una sesión de `app.profiling` y su perfil vuelve con el resultado.
+
+También reparte la ingesta en vivo entre workers (`LiveHub`): cada worker
+publica sus deltas (`publish`) y mantiene una conexión `subscribe` por la que
+recibe los de todos, con los agregados globales.
+
+Uso (normalmente lo arranca `serve.py`):
+    python -m app.etl.compute_server
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from concurrent.futures import Future
+from multiprocessing.connection import Connection, Listener
+from app import profiling
+from app.config import config
+from app.etl.compute import INTERACTIVE, HEAVY, LANES, section_lines, split_chunks
+from app.services.ingest_service import LiveAggregates
+import logging
+import os
+import queue
+import signal
+import threading
+import time
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Un delta de ingesta lleva hasta 2 x WS_DELTA_MAX_POINTS filas
+MAX_REQUEST_BYTES = 8 << 20
+LIVE_BACKLOG = 256
+
+
+class LiveHub:
+    """
+    Agregados en vivo de todos los workers y una cola acotada por suscriptor.
+    Un suscriptor atrasado pierde deltas (no frena a los demás ni al publicador).
+    """
+
+    def __init__(self, backlog: int = LIVE_BACKLOG):
+        self.backlog = backlog
+        self.aggregates = LiveAggregates()
+        self.dropped = 0
+        self._subscribers: "List[queue.Queue[bytes]]" = []
+        self._lock = threading.Lock()
+
+    def publish(self, delta: Dict[str, Any]):
+        with self._lock:
+            # Bajo el lock: todos los suscriptores reciben los deltas en el mismo orden
+            self.aggregates.apply(delta["summary"])
+            event = orjson.dumps({
+                "count": delta["count"], "rows": delta["rows"],
+                "rejected_count": delta["rejected_count"], "rejected": delta["rejected"],
+                "aggregates": self.aggregates.snapshot(),
+            })
+            for pending in self._subscribers:
+                try:
+                    pending.put_nowait(event)
+                except queue.Full:
+                    self.dropped += 1
+
+    def subscribe(self) -> "Tuple[queue.Queue[bytes], bytes]":
+        """Cola del suscriptor y un primer delta vacío con los agregados actuales."""
+        pending: "queue.Queue[bytes]" = queue.Queue(maxsize=self.backlog)
+        with self._lock:
+            self._subscribers.append(pending)
+            current = orjson.dumps({"count": 0, "rows": [], "rejected_count": 0, "rejected": [],
+                                    "aggregates": self.aggregates.snapshot()})
+        return pending, current
+
+    def unsubscribe(self, pending: "queue.Queue[bytes]"):
+        with self._lock:
+            self._subscribers.remove(pending)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "dropped": self.dropped}
+
+
+class ComputeServer:
+    """Una cola de trabajos y sus hilos ejecutores por carril + un hilo por conexión de worker."""
+
+    def __init__(self, address: str, authkey: bytes, concurrency: int, queue_size: int,
+                 heavy_concurrency: int = 1):
+        self.address = address
+        self.authkey = authkey
+        self.concurrency = concurrency
+        self.heavy_concurrency = heavy_concurrency
+        # (trabajo, argumentos, resultado, perfil: dict a rellenar si la petición está perfilada)
+        self.queues: "Dict[str, queue.Queue[Tuple[Callable, Dict[str, Any], Future, Optional[Dict]]]]" = {
+            lane: queue.Queue(maxsize=queue_size) for lane in LANES
+        }
+        self.jobs = None
+        self.started = time.monotonic()
+        self.counts = {"running": 0, "completed": 0, "failed": 0, "rejected": 0}
+        self.live = LiveHub()
+        self._lock = threading.Lock()
+
+    def _count(self, name: str, delta: int = 1):
+        with self._lock:
+            self.counts[name] += delta
+
+    def serve_forever(self):
+        from app.etl import jobs  # Crea la SparkSession de este proceso
+
+        self.jobs = jobs
+        threads = {INTERACTIVE: self.concurrency, HEAVY: max(1, self.heavy_concurrency)}
+        for lane, count in threads.items():
+            for i in range(count):
+                threading.Thread(target=self._work, args=(lane,), name=f"compute-{lane}-{i}", daemon=True).start()
+
+        if os.path.exists(self.address):
+            os.remove(self.address)  # Socket de una ejecución anterior
+        with Listener(self.address, family="AF_UNIX", authkey=self.authkey) as listener:
+            os.chmod(self.address, 0o600)
+            logger.info(f"✓ Compute process listening on {self.address} "
+                        f"(concurrency={self.concurrency}+{self.heavy_concurrency} heavy, "
+                        f"queue={self.queues[INTERACTIVE].maxsize})")
+            while True:
+                try:
+                    conn = listener.accept()
+                except Exception as e:  # Autenticación fallida o conexión cortada
+                    logger.warning(f"Rejected compute connection: {e}")
+                    continue
+                threading.Thread(target=self._handle, args=(conn,), daemon=True).start()
+
+    def health(self) -> Dict[str, Any]:
+        with self._lock:
+            counts = dict(self.counts)
+        try:
+            spark = self.jobs.storage() if self.jobs is not None else None
+        except Exception as e:
+            spark = {"error": str(e)}
+        return {
+            "status": "ok",
+            "pid": os.getpid(),
+            "uptime_s": round(time.monotonic() - self.started, 1),
+            "queued": {lane: q.qsize() for lane, q in self.queues.items()},
+            "queue_size": self.queues[INTERACTIVE].maxsize,
+            "concurrency": self.concurrency,
+            "heavy_concurrency": self.heavy_concurrency,
+            **counts,
+            "live": self.live.stats(),
+            "spark": spark,
+        }
+
+    def _handle(self, conn: Connection):
+        try:
+            with conn:
+                request = orjson.loads(conn.recv_bytes(MAX_REQUEST_BYTES))
+                op = request.get("op")
+                if op == "health":
+                    self._send(conn, {"status": 200, "chunks": 0, "health": self.health()})
+                elif op == "run":
+                    self._run(conn, request.get("job"), self._queue(request), request.get("args") or {},
+                              request.get("profile", False))
+                elif op == "stream":
+                    self._stream(conn, request.get("job"), self._queue(request), request.get("args") or {},
+                                 request.get("profile", False))
+                elif op == "publish":
+                    self.live.publish(request)
+                    self._send(conn, {"status": 200, "chunks": 0})
+                elif op == "subscribe":
+                    self._subscribe(conn)
+                else:
+                    self._send(conn, {"status": 400, "error": f"Unknown compute op: {op}"})
+        except (OSError, EOFError):
+            pass  # El worker cerró la conexión (p. ej. por timeout)
+        except Exception as e:
+            logger.error(f"Error handling compute request: {e}")
+
+    def _queue(self, request: Dict[str, Any]) -> queue.Queue:
+        """Cola del carril pedido (los workers anteriores a los carriles no lo envían)."""
+        return self.queues.get(request.get("lane"), self.queues[INTERACTIVE])
+
+    def _run(self, conn: Connection, name: str, pending: queue.Queue, args: Dict[str, Any], profile: bool):
+        job = self.jobs.JOBS.get(name)
+        if job is None:
+            self._send(conn, {"status": 404, "error": f"Unknown compute job: {name}"})
+            return
+        future: Future = Future()
+        trace = {} if profile else None
+        try:
+            pending.put_nowait((job, args, future, trace))
+        except queue.Full:
+            self._count("rejected")
+            self._send(conn, {"status": 503, "error": "Compute queue is full"})
+            return
+        try:
+            payload = future.result()
+        except Exception as e:
+            self._send(conn, {"status": 500, "error": str(e)})
+            return
+        chunks = list(split_chunks(payload))
+        header = {"status": 200, "chunks": len(chunks), "bytes": len(payload)}
+        if trace:
+            header["profile"] = trace
+        self._send(conn, header)
+        for chunk in chunks:
+            conn.send_bytes(chunk)
+
+    def _stream(self, conn: Connection, name: str, pending: queue.Queue, args: Dict[str, Any], profile: bool):
+        """Como `_run`, pero reenvía cada sección en cuanto el hilo ejecutor la deja en `lines`."""
+        job = self.jobs.STREAMS.get(name)
+        if job is None:
+            self._send(conn, {"status": 404, "error": f"Unknown compute stream: {name}"})
+            return
+        lines: "queue.Queue[Optional[bytes]]" = queue.Queue()
+        closed = threading.Event()
+
+        def produce(**kwargs) -> None:
+            try:
+                sections = section_lines(job(**kwargs))
+                for line in sections:
+                    if closed.is_set():  # El worker cortó: no calcular el resto
+                        sections.close()
+                        break
+                    lines.put(line)
+            finally:
+                lines.put(None)
+
+        produce.__name__ = job.__name__
+        future: Future = Future()
+        trace = {} if profile else None
+        try:
+            pending.put_nowait((produce, args, future, trace))
+        except queue.Full:
+            self._count("rejected")
+            self._send(conn, {"status": 503, "error": "Compute queue is full"})
+            return
+        try:
+            line = lines.get()
+            if line is None:
+                try:
+                    future.result()
+                except Exception as e:
+                    self._send(conn, {"status": 500, "error": str(e)})
+                    return
+            self._send(conn, {"status": 200, "stream": True})
+            while line is not None:
+                conn.send_bytes(line)
+                line = lines.get()
+            conn.send_bytes(b"")
+            if trace is not None:
+                # El perfil se completa al terminar el trabajo, después de la última sección
+                try:
+                    future.result()
+                except Exception:
+                    pass
+                self._send(conn, trace)
+        finally:
+            closed.set()
+
+    def _subscribe(self, conn: Connection):
+        """Conexión abierta mientras viva el worker: un mensaje por delta."""
+        pending, current = self.live.subscribe()
+        try:
+            self._send(conn, {"status": 200, "live": True})
+            conn.send_bytes(current)
+            while True:
+                conn.send_bytes(pending.get())
+        finally:
+            self.live.unsubscribe(pending)
+
+    @staticmethod
+    def _send(conn: Connection, header: Dict[str, Any]):
+        conn.send_bytes(orjson.dumps(header))
+
+    def _work(self, lane: str):
+        # Propiedad local del hilo: todos sus jobs van al pool FAIR del carril
+        self.jobs.use_pool(lane)
+        pending = self.queues[lane]
+        while True:
+            job, args, future, trace = pending.get()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self._count("running")
+            session = profiling.start("JOB", job.__name__) if trace is not None else None
+            try:
+                payload = orjson.dumps(job(**args))
+            except Exception as e:
+                logger.error(f"Compute job {job.__name__} failed: {e}")
+                self._trace(session, trace)
+                future.set_exception(e)
+                self._count("failed")
+            else:
+                # Antes del resultado: quien lo espera envía el perfil con él
+                self._trace(session, trace)
+                future.set_result(payload)
+                self._count("completed")
+            finally:
+                self._count("running", -1)
+
+    @staticmethod
+    def _trace(session: Optional[profiling.ProfileSession], trace: Optional[Dict[str, Any]]):
+        if session is not None:
+            # Ida y vuelta por JSON: los valores de los eventos de Spark (Py4J) se vuelven texto
+            trace.update(orjson.loads(orjson.dumps(profiling.collect(session), default=str)))
+
+
+def _terminate(signum, frame):
+    raise SystemExit(0)
+
+
+def main():
+    logging.basicConfig(
+        level=logging.INFO,
+        format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+    )
+    if config.COMPUTE_METRICS_PORT:
+        # Métricas de Spark y de etapas de este proceso (los workers no ejecutan Spark)
+        from prometheus_client import start_http_server
+        start_http_server(config.COMPUTE_METRICS_PORT)
+        logger.info(f"✓ Compute metrics on :{config.COMPUTE_METRICS_PORT}/metrics")
+
+    # SIGTERM (serve.py) -> salida ordenada: detener Spark y borrar el socket
+    signal.signal(signal.SIGTERM, _terminate)
+    server = ComputeServer(
+        config.COMPUTE_SOCKET,
+        config.COMPUTE_AUTHKEY.encode() if config.COMPUTE_AUTHKEY else None,
+        config.COMPUTE_CONCURRENCY,
+        config.COMPUTE_QUEUE_SIZE,
+        config.COMPUTE_HEAVY_CONCURRENCY,
+    )
+    try:
+        server.serve_forever()
+    except (KeyboardInterrupt, SystemExit):
+        pass
+    finally:
+        if server.jobs is not None:
+            server.jobs.stop()
+        if os.path.exists(config.COMPUTE_SOCKET):
+            os.remove(config.COMPUTE_SOCKET)
+        logger.info("✓ Compute process stopped")
+
+
+if __name__ == "__main__":
+    main()
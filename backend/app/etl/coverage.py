@@ -0,0 +1,131 @@
+"""
+Cálculo incremental de la cobertura interpolada (ver `app.services.coverage`).
+
+Se ejecuta en el proceso de cómputo (trabajo `coverage_refresh`). Para cada
+tesela y operadora se leen del almacén de puntos las mediciones cercanas y se
+calcula su huella; solo las teselas con huella nueva se envían a un pool de
+procesos (`COVERAGE_WORKERS`, arranque `spawn` para no heredar la JVM de
+Spark). El resto reutiliza el resultado guardado en disco.
+"""
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from app.config import config
+from app.services.boundaries import BBox, boundary_index, union_bbox
+from app.services.coverage import CoverageStore, Grid, coverage_store, fingerprint, interpolate_tile, tile_inputs
+from app.services.filters import parse_bbox
+from app.services.point_store import StoreView
+from app import metrics
+from array import array
+import logging
+import multiprocessing
+import secrets
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+
+def coverage_bbox() -> Optional[BBox]:
+    """Extensión de la rejilla: `COVERAGE_BBOX` o, si no se define, la de los límites de Santa Cruz."""
+    if config.COVERAGE_BBOX:
+        return parse_bbox(config.COVERAGE_BBOX)
+    return union_bbox(boundary_index.regions)
+
+
+class CoverageRunner:
+    """Refrescos serializados de la superficie; el pool se crea con el primero que lo necesita."""
+
+    def __init__(self, store: CoverageStore, workers: int):
+        self.store = store
+        self.workers = workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+
+    def params(self) -> Dict[str, Any]:
+        return {
+            "radius_km": config.COVERAGE_RADIUS_KM,
+            "neighbors": config.COVERAGE_NEIGHBORS,
+            "power": config.COVERAGE_POWER,
+        }
+
+    def refresh(self, view: StoreView, force: bool = False) -> Dict[str, Any]:
+        """Recalcula las teselas cuyas entradas cambiaron; devuelve el resumen del refresco."""
+        with self._lock:
+            bbox = coverage_bbox()
+            if bbox is None:
+                return {"success": False, "code": 503, "error": "Coverage area is not available"}
+            grid = Grid.covering(bbox, config.COVERAGE_CELL_DEG, config.COVERAGE_TILE_CELLS)
+            current = self.store.manifest()
+            params = self.params()
+            same_setup = current is not None and current["params"] == params and current["grid"] == grid.to_dict()
+            if not force and same_setup and current["version"] == view.version:
+                return self._summary(current, recomputed=0, seconds=0.0)
+
+            start = time.perf_counter()
+            tiles: Dict[str, Dict[str, str]] = {}
+            tasks, keys = [], []
+            with metrics.stage("coverage_plan"):
+                for tx, ty in grid.tiles():
+                    for operator, points in tile_inputs(view, grid, tx, ty, params["radius_km"]).items():
+                        key = fingerprint({**params, "grid": grid.to_dict()}, operator, tx, ty, points)
+                        tiles.setdefault(operator, {})[f"{tx},{ty}"] = key
+                        if force or not self.store.has_tile(key):
+                            keys.append(key)
+                            tasks.append((grid.to_dict(), tx, ty, array("d", [v for p in points for v in p]).tobytes(),
+                                          params["radius_km"], params["neighbors"], params["power"]))
+
+            with metrics.stage("coverage_interpolate"):
+                for key, (value, confidence) in zip(keys, self._map(tasks)):
+                    self.store.write_tile(key, value, confidence)
+
+            unchanged = same_setup and current["tiles"] == tiles
+            manifest = {
+                "build": current["build"] if unchanged else secrets.token_hex(8),
+                "version": view.version,
+                "params": params,
+                "grid": grid.to_dict(),
+                "tiles": tiles,
+                "updated_at": time.time(),
+            }
+            self.store.publish(manifest)
+            seconds = time.perf_counter() - start
+            logger.info(f"📶 Coverage refreshed: {len(keys)} tiles recomputed ({seconds:.2f}s)")
+            return self._summary(manifest, recomputed=len(keys), seconds=seconds)
+
+    @staticmethod
+    def _summary(manifest: Dict[str, Any], recomputed: int, seconds: float) -> Dict[str, Any]:
+        grid = manifest["grid"]
+        total = sum(len(tiles) for tiles in manifest["tiles"].values())
+        return {
+            "success": True,
+            "build": manifest["build"],
+            "operators": sorted(manifest["tiles"]),
+            "grid": {"cols": grid["cols"], "rows": grid["rows"], "tile": grid["tile"],
+                     "cell_deg": grid["cell_deg"]},
+            "recomputed": recomputed,
+            "reused": total - recomputed,
+            "seconds": round(seconds, 3),
+        }
+
+    def _map(self, tasks: List[Tuple[Any, ...]]) -> Iterable[Tuple[bytes, bytes]]:
+        """Interpola las teselas en el pool (o aquí mismo si hay una sola o `COVERAGE_WORKERS=1`)."""
+        if self.workers <= 1 or len(tasks) <= 1:
+            return map(interpolate_tile, tasks)
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context("spawn"))
+        try:
+            return list(self._pool.map(interpolate_tile, tasks))
+        except BrokenProcessPool:
+            # Un proceso del pool murió (p. ej. sin memoria): el siguiente refresco crea otro
+            self._pool = None
+            raise
+
+    def stop(self):
+        if self._pool is not None:
+            self._pool.shutdown(cancel_futures=True)
+            self._pool = None
+
+
+# Singleton instance
+coverage_runner = CoverageRunner(coverage_store, config.COVERAGE_WORKERS)
@@ -0,0 +1,198 @@
+"""
+Exportaciones masivas con Spark en segundo plano.
+
+Un solo hilo, con cola acotada (`EXPORT_QUEUE_SIZE`), lee la fuente por
+páginas keyset de `EXPORT_CHUNK_ROWS` filas (todas cuestan lo mismo, como el
+cursor de `/signals`), aplica el residual sobre cada lote y Spark las escribe
+en modo append como Parquet o CSV gzip, particionado si se pide. Los jobs van al pool FAIR
+`exports` (`fairscheduler.xml`), que pesa menos que el de las rutas
+interactivas, y al grupo de jobs de la exportación: el progreso sale del
+status tracker de Spark y `cancel` interrumpe el job en curso. Al terminar,
+la salida se empaqueta en un zip sin recomprimir.
+"""
+from typing import Any, Dict, List, Optional
+from app.services.exports import ACTIVE, ARCHIVE, FORMATS, PARTITION_COLUMNS, ExportStore, export_store, now_iso
+from app.services.filters import SignalFilter, apply_to_batch
+from app.services.supabase_service import supabase_service
+from app.etl.spark_pipeline import spark_etl_service
+from app.config import config
+import logging
+import os
+import queue
+import shutil
+import threading
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+EXPORT_POOL = "exports"
+PROGRESS_INTERVAL = 1.0  # segundos entre actualizaciones de progreso
+
+
+class ExportCancelled(Exception):
+    pass
+
+
+class ExportRunner:
+    """Cola de exportaciones + hilo que las ejecuta una a una."""
+
+    def __init__(self, store: ExportStore, queue_size: int, chunk_rows: int):
+        self.store = store
+        self.chunk_rows = chunk_rows
+        self.queue: "queue.Queue[str]" = queue.Queue(maxsize=queue_size)
+        self.cancelled = set()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        # Las que estaban en marcha cuando terminó el proceso anterior no se reanudan
+        for status in store.list():
+            if status["status"] in ACTIVE:
+                store.update(status["id"], status="failed", error="Interrupted by a restart",
+                             finished_at=now_iso())
+
+    def start(self, filters: Dict[str, Any], format: str = "parquet",
+              partition_by: Optional[List[str]] = None) -> Dict[str, Any]:
+        """Valida y encola; devuelve el estado inicial (o `success: False` si no se acepta)."""
+        partition_by = list(dict.fromkeys(partition_by or []))
+        if format not in FORMATS:
+            return {"success": False, "code": 400, "error": f"format must be one of {', '.join(FORMATS)}"}
+        unknown = [c for c in partition_by if c not in PARTITION_COLUMNS]
+        if unknown:
+            return {"success": False, "code": 400,
+                    "error": f"partition_by must be in {', '.join(PARTITION_COLUMNS)}"}
+
+        self.store.expire()
+        status = self.store.create(format=format, partition_by=partition_by, filters=filters)
+        try:
+            self.queue.put_nowait(status["id"])
+        except queue.Full:
+            self.store.remove(status["id"])
+            return {"success": False, "code": 503, "error": "Export queue is full, retry later"}
+        self._ensure_thread()
+        return {"success": True, **status}
+
+    def cancel(self, export_id: str) -> Dict[str, Any]:
+        """Cancela una exportación en cola o en curso; si ya terminó, borra sus ficheros."""
+        status = self.store.read(export_id)
+        if status is None:
+            return {"success": False, "code": 404, "error": "Export not found"}
+        if status["status"] in ACTIVE:
+            self.cancelled.add(export_id)
+            spark_etl_service.spark.sparkContext.cancelJobGroup(export_id)
+            status = self.store.update(export_id, status="cancelled", finished_at=now_iso())
+        else:
+            self.store.remove(export_id)
+            status = {**status, "status": "deleted"}
+        return {"success": True, **status}
+
+    def _ensure_thread(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="exports", daemon=True)
+                self._thread.start()
+
+    def _work(self):
+        sc = spark_etl_service.spark.sparkContext
+        # Propiedades locales del hilo: todos los jobs de este hilo van al pool de exportaciones
+        sc.setLocalProperty("spark.scheduler.pool", EXPORT_POOL)
+        while True:
+            export_id = self.queue.get()
+            if export_id in self.cancelled:
+                self.cancelled.discard(export_id)
+                continue
+            try:
+                self._run(export_id)
+            except ExportCancelled:
+                shutil.rmtree(self.store.path(export_id, "data"), ignore_errors=True)
+                # Por si un cambio de estado posterior a `cancel` lo sobrescribió
+                self.store.update(export_id, status="cancelled")
+                logger.info(f"Export {export_id} cancelled")
+            except Exception as e:
+                if export_id in self.cancelled:
+                    # El job se interrumpió por `cancel`
+                    shutil.rmtree(self.store.path(export_id, "data"), ignore_errors=True)
+                    logger.info(f"Export {export_id} cancelled")
+                else:
+                    logger.error(f"Export {export_id} failed: {e}")
+                    self.store.update(export_id, status="failed", error=str(e), finished_at=now_iso())
+            finally:
+                self.cancelled.discard(export_id)
+
+    def _run(self, export_id: str):
+        status = self.store.update(export_id, status="running", started_at=now_iso())
+        sc = spark_etl_service.spark.sparkContext
+        sc.setJobGroup(export_id, f"export {export_id}", interruptOnCancel=True)
+
+        signal_filter = SignalFilter.from_dict(status["filters"])
+        plan = supabase_service.compile_filters(signal_filter)
+        # Sin filtros el total se conoce de antemano; con filtros solo al terminar
+        total = supabase_service.get_total_count() if signal_filter.is_empty() else None
+        output = self.store.path(export_id, "data")
+
+        stop = threading.Event()
+        watcher = threading.Thread(target=self._watch, args=(export_id, stop), daemon=True)
+        watcher.start()
+        rows = read = 0
+        after = None
+        try:
+            while not plan.matches_nothing:
+                if export_id in self.cancelled:
+                    raise ExportCancelled()
+                # Directo a la fuente: un error de lectura debe fallar la exportación, no truncarla
+                batch, last = supabase_service.source.fetch_page(plan.pushed, self.chunk_rows, after)
+                if batch.size == 0:
+                    break
+                read += batch.size
+                if plan.residual:
+                    # Sobre el lote (p. ej. polígonos): el conteo no vuelve a evaluar un UDF en Spark
+                    apply_to_batch(batch, plan.residual)
+                if batch:
+                    df = spark_etl_service.create_dataframe(batch)
+                    spark_etl_service.write_export(df, output, status["format"], status["partition_by"])
+                    df.unpersist()
+                    rows += len(batch)
+                self.store.update(export_id, rows=rows,
+                                  progress=round(min(read / total, 0.99), 4) if total else None)
+                if batch.size < self.chunk_rows:
+                    break
+                after = last
+        finally:
+            stop.set()
+            watcher.join()
+
+        if export_id in self.cancelled:
+            raise ExportCancelled()
+        self.store.update(export_id, status="packaging")
+        size = self._package(export_id, output)
+        if export_id in self.cancelled:
+            # Cancelada mientras se empaquetaba: no se publica como terminada
+            os.remove(self.store.path(export_id, ARCHIVE))
+            raise ExportCancelled()
+        self.store.update(export_id, status="done", rows=rows, progress=1.0, bytes=size,
+                          finished_at=now_iso(), tasks=None)
+        logger.info(f"✓ Export {export_id} done: {rows} rows, {size} bytes")
+
+    def _watch(self, export_id: str, stop: threading.Event):
+        """Progreso de las tareas Spark en curso de la exportación."""
+        while not stop.wait(PROGRESS_INTERVAL):
+            done, total = spark_etl_service.job_group_progress(export_id)
+            if total:
+                self.store.update(export_id, tasks={"done": done, "total": total})
+
+    def _package(self, export_id: str, output: str) -> int:
+        """Zip (sin recomprimir: Parquet y CSV gzip ya lo están) sin los ficheros de control de Spark."""
+        archive = self.store.path(export_id, ARCHIVE)
+        tmp = archive + ".tmp"
+        with zipfile.ZipFile(tmp, "w", compression=zipfile.ZIP_STORED, allowZip64=True) as zf:
+            for root, _, files in os.walk(output):
+                for name in sorted(files):
+                    if name.startswith(("_", ".")):
+                        continue  # _SUCCESS, .crc
+                    path = os.path.join(root, name)
+                    zf.write(path, os.path.relpath(path, output))
+        os.replace(tmp, archive)
+        shutil.rmtree(output, ignore_errors=True)
+        return os.path.getsize(archive)
+
+
+# Singleton instance
+export_runner = ExportRunner(export_store, config.EXPORT_QUEUE_SIZE, config.EXPORT_CHUNK_ROWS)
@@ -0,0 +1,252 @@
+"""
+Trabajos de Spark que exponen las rutas.
+
+Cada trabajo recibe argumentos serializables (el filtro como dict canónico
+de `SignalFilter.to_key`) y devuelve el payload JSON de la respuesta. Así se
+pueden ejecutar en el mismo proceso o enviarse al proceso de cómputo
+(`compute_server`) sin cambiar nada más. Los trabajos de `STREAMS` son
+generadores: cada sección que producen se envía en cuanto está lista.
+
+Con `sample > 1` (control de admisión, `app.services.admission`) los
+análisis se calculan sobre una muestra ponderada y el payload lo indica con
+`approximate` y `sample_rate`.
+"""
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from contextlib import contextmanager
+from pyspark.sql import DataFrame
+from app.services.supabase_service import supabase_service
+from app.services.boundaries import boundary_index
+from app.services.filters import SignalFilter
+from app.etl.spark_pipeline import spark_etl_service
+from app.etl.exports import export_runner
+from app.etl.coverage import coverage_runner
+from app.services.point_index import point_index
+from app.services.compaction import compactor
+from app.etl.compute import HEAVY
+
+
+# Pool FAIR de Spark de cada carril del cómputo (`fairscheduler.xml`)
+LANE_POOLS = {HEAVY: "heavy"}
+DEFAULT_POOL = "default"
+
+
+EMPTY_AGGREGATE = {
+    "success": True,
+    "total_signals": 0,
+    "average_battery": 0,
+    "signals_by_company": {},
+    "signals_by_type": {},
+    "geographic_distribution": {}
+}
+
+
+def use_pool(lane: str):
+    """Los jobs de Spark que lance este hilo van al pool del carril."""
+    sc = spark_etl_service.spark.sparkContext
+    sc.setLocalProperty("spark.scheduler.pool", LANE_POOLS.get(lane, DEFAULT_POOL))
+
+
+@contextmanager
+def signal_frame(signal_filter: SignalFilter, sample: int = 1) -> Iterator[Optional[DataFrame]]:
+    """
+    DataFrame con las señales del filtro mientras dure el bloque (None si no
+    hay filas). Es una vista filtrada del dataset base de la versión actual;
+    si la tabla no cabe entera en él, lo filtrado se lee de la fuente y se
+    libera al salir. Las filas son las de la tabla compactada: la columna
+    `reports` dice cuántos reportes representa cada una (con `sample > 1`,
+    una muestra de 1 de cada `sample` filas con el peso multiplicado).
+    """
+    plan = supabase_service.compile_filters(signal_filter)
+    if plan.matches_nothing:
+        yield None
+        return
+
+    with spark_etl_service.dataset(supabase_service.watermark(), _load_dataset) as dataset:
+        if dataset.complete or signal_filter.is_empty():
+            predicates = plan.pushed + plan.residual
+            df = spark_etl_service.filter_dataframe(dataset.df, predicates) if predicates else dataset.df
+            yield spark_etl_service.sample_frame(df, sample) if dataset.rows else None
+            return
+
+    # Tabla mayor que el dataset base: la fuente filtra lo que puede
+    raw_data = supabase_service.read_signal_batch(plan, apply_residual=False, compacted=True)
+    if not raw_data:
+        yield None
+        return
+    cached = df = spark_etl_service.create_dataframe(raw_data)
+    try:
+        # Solo lo que la fuente no pudo filtrar (p. ej. polígonos de región)
+        if plan.residual:
+            df = spark_etl_service.filter_dataframe(df, plan.residual)
+        yield spark_etl_service.sample_frame(df, sample)
+    finally:
+        cached.unpersist()
+
+
+def _load_dataset(max_rows: int):
+    # Propaga errores: una lectura fallida no se registra como dataset vacío
+    return supabase_service.read_signal_batch(limit=max_rows, compacted=True)
+
+
+def approximate(payload: Dict[str, Any], sample: int) -> Dict[str, Any]:
+    """Marca el payload como estimado sobre una muestra (sin cambios si es exacto)."""
+    if sample > 1:
+        payload["approximate"] = True
+        payload["sample_rate"] = 1 / sample
+    return payload
+
+
+def aggregate(filters: Dict[str, Any], sample: int = 1) -> Dict[str, Any]:
+    """Estadísticas y análisis del dashboard (`POST /analytics/aggregate`)."""
+    signal_filter = SignalFilter.from_dict(filters)
+    with signal_frame(signal_filter, sample) as df:
+        if df is None:
+            return dict(EMPTY_AGGREGATE)
+        return approximate(aggregate_frame(df, signal_filter), sample)
+
+
+def aggregate_frame(df: DataFrame, signal_filter: SignalFilter,
+                    by_company: Optional[Dict[str, int]] = None,
+                    by_type: Optional[Dict[str, int]] = None) -> Dict[str, Any]:
+    """Payload de `aggregate` sobre un DataFrame ya cargado (reutiliza los conteos si se pasan)."""
+    # Calcular agregaciones básicas
+    stats = spark_etl_service.calculate_statistics(df)
+    if by_company is None:
+        by_company = spark_etl_service.aggregate_by_company(df)
+    if by_type is None:
+        by_type = spark_etl_service.aggregate_by_signal_type(df)
+    by_geography = spark_etl_service.aggregate_by_geography(df)
+
+    # Análisis avanzados
+    speed_by_operator = spark_etl_service.analyze_speed_by_operator(df)
+    signal_heatmap = spark_etl_service.analyze_signal_by_district(df)
+    coverage_analysis = spark_etl_service.analyze_coverage_by_operator(df)
+    district_analysis = spark_etl_service.analyze_by_district(df)
+
+    # Si no hay filtros, usar el conteo total real de la base de datos
+    if signal_filter.is_empty():
+        real_total = supabase_service.get_total_count()
+        if real_total > 0:
+            stats["total_signals"] = real_total
+
+    return {
+        "success": True,
+        "total_signals": stats["total_signals"],
+        "average_battery": stats["average_battery"],
+        "signals_by_company": by_company,
+        "signals_by_type": by_type,
+        "geographic_distribution": by_geography,
+        "statistics": stats,
+        # Análisis avanzados
+        "speed_by_operator": speed_by_operator,
+        "signal_heatmap": signal_heatmap,
+        "coverage_analysis": coverage_analysis,
+        "district_analysis": district_analysis
+    }
+
+
+def timeseries(filters: Dict[str, Any], interval: str = "hour", sample: int = 1) -> Dict[str, Any]:
+    """Serie temporal (`GET /analytics/timeseries`)."""
+    signal_filter = SignalFilter.from_dict(filters)
+    with signal_frame(signal_filter, sample) as df:
+        time_series = spark_etl_service.time_series_aggregation(df, interval) if df is not None else []
+
+    return approximate({
+        "success": True,
+        "interval": interval,
+        "data": time_series
+    }, sample)
+
+
+def dashboard(filters: Dict[str, Any], interval: str = "hour", points_limit: int = 60000,
+              seed: int = 42, sample: int = 1) -> Iterator[Dict[str, Any]]:
+    """
+    Todas las secciones del dashboard (`POST /dashboard`) sobre un único
+    DataFrame (ver `signal_frame`), sin volver a leer la fuente. Cada
+    sección se produce en cuanto está lista, primero las que el frontend pinta antes.
+    """
+    signal_filter = SignalFilter.from_dict(filters)
+    # También si el cliente corta el stream, al cerrar el generador se libera el DataFrame
+    with signal_frame(signal_filter, sample) as df:
+        if df is None:
+            yield {"section": "facets", "data": _facets({}, {})}
+            yield {"section": "stats", "data": dict(EMPTY_AGGREGATE)}
+            yield {"section": "points", "data": {"count": 0, "points": []}}
+            yield {"section": "timeseries", "data": {"interval": interval, "data": []}}
+            return
+
+        by_company = spark_etl_service.aggregate_by_company(df)
+        by_type = spark_etl_service.aggregate_by_signal_type(df)
+        yield {"section": "facets", "data": _facets(by_company, by_type)}
+
+        stats = aggregate_frame(df, signal_filter, by_company, by_type)
+        yield {"section": "stats", "data": approximate(stats, sample)}
+
+        # Filas contadas en el job de estadísticas: el muestreo no vuelve a contar
+        points = spark_etl_service.get_geographic_points(df, limit=points_limit, seed=seed,
+                                                         rows=stats["statistics"]["rows"])
+        yield {"section": "points", "data": {"count": len(points), "points": points}}
+
+        time_series = spark_etl_service.time_series_aggregation(df, interval)
+        yield {"section": "timeseries", "data": approximate({"interval": interval, "data": time_series}, sample)}
+
+
+def _facets(by_company: Dict[str, int], by_type: Dict[str, int]) -> Dict[str, Any]:
+    """Opciones de filtros (mismas claves que `/filters/options`) con conteos del filtro actual."""
+    return {
+        "provincias": boundary_index.names("provincia"),
+        "municipios": boundary_index.names("municipio"),
+        "empresas": sorted(by_company),
+        "tipos_senal": sorted(by_type),
+        "counts": {"empresas": by_company, "tipos_senal": by_type},
+    }
+
+
+def export_start(filters: Dict[str, Any], format: str = "parquet",
+                 partition_by: Optional[List[str]] = None) -> Dict[str, Any]:
+    """Encola una exportación (`POST /exports`); la ejecuta el hilo de `export_runner`."""
+    return export_runner.start(filters, format, partition_by)
+
+
+def export_cancel(export_id: str) -> Dict[str, Any]:
+    """Cancela o borra una exportación (`DELETE /exports/{id}`)."""
+    return export_runner.cancel(export_id)
+
+
+def storage() -> Dict[str, Any]:
+    """Uso de almacenamiento de Spark (`health` del proceso de cómputo)."""
+    return spark_etl_service.storage()
+
+
+def coverage_refresh(force: bool = False) -> Dict[str, Any]:
+    """Recalcula las teselas de cobertura afectadas por mediciones nuevas (`/map/coverage`)."""
+    return coverage_runner.refresh(point_index.view(), force)
+
+
+def compaction(full: bool = False) -> Dict[str, Any]:
+    """Compacta las filas crudas nuevas (`POST /compaction`) y rehace el almacén de puntos."""
+    result = compactor.run(full)
+    if result.get("merged_rows"):
+        point_index.invalidate()
+        point_index.view()  # Publica la generación nueva en disco: los workers la reabren
+    return result
+
+
+JOBS: Dict[str, Callable[..., Dict[str, Any]]] = {
+    "aggregate": aggregate,
+    "timeseries": timeseries,
+    "export_start": export_start,
+    "export_cancel": export_cancel,
+    "coverage_refresh": coverage_refresh,
+    "compaction": compaction,
+}
+
+STREAMS: Dict[str, Callable[..., Iterator[Dict[str, Any]]]] = {
+    "dashboard": dashboard,
+}
+
+
+def stop():
+    """Detiene la sesión de Spark y el pool de cobertura."""
+    coverage_runner.stop()
+    spark_etl_service.stop()
@@ -1,18 +1,111 @@
 """
 ETL Pipeline usando Apache Spark.
 Procesa datos de señales para análisis y agregaciones.
+
+El dataset base (ver `SparkETLService.dataset`) se persiste una vez por
+versión de los datos y las consultas filtran vistas derivadas de él; la
+versión anterior se libera cuando termina el último trabajo que la usa.
+
+Si las filas vienen de la tabla compactada, la columna `reports` dice
+cuántos reportes representa cada una: conteos y medias se ponderan con ella
+(sin la columna, cada fila cuenta uno).
 """
-from pyspark.sql import SparkSession, DataFrame
+from pyspark import StorageLevel
+from pyspark.sql import SparkSession, DataFrame, Row
 from pyspark.sql import functions as F
-from pyspark.sql.types import StructType, StructField, StringType, DoubleType, IntegerType, TimestampType
-from typing import List, Dict, Any
+from pyspark.sql.window import Window
+from pyspark.sql.types import StructType, StructField, StringType, DoubleType, IntegerType, TimestampType, BooleanType
+from typing import Callable, Iterator, List, Dict, Any, Optional, Sequence, Tuple, Union
+from contextlib import contextmanager
+from app.config import config
+from app.models.signal_batch import SignalBatch, COLUMNS as BATCH_COLUMNS
+from app.services.boundaries import contains_any
+from app.services.filters import Predicate
+from app import metrics, profiling
+import functools
 import logging
 import tempfile
+import threading
 import json
 import os
+import time
+
+try:
+    import numpy as np
+    import pandas as pd
+    import pyarrow  # noqa: F401 (Spark lo usa al convertir el DataFrame de pandas)
+except ImportError:  # Opcionales (extra `pyspark[sql]`): sin ellos el lote va como tuplas
+    np = None
+    pd = None
 
 logger = logging.getLogger(__name__)
 
+# Pools FAIR: las exportaciones (`exports`) y las peticiones caras (`heavy`) no acaparan
+# a las rutas interactivas
+SCHEDULER_POOLS = os.path.join(os.path.dirname(__file__), "fairscheduler.xml")
+# Caché columnar comprimida (en PySpark los bloques persistidos siempre van serializados);
+# lo que no cabe en memoria pasa a disco en vez de recalcularse
+STORAGE_LEVEL = StorageLevel.MEMORY_AND_DISK
+
+
+def reports(df: DataFrame):
+    """Peso de cada fila: reportes que representa (1 si no viene de la tabla compactada)."""
+    return F.col("reports") if "reports" in df.columns else F.lit(1)
+
+
+def weighted_avg(column: str, weight):
+    """Media de `column` ponderada por `weight`."""
+    return F.sum(F.col(column) * weight) / F.sum(weight)
+
+
+JOB_DESCRIPTION = "spark.job.description"
+JOB_GROUP = "spark.jobGroup.id"
+
+
+def instrumented(method):
+    """Mide el método como etapa `spark.<nombre>` y etiqueta sus jobs de Spark."""
+    name = method.__name__
+
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        sc = self.spark.sparkContext
+        # Llamadas anidadas: al salir se restaura lo del llamador, no se borra
+        outer_description = sc.getLocalProperty(JOB_DESCRIPTION)
+        outer_group = sc.getLocalProperty(JOB_GROUP)
+        sc.setJobDescription(name)
+        session = profiling.current()
+        if session is not None:
+            # Agrupa los jobs de esta petición para el informe de stages
+            call = session.begin_call(name)
+            sc.setLocalProperty(JOB_GROUP, session.id)
+            start = time.perf_counter()
+        try:
+            with metrics.stage(f"spark.{name}"):
+                return method(self, *args, **kwargs)
+        finally:
+            sc.setJobDescription(outer_description)
+            if session is not None:
+                call["seconds"] = round(time.perf_counter() - start, 6)
+                sc.setLocalProperty(JOB_GROUP, outer_group)
+    return wrapper
+
+
+class Dataset:
+    """Dataset base persistido de una versión de los datos; `leases` = trabajos que lo usan."""
+
+    def __init__(self, version: str, df: DataFrame, rows: int, complete: bool):
+        self.version = version
+        self.df = df
+        self.rows = rows
+        self.complete = complete  # False: la tabla tenía más filas que `SPARK_DATASET_MAX_ROWS`
+        self.leases = 0
+        self.retired = False
+        self.loaded_at = time.time()
+
+    def describe(self) -> Dict[str, Any]:
+        return {"version": self.version, "rows": self.rows, "complete": self.complete,
+                "leases": self.leases, "loaded_at": self.loaded_at}
+
 
 class SparkETLService:
     """Servicio ETL con Spark - YAGNI: solo transformaciones necesarias."""
@@ -24,15 +117,123 @@ class SparkETLService:
             .config("spark.driver.memory", "4g") \
             .config("spark.executor.memory", "4g") \
             .config("spark.sql.execution.arrow.pyspark.enabled", "true") \
+            .config("spark.scheduler.mode", "FAIR") \
+            .config("spark.scheduler.allocation.file", SCHEDULER_POOLS) \
+            .config("spark.sql.inMemoryColumnarStorage.compressed", "true") \
+            .config("spark.sql.inMemoryColumnarStorage.batchSize", str(config.SPARK_CACHE_BATCH_ROWS)) \
             .getOrCreate()
         
         self.spark.sparkContext.setLogLevel("WARN")
+        
+        if config.SPARK_METRICS_LISTENER:
+            metrics.register_spark_listener(self.spark.sparkContext)
+        
+        # Registro del dataset base: el actual y los retirados aún en uso
+        self._dataset: Optional[Dataset] = None
+        self._retired: List[Dataset] = []
+        self._datasets_lock = threading.Lock()
+        self._load_lock = threading.Lock()
+    
+    @contextmanager
+    def dataset(self, version: str, loader: Callable[[int], SignalBatch]) -> Iterator[Dataset]:
+        """
+        Dataset base de `version` mientras dure el bloque. Se carga y persiste
+        una sola vez por versión (`loader(max_rows)` lee la fuente; si falla,
+        el error se propaga y no se registra nada); al llegar una versión nueva
+        la anterior se retira y se libera en cuanto ningún trabajo la usa.
+        """
+        dataset = self._acquire(version, loader)
+        try:
+            yield dataset
+        finally:
+            self._release(dataset)
+    
+    def _lease(self, version: str) -> Optional[Dataset]:
+        with self._datasets_lock:
+            current = self._dataset
+            if current is not None and current.version == version:
+                current.leases += 1
+                return current
+        return None
+    
+    def _acquire(self, version: str, loader: Callable[[int], SignalBatch]) -> Dataset:
+        dataset = self._lease(version)
+        if dataset is not None:
+            return dataset
+        with self._load_lock:
+            # Otro trabajo pudo cargar esta versión mientras se esperaba
+            dataset = self._lease(version)
+            if dataset is not None:
+                return dataset
+            batch = loader(config.SPARK_DATASET_MAX_ROWS)
+            df = self.create_dataframe(batch)
+            dataset = Dataset(version, df, len(batch), batch.size < config.SPARK_DATASET_MAX_ROWS)
+            with self._datasets_lock:
+                previous, self._dataset = self._dataset, dataset
+                dataset.leases += 1
+                if previous is not None:
+                    previous.retired = True
+                    self._retired.append(previous)
+                    self._unpersist_idle()
+        logger.info(f"✓ Dataset {version} persisted ({dataset.rows} rows)")
+        self._report_storage()
+        return dataset
+    
+    def _release(self, dataset: Dataset):
+        with self._datasets_lock:
+            dataset.leases -= 1
+            freed = self._unpersist_idle()
+        if freed:
+            self._report_storage()
+    
+    def _unpersist_idle(self) -> int:
+        """Libera los datasets retirados sin trabajos en curso (con `_datasets_lock`)."""
+        idle = [d for d in self._retired if d.leases == 0]
+        for dataset in idle:
+            dataset.df.unpersist()
+            self._retired.remove(dataset)
+            logger.info(f"✓ Dataset {dataset.version} unpersisted")
+        return len(idle)
     
-    def create_dataframe(self, data: List[Dict[str, Any]]) -> DataFrame:
-        """Crea DataFrame de Spark desde datos de Supabase."""
+    def storage(self) -> Dict[str, Any]:
+        """Datasets registrados y bytes persistidos en memoria y disco (block manager)."""
+        memory = disk = partitions = 0
+        for info in self.spark.sparkContext._jsc.sc().getRDDStorageInfo():
+            memory += info.memSize()
+            disk += info.diskSize()
+            partitions += info.numCachedPartitions()
+        with self._datasets_lock:
+            current = self._dataset.describe() if self._dataset is not None else None
+            retired = [d.describe() for d in self._retired]
+        metrics.SPARK_CACHE_BYTES.labels(storage="memory").set(memory)
+        metrics.SPARK_CACHE_BYTES.labels(storage="disk").set(disk)
+        metrics.SPARK_DATASET_ROWS.set(current["rows"] if current else 0)
+        return {
+            "dataset": current,
+            "retired": retired,
+            "memory_bytes": memory,
+            "disk_bytes": disk,
+            "cached_partitions": partitions,
+        }
+    
+    def _report_storage(self):
+        try:
+            self.storage()
+        except Exception as e:
+            logger.warning(f"Could not read Spark storage info: {e}")
+    
+    @instrumented
+    def create_dataframe(self, data: Union[SignalBatch, List[Dict[str, Any]]]) -> DataFrame:
+        """
+        Crea DataFrame de Spark desde datos de Supabase, persistido y ya
+        materializado: el llamador lo libera con `unpersist()` (o usa `dataset`).
+        """
         if not data:
             return self.spark.createDataFrame([], self._get_schema())
         
+        if isinstance(data, SignalBatch):
+            return self._create_from_batch(data)
+        
         try:
             with tempfile.NamedTemporaryFile(mode='w', delete=False, suffix='.json', encoding='utf-8') as tmp:
                 for row in data:
@@ -46,7 +247,8 @@ class SparkETLService:
             
             # Forzar la lectura para asegurar que el archivo se procesa
             # Esto evita problemas de lazy evaluation si el archivo se borra o bloquea
-            df.cache()
+            df.persist(STORAGE_LEVEL)
+            profiling.capture_plan(df)
             count = df.count()
             logger.info(f"DataFrame created with {count} rows from temp file")
             
@@ -60,6 +262,59 @@ class SparkETLService:
                 logger.error(f"Error creating DataFrame directly: {e2}")
                 return self.spark.createDataFrame([], self._get_schema())
     
+    def _create_from_batch(self, batch: SignalBatch) -> DataFrame:
+        """
+        DataFrame desde un lote columnar con schema explícito (sin JSON
+        intermedio ni inferencia de tipos). Con pandas y pyarrow las columnas
+        pasan a Spark por Arrow sin crear un objeto por fila; si no, como
+        tuplas de las filas válidas.
+        """
+        columns = BATCH_COLUMNS + (("reports",) if "reports" in batch.numeric else ())
+        schema = self._get_batch_schema(columns)
+        if pd is not None:
+            df = self.spark.createDataFrame(self._batch_frame(batch, columns), schema)
+        else:
+            df = self.spark.createDataFrame(list(batch.iter_tuples(columns)), schema)
+        df.persist(STORAGE_LEVEL)
+        profiling.capture_plan(df)
+        count = df.count()
+        logger.info(f"DataFrame created with {count} rows from signal batch")
+        return df
+
+    def _batch_frame(self, batch: SignalBatch, columns: Sequence[str]) -> "pd.DataFrame":
+        """Columnas de las filas válidas como DataFrame de pandas (números sin copiar a objetos)."""
+        valid = np.frombuffer(batch.valid, dtype=np.uint8).astype(bool)
+        data = {}
+        for name in columns:
+            if name in batch.numeric:
+                # Vista del buffer (array o memoryview) con su tipo: sin copia hasta la máscara
+                data[name] = np.asarray(batch.numeric[name])[valid]
+            elif name in batch.codes:
+                # Texto: se decodifica indexando el diccionario con los códigos
+                dictionary = np.asarray(batch.dictionaries[name], dtype=object)
+                data[name] = dictionary[np.asarray(batch.codes[name])[valid]]
+            else:
+                data[name] = np.asarray(batch.text[name], dtype=object)[valid]
+        return pd.DataFrame(data, columns=list(columns))
+
+    def _get_batch_schema(self, columns: Sequence[str] = BATCH_COLUMNS) -> StructType:
+        """Schema de `columns` (mismos tipos que el DataFrame leído de JSON)."""
+        types = {
+            "latitude": DoubleType(), "longitude": DoubleType(),
+            "speed": DoubleType(), "altitude": DoubleType(),
+            "signal": IntegerType(), "battery": IntegerType(), "reports": IntegerType(),
+        }
+        return StructType([StructField(c, types.get(c, StringType()), True) for c in columns])
+
+    def _collect(self, df: DataFrame) -> List[Row]:
+        """Ejecuta `collect()` capturando el plan si la petición se perfila."""
+        profiling.capture_plan(df)
+        return df.collect()
+
+    def _first(self, df: DataFrame) -> Optional[Row]:
+        profiling.capture_plan(df)
+        return df.first()
+
     def _get_schema(self) -> StructType:
         """Define schema de los datos - KISS: campos esenciales."""
         return StructType([
@@ -77,37 +332,44 @@ class SparkETLService:
             StructField("timestamp", StringType(), True),  # Cambiado a String para evitar errores de parseo
         ])
     
+    @instrumented
     def aggregate_by_company(self, df: DataFrame) -> Dict[str, int]:
         """Agrega señales por operador."""
-        result = df.groupBy("sim_operator").count().collect()
+        result = self._collect(df.groupBy("sim_operator").agg(F.sum(reports(df)).alias("count")))
         return {row["sim_operator"]: row["count"] for row in result if row["sim_operator"]}
     
+    @instrumented
     def aggregate_by_signal_type(self, df: DataFrame) -> Dict[str, int]:
         """Agrega señales por tipo de red."""
-        result = df.groupBy("network_type").count().collect()
+        result = self._collect(df.groupBy("network_type").agg(F.sum(reports(df)).alias("count")))
         return {row["network_type"]: row["count"] for row in result if row["network_type"]}
     
+    @instrumented
     def aggregate_by_geography(self, df: DataFrame) -> Dict[str, Any]:
         """Agrega señales por dispositivo."""
-        devices = df.groupBy("device_name").count().collect()
+        devices = self._collect(df.groupBy("device_name").agg(F.sum(reports(df)).alias("count")))
         
         return {
             "devices": {row["device_name"]: row["count"] for row in devices if row["device_name"]}
         }
     
+    @instrumented
     def calculate_statistics(self, df: DataFrame) -> Dict[str, Any]:
         """Calcula estadísticas generales."""
-        stats = df.select(
-            F.count("*").alias("total"),
-            F.avg("battery").alias("avg_battery"),
+        weight = reports(df)
+        stats = self._first(df.select(
+            F.sum(weight).alias("total"),
+            F.count(F.lit(1)).alias("rows"),
+            weighted_avg("battery", weight).alias("avg_battery"),
             F.min("battery").alias("min_battery"),
             F.max("battery").alias("max_battery"),
-            F.avg("signal").alias("avg_signal"),
-            F.avg("altitude").alias("avg_altitude")
-        ).first()
+            weighted_avg("signal", weight).alias("avg_signal"),
+            weighted_avg("altitude", weight).alias("avg_altitude")
+        ))
         
         return {
-            "total_signals": stats["total"],
+            "total_signals": stats["total"] or 0,
+            "rows": stats["rows"],  # Filas del DataFrame (con la tabla compactada, menos que reportes)
             "average_battery": round(stats["avg_battery"], 2) if stats["avg_battery"] else 0,
             "min_battery": stats["min_battery"],
             "max_battery": stats["max_battery"],
@@ -115,6 +377,7 @@ class SparkETLService:
             "average_altitude": round(stats["avg_altitude"], 2) if stats["avg_altitude"] else 0
         }
     
+    @instrumented
     def time_series_aggregation(self, df: DataFrame, interval: str = "hour") -> List[Dict[str, Any]]:
         """Agrega datos por intervalo de tiempo."""
         if interval == "hour":
@@ -124,13 +387,13 @@ class SparkETLService:
         else:
             df_time = df.withColumn("time_bucket", F.date_trunc("hour", "timestamp"))
         
-        result = df_time.groupBy("time_bucket") \
+        weight = reports(df)
+        result = self._collect(df_time.groupBy("time_bucket") \
             .agg(
-                F.count("*").alias("count"),
-                F.avg("battery").alias("avg_battery")
+                F.sum(weight).alias("count"),
+                weighted_avg("battery", weight).alias("avg_battery")
             ) \
-            .orderBy("time_bucket") \
-            .collect()
+            .orderBy("time_bucket"))
         
         return [
             {
@@ -141,27 +404,62 @@ class SparkETLService:
             for row in result
         ]
     
-    def filter_dataframe(self, df: DataFrame, filters: Dict[str, Any]) -> DataFrame:
-        """Aplica filtros al DataFrame."""
+    def filter_dataframe(self, df: DataFrame, predicates: Sequence[Predicate]) -> DataFrame:
+        """
+        Aplica predicados de un `FilterPlan`: los residuales sobre lo que ya
+        filtró la fuente, o el plan entero sobre el dataset base.
+        """
         filtered_df = df
         
-        if filters.get("sim_operators"):
-            filtered_df = filtered_df.filter(F.col("sim_operator").isin(filters["sim_operators"]))
-        
-        if filters.get("network_types"):
-            filtered_df = filtered_df.filter(F.col("network_type").isin(filters["network_types"]))
-        
-        if filters.get("device_names"):
-            filtered_df = filtered_df.filter(F.col("device_name").isin(filters["device_names"]))
+        for predicate in predicates:
+            if predicate.op == "within":
+                regions = predicate.value
+                inside = F.udf(lambda lat, lng: lat is not None and lng is not None
+                               and contains_any(regions, lat, lng), BooleanType())
+                filtered_df = filtered_df.filter(inside(F.col("latitude"), F.col("longitude")))
+            elif predicate.op == "in":
+                filtered_df = filtered_df.filter(F.col(predicate.column).isin(list(predicate.value)))
+            elif predicate.column == "timestamp":
+                # La columna es texto ISO: se compara como instante, no como cadena
+                column, bound = F.col("timestamp").cast(TimestampType()), F.lit(predicate.value).cast(TimestampType())
+                filtered_df = filtered_df.filter(column >= bound if predicate.op == ">=" else column <= bound)
+            elif predicate.op == ">=":
+                filtered_df = filtered_df.filter(F.col(predicate.column) >= predicate.value)
+            elif predicate.op == "<=":
+                filtered_df = filtered_df.filter(F.col(predicate.column) <= predicate.value)
         
         return filtered_df
     
-    def get_geographic_points(self, df: DataFrame, limit: int = 60000) -> List[Dict[str, Any]]:
-        """Obtiene puntos geográficos para visualización en mapa."""
-        points = df.select(
+    def sample_frame(self, df: DataFrame, sample: int, seed: int = 42) -> DataFrame:
+        """
+        Modo aproximado: 1 de cada `sample` filas, y cada una representa
+        `sample` veces sus reportes. Conteos y medias ponderados por `reports`
+        estiman los del DataFrame completo sin cambiar ninguna agregación.
+        """
+        if sample <= 1:
+            return df
+        return df.sample(fraction=1.0 / sample, seed=seed).withColumn("reports", reports(df) * F.lit(sample))
+    
+    @instrumented
+    def get_geographic_points(self, df: DataFrame, limit: int = 60000, sampling: str = "stratified",
+                              seed: int = 42, cell_deg: float = config.MAP_INDEX_CELL_DEG,
+                              rows: Optional[int] = None) -> List[Dict[str, Any]]:
+        """
+        Obtiene puntos geográficos para visualización en mapa.
+        `sampling="stratified"`: muestra representativa (ver `_stratified_sample`);
+        `"first"`: las primeras `limit` filas (comportamiento anterior).
+        `rows`: filas de `df` si el llamador ya las conoce (evita un conteo).
+        """
+        if sampling == "first":
+            sample = df.limit(limit)
+        elif sampling == "stratified":
+            sample = self._stratified_sample(df, limit, seed, cell_deg, rows)
+        else:
+            raise ValueError(f"Unknown sampling mode: {sampling}")
+        points = self._collect(sample.select(
             "latitude", "longitude", "network_type", "sim_operator", 
             "battery", "device_name", "signal"
-        ).limit(limit).collect()
+        ))
         
         return [
             {
@@ -176,14 +474,43 @@ class SparkETLService:
             for row in points
         ]
     
+    def _stratified_sample(self, df: DataFrame, limit: int, seed: int, cell_deg: float,
+                           rows: Optional[int] = None) -> DataFrame:
+        """
+        Muestreo estratificado por celda espacial y operadora en una sola pasada
+        (una ventana = un shuffle): cada estrato aporta en proporción a su tamaño
+        y al menos un punto, así las zonas con poca cobertura no desaparecen.
+        El orden dentro del estrato es un hash de la fila con `seed`: la misma
+        semilla da la misma muestra (cacheable). La fracción sale de `rows`;
+        solo si el llamador no las sabe se cuentan (un job más).
+        """
+        total = rows if rows is not None else df.count()
+        if total <= limit:
+            return df
+        fraction = limit / total
+        stratum = Window.partitionBy("_cell_y", "_cell_x", "sim_operator").orderBy("_u")
+        whole = stratum.rowsBetween(Window.unboundedPreceding, Window.unboundedFollowing)
+        ranked = (
+            df.withColumn("_cell_y", F.floor(F.col("latitude") / cell_deg))
+              .withColumn("_cell_x", F.floor(F.col("longitude") / cell_deg))
+              .withColumn("_u", F.xxhash64(F.lit(seed), "latitude", "longitude", "timestamp", "device_name"))
+              .withColumn("_rank", F.row_number().over(stratum))
+              .withColumn("_n", F.count("*").over(whole))
+        )
+        quota = F.greatest(F.lit(1), F.ceil(F.col("_n") * F.lit(fraction)))
+        # Si los mínimos por estrato exceden `limit`, se conservan primero los de menor rango
+        return ranked.where(F.col("_rank") <= quota).orderBy("_rank", "_u").limit(limit)
+    
+    @instrumented
     def analyze_speed_by_operator(self, df: DataFrame) -> Dict[str, Any]:
         """Analiza velocidad promedio por operadora."""
-        speed_stats = df.groupBy("sim_operator").agg(
-            F.avg("speed").alias("avg_speed"),
+        weight = reports(df)
+        speed_stats = self._collect(df.groupBy("sim_operator").agg(
+            weighted_avg("speed", weight).alias("avg_speed"),
             F.max("speed").alias("max_speed"),
             F.min("speed").alias("min_speed"),
-            F.count("*").alias("total_measurements")
-        ).collect()
+            F.sum(weight).alias("total_measurements")
+        ))
         
         return {
             row["sim_operator"]: {
@@ -195,17 +522,19 @@ class SparkETLService:
             for row in speed_stats if row["sim_operator"]
         }
     
+    @instrumented
     def analyze_signal_by_district(self, df: DataFrame) -> List[Dict[str, Any]]:
         """Analiza calidad de señal promedio por ubicación geográfica (para mapa de calor)."""
         # Agrupar por coordenadas aproximadas (redondear a 3 decimales para agrupar zonas cercanas)
-        heatmap_data = df.withColumn("lat_rounded", F.round(F.col("latitude"), 3))\
+        weight = reports(df)
+        heatmap_data = self._collect(df.withColumn("lat_rounded", F.round(F.col("latitude"), 3))\
                          .withColumn("lng_rounded", F.round(F.col("longitude"), 3))\
                          .groupBy("lat_rounded", "lng_rounded").agg(
-                             F.avg("signal").alias("avg_signal"),
-                             F.avg("speed").alias("avg_speed"),
-                             F.count("*").alias("measurements"),
+                             weighted_avg("signal", weight).alias("avg_signal"),
+                             weighted_avg("speed", weight).alias("avg_speed"),
+                             F.sum(weight).alias("measurements"),
                              F.first("sim_operator").alias("primary_operator")
-                         ).collect()
+                         ))
         
         return [
             {
@@ -219,13 +548,15 @@ class SparkETLService:
             for row in heatmap_data
         ]
     
+    @instrumented
     def analyze_coverage_by_operator(self, df: DataFrame) -> Dict[str, Any]:
         """Analiza cobertura geográfica por operadora."""
-        coverage = df.groupBy("sim_operator").agg(
+        weight = reports(df)
+        coverage = self._collect(df.groupBy("sim_operator").agg(
             F.countDistinct("latitude", "longitude").alias("unique_locations"),
-            F.avg("signal").alias("avg_signal_strength"),
-            F.count("*").alias("total_records")
-        ).collect()
+            weighted_avg("signal", weight).alias("avg_signal_strength"),
+            F.sum(weight).alias("total_records")
+        ))
         
         return {
             row["sim_operator"]: {
@@ -236,6 +567,7 @@ class SparkETLService:
             for row in coverage if row["sim_operator"]
         }
 
+    @instrumented
     def analyze_by_district(self, df: DataFrame, geojson_path: str = None) -> Dict[str, Any]:
         """Analiza datos agrupados por distrito geográfico."""
         import json
@@ -260,27 +592,28 @@ class SparkETLService:
         
         # Crear "distrito virtual" basado en coordenadas redondeadas
         # (agrupación por zonas geográficas)
-        district_stats = df.withColumn("virtual_district", 
+        weight = reports(df)
+        district_stats = self._collect(df.withColumn("virtual_district", 
                                        F.concat(
                                            F.round(F.col("latitude"), 2).cast("string"),
                                            F.lit("_"),
                                            F.round(F.col("longitude"), 2).cast("string")
                                        ))\
                           .groupBy("virtual_district").agg(
-                              F.count("*").alias("total_signals"),
-                              F.avg("signal").alias("avg_signal"),
-                              F.avg("speed").alias("avg_speed"),
+                              F.sum(weight).alias("total_signals"),
+                              weighted_avg("signal", weight).alias("avg_signal"),
+                              weighted_avg("speed", weight).alias("avg_speed"),
                               F.first("latitude").alias("lat"),
                               F.first("longitude").alias("lng"),
                               # Contar por operadora
-                              F.sum(F.when(F.col("sim_operator") == "ENTEL", 1).otherwise(0)).alias("count_entel"),
-                              F.sum(F.when(F.col("sim_operator") == "TIGO", 1).otherwise(0)).alias("count_tigo"),
-                              F.sum(F.when(F.col("sim_operator") == "VIVA", 1).otherwise(0)).alias("count_viva"),
+                              F.sum(F.when(F.col("sim_operator") == "ENTEL", weight).otherwise(0)).alias("count_entel"),
+                              F.sum(F.when(F.col("sim_operator") == "TIGO", weight).otherwise(0)).alias("count_tigo"),
+                              F.sum(F.when(F.col("sim_operator") == "VIVA", weight).otherwise(0)).alias("count_viva"),
                               # Contar por tipo de red
-                              F.sum(F.when(F.col("network_type") == "WiFi", 1).otherwise(0)).alias("count_wifi"),
-                              F.sum(F.when(F.col("network_type") == "4G", 1).otherwise(0)).alias("count_4g"),
-                              F.sum(F.when(F.col("network_type") == "3G", 1).otherwise(0)).alias("count_3g")
-                          ).collect()
+                              F.sum(F.when(F.col("network_type") == "WiFi", weight).otherwise(0)).alias("count_wifi"),
+                              F.sum(F.when(F.col("network_type") == "4G", weight).otherwise(0)).alias("count_4g"),
+                              F.sum(F.when(F.col("network_type") == "3G", weight).otherwise(0)).alias("count_3g")
+                          ))
         
         results = []
         for row in district_stats:
@@ -311,9 +644,42 @@ class SparkETLService:
             "total_districts": len(results)
         }
 
-    
+    @instrumented
+    def write_export(self, df: DataFrame, path: str, fmt: str = "parquet",
+                     partition_by: Optional[Sequence[str]] = None):
+        """Añade `df` a la exportación en `path` (Parquet snappy o CSV gzip)."""
+        partition_by = list(partition_by or [])
+        if "date" in partition_by:
+            df = df.withColumn("date", F.to_date("timestamp"))
+        writer = df.write.mode("append")
+        if partition_by:
+            writer = writer.partitionBy(*partition_by)
+        if fmt == "csv":
+            writer.option("header", "true").option("compression", "gzip").csv(path)
+        else:
+            writer.option("compression", "snappy").parquet(path)
+
+    def job_group_progress(self, group: str) -> Tuple[int, int]:
+        """(tareas terminadas, tareas totales) de los stages activos de un grupo de jobs."""
+        tracker = self.spark.sparkContext.statusTracker()
+        done = total = 0
+        for job_id in tracker.getJobIdsForGroup(group):
+            job = tracker.getJobInfo(job_id)
+            if job is None or job.status != "RUNNING":
+                continue
+            for stage_id in job.stageIds:
+                stage = tracker.getStageInfo(stage_id)
+                if stage is not None:
+                    done += stage.numCompletedTasks
+                    total += stage.numTasks
+        return done, total
+
     def stop(self):
-        """Detiene la sesión de Spark."""
+        """Libera los datasets persistidos y detiene la sesión de Spark."""
+        with self._datasets_lock:
+            for dataset in self._retired + ([self._dataset] if self._dataset is not None else []):
+                dataset.df.unpersist()
+            self._dataset, self._retired = None, []
         self.spark.stop()
 
 
@@ -0,0 +1,197 @@
+"""
+Respuestas condicionales (ETag / 304) y cuerpos precomprimidos.
+
+La versión de una respuesta se deriva del watermark del dataset y de la clave
+del filtro, así que se conoce antes de calcular nada: si coincide con
+`If-None-Match` se responde 304 sin tocar la fuente ni Spark. El cuerpo JSON y
+sus variantes gzip/brotli se codifican una sola vez, al guardarse en la caché
+de resultados; cada petición solo elige la variante según `Accept-Encoding`.
+Con caché compartida las variantes se publican para todos los workers.
+"""
+from typing import Any, Dict, List, Optional, Tuple
+from fastapi import Request
+from fastapi.responses import FileResponse, Response, StreamingResponse
+from app import metrics
+from app.shared_cache import SharedEntry
+import gzip
+import hashlib
+import json
+import orjson
+import os
+import re
+
+try:
+    import brotli
+except ImportError:  # Opcional: sin brotli se sirve gzip
+    brotli = None
+
+MIN_COMPRESS_SIZE = 1024  # bytes; por debajo no compensa comprimir
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+FILE_CHUNK = 1 << 20  # 1 MiB por lectura en descargas parciales
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+def make_etag(watermark: str, route: str, key: Any) -> str:
+    """ETag débil: mismo dataset + misma ruta + mismo filtro -> misma versión."""
+    raw = json.dumps([watermark, route, key], sort_keys=True, default=str)
+    return f'W/"{hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """`If-None-Match` contiene la ETag (comparación débil) o `*`."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    wanted = etag[2:] if etag.startswith("W/") else etag
+    for candidate in header.split(","):
+        candidate = candidate.strip()
+        if candidate == "*" or (candidate[2:] if candidate.startswith("W/") else candidate) == wanted:
+            return True
+    return False
+
+
+def not_modified(etag: str) -> Response:
+    metrics.cache_result("http", "not_modified")
+    return Response(status_code=304, headers=_headers(etag))
+
+
+def _headers(etag: str) -> Dict[str, str]:
+    # no-cache: el navegador guarda la respuesta pero revalida siempre (304)
+    return {"ETag": etag, "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+
+
+def _accepted(request: Request) -> set:
+    """Codificaciones aceptadas (ignora las de q=0)."""
+    accepted = set()
+    for part in request.headers.get("accept-encoding", "").split(","):
+        name, _, params = part.strip().partition(";")
+        if name and params.replace(" ", "") not in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            accepted.add(name.strip().lower())
+    return accepted
+
+
+class EncodedBody:
+    """Cuerpo serializado una vez (JSON u otro tipo), con sus variantes comprimidas."""
+
+    __slots__ = ("etag", "identity", "gzip", "br", "media_type", "headers")
+
+    def __init__(self, etag: str, identity: bytes, gzip_body: Optional[bytes], br_body: Optional[bytes],
+                 media_type: str = "application/json", headers: Optional[Dict[str, str]] = None):
+        # bytes o memoryview (caché compartida): Response acepta ambos
+        self.etag = etag
+        self.identity = identity
+        self.gzip = gzip_body
+        self.br = br_body
+        self.media_type = media_type
+        self.headers = headers or {}
+
+    @classmethod
+    def encode(cls, payload: Any, etag: str) -> "EncodedBody":
+        with metrics.stage("serialize"):
+            identity = orjson.dumps(payload)
+        return cls.from_json(identity, etag)
+
+    @classmethod
+    def from_json(cls, identity: bytes, etag: str) -> "EncodedBody":
+        """Desde JSON ya serializado (p. ej. el resultado del proceso de cómputo)."""
+        return cls.from_bytes(identity, etag)
+
+    @classmethod
+    def from_bytes(cls, identity: bytes, etag: str, media_type: str = "application/json",
+                   headers: Optional[Dict[str, str]] = None, compress: bool = True) -> "EncodedBody":
+        """Cuerpo de cualquier tipo; `compress=False` para formatos ya comprimidos (PNG)."""
+        if not compress or len(identity) < MIN_COMPRESS_SIZE:
+            return cls(etag, identity, None, None, media_type, headers)
+        with metrics.stage("compress"):
+            gzip_body = gzip.compress(identity, compresslevel=GZIP_LEVEL)
+            br_body = brotli.compress(identity, quality=BROTLI_QUALITY) if brotli is not None else None
+        return cls(etag, identity, gzip_body, br_body, media_type, headers)
+
+    def to_shared(self) -> Tuple[List[bytes], Dict[str, Any]]:
+        """(secciones, metadatos) para `SharedCache`; las variantes ausentes van vacías."""
+        meta = {"etag": self.etag, "media_type": self.media_type, "headers": self.headers}
+        return [self.identity, self.gzip or b"", self.br or b""], meta
+
+    @classmethod
+    def from_shared(cls, entry: "SharedEntry") -> "EncodedBody":
+        """Cuerpo sobre las páginas compartidas (`memoryview`, sin copia)."""
+        identity, gzip_body, br_body = entry.sections
+        return cls(entry.meta["etag"], identity, gzip_body or None, br_body or None,
+                   entry.meta.get("media_type", "application/json"), entry.meta.get("headers"))
+
+    def nbytes(self) -> int:
+        return len(self.identity) + len(self.gzip or b"") + len(self.br or b"")
+
+    def response(self, request: Request) -> Response:
+        """La variante que acepta el cliente, sin volver a codificar."""
+        headers = {**_headers(self.etag), **self.headers}
+        accepted = _accepted(request)
+        body = self.identity
+        if self.br is not None and "br" in accepted:
+            body = self.br
+            headers["Content-Encoding"] = "br"
+        elif self.gzip is not None and ("gzip" in accepted or "*" in accepted):
+            body = self.gzip
+            headers["Content-Encoding"] = "gzip"
+        return Response(content=body, media_type=self.media_type, headers=headers)
+
+
+def file_etag(path: str) -> str:
+    """ETag fuerte de un fichero publicado (no se modifica: se reemplaza)."""
+    stat = os.stat(path)
+    return f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+
+
+def _parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """Un solo rango `bytes=a-b`, `a-` o `-n` -> (inicio, fin inclusivo); None si no es satisfacible."""
+    match = _RANGE.match(header.strip())
+    if match is None or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first == "":
+        length = int(last)
+        return (max(size - length, 0), size - 1) if length and size else None
+    start = int(first)
+    end = min(int(last), size - 1) if last else size - 1
+    return (start, end) if start <= end else None
+
+
+def _read_file(path: str, start: int, length: int):
+    with open(path, "rb") as f:
+        f.seek(start)
+        while length > 0:
+            chunk = f.read(min(FILE_CHUNK, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+def file_response(request: Request, path: str, media_type: str, filename: str) -> Response:
+    """
+    Descarga de un fichero con `Range` (reanudable): 206 con la parte pedida,
+    416 si el rango no es válido y el fichero entero si no hay rango o
+    `If-Range` no coincide con la ETag.
+    """
+    etag = file_etag(path)
+    size = os.path.getsize(path)
+    headers = {"ETag": etag, "Accept-Ranges": "bytes"}
+    header = request.headers.get("range")
+    if_range = request.headers.get("if-range")
+    if header and (if_range is None or if_range.strip() == etag):
+        if not header.strip().startswith("bytes=") or "," in header:
+            # Varios rangos (multipart) no se sirven: fichero entero
+            return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
+        span = _parse_range(header, size)
+        if span is None:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+        start, end = span
+        headers.update({
+            "Content-Range": f"bytes {start}-{end}/{size}",
+            "Content-Length": str(end - start + 1),
+            "Content-Disposition": f'attachment; filename="{filename}"',
+        })
+        return StreamingResponse(_read_file(path, start, end - start + 1), status_code=206,
+                                 media_type=media_type, headers=headers)
+    return FileResponse(path, media_type=media_type, filename=filename, headers=headers)
@@ -0,0 +1,235 @@
+"""
+Métricas de rendimiento en formato Prometheus.
+
+Histogramas por etapa del camino caliente (fetch, normalización, creación del
+DataFrame, cada job de Spark, serialización) y por endpoint, contadores de
+caché y métricas de Spark recogidas con un SparkListener.
+"""
+from prometheus_client import Counter, Gauge, Histogram
+from contextlib import contextmanager
+from app import profiling
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Buckets pensados para operaciones entre 1 ms y 2 minutos
+LATENCY_BUCKETS = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+    1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0,
+)
+
+STAGE_LATENCY = Histogram(
+    "signal_stage_duration_seconds",
+    "Duración de cada etapa del procesamiento",
+    ["stage"],
+    buckets=LATENCY_BUCKETS,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Duración de las peticiones HTTP por endpoint",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Consultas a la caché de resultados",
+    ["cache", "result"],  # result: hit | miss | expired | not_modified
+)
+
+CACHE_ENTRIES = Gauge(
+    "cache_entries",
+    "Entradas en la caché de resultados",
+    ["cache"],
+)
+
+ROWS_FETCHED = Counter(
+    "signal_rows_fetched_total",
+    "Filas leídas de la fuente de datos",
+    ["source"],
+)
+
+SPARK_JOB_DURATION = Histogram(
+    "spark_job_duration_seconds",
+    "Duración de los jobs de Spark por descripción",
+    ["job", "result"],
+    buckets=LATENCY_BUCKETS,
+)
+
+SPARK_SHUFFLE_READ_BYTES = Counter(
+    "spark_shuffle_read_bytes_total",
+    "Bytes leídos en shuffles de Spark",
+)
+
+SPARK_SHUFFLE_WRITE_BYTES = Counter(
+    "spark_shuffle_write_bytes_total",
+    "Bytes escritos en shuffles de Spark",
+)
+
+SPARK_STAGES = Counter(
+    "spark_stages_completed_total",
+    "Stages de Spark completados",
+    ["result"],
+)
+
+SPARK_CACHE_BYTES = Gauge(
+    "spark_cache_bytes",
+    "Bytes de DataFrames persistidos en Spark",
+    ["storage"],  # memory | disk
+)
+
+SPARK_DATASET_ROWS = Gauge(
+    "spark_dataset_rows",
+    "Filas del dataset base persistido",
+)
+
+WS_CONNECTIONS = Gauge(
+    "websocket_connections",
+    "Conexiones WebSocket activas",
+)
+
+WS_QUEUE_DEPTH = Gauge(
+    "websocket_queue_depth",
+    "Mensajes pendientes en las colas de salida WebSocket",
+    ["aggregate"],  # total | max
+)
+
+WS_DROPPED = Gauge(
+    "websocket_messages_dropped",
+    "Mensajes descartados o fusionados en colas WebSocket",
+    ["reason"],  # dropped | coalesced
+)
+
+INGEST_BUFFERED = Gauge(
+    "ingest_buffered_rows",
+    "Filas ingeridas pendientes de escribir",
+)
+
+ADMISSIONS = Counter(
+    "admission_requests_total",
+    "Decisiones del control de admisión por coste",
+    ["endpoint", "decision"],  # decision: cheap | queued | degraded | rejected | unchecked
+)
+
+ADMISSION_WAITING = Gauge(
+    "admission_waiting",
+    "Peticiones caras esperando turno en este worker",
+    ["endpoint"],
+)
+
+
+@contextmanager
+def stage(name: str):
+    """Mide la duración de un bloque como etapa `name`."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_LATENCY.labels(stage=name).observe(time.perf_counter() - start)
+
+
+def cache_result(cache: str, result: str):
+    CACHE_REQUESTS.labels(cache=cache, result=result).inc()
+
+
+class SparkMetricsListener:
+    """
+    Implementación Python de `SparkListenerInterface` vía Py4J.
+
+    Registra duración de jobs (etiquetada con `spark.job.description`) y bytes
+    de shuffle por stage. Los jobs de peticiones perfiladas (job group = id de
+    la sesión) además se anotan en su `ProfileSession`. Los demás eventos se
+    ignoran.
+    """
+
+    def __init__(self):
+        self._jobs = {}
+
+    def onJobStart(self, event):
+        description = group = None
+        props = event.properties()
+        if props is not None:
+            description = props.getProperty("spark.job.description")
+            group = props.getProperty("spark.jobGroup.id")
+        self._jobs[event.jobId()] = (event.time(), description or "unnamed")
+
+        session = profiling.find(group)
+        if session is not None:
+            stage_ids = event.stageIds()
+            session.job_started(
+                event.jobId(),
+                description or "unnamed",
+                [stage_ids.apply(i) for i in range(stage_ids.size())],
+            )
+
+    def onJobEnd(self, event):
+        started = self._jobs.pop(event.jobId(), None)
+        if started is None:
+            return
+        start_ms, description = started
+        result = "success" if "JobSucceeded" in event.jobResult().toString() else "failed"
+        SPARK_JOB_DURATION.labels(job=description, result=result).observe((event.time() - start_ms) / 1000.0)
+
+    def onStageCompleted(self, event):
+        info = event.stageInfo()
+        failed = info.failureReason().isDefined()
+        SPARK_STAGES.labels(result="failed" if failed else "success").inc()
+        task_metrics = info.taskMetrics()
+        if task_metrics is not None:
+            SPARK_SHUFFLE_READ_BYTES.inc(task_metrics.shuffleReadMetrics().totalBytesRead())
+            SPARK_SHUFFLE_WRITE_BYTES.inc(task_metrics.shuffleWriteMetrics().bytesWritten())
+
+        for session in profiling.active_sessions():
+            if session.owns_stage(info.stageId()):
+                session.stage_completed(_stage_summary(info, failed))
+
+    def __getattr__(self, name):
+        # Resto de callbacks de SparkListenerInterface: no-op
+        if name.startswith("on"):
+            return lambda *args: None
+        raise AttributeError(name)
+
+    class Java:
+        implements = ["org.apache.spark.scheduler.SparkListenerInterface"]
+
+
+def _stage_summary(info, failed: bool) -> dict:
+    """Datos de un `StageInfo` para el informe de perfilado."""
+    submitted, completed = info.submissionTime(), info.completionTime()
+    duration = None
+    if submitted.isDefined() and completed.isDefined():
+        duration = (completed.get() - submitted.get()) / 1000.0
+    summary = {
+        "stage_id": info.stageId(),
+        "name": info.name(),
+        "tasks": info.numTasks(),
+        "duration_s": duration,
+        "failed": failed,
+    }
+    task_metrics = info.taskMetrics()
+    if task_metrics is not None:
+        summary.update({
+            "executor_run_time_ms": task_metrics.executorRunTime(),
+            "executor_cpu_time_ns": task_metrics.executorCpuTime(),
+            "input_records": task_metrics.inputMetrics().recordsRead(),
+            "shuffle_read_bytes": task_metrics.shuffleReadMetrics().totalBytesRead(),
+            "shuffle_write_bytes": task_metrics.shuffleWriteMetrics().bytesWritten(),
+        })
+    return summary
+
+
+def register_spark_listener(spark_context) -> bool:
+    """Registra el listener en el SparkContext. Devuelve False si no es posible."""
+    try:
+        from pyspark.java_gateway import ensure_callback_server_started
+
+        gateway = spark_context._gateway
+        ensure_callback_server_started(gateway)
+        spark_context._jsc.sc().addSparkListener(SparkMetricsListener())
+        logger.info("✓ Spark metrics listener registered")
+        return True
+    except Exception as e:
+        logger.warning(f"Could not register Spark metrics listener: {e}")
+        return False
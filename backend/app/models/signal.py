@@ -32,6 +32,18 @@ class FilterParams(BaseModel):
     fecha_fin: Optional[datetime] = None
     battery_min: Optional[int] = None
     signal_min: Optional[int] = None
+    # Claves que envía el frontend (ver app.services.filters)
+    provincias: Optional[List[str]] = None
+    municipios: Optional[List[str]] = None
+    empresas: Optional[List[str]] = None
+    tipos_senal: Optional[List[str]] = None
+    bbox: Optional[List[float]] = Field(None, description="[min_lng, min_lat, max_lng, max_lat]")
+
+
+class ExportRequest(FilterParams):
+    """Exportación masiva: filtros + formato de salida y columnas de partición."""
+    format: str = Field("parquet", description="parquet | csv (gzip)")
+    partition_by: List[str] = Field(default_factory=list, description="sim_operator, network_type, date")
 
 
 class AggregatedData(BaseModel):
@@ -0,0 +1,185 @@
+"""
+Representación columnar de un lote de señales.
+
+Sustituye a la lista de dicts normalizados: cada columna numérica es un
+`array` tipado, las de texto se codifican por diccionario (códigos enteros +
+valores únicos) y una máscara marca las filas con coordenadas válidas. La
+normalización trabaja columna a columna; las filas dict solo se construyen
+si un consumidor las pide (`to_rows`).
+
+Los lotes de la tabla compactada traen además `numeric["reports"]`: cuántos
+reportes crudos representa cada fila (sin esa columna, uno por fila).
+"""
+from array import array
+from itertools import compress
+from typing import Any, Dict, Iterable, Iterator, List, Sequence, Tuple
+import sys
+
+FLOAT_COLUMNS = ("latitude", "longitude", "speed", "altitude")
+INT_COLUMNS = ("signal", "battery")
+DICT_COLUMNS = ("sim_operator", "network_type", "device_name")
+TEXT_COLUMNS = ("timestamp",)
+
+# Mismo orden que `data_source.SIGNAL_COLUMNS`
+COLUMNS = (
+    "latitude", "longitude", "signal", "sim_operator", "network_type",
+    "device_name", "speed", "battery", "altitude", "timestamp",
+)
+
+NAN = float("nan")
+UNKNOWN = "Unknown"
+
+
+def _encode(values: Iterable[Any]) -> Tuple[array, List[Any]]:
+    """Codificación por diccionario: (códigos, valores únicos en orden de aparición)."""
+    index: Dict[Any, int] = {}
+    # setdefault evalúa len(index) antes de insertar: el valor nuevo recibe el siguiente código
+    codes = array("I", [index.setdefault(v, len(index)) for v in values])
+    return codes, list(index)
+
+
+def _normalize_dictionary(codes: array, dictionary: List[Any]) -> Tuple[array, List[str]]:
+    """Normaliza solo los valores únicos (str, vacío -> 'Unknown') y fusiona duplicados."""
+    normalized = [str(v) if v else UNKNOWN for v in dictionary]
+    if len(set(normalized)) == len(normalized):
+        return codes, normalized
+    merged: Dict[str, int] = {}
+    remap = [merged.setdefault(v, len(merged)) for v in normalized]
+    return array("I", map(remap.__getitem__, codes)), list(merged)
+
+
+class SignalBatch:
+    """Lote columnar de señales normalizadas."""
+
+    __slots__ = ("size", "numeric", "codes", "dictionaries", "text", "valid")
+
+    def __init__(self, size: int, numeric: Dict[str, array], codes: Dict[str, array],
+                 dictionaries: Dict[str, List[str]], text: Dict[str, List[Any]], valid: bytearray):
+        self.size = size
+        self.numeric = numeric
+        self.codes = codes
+        self.dictionaries = dictionaries
+        self.text = text
+        self.valid = valid
+
+    # --- Construcción ---
+
+    @classmethod
+    def empty(cls) -> "SignalBatch":
+        return cls.from_columns({c: [] for c in COLUMNS})
+
+    @classmethod
+    def from_rows(cls, rows: Sequence[Dict[str, Any]]) -> "SignalBatch":
+        """Normaliza filas crudas (p. ej. JSON de PostgREST) columna a columna."""
+        return cls.from_columns({c: [row.get(c) for row in rows] for c in COLUMNS}, normalized=False)
+
+    @classmethod
+    def from_columns(cls, columns: Dict[str, Sequence[Any]], normalized: bool = True) -> "SignalBatch":
+        """
+        Construye el lote desde columnas. Con `normalized=True` (fuentes SQL, que
+        normalizan en la consulta) los números se copian tal cual a arrays.
+        """
+        lat, lng = columns["latitude"], columns["longitude"]
+        size = len(lat)
+        valid = bytearray(1 if a and b else 0 for a, b in zip(lat, lng))
+
+        numeric: Dict[str, array] = {}
+        if normalized:
+            for name in FLOAT_COLUMNS:
+                numeric[name] = _as_array("d", columns[name])
+            for name in INT_COLUMNS:
+                numeric[name] = _as_array("i", columns[name])
+        else:
+            numeric["latitude"] = array("d", [float(v) if v else NAN for v in lat])
+            numeric["longitude"] = array("d", [float(v) if v else NAN for v in lng])
+            for name in ("speed", "altitude"):
+                numeric[name] = array("d", [float(v) if v else 0.0 for v in columns[name]])
+            for name in INT_COLUMNS:
+                numeric[name] = array("i", [int(v) if v else 0 for v in columns[name]])
+
+        if "reports" in columns:
+            numeric["reports"] = _as_array("i", columns["reports"])
+
+        codes: Dict[str, array] = {}
+        dictionaries: Dict[str, List[str]] = {}
+        for name in DICT_COLUMNS:
+            codes[name], dictionaries[name] = _normalize_dictionary(*_encode(columns[name]))
+
+        text = {name: list(columns[name]) for name in TEXT_COLUMNS}
+        return cls(size, numeric, codes, dictionaries, text, valid)
+
+    @classmethod
+    def from_buffers(cls, meta: Dict[str, Any], buffers: Sequence[Any]) -> "SignalBatch":
+        """
+        Lote sobre buffers de bytes ya existentes (p. ej. ficheros mapeados):
+        `meta` da el typecode de cada columna numérica y de códigos, en el orden
+        de `buffers` tras la máscara. Las columnas son vistas (`memoryview`),
+        sin copia; solo la máscara se copia.
+        """
+        views = iter(buffers)
+        valid = bytearray(next(views))
+        numeric = {name: memoryview(next(views)).cast(typecode) for name, typecode in meta["numeric"].items()}
+        codes = {name: memoryview(next(views)).cast(typecode) for name, typecode in meta["codes"].items()}
+        return cls(meta["size"], numeric, codes, meta["dictionaries"], meta["text"], valid)
+
+    # --- Acceso ---
+
+    def __len__(self) -> int:
+        """Filas válidas (con coordenadas)."""
+        return self.valid.count(1)
+
+    def __bool__(self) -> bool:
+        return 1 in self.valid
+
+    def column(self, name: str) -> Sequence[Any]:
+        """Columna completa (incluye filas no válidas). Texto: valores compartidos del diccionario."""
+        if name in self.numeric:
+            return self.numeric[name]
+        if name in self.codes:
+            return list(map(self.dictionaries[name].__getitem__, self.codes[name]))
+        return self.text[name]
+
+    def iter_tuples(self, columns: Sequence[str] = COLUMNS) -> Iterator[Tuple[Any, ...]]:
+        """Tuplas de las filas válidas, en el orden de `columns`."""
+        return compress(zip(*[self.column(c) for c in columns]), self.valid)
+
+    def value_counts(self, name: str) -> Dict[str, int]:
+        """Conteo por valor de una columna codificada, sin decodificar filas."""
+        counts = [0] * len(self.dictionaries[name])
+        for code in compress(self.codes[name], self.valid):
+            counts[code] += 1
+        return {value: n for value, n in zip(self.dictionaries[name], counts) if n}
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Filas dict con el formato de la antigua `_normalize_data` (compatibilidad)."""
+        return [dict(zip(COLUMNS, values)) for values in self.iter_tuples(COLUMNS)]
+
+    def to_columnar(self) -> Dict[str, Any]:
+        """Columnas de filas válidas listas para JSON (texto como códigos + diccionario)."""
+        valid = self.valid
+        columns: Dict[str, Any] = {}
+        for name in COLUMNS:
+            if name in self.codes:
+                columns[name] = list(compress(self.codes[name], valid))
+            elif name in self.numeric:
+                columns[name] = list(compress(self.numeric[name], valid))
+            else:
+                columns[name] = list(compress(self.text[name], valid))
+        return {"columns": columns, "dictionaries": self.dictionaries}
+
+    def nbytes(self) -> int:
+        """Memoria aproximada del lote (buffers + objetos de texto)."""
+        total = len(self.valid)
+        for buf in list(self.numeric.values()) + list(self.codes.values()):
+            total += buf.itemsize * len(buf)
+        for values in self.dictionaries.values():
+            total += sum(sys.getsizeof(v) for v in values)
+        for values in self.text.values():
+            total += sys.getsizeof(values) + sum(sys.getsizeof(v) for v in values if v is not None)
+        return total
+
+
+def _as_array(typecode: str, values: Sequence[Any]) -> array:
+    if isinstance(values, array) and values.typecode == typecode:
+        return values
+    return array(typecode, values)
@@ -0,0 +1,306 @@
+"""
+Perfilado bajo demanda de peticiones individuales.
+
+Con `PROFILING_ENABLED=true`, una petición con la cabecera `X-Profile: 1`
+(o `?profile=1`, y `X-Profile-Token` si se configura `PROFILING_TOKEN`) se ejecuta bajo un profiler por muestreo. Además se capturan
+el plan `explain("formatted")` y los tiempos de cada DataFrame que ejecuta
+`SparkETLService`, y los stages de Spark de esos jobs. El resultado se guarda
+como un zip descargable:
+- `stacks.folded`: pilas en formato "folded" (compatible con flamegraph.pl / speedscope),
+  con el nombre del hilo como raíz: el que atiende la petición y los que ejecutan su trabajo
+- `plans.txt`: planes físicos de Spark por método
+- `report.json`: tiempos por método y por stage
+
+En modo remoto (`serve.py`) Spark corre en el proceso de cómputo: el worker
+pide el perfilado con el trabajo y el proceso de cómputo lo ejecuta bajo su
+propia sesión (`collect`); planes, jobs, stages y pilas vuelven con el
+resultado y se suman a la sesión del worker (`merge`).
+"""
+from typing import Any, Dict, List, Optional
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from app.config import config
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+import zipfile
+
+logger = logging.getLogger(__name__)
+
+_current: ContextVar[Optional["ProfileSession"]] = ContextVar("profile_session", default=None)
+
+# Sesiones activas por id (el SparkListener las busca por job group)
+_active: Dict[str, "ProfileSession"] = {}
+_active_lock = threading.Lock()
+
+
+class SamplingProfiler:
+    """
+    Muestrea periódicamente las pilas de los hilos de una petición (el que la
+    atiende y los que ejecutan su trabajo, ver `attach`) y acumula pilas
+    plegadas, cada una bajo el nombre de su hilo.
+    """
+
+    def __init__(self, thread_id: int, interval: float):
+        self.threads: Dict[int, str] = {thread_id: threading.current_thread().name}
+        self.interval = interval
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def add_thread(self, thread_id: int, name: str):
+        self.threads[thread_id] = name
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            frames = sys._current_frames()
+            for thread_id, name in list(self.threads.items()):
+                frame = frames.get(thread_id)
+                if frame is None or thread_id == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                stack.append(name)
+                self.samples[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "\n".join(f"{stack} {count}" for stack, count in self.samples.most_common()) + "\n"
+
+
+class ProfileSession:
+    """Datos recogidos durante una petición perfilada."""
+
+    def __init__(self, method: str, path: str):
+        self.id = f"{datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.method = method
+        self.path = path
+        self.started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.status: Optional[int] = None
+        self.spark_calls: List[Dict[str, Any]] = []
+        self.jobs: Dict[int, Dict[str, Any]] = {}
+        self.stages: List[Dict[str, Any]] = []
+        self._stage_jobs: Dict[int, int] = {}
+        self._lock = threading.Lock()
+        self.profiler = SamplingProfiler(threading.get_ident(), config.PROFILING_INTERVAL_MS / 1000.0)
+
+    # --- Llamadas de SparkETLService ---
+
+    def begin_call(self, name: str) -> Dict[str, Any]:
+        call = {"method": name, "seconds": None, "plans": []}
+        self.spark_calls.append(call)
+        return call
+
+    def add_plan(self, plan: str):
+        if self.spark_calls:
+            self.spark_calls[-1]["plans"].append(plan)
+
+    # --- Eventos del SparkListener (hilo de callbacks de Py4J) ---
+
+    def job_started(self, job_id: int, description: str, stage_ids: List[int]):
+        with self._lock:
+            self.jobs[job_id] = {"job_id": job_id, "description": description, "stage_ids": stage_ids}
+            for stage_id in stage_ids:
+                self._stage_jobs[stage_id] = job_id
+
+    def owns_stage(self, stage_id: int) -> bool:
+        with self._lock:
+            return stage_id in self._stage_jobs
+
+    def stage_completed(self, stage: Dict[str, Any]):
+        with self._lock:
+            stage["job_id"] = self._stage_jobs.get(stage["stage_id"])
+            self.stages.append(stage)
+
+    # --- Resultado ---
+
+    def report(self) -> Dict[str, Any]:
+        return {
+            "id": self.id,
+            "method": self.method,
+            "path": self.path,
+            "status": self.status,
+            "duration_s": round(self.duration or 0.0, 6),
+            "samples": sum(self.profiler.samples.values()),
+            "sample_interval_ms": config.PROFILING_INTERVAL_MS,
+            "spark_calls": [
+                {"method": c["method"], "seconds": c["seconds"], "plans": len(c["plans"])}
+                for c in self.spark_calls
+            ],
+            "spark_jobs": list(self.jobs.values()),
+            "spark_stages": self.stages,
+        }
+
+    def plans_text(self) -> str:
+        parts = []
+        for index, call in enumerate(self.spark_calls):
+            for plan in call["plans"]:
+                parts.append(f"== [{index}] {call['method']} ({call['seconds']} s) ==\n{plan}\n")
+        return "\n".join(parts) or "(no Spark plans captured)\n"
+
+
+def current() -> Optional[ProfileSession]:
+    """Sesión de perfilado de la petición actual, si la hay."""
+    return _current.get()
+
+
+def attach() -> None:
+    """Añade el hilo actual al muestreo de la petición perfilada (p. ej. el que ejecuta su trabajo)."""
+    session = current()
+    if session is not None:
+        thread = threading.current_thread()
+        session.profiler.add_thread(thread.ident, thread.name)
+
+
+def find(session_id: Optional[str]) -> Optional[ProfileSession]:
+    if not session_id:
+        return None
+    with _active_lock:
+        return _active.get(session_id)
+
+
+def active_sessions() -> List[ProfileSession]:
+    with _active_lock:
+        return list(_active.values())
+
+
+def start(method: str, path: str) -> ProfileSession:
+    session = ProfileSession(method, path)
+    with _active_lock:
+        _active[session.id] = session
+    _current.set(session)
+    session.profiler.start()
+    return session
+
+
+def finish(session: ProfileSession, status: int) -> str:
+    """Detiene el muestreo, escribe el artefacto y devuelve su ruta."""
+    session.profiler.stop()
+    session.duration = time.perf_counter() - session.started
+    session.status = status
+    if session.jobs:
+        # El bus de eventos de Spark es asíncrono: esperar a los últimos stages
+        _wait_for_stages(session)
+    with _active_lock:
+        _active.pop(session.id, None)
+    return write_artifact(session)
+
+
+def collect(session: ProfileSession) -> Dict[str, Any]:
+    """Como `finish`, sin artefacto: lo que el proceso de cómputo devuelve al worker."""
+    session.profiler.stop()
+    if session.jobs:
+        _wait_for_stages(session)
+    with _active_lock:
+        _active.pop(session.id, None)
+    _current.set(None)  # El hilo ejecutor sigue atendiendo otros trabajos
+    return {
+        "samples": dict(session.profiler.samples),
+        "spark_calls": session.spark_calls,
+        "spark_jobs": list(session.jobs.values()),
+        "spark_stages": session.stages,
+    }
+
+
+def merge(session: ProfileSession, trace: Dict[str, Any]) -> None:
+    """Suma a la sesión del worker lo recogido por `collect` en el proceso de cómputo."""
+    session.profiler.samples.update(trace["samples"])
+    session.spark_calls.extend(trace["spark_calls"])
+    with session._lock:
+        for job in trace["spark_jobs"]:
+            session.jobs[job["job_id"]] = job
+        session.stages.extend(trace["spark_stages"])
+
+
+def _wait_for_stages(session: ProfileSession, quiet: float = 0.1, timeout: float = 1.0):
+    deadline = time.monotonic() + timeout
+    seen = -1
+    while time.monotonic() < deadline and len(session.stages) != seen:
+        seen = len(session.stages)
+        time.sleep(quiet)
+
+
+def capture_plan(df) -> None:
+    """Guarda el plan formateado de un DataFrame si hay una sesión activa."""
+    session = current()
+    if session is None:
+        return
+    try:
+        plan = df._sc._jvm.PythonSQLUtils.explainString(df._jdf.queryExecution(), "formatted")
+    except Exception as e:
+        plan = f"(explain failed: {e})"
+    session.add_plan(plan)
+
+
+def _artifact_path(session_id: str) -> str:
+    return os.path.join(config.PROFILING_DIR, f"profile-{session_id}.zip")
+
+
+def write_artifact(session: ProfileSession) -> str:
+    os.makedirs(config.PROFILING_DIR, exist_ok=True)
+    path = _artifact_path(session.id)
+    with zipfile.ZipFile(path, "w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("stacks.folded", session.profiler.folded())
+        zf.writestr("plans.txt", session.plans_text())
+        zf.writestr("report.json", json.dumps(session.report(), indent=2, default=str))
+    _prune()
+    logger.info(f"Profile written: {path} ({session.duration:.3f}s)")
+    return path
+
+
+def _prune():
+    """Conserva solo los últimos PROFILING_MAX_ARTIFACTS artefactos."""
+    files = list_artifacts()
+    for name in files[config.PROFILING_MAX_ARTIFACTS:]:
+        try:
+            os.remove(os.path.join(config.PROFILING_DIR, name))
+        except OSError:
+            pass
+
+
+def list_artifacts() -> List[str]:
+    """Artefactos existentes, del más reciente al más antiguo."""
+    if not os.path.isdir(config.PROFILING_DIR):
+        return []
+    names = [n for n in os.listdir(config.PROFILING_DIR) if n.startswith("profile-") and n.endswith(".zip")]
+    return sorted(names, reverse=True)
+
+
+def artifact_path(session_id: str) -> Optional[str]:
+    # El id viene de la URL: no permitir rutas
+    if not session_id or "/" in session_id or "\\" in session_id or ".." in session_id:
+        return None
+    path = _artifact_path(session_id)
+    return path if os.path.exists(path) else None
+
+
+def requested_mode(headers, query_params) -> Optional[str]:
+    """
+    Modo de perfilado pedido por la petición, si está autorizado:
+    - "1": respuesta normal + cabeceras `X-Profile-Id` / `X-Profile-Url`
+    - "download": la respuesta es directamente el zip del perfil
+    """
+    if not config.PROFILING_ENABLED:
+        return None
+    mode = headers.get("x-profile") or query_params.get("profile")
+    if mode not in ("1", "download"):
+        return None
+    if config.PROFILING_TOKEN and headers.get("x-profile-token") != config.PROFILING_TOKEN:
+        return None
+    return mode
@@ -0,0 +1,221 @@
+"""
+Control de admisión por coste de las rutas caras.
+
+Antes de trabajar, cada petición estima su coste con el catálogo de
+estadísticas (`app.services.stats_catalog`): filas estimadas por el peso de
+la ruta (`COST_WEIGHTS`, aproximadamente cuántas veces se recorren). Según el coste:
+- `<= ADMISSION_CHEAP_COST`: pasa sin esperar; las baratas nunca hacen cola
+  detrás de las caras
+- si no, espera uno de los `ADMISSION_SLOTS` turnos de su ruta (como mucho
+  `ADMISSION_QUEUE_SIZE` en espera; llena o tras `ADMISSION_QUEUE_TIMEOUT`
+  segundos -> 503 con `Retry-After`) y su trabajo va al carril `heavy` del
+  cómputo (hilos y pool FAIR propios)
+- `> ADMISSION_MAX_COST`: además se degrada hasta caber en el máximo: los
+  análisis se calculan sobre una muestra de 1 de cada `sample` filas y
+  `/signals` recorta `limit` (el cliente sigue con `next_cursor`)
+
+Los turnos son por worker: con N workers caben N x `ADMISSION_SLOTS`
+peticiones caras por ruta.
+"""
+from typing import Any, Callable, Dict, Iterator, Optional
+from fastapi.responses import StreamingResponse
+from starlette.types import Receive, Scope, Send
+from app.config import config
+from app.etl.compute import HEAVY, INTERACTIVE
+from app.services.filters import SignalFilter
+from app.services.stats_catalog import Estimate, stats_catalog
+from app import metrics
+import asyncio
+import logging
+import math
+
+logger = logging.getLogger(__name__)
+
+CHEAP, QUEUED, DEGRADED = "cheap", "queued", "degraded"
+UNCHECKED = "unchecked"  # ADMISSION_ENABLED=false
+WAITS = (QUEUED, DEGRADED)
+
+# Coste por fila estimada (aggregate: ocho jobs de Spark sobre el DataFrame)
+COST_WEIGHTS = {"aggregate": 8, "dashboard": 10, "timeseries": 1, "signals": 2}
+# Rutas que leen las filas crudas de `locations` (el resto, las del análisis)
+RAW_ENDPOINTS = frozenset({"signals"})
+
+
+class AdmissionRejected(Exception):
+    """Sin turno para la petición; la ruta responde 503 con `Retry-After`."""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.status = 503
+        self.retry_after = retry_after
+
+
+class Ticket:
+    """Decisión de admisión de una petición; `release` devuelve su turno (una vez, desde cualquier hilo)."""
+
+    def __init__(self, endpoint: str, estimate: Optional[Estimate], cost: float, decision: str,
+                 sample: int = 1, limit: Optional[int] = None):
+        self.endpoint = endpoint
+        self.estimate = estimate
+        self.cost = cost
+        self.decision = decision
+        self.sample = sample
+        self.limit = limit
+        self._release: Optional[Callable[[], None]] = None
+
+    @property
+    def lane(self) -> str:
+        """Carril del proceso de cómputo: las caras no ocupan los hilos de las baratas."""
+        return HEAVY if self.decision in WAITS else INTERACTIVE
+
+    def headers(self) -> Dict[str, str]:
+        headers = {"X-Admission": self.decision}
+        if self.estimate is not None:
+            headers["X-Estimated-Cost"] = str(round(self.cost))
+        if self.sample > 1:
+            headers["X-Sample-Rate"] = f"1/{self.sample}"
+        return headers
+
+    def release(self):
+        release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def response(self, content: Iterator[bytes], media_type: str) -> "AdmittedResponse":
+        """Respuesta en streaming que mantiene el turno mientras se envía."""
+        return AdmittedResponse(self, content, media_type)
+
+
+class AdmittedResponse(StreamingResponse):
+    """
+    Devuelve el turno de `ticket` y cierra `content` (conexión con el cómputo,
+    dataset de Spark) al terminar `__call__`, que corre siempre: aunque el
+    cliente se vaya antes de empezar a leer y el iterador no llegue a arrancar.
+    """
+
+    def __init__(self, ticket: Ticket, content: Iterator[bytes], media_type: str):
+        super().__init__(content, media_type=media_type, headers=ticket.headers())
+        self.ticket = ticket
+        self.content = content
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            try:
+                close = getattr(self.content, "close", None)
+                if close is not None:
+                    # Puede liberar el dataset de Spark: fuera del event loop
+                    await asyncio.to_thread(close)
+            finally:
+                self.ticket.release()
+
+
+class _Gate:
+    """Turnos y espera de una ruta (en el event loop del worker)."""
+
+    def __init__(self, slots: int):
+        self.semaphore = asyncio.Semaphore(slots)
+        self.waiting = 0
+
+
+class AdmissionController:
+    """Estima, decide y reparte los turnos de las rutas caras de este worker."""
+
+    def __init__(self, estimate: Callable[[SignalFilter], Estimate], enabled: bool, cheap_cost: float,
+                 max_cost: float, slots: int, queue_size: int, queue_timeout: float):
+        self.estimate = estimate
+        self.enabled = enabled
+        self.cheap_cost = cheap_cost
+        self.max_cost = max_cost
+        self.slots = max(1, slots)
+        self.queue_size = queue_size
+        self.queue_timeout = queue_timeout
+        self._gates: Dict[str, _Gate] = {}
+
+    def plan(self, endpoint: str, signal_filter: SignalFilter, limit: Optional[int] = None) -> Ticket:
+        """Coste estimado y decisión (sin esperar turno); `limit` son las filas pedidas a `/signals`."""
+        if not self.enabled:
+            return Ticket(endpoint, None, 0.0, UNCHECKED, limit=limit)
+        try:
+            estimate = self.estimate(signal_filter)
+        except Exception as e:
+            # Sin estadísticas no se sabe si es barata: espera turno, sin degradar
+            logger.warning(f"Cost estimate failed for {endpoint}: {e}")
+            return Ticket(endpoint, None, math.inf, QUEUED, limit=limit)
+
+        weight = COST_WEIGHTS[endpoint]
+        rows = estimate.rows if endpoint in RAW_ENDPOINTS else estimate.scan_rows
+        if limit is not None:
+            rows = min(rows, limit)
+        cost = rows * weight
+        if cost <= self.cheap_cost:
+            return Ticket(endpoint, estimate, cost, CHEAP, limit=limit)
+        if cost <= self.max_cost:
+            return Ticket(endpoint, estimate, cost, QUEUED, limit=limit)
+
+        if limit is not None:
+            # Página más corta: el resto llega con `next_cursor`
+            limit = max(1, int(self.max_cost // weight))
+            return Ticket(endpoint, estimate, min(rows, limit) * weight, DEGRADED, limit=limit)
+        sample = math.ceil(cost / self.max_cost)
+        return Ticket(endpoint, estimate, cost / sample, DEGRADED, sample=sample)
+
+    async def admit(self, endpoint: str, signal_filter: SignalFilter, limit: Optional[int] = None) -> Ticket:
+        """Decisión y, si no es barata, su turno; `AdmissionRejected` si no llega a tiempo."""
+        # Lee el almacén de puntos y puede reanalizar la muestra: fuera del event loop
+        ticket = await asyncio.to_thread(self.plan, endpoint, signal_filter, limit)
+        if ticket.decision in WAITS:
+            await self._acquire(ticket)
+        metrics.ADMISSIONS.labels(endpoint=endpoint, decision=ticket.decision).inc()
+        return ticket
+
+    async def _acquire(self, ticket: Ticket):
+        gate = self._gates.get(ticket.endpoint)
+        if gate is None:
+            gate = self._gates[ticket.endpoint] = _Gate(self.slots)
+        retry_after = max(1, math.ceil(self.queue_timeout))
+        if gate.semaphore.locked() and gate.waiting >= self.queue_size:
+            metrics.ADMISSIONS.labels(endpoint=ticket.endpoint, decision="rejected").inc()
+            raise AdmissionRejected(f"Too many expensive {ticket.endpoint} requests, retry later", retry_after)
+
+        gate.waiting += 1
+        metrics.ADMISSION_WAITING.labels(endpoint=ticket.endpoint).inc()
+        try:
+            with metrics.stage("admission_wait"):
+                await asyncio.wait_for(gate.semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            metrics.ADMISSIONS.labels(endpoint=ticket.endpoint, decision="rejected").inc()
+            raise AdmissionRejected(f"Timed out waiting for a {ticket.endpoint} slot, retry later", retry_after)
+        finally:
+            gate.waiting -= 1
+            metrics.ADMISSION_WAITING.labels(endpoint=ticket.endpoint).dec()
+
+        loop = asyncio.get_running_loop()
+        # Los streams terminan en un hilo del pool: el semáforo se libera en el loop
+        ticket._release = lambda: loop.call_soon_threadsafe(gate.semaphore.release)
+
+    def describe(self) -> Dict[str, Any]:
+        return {
+            "enabled": self.enabled,
+            "cheap_cost": self.cheap_cost,
+            "max_cost": self.max_cost,
+            "slots": self.slots,
+            "endpoints": {
+                endpoint: {"running": self.slots - gate.semaphore._value, "waiting": gate.waiting}
+                for endpoint, gate in self._gates.items()
+            },
+            "stats": stats_catalog.describe(),
+        }
+
+
+# Singleton instance
+admission = AdmissionController(
+    stats_catalog.estimate,
+    enabled=config.ADMISSION_ENABLED,
+    cheap_cost=config.ADMISSION_CHEAP_COST,
+    max_cost=config.ADMISSION_MAX_COST,
+    slots=config.ADMISSION_SLOTS,
+    queue_size=config.ADMISSION_QUEUE_SIZE,
+    queue_timeout=config.ADMISSION_QUEUE_TIMEOUT,
+)
@@ -0,0 +1,138 @@
+"""
+Límites administrativos (provincia / municipio) de Santa Cruz.
+
+Se cargan una vez desde el GeoJSON de distritos del frontend. Sirven para
+resolver los filtros `provincias` / `municipios`: la base de datos solo tiene
+coordenadas, así que una región se traduce a su bbox (filtrable en la fuente)
+más un test punto-en-polígono exacto.
+"""
+from typing import Iterable, List, Optional, Sequence, Tuple
+from app.config import config
+import json
+import logging
+import threading
+import unicodedata
+
+logger = logging.getLogger(__name__)
+
+# (min_lng, min_lat, max_lng, max_lat)
+BBox = Tuple[float, float, float, float]
+Ring = List[Tuple[float, float]]
+
+
+def normalize_name(name: str) -> str:
+    """Compara nombres sin tildes ni mayúsculas ('Andrés Ibáñez' == 'Andres Ibañez')."""
+    decomposed = unicodedata.normalize("NFKD", name or "")
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold().strip()
+
+
+def _ring_contains(ring: Ring, lng: float, lat: float) -> bool:
+    """Ray casting sobre un anillo (lista de (lng, lat))."""
+    inside = False
+    j = len(ring) - 1
+    for i in range(len(ring)):
+        xi, yi = ring[i]
+        xj, yj = ring[j]
+        if (yi > lat) != (yj > lat) and lng < (xj - xi) * (lat - yi) / (yj - yi) + xi:
+            inside = not inside
+        j = i
+    return inside
+
+
+class Region:
+    """Un distrito del GeoJSON: nombres, bbox y polígonos (exterior + huecos)."""
+
+    __slots__ = ("provincia", "municipio", "distrito", "bbox", "polygons")
+
+    def __init__(self, provincia: str, municipio: str, distrito: str, polygons: List[List[Ring]]):
+        self.provincia = provincia
+        self.municipio = municipio
+        self.distrito = distrito
+        self.polygons = polygons
+        lngs = [p[0] for polygon in polygons for p in polygon[0]]
+        lats = [p[1] for polygon in polygons for p in polygon[0]]
+        self.bbox: BBox = (min(lngs), min(lats), max(lngs), max(lats))
+
+    def contains(self, lat: float, lng: float) -> bool:
+        min_lng, min_lat, max_lng, max_lat = self.bbox
+        if not (min_lat <= lat <= max_lat and min_lng <= lng <= max_lng):
+            return False
+        for polygon in self.polygons:
+            if _ring_contains(polygon[0], lng, lat) and not any(_ring_contains(h, lng, lat) for h in polygon[1:]):
+                return True
+        return False
+
+    def __repr__(self) -> str:
+        return f"{self.provincia} / {self.municipio} / {self.distrito}"
+
+
+def union_bbox(regions: Iterable[Region]) -> Optional[BBox]:
+    boxes = [r.bbox for r in regions]
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes),
+            max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def contains_any(regions: Sequence[Region], lat: float, lng: float) -> bool:
+    return any(r.contains(lat, lng) for r in regions)
+
+
+class BoundaryIndex:
+    """Regiones indexadas por nombre normalizado de provincia y municipio."""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._regions: Optional[List[Region]] = None
+        self._lock = threading.Lock()
+
+    @property
+    def regions(self) -> List[Region]:
+        if self._regions is None:
+            with self._lock:
+                if self._regions is None:
+                    self._regions = self._load()
+        return self._regions
+
+    def _load(self) -> List[Region]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            logger.error(f"Could not load boundaries from {self.path}: {e}")
+            return []
+
+        regions = []
+        for feature in data.get("features", []):
+            props = feature.get("properties") or {}
+            geometry = feature.get("geometry") or {}
+            coords = geometry.get("coordinates") or []
+            if geometry.get("type") == "Polygon":
+                coords = [coords]
+            elif geometry.get("type") != "MultiPolygon":
+                continue
+            polygons = [[[(float(p[0]), float(p[1])) for p in ring] for ring in polygon] for polygon in coords]
+            if polygons:
+                regions.append(Region(props.get("provincia") or "", props.get("municipio") or "",
+                                      props.get("distrito") or "", polygons))
+        logger.info(f"Loaded {len(regions)} boundary regions from {self.path}")
+        return regions
+
+    def find(self, provincias: Optional[Iterable[str]] = None,
+             municipios: Optional[Iterable[str]] = None) -> List[Region]:
+        """Regiones que cumplen ambos filtros de nombre (vacío = sin filtro)."""
+        wanted_p = {normalize_name(p) for p in provincias or []}
+        wanted_m = {normalize_name(m) for m in municipios or []}
+        return [
+            r for r in self.regions
+            if (not wanted_p or normalize_name(r.provincia) in wanted_p)
+            and (not wanted_m or normalize_name(r.municipio) in wanted_m)
+        ]
+
+    def names(self, level: str) -> List[str]:
+        """Nombres distintos de `provincia` o `municipio`."""
+        return sorted({getattr(r, level) for r in self.regions if getattr(r, level)})
+
+
+# Singleton instance
+boundary_index = BoundaryIndex(config.BOUNDARIES_PATH)
@@ -0,0 +1,212 @@
+"""
+Límites del mapa precalculados por nivel de zoom (`GET /boundaries`).
+
+El paso de construcción (`build_boundaries.py`, o la primera petición si
+faltan o cambió la fuente) lee el GeoJSON de distritos (`BOUNDARIES_PATH`),
+disuelve municipios y provincias sobre la misma topología (o toma las
+provincias de `BOUNDARY_PROVINCES_PATH`, ver `extract_features`) y escribe un
+TopoJSON cuantizado por nivel: cada nivel simplifica los arcos a un píxel de
+su zoom y cuantiza a un cuarto de píxel. Las geometrías llevan su bbox y su
+centroide de área precalculados.
+
+El frontend pide el nivel de su zoom; a zoom bajo recibe pocos vértices.
+"""
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+from datetime import datetime, timezone
+from app.config import config
+from app.services import topology
+from app.services.boundaries import BBox
+import hashlib
+import json
+import logging
+import orjson
+import os
+import secrets
+import threading
+
+logger = logging.getLogger(__name__)
+
+LEVEL_ZOOMS = (6, 9, 12, 15)  # un nivel por zoom; por encima de 15 se usa el último
+QUANTIZE_PX = 0.25  # celda de cuantización en píxeles del zoom del nivel
+SLIVER_PX = 2  # anchura (píxeles del último nivel) por debajo de la cual se descarta una rendija al disolver
+INDEX = "index.json"
+LAYERS = ("distritos", "municipios", "provincias")
+# Departamento de Santa Cruz, con margen (para extraer provincias de un GeoJSON nacional)
+SANTA_CRUZ_BBOX: BBox = (-64.9, -20.6, -57.4, -13.3)
+
+
+def pixel_deg(zoom: int) -> float:
+    """Grados de longitud por píxel al zoom dado (teselas de 256 px)."""
+    return 360.0 / (256 * 2 ** zoom)
+
+
+def level_for(zoom: float) -> int:
+    """Nivel (zoom de `LEVEL_ZOOMS`) que se sirve al zoom pedido."""
+    candidates = [z for z in LEVEL_ZOOMS if z <= zoom]
+    return candidates[-1] if candidates else LEVEL_ZOOMS[0]
+
+
+def extract_features(features: Sequence[Dict[str, Any]], bbox: BBox) -> List[Dict[str, Any]]:
+    """
+    Features cuyo centroide de área cae en `bbox` y cuyo bbox no se sale de él
+    (la media de los vértices se desvía hacia los bordes más detallados y deja
+    pasar provincias vecinas).
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    selected = []
+    for feature in features:
+        polygons = topology.normalize_polygons(feature.get("geometry") or {})
+        if not polygons:
+            continue
+        x, y = topology.centroid(polygons)
+        f_min_lng, f_min_lat, f_max_lng, f_max_lat = topology.bbox_of(p[0] for p in polygons)
+        if min_lng <= x <= max_lng and min_lat <= y <= max_lat and \
+                min_lng <= f_min_lng and f_max_lng <= max_lng and min_lat <= f_min_lat and f_max_lat <= max_lat:
+            selected.append(feature)
+    return selected
+
+
+def _load(path: str) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("features", [])
+
+
+def source_fingerprint(paths: Sequence[Optional[str]]) -> str:
+    digest = hashlib.blake2b(repr([LEVEL_ZOOMS, QUANTIZE_PX, SLIVER_PX]).encode(), digest_size=12)
+    for path in paths:
+        if path:
+            with open(path, "rb") as f:
+                digest.update(f.read())
+    return digest.hexdigest()
+
+
+def build(districts_path: str, out_dir: str, provinces_path: Optional[str] = None) -> Dict[str, Any]:
+    """Construye los niveles en `out_dir`; devuelve el índice escrito."""
+    districts = [f for f in _load(districts_path) if topology.normalize_polygons(f.get("geometry") or {})]
+    provinces = extract_features(_load(provinces_path), SANTA_CRUZ_BBOX) if provinces_path else []
+
+    polygon_sets = [topology.normalize_polygons(f["geometry"]) for f in districts + provinces]
+    topo, encoded = topology.Topology.build(polygon_sets)
+    objects: Dict[str, List[Tuple[List[topology.ArcPolygon], Dict[str, Any]]]] = {layer: [] for layer in LAYERS}
+
+    for feature, polygons in zip(districts, encoded):
+        props = feature.get("properties") or {}
+        objects["distritos"].append((polygons, {
+            k: props.get(k) for k in ("provincia", "municipio", "nombreciud", "distrito", "poblacion", "viviendas")
+        }))
+    district_polygons = encoded[:len(districts)]
+    for layer, keys in (("municipios", ("provincia", "municipio")), ("provincias", ("provincia",))):
+        if layer == "provincias" and provinces:
+            for feature, polygons in zip(provinces, encoded[len(districts):]):
+                props = feature.get("properties") or {}
+                objects[layer].append((polygons, {"provincia": props.get("shapeName") or props.get("provincia")}))
+            continue
+        groups: Dict[Tuple[Any, ...], List[List[topology.ArcPolygon]]] = {}
+        for feature, polygons in zip(districts, district_polygons):
+            props = feature.get("properties") or {}
+            groups.setdefault(tuple(props.get(k) for k in keys), []).append(polygons)
+        for values, members in groups.items():
+            dissolved = topo.dissolve(members, min_width=pixel_deg(LEVEL_ZOOMS[-1]) * SLIVER_PX)
+            objects[layer].append((dissolved, dict(zip(keys, values))))
+
+    # bbox y centroide de cada geometría (a resolución completa)
+    geometries: Dict[str, List[Dict[str, Any]]] = {}
+    all_rings = []
+    for layer, items in objects.items():
+        geometries[layer] = []
+        for polygons, props in items:
+            points = topo.polygons_points(polygons)
+            all_rings.extend(p[0] for p in points)
+            x, y = topology.centroid(points)
+            props = {**props, "centroid": [round(x, topology.COORD_DIGITS), round(y, topology.COORD_DIGITS)]}
+            geometries[layer].append(topology.geometry(polygons, props, topology.bbox_of(p[0] for p in points)))
+    extent = topology.bbox_of(all_rings)
+    rings = [ring for items in objects.values() for polygons, _ in items for polygon in polygons for ring in polygon]
+
+    os.makedirs(out_dir, exist_ok=True)
+    importance = topo.importance()
+    levels = []
+    for i, zoom in enumerate(LEVEL_ZOOMS):
+        arcs = topo.simplified(pixel_deg(zoom), importance, rings)
+        transform, quantized = topology.quantize(arcs, extent, pixel_deg(zoom) * QUANTIZE_PX)
+        level = {
+            "zoom": zoom,
+            "min_zoom": 0 if i == 0 else zoom,
+            "max_zoom": LEVEL_ZOOMS[i + 1] - 1 if i + 1 < len(LEVEL_ZOOMS) else None,
+            "tolerance": pixel_deg(zoom),
+        }
+        body = orjson.dumps({
+            "type": "Topology",
+            "bbox": [round(v, topology.COORD_DIGITS) for v in extent],
+            "transform": transform,
+            "level": level,
+            "objects": {layer: {"type": "GeometryCollection", "geometries": geoms}
+                        for layer, geoms in geometries.items() if geoms},
+            "arcs": quantized,
+        })
+        name = f"z{zoom}.topojson"
+        _write(os.path.join(out_dir, name), body)
+        levels.append({**level, "file": name, "bytes": len(body),
+                       "points": sum(len(arc) for arc in quantized),
+                       "etag": hashlib.blake2b(body, digest_size=8).hexdigest()})
+
+    index = {
+        "source": source_fingerprint([districts_path, provinces_path]),
+        "built_at": datetime.now(timezone.utc).isoformat(),
+        "features": {layer: len(geoms) for layer, geoms in geometries.items()},
+        "arcs": len(topo.arcs),
+        "points": sum(len(arc) for arc in topo.arcs),
+        "levels": levels,
+    }
+    _write(os.path.join(out_dir, INDEX), orjson.dumps(index, option=orjson.OPT_INDENT_2))
+    logger.info(f"🗺️ Boundary levels built: {index['features']} in {len(levels)} levels")
+    return index
+
+
+def _write(path: str, data: bytes):
+    tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+class BoundaryLevels:
+    """Niveles en disco; se construyen al primer uso si faltan o cambió la fuente."""
+
+    def __init__(self, districts_path: str, provinces_path: Optional[str], directory: str):
+        self.districts_path = districts_path
+        self.provinces_path = provinces_path or None
+        self.directory = directory
+        self._index: Optional[Dict[str, Any]] = None
+        self._lock = threading.Lock()
+
+    def index(self) -> Dict[str, Any]:
+        if self._index is None:
+            with self._lock:
+                if self._index is None:
+                    self._index = self._open()
+        return self._index
+
+    def _open(self) -> Dict[str, Any]:
+        try:
+            with open(os.path.join(self.directory, INDEX)) as f:
+                index = json.load(f)
+        except (FileNotFoundError, ValueError):
+            index = None
+        source = source_fingerprint([self.districts_path, self.provinces_path])
+        if index is None or index.get("source") != source:
+            index = build(self.districts_path, self.directory, self.provinces_path)
+        return index
+
+    def level(self, zoom: float) -> Dict[str, Any]:
+        """Metadatos del nivel que corresponde al zoom pedido."""
+        zoom_level = level_for(zoom)
+        return next(level for level in self.index()["levels"] if level["zoom"] == zoom_level)
+
+    def read(self, level: Dict[str, Any]) -> bytes:
+        with open(os.path.join(self.directory, level["file"]), "rb") as f:
+            return f.read()
+
+
+# Singleton instance
+boundary_levels = BoundaryLevels(config.BOUNDARIES_PATH, config.BOUNDARY_PROVINCES_PATH, config.BOUNDARY_LEVELS_DIR)
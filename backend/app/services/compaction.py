@@ -0,0 +1,190 @@
+"""
+Compactación de reportes casi duplicados.
+
+Los dispositivos reportan cada pocos segundos, muchas veces desde el mismo
+sitio. La compactación agrupa los reportes de un dispositivo (con su
+operadora y tipo de red) que caen en la misma celda de `COMPACTION_DISTANCE_M`
+metros de lado y en la misma ventana de `COMPACTION_WINDOW_S` segundos, y
+guarda una fila representativa por grupo en `locations_compacted`: posición,
+altitud y velocidad medias, señal media con mínimo y máximo, la última
+batería, primer y último instante y el número de reportes. Las filas crudas
+de `locations` no se tocan (auditoría, `/signals`, exportaciones).
+
+Es incremental: cada ejecución lee por orden de id las filas crudas
+posteriores a la última compactada (`MAX(last_id)`) y, trozo a trozo, las
+fusiona con los grupos ya guardados de las mismas ventanas. Los acumulados
+son sumas, así que fusionar es sumar; cada trozo se escribe en una
+transacción y el último id avanza con él. Cambiar la distancia o la ventana
+solo afecta a lo que se compacte después (`full=True` lo rehace todo).
+
+Con varios escritores (PostgreSQL) los ids no se confirman en orden: una
+transacción lenta puede confirmar el id 10 después de que se compacte el 11,
+y `MAX(last_id)` lo saltaría. Por eso cada ejecución se detiene antes de la
+primera fila insertada hace menos de `COMPACTION_GRACE_S` segundos
+(`ingested_at`): lo anterior ya está confirmado si ninguna inserción tarda
+más que la gracia. SQLite tiene un solo escritor y no necesita el corte.
+"""
+from typing import Any, Dict, List, Sequence, Tuple
+from app.config import config
+from app.services.data_source import BIN_COLUMNS
+from app.services.point_store import epoch_seconds
+from app.services.supabase_service import supabase_service
+from app.shared_cache import dataset_version
+from app import metrics
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+METERS_PER_DEGREE = 111320.0
+
+# Acumulado de un grupo (lista mutable, índices fijos)
+COUNT, LAT, LNG, ALT, SPEED, SIGNAL, SIGNAL_MIN, SIGNAL_MAX = range(8)
+BATTERY, FIRST, FIRST_AT, LAST, LAST_AT, LAST_ID = range(8, 14)
+
+BinKey = Tuple[str, str, str, int, int, int]
+
+
+class Compactor:
+    """Compacta las filas crudas nuevas de la fuente de `service` (una ejecución a la vez)."""
+
+    def __init__(self, service, distance_m: float, window_s: int, chunk_rows: int, grace: float = 0.0):
+        self.service = service
+        self.distance_m = distance_m
+        self.window_s = max(1, int(window_s))
+        self.chunk_rows = chunk_rows
+        self.grace = grace
+        self.lat_step = distance_m / METERS_PER_DEGREE
+        self._lock = threading.Lock()
+
+    def run(self, full: bool = False) -> Dict[str, Any]:
+        """Compacta lo pendiente (o todo con `full`) y devuelve el resumen con la reducción."""
+        source = self.service.source
+        if not source.supports_compaction:
+            return {"success": False, "code": 501, "error": f"{source.name} source does not support compaction"}
+
+        with self._lock:
+            start = time.perf_counter()
+            if full:
+                source.clear_bins()
+            after = source.compaction_state()["last_id"]
+            merged = written = 0
+            while True:
+                with metrics.stage("compaction.fetch"):
+                    chunk = source.fetch_raw_after(after, self.chunk_rows, self.grace)
+                if not len(chunk):
+                    break
+                columns = chunk.as_dict()
+                with metrics.stage("compaction.merge"):
+                    bins = self.merge(source, columns)
+                with metrics.stage("compaction.write"):
+                    written += source.write_bins(bins)
+                merged += len(chunk)
+                after = columns["id"][-1]
+                if len(chunk) < self.chunk_rows:
+                    break
+            state = source.compaction_state()
+
+        if merged:
+            # Los análisis leen la tabla compactada: las vistas cacheadas cambian de forma
+            dataset_version.bump()
+        seconds = time.perf_counter() - start
+        logger.info(f"🗜️ Compaction: {merged} raw rows merged into {written} bins "
+                    f"({state['reports']} -> {state['bins']} rows, {seconds:.2f}s)")
+        return {
+            "success": True,
+            "merged_rows": merged,
+            "bins_written": written,
+            "raw_rows": state["reports"],
+            "compacted_rows": state["bins"],
+            "reduction_ratio": round(1 - state["bins"] / state["reports"], 4) if state["reports"] else 0.0,
+            "last_id": state["last_id"],
+            "distance_m": self.distance_m,
+            "window_s": self.window_s,
+            "seconds": round(seconds, 3),
+        }
+
+    def key(self, device: str, operator: str, network: str, lat: float, lng: float, at: int) -> BinKey:
+        """Grupo de un reporte: ventana de tiempo y celda de `distance_m` metros de lado."""
+        cell_lat = math.floor(lat / self.lat_step)
+        # La celda de longitud se ensancha con la latitud para medir lo mismo en metros
+        lng_step = self.lat_step / max(math.cos(math.radians((cell_lat + 0.5) * self.lat_step)), 1e-6)
+        return device, operator, network, at - at % self.window_s, cell_lat, math.floor(lng / lng_step)
+
+    def merge(self, source, columns: Dict[str, Sequence[Any]]) -> List[Tuple[Any, ...]]:
+        """Grupos completos (orden de `BIN_COLUMNS`) tras fusionar un trozo de filas crudas."""
+        lat, lng = columns["latitude"], columns["longitude"]
+        altitude, speed = columns["altitude"], columns["speed"]
+        signal, battery = columns["signal"], columns["battery"]
+        timestamps, ids = columns["timestamp"], columns["id"]
+
+        groups: Dict[BinKey, List[Any]] = {}
+        for r, (device, operator, network) in enumerate(zip(
+                columns["device_name"], columns["sim_operator"], columns["network_type"])):
+            at = epoch_seconds(timestamps[r])
+            key = self.key(device, operator, network, lat[r], lng[r], at)
+            report = [1, lat[r], lng[r], altitude[r], speed[r], signal[r], signal[r], signal[r],
+                      battery[r], timestamps[r], at, timestamps[r], at, ids[r]]
+            group = groups.get(key)
+            if group is None:
+                groups[key] = report
+            else:
+                _combine(group, report)
+
+        # Los grupos ya guardados de esas ventanas se suman a lo nuevo
+        windows = [key[3] for key in groups]
+        for stored in source.read_bins(min(windows), max(windows)):
+            key = tuple(stored[:6])
+            group = groups.get(key)
+            if group is not None:
+                _combine(group, _accumulator(stored))
+
+        return [(*key, *_representative(group)) for key, group in groups.items()]
+
+
+def _accumulator(row: Sequence[Any]) -> List[Any]:
+    """Acumulado desde una fila de la tabla compactada (orden de `BIN_COLUMNS`)."""
+    stored = dict(zip(BIN_COLUMNS, row))
+    return [
+        stored["report_count"], stored["latitude_sum"], stored["longitude_sum"],
+        stored["altitude_sum"], stored["speed_sum"], stored["signal_sum"],
+        stored["signal_min"], stored["signal_max"], stored["battery"],
+        stored["timestamp"], epoch_seconds(stored["timestamp"]),
+        stored["last_timestamp"], epoch_seconds(stored["last_timestamp"]), stored["last_id"],
+    ]
+
+
+def _combine(group: List[Any], other: Sequence[Any]):
+    """Suma `other` a `group`; la batería es la del reporte más reciente."""
+    for i in (COUNT, LAT, LNG, ALT, SPEED, SIGNAL):
+        group[i] += other[i]
+    group[SIGNAL_MIN] = min(group[SIGNAL_MIN], other[SIGNAL_MIN])
+    group[SIGNAL_MAX] = max(group[SIGNAL_MAX], other[SIGNAL_MAX])
+    if other[FIRST_AT] < group[FIRST_AT]:
+        group[FIRST], group[FIRST_AT] = other[FIRST], other[FIRST_AT]
+    if (other[LAST_AT], other[LAST_ID]) > (group[LAST_AT], group[LAST_ID]):
+        group[LAST], group[LAST_AT], group[BATTERY] = other[LAST], other[LAST_AT], other[BATTERY]
+    group[LAST_ID] = max(group[LAST_ID], other[LAST_ID])
+
+
+def _representative(group: Sequence[Any]) -> Tuple[Any, ...]:
+    """Columnas de `BIN_COLUMNS` tras la clave: fila representativa y acumulados."""
+    n = group[COUNT]
+    return (
+        group[LAT] / n, group[LNG] / n, group[ALT] / n, group[SPEED] / n,
+        group[BATTERY], round(group[SIGNAL] / n), group[FIRST],
+        n, group[LAT], group[LNG], group[ALT], group[SPEED],
+        group[SIGNAL], group[SIGNAL_MIN], group[SIGNAL_MAX], group[LAST], group[LAST_ID],
+    )
+
+
+# Singleton instance
+compactor = Compactor(
+    supabase_service,
+    distance_m=config.COMPACTION_DISTANCE_M,
+    window_s=config.COMPACTION_WINDOW_S,
+    chunk_rows=config.COMPACTION_CHUNK_ROWS,
+    grace=config.COMPACTION_GRACE_S,
+)
@@ -0,0 +1,320 @@
+"""
+Cobertura estimada por operadora donde ningún dispositivo midió.
+
+El mapa de calor solo pinta celdas con mediciones. Esta superficie estima la
+señal de cada operadora en una rejilla regular sobre Santa Cruz por
+ponderación inversa a la distancia (IDW): cada celda promedia las
+`COVERAGE_NEIGHBORS` mediciones más cercanas dentro de `COVERAGE_RADIUS_KM`,
+buscadas en un árbol k-d. Donde no hay ninguna a menos del radio queda sin
+valor (NaN), y la confianza baja con la distancia a la medición más cercana.
+
+La rejilla se parte en teselas independientes (las calcula un pool de
+procesos, ver `app.etl.coverage`). Cada tesela guarda en disco su resultado
+con nombre igual a la huella de sus entradas (parámetros + mediciones de la
+operadora en la tesela ampliada por el radio): una medición nueva solo cambia
+la huella, y por tanto el cálculo, de las teselas a menos de un radio.
+
+Las filas de la rejilla son equiespaciadas en Web Mercator (como
+`app.services.heatmap`), así que el PNG se superpone tal cual.
+"""
+from array import array
+from heapq import heappush, heapreplace
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.config import config
+from app.services.boundaries import BBox
+from app.services.heatmap import Raster, mercator_lat, mercator_y
+from app.services.point_store import StoreView
+import hashlib
+import json
+import math
+import os
+import secrets
+
+KM_PER_DEG = 110.574  # km por grado de latitud
+MIN_DISTANCE_KM = 0.005  # suaviza el peso de las mediciones sobre el centro de la celda
+MANIFEST = "manifest.json"
+
+# (value, confidence) de una tesela: dos planos float32 de `tile` x `tile` celdas
+TilePlanes = Tuple[array, array]
+
+
+class KDTree:
+    """
+    Árbol k-d 2D implícito: `order` se ordena por tramos y cada nodo parte su
+    tramo por la mediana del eje (x e y alternos), guardada en `splits[mid]`
+    (los hijos reordenan su tramo después). Las hojas de hasta `LEAF` puntos
+    se recorren enteras.
+    """
+
+    LEAF = 16
+
+    def __init__(self, xs: Sequence[float], ys: Sequence[float]):
+        self.xs = xs
+        self.ys = ys
+        self.order = list(range(len(xs)))
+        self.splits = [0.0] * len(xs)
+        self._build(0, len(xs), 0)
+
+    def _build(self, lo: int, hi: int, axis: int):
+        if hi - lo <= self.LEAF:
+            return
+        coords = self.ys if axis else self.xs
+        self.order[lo:hi] = sorted(self.order[lo:hi], key=coords.__getitem__)
+        mid = (lo + hi) // 2
+        self.splits[mid] = coords[self.order[mid]]
+        self._build(lo, mid, 1 - axis)
+        self._build(mid, hi, 1 - axis)
+
+    def nearest(self, x: float, y: float, k: int, radius: float) -> List[Tuple[float, int]]:
+        """Hasta `k` puntos más cercanos a menos de `radius`: [(distancia², índice)], sin orden."""
+        xs, ys, order, splits, leaf = self.xs, self.ys, self.order, self.splits, self.LEAF
+        heap: List[Tuple[float, int]] = []  # (-d², i): el más lejano en la cima
+        limit = radius * radius
+        stack = [(0, len(order), 0, 0.0)]
+        while stack:
+            lo, hi, axis, gap = stack.pop()
+            if gap >= limit:
+                continue  # El tramo está más lejos que el peor vecino actual
+            if hi - lo <= leaf:
+                for i in order[lo:hi]:
+                    dx, dy = xs[i] - x, ys[i] - y
+                    d2 = dx * dx + dy * dy
+                    if d2 < limit:
+                        if len(heap) < k:
+                            heappush(heap, (-d2, i))
+                        else:
+                            heapreplace(heap, (-d2, i))
+                        if len(heap) == k:
+                            limit = -heap[0][0]
+                continue
+            mid = (lo + hi) // 2
+            diff = (y if axis else x) - splits[mid]
+            near, far = ((lo, mid), (mid, hi)) if diff < 0 else ((mid, hi), (lo, mid))
+            # El lado lejano se apila primero: se visita después, con el límite ya reducido
+            stack.append((far[0], far[1], 1 - axis, diff * diff))
+            stack.append((near[0], near[1], 1 - axis, 0.0))
+        return [(-d2, i) for d2, i in heap]
+
+
+class Grid:
+    """Rejilla de `cell_deg` grados (filas equiespaciadas en Mercator), en teselas de `tile` celdas."""
+
+    __slots__ = ("west", "top", "cell_deg", "tile", "cols", "rows")
+
+    def __init__(self, west: float, top: float, cell_deg: float, tile: int, cols: int, rows: int):
+        self.west = west
+        self.top = top  # y de Mercator del borde norte
+        self.cell_deg = cell_deg
+        self.tile = tile
+        self.cols = cols
+        self.rows = rows
+
+    @classmethod
+    def covering(cls, bbox: BBox, cell_deg: float, tile: int) -> "Grid":
+        """Rejilla que cubre el bbox, redondeada a teselas enteras."""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        top = mercator_y(max_lat)
+        span = tile * cell_deg
+        cols = tile * max(1, math.ceil((max_lng - min_lng) / span))
+        rows = tile * max(1, math.ceil((top - mercator_y(min_lat)) / math.radians(span)))
+        return cls(min_lng, top, cell_deg, tile, cols, rows)
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Grid":
+        return cls(**{name: data[name] for name in cls.__slots__})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    @property
+    def step(self) -> float:
+        """Alto de una fila en unidades de Mercator (celdas cuadradas en el mapa)."""
+        return math.radians(self.cell_deg)
+
+    def tiles(self) -> Iterator[Tuple[int, int]]:
+        for ty in range(self.rows // self.tile):
+            for tx in range(self.cols // self.tile):
+                yield tx, ty
+
+    def cells_bbox(self, c0: int, r0: int, c1: int, r1: int) -> BBox:
+        """Bbox de las celdas [c0, c1) x [r0, r1)."""
+        return (self.west + c0 * self.cell_deg, mercator_lat(self.top - r1 * self.step),
+                self.west + c1 * self.cell_deg, mercator_lat(self.top - r0 * self.step))
+
+    def tile_bbox(self, tx: int, ty: int) -> BBox:
+        t = self.tile
+        return self.cells_bbox(tx * t, ty * t, (tx + 1) * t, (ty + 1) * t)
+
+    def window(self, bbox: BBox) -> Optional[Tuple[int, int, int, int]]:
+        """Celdas (c0, r0, c1, r1) que tocan el bbox; None si no lo corta."""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        c0 = max(0, math.floor((min_lng - self.west) / self.cell_deg))
+        c1 = min(self.cols, math.ceil((max_lng - self.west) / self.cell_deg))
+        r0 = max(0, math.floor((self.top - mercator_y(max_lat)) / self.step))
+        r1 = min(self.rows, math.ceil((self.top - mercator_y(min_lat)) / self.step))
+        if c0 >= c1 or r0 >= r1:
+            return None
+        return c0, r0, c1, r1
+
+
+def tile_inputs(view: StoreView, grid: Grid, tx: int, ty: int, radius_km: float) -> Dict[str, List[Tuple[float, float, float]]]:
+    """Mediciones de señal (lat, lng, dBm) por operadora en la tesela ampliada por el radio."""
+    min_lng, min_lat, max_lng, max_lat = grid.tile_bbox(tx, ty)
+    dlat = radius_km / KM_PER_DEG
+    dlng = radius_km / (KM_PER_DEG * math.cos(math.radians(max(abs(min_lat), abs(max_lat)) + dlat)))
+    rows = view.query((min_lng - dlng, min_lat - dlat, max_lng + dlng, max_lat + dlat))
+
+    batch = view.batch
+    lat, lng, signal = batch.numeric["latitude"], batch.numeric["longitude"], batch.numeric["signal"]
+    operators, names = batch.codes["sim_operator"], batch.dictionaries["sim_operator"]
+    inputs: Dict[str, List[Tuple[float, float, float]]] = {}
+    for r in rows:
+        if signal[r] == 0:
+            continue  # Sin lectura de señal (normalizada a 0)
+        inputs.setdefault(names[operators[r]], []).append((lat[r], lng[r], float(signal[r])))
+    return inputs
+
+
+def fingerprint(params: Dict[str, Any], operator: str, tx: int, ty: int,
+                points: List[Tuple[float, float, float]]) -> str:
+    """Huella de las entradas de una tesela (independiente del orden de las filas en el almacén)."""
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(json.dumps([params, operator, tx, ty], sort_keys=True).encode())
+    digest.update(array("d", [v for p in sorted(points) for v in p]).tobytes())
+    return digest.hexdigest()
+
+
+def interpolate_tile(task: Tuple[Any, ...]) -> Tuple[bytes, bytes]:
+    """
+    IDW de una tesela (función de nivel de módulo: se ejecuta en el pool de
+    procesos). `task` = (grid dict, tx, ty, puntos float64 lat/lng/dBm en
+    bytes, radio km, vecinos, potencia). Devuelve los planos float32 de valor
+    y de confianza, fila norte primero.
+    """
+    grid_data, tx, ty, packed, radius_km, neighbors, power = task
+    grid = Grid.from_dict(grid_data)
+    points = array("d")
+    points.frombytes(packed)
+    t, step = grid.tile, grid.step
+
+    # Proyección plana local (km) centrada en la latitud de la tesela
+    min_lng, min_lat, max_lng, max_lat = grid.tile_bbox(tx, ty)
+    km_per_lng = KM_PER_DEG * math.cos(math.radians((min_lat + max_lat) / 2))
+    xs = [v * km_per_lng for v in points[1::3]]
+    ys = [v * KM_PER_DEG for v in points[0::3]]
+    values = points[2::3]
+    tree = KDTree(xs, ys)
+
+    eps = MIN_DISTANCE_KM * MIN_DISTANCE_KM
+    half = power / 2
+    value = array("f", [math.nan]) * (t * t)
+    confidence = array("f", [0.0]) * (t * t)
+    cx = [(grid.west + (tx * t + i + 0.5) * grid.cell_deg) * km_per_lng for i in range(t)]
+    for j in range(t):
+        cy = mercator_lat(grid.top - (ty * t + j + 0.5) * step) * KM_PER_DEG
+        for i in range(t):
+            found = tree.nearest(cx[i], cy, neighbors, radius_km)
+            if not found:
+                continue
+            total = weights = 0.0
+            for d2, p in found:
+                w = 1.0 / (d2 + eps) ** half
+                total += w * values[p]
+                weights += w
+            value[j * t + i] = total / weights
+            confidence[j * t + i] = 1.0 - math.sqrt(min(d2 for d2, _ in found)) / radius_km
+    return value.tobytes(), confidence.tobytes()
+
+
+class CoverageStore:
+    """
+    Teselas calculadas en `COVERAGE_DIR/tiles/<huella>.f32` y `manifest.json`
+    (rejilla, parámetros y huella de cada tesela por operadora), sustituido de
+    forma atómica. Lo escribe el proceso de cómputo; cualquier worker lo lee.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _tile_path(self, key: str) -> str:
+        return os.path.join(self.directory, "tiles", f"{key}.f32")
+
+    def manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def has_tile(self, key: str) -> bool:
+        return os.path.exists(self._tile_path(key))
+
+    def write_tile(self, key: str, value: bytes, confidence: bytes):
+        path = self._tile_path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(value)
+            f.write(confidence)
+        os.replace(tmp, path)
+
+    def read_tile(self, key: str, tile: int) -> Optional[TilePlanes]:
+        planes = array("f")
+        try:
+            with open(self._tile_path(key), "rb") as f:
+                planes.frombytes(f.read())
+        except FileNotFoundError:
+            return None
+        cells = tile * tile
+        return planes[:cells], planes[cells:]
+
+    def publish(self, manifest: Dict[str, Any]):
+        """Sustituye el manifiesto y borra las teselas que ya no usan ni este ni el anterior."""
+        previous = self.manifest()
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, MANIFEST)
+        tmp = f"{path}.{secrets.token_hex(4)}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, path)
+
+        # Se conservan las del manifiesto anterior: un lector puede estar usándolo
+        keep = {key for m in (manifest, previous) if m for tiles in m["tiles"].values() for key in tiles.values()}
+        directory = os.path.join(self.directory, "tiles")
+        for name in os.listdir(directory) if os.path.isdir(directory) else []:
+            if name.endswith(".f32") and name[:-4] not in keep:
+                try:
+                    os.remove(os.path.join(directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def raster(self, manifest: Dict[str, Any], operator: str, bbox: Optional[BBox]) -> Optional[Raster]:
+        """Superficie de la operadora sobre las celdas que tocan `bbox` (toda la rejilla si es None)."""
+        grid = Grid.from_dict(manifest["grid"])
+        window = grid.window(bbox) if bbox is not None else (0, 0, grid.cols, grid.rows)
+        if window is None:
+            return None
+        c0, r0, c1, r1 = window
+        width, height, t = c1 - c0, r1 - r0, grid.tile
+        value = [math.nan] * (width * height)
+        confidence = [0.0] * (width * height)
+        tiles = manifest["tiles"].get(operator, {})
+        for ty in range(r0 // t, (r1 - 1) // t + 1):
+            for tx in range(c0 // t, (c1 - 1) // t + 1):
+                key = tiles.get(f"{tx},{ty}")
+                planes = self.read_tile(key, t) if key else None
+                if planes is None:
+                    continue  # Sin mediciones a menos de un radio
+                tile_value, tile_confidence = planes
+                # Tramo de la tesela dentro de la ventana
+                x0, x1 = max(c0, tx * t), min(c1, (tx + 1) * t)
+                for row in range(max(r0, ty * t), min(r1, (ty + 1) * t)):
+                    src = (row - ty * t) * t + x0 - tx * t
+                    dst = (row - r0) * width + x0 - c0
+                    value[dst:dst + x1 - x0] = tile_value[src:src + x1 - x0]
+                    confidence[dst:dst + x1 - x0] = tile_confidence[src:src + x1 - x0]
+        return Raster(grid.cells_bbox(c0, r0, c1, r1), width, height, "signal", confidence, value)
+
+
+# Singleton instance
+coverage_store = CoverageStore(config.COVERAGE_DIR)
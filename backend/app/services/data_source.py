@@ -0,0 +1,463 @@
+"""
+Interfaz de fuentes de datos de señales.
+
+`SupabaseService` delega en una `SignalDataSource`: la API REST de Supabase
+(PostgREST), PostgreSQL directo o SQLite como sustituto local. Las fuentes SQL
+comparten el generador de consultas de este módulo, así los filtros se
+resuelven en la base de datos y las filas ya llegan normalizadas.
+
+Las fuentes SQL guardan además la tabla compactada (`COMPACTED_TABLE`, ver
+`app.services.compaction`), que es la que leen por defecto los análisis.
+"""
+from abc import ABC, abstractmethod
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from app.models.signal_batch import SignalBatch
+from app.services.filters import DEFAULT_PUSHDOWN, Predicate
+import logging
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "locations"
+
+# Columnas que se leen para análisis, en orden fijo
+SIGNAL_COLUMNS = [
+    "latitude", "longitude", "signal", "sim_operator", "network_type",
+    "device_name", "speed", "battery", "altitude", "timestamp",
+]
+
+# Páginas por keyset: además de las columnas de análisis, el id (desempate del cursor)
+PAGE_COLUMNS = SIGNAL_COLUMNS + ["id"]
+
+# Clave de una fila en el orden de las páginas: (timestamp, id)
+PageKey = Tuple[str, int]
+
+# Análisis sobre la tabla compactada: además, los reportes crudos que representa cada fila
+COMPACTED_COLUMNS = SIGNAL_COLUMNS + ["reports"]
+
+COMPACTED_TABLE = "locations_compacted"
+MAX_ID = 2 ** 63 - 1  # tope de BIGINT: sin filas recientes no hay corte
+
+# Fila única con un contador que suben los triggers de UPDATE sobre `locations`
+# (inserciones y borrados ya cambian conteo y MAX(id))
+CHANGES_TABLE = "locations_changes"
+
+# Clave de un grupo compactado: dispositivo, operadora, red, ventana de tiempo y celda
+BIN_KEY = ["device_name", "sim_operator", "network_type", "window_start", "cell_lat", "cell_lng"]
+
+# Columnas de la tabla compactada: la clave, la fila representativa (mismos
+# nombres que en `locations`: sirven el SELECT normalizado y los predicados)
+# y los acumulados con los que se fusionan reportes nuevos
+BIN_COLUMNS = BIN_KEY + [
+    "latitude", "longitude", "altitude", "speed", "battery", "signal", "timestamp",
+    "report_count", "latitude_sum", "longitude_sum", "altitude_sum", "speed_sum",
+    "signal_sum", "signal_min", "signal_max", "last_timestamp", "last_id",
+]
+
+# Columnas que se pueden insertar (ingesta)
+INSERT_COLUMNS = [
+    "device_id", "device_name", "latitude", "longitude", "altitude", "speed",
+    "battery", "signal", "sim_operator", "network_type", "timestamp",
+]
+
+# Columnas de texto permitidas en DISTINCT (evita inyección por nombre de columna)
+DISTINCT_COLUMNS = {"device_id", "device_name", "sim_operator", "network_type"}
+
+# Tipo de buffer por columna: typecode de `array` o None para listas de objetos
+COLUMN_TYPES = {
+    "latitude": "d",
+    "longitude": "d",
+    "speed": "d",
+    "altitude": "d",
+    "signal": "i",
+    "battery": "i",
+    "sim_operator": None,
+    "network_type": None,
+    "device_name": None,
+    "timestamp": None,
+    "id": "q",
+    "reports": "i",
+}
+
+
+class ColumnBuffers:
+    """Acumula filas en buffers por columna (arrays tipados para números)."""
+
+    def __init__(self, columns: Sequence[str] = SIGNAL_COLUMNS):
+        self.columns = list(columns)
+        self.buffers = [
+            array(COLUMN_TYPES[c]) if COLUMN_TYPES.get(c) else []
+            for c in self.columns
+        ]
+        self._appends = [b.append for b in self.buffers]
+
+    def append_row(self, values: Sequence[Any]):
+        for append, value in zip(self._appends, values):
+            append(value)
+
+    def extend_rows(self, rows: Iterable[Sequence[Any]]):
+        appends = self._appends
+        for values in rows:
+            for append, value in zip(appends, values):
+                append(value)
+
+    def __len__(self) -> int:
+        return len(self.buffers[0]) if self.buffers else 0
+
+    def as_dict(self) -> Dict[str, Sequence[Any]]:
+        return dict(zip(self.columns, self.buffers))
+
+    def to_rows(self) -> List[Dict[str, Any]]:
+        """Materializa filas dict (formato que consumen rutas y Spark hoy)."""
+        names = self.columns
+        return [dict(zip(names, values)) for values in zip(*self.buffers)]
+
+    def to_batch(self) -> SignalBatch:
+        """Lote columnar (las filas ya vienen normalizadas por el SQL)."""
+        return SignalBatch.from_columns(self.as_dict())
+
+
+def _select_list(timestamp_expr: str) -> str:
+    """SELECT con la misma normalización que `_normalize_data`, en SQL portable."""
+    return ", ".join([
+        "CAST(latitude AS DOUBLE PRECISION) AS latitude",
+        "CAST(longitude AS DOUBLE PRECISION) AS longitude",
+        "CAST(COALESCE(signal, 0) AS INTEGER) AS signal",
+        "COALESCE(NULLIF(sim_operator, ''), 'Unknown') AS sim_operator",
+        "COALESCE(NULLIF(network_type, ''), 'Unknown') AS network_type",
+        "COALESCE(NULLIF(device_name, ''), 'Unknown') AS device_name",
+        "CAST(COALESCE(speed, 0) AS DOUBLE PRECISION) AS speed",
+        "CAST(COALESCE(battery, 0) AS INTEGER) AS battery",
+        "CAST(COALESCE(altitude, 0) AS DOUBLE PRECISION) AS altitude",
+        f'{timestamp_expr} AS "timestamp"',
+    ])
+
+
+# Columna SQL de cada columna de predicado (lista cerrada: sin inyección por nombre)
+PREDICATE_COLUMNS = {
+    "sim_operator": "sim_operator",
+    "network_type": "network_type",
+    "device_name": "device_name",
+    "timestamp": '"timestamp"',
+    "battery": "battery",
+    "signal": "signal",
+    "latitude": "latitude",
+    "longitude": "longitude",
+}
+
+
+def build_where(predicates: Optional[Sequence[Predicate]] = None,
+                placeholder: str = "%s") -> Tuple[str, List[Any]]:
+    """Traduce los predicados empujados a una cláusula WHERE parametrizada."""
+    clauses = [
+        "latitude IS NOT NULL",
+        "longitude IS NOT NULL",
+        "latitude <> 0",
+        "longitude <> 0",
+    ]
+    params: List[Any] = []
+
+    for predicate in predicates or []:
+        column = PREDICATE_COLUMNS[predicate.column]
+        if predicate.op == "in":
+            clauses.append(f"{column} IN ({', '.join([placeholder] * len(predicate.value))})")
+            params.extend(predicate.value)
+        elif predicate.op in (">=", "<="):
+            clauses.append(f"{column} {predicate.op} {placeholder}")
+            params.append(predicate.value)
+        else:
+            raise ValueError(f"Operator {predicate.op} cannot be pushed to SQL")
+
+    return " AND ".join(clauses), params
+
+
+def build_select(predicates: Optional[Sequence[Predicate]] = None, limit: Optional[int] = None,
+                 offset: int = 0, placeholder: str = "%s",
+                 timestamp_expr: str = '"timestamp"', newest: bool = False) -> Tuple[str, List[Any]]:
+    """SELECT normalizado con predicados, límite y offset; con `newest`, de la fila más nueva a la más vieja."""
+    where, params = build_where(predicates, placeholder)
+    sql = f"SELECT {_select_list(timestamp_expr)} FROM {TABLE_NAME} WHERE {where} ORDER BY id"
+    if newest:
+        sql += " DESC"
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    if offset:
+        sql += f" OFFSET {int(offset)}"
+    return sql, params
+
+
+def build_page_select(predicates: Optional[Sequence[Predicate]], limit: int,
+                      after: Optional[PageKey] = None, placeholder: str = "%s",
+                      timestamp_expr: str = '"timestamp"') -> Tuple[str, List[Any]]:
+    """
+    Página por keyset: orden (timestamp, id) y filas posteriores a `after`.
+    Con un índice sobre ("timestamp", id) cada página es un recorrido de
+    índice desde la clave, sin saltar filas como OFFSET.
+    """
+    where, params = build_where(predicates, placeholder)
+    if after is not None:
+        where += f" AND ({timestamp_expr}, id) > ({placeholder}, {placeholder})"
+        params.extend(after)
+    sql = (f"SELECT {_select_list(timestamp_expr)}, id FROM {TABLE_NAME} "
+           f"WHERE {where} ORDER BY {timestamp_expr}, id LIMIT {int(limit)}")
+    return sql, params
+
+
+def build_compacted_select(predicates: Optional[Sequence[Predicate]] = None, limit: Optional[int] = None,
+                           offset: int = 0, placeholder: str = "%s",
+                           timestamp_expr: str = '"timestamp"', newest: bool = False) -> Tuple[str, List[Any]]:
+    """
+    SELECT de análisis: los grupos compactados (peso `report_count`) y las
+    filas crudas posteriores al último id compactado (peso 1), que absorberá
+    la próxima compactación. Sin compactar nada equivale a leer `locations`.
+    Con `newest` el resultado va ordenado por tiempo descendente (un `limit`
+    se queda con lo más reciente); si no, sin orden.
+    """
+    where, params = build_where(predicates, placeholder)
+    select = _select_list(timestamp_expr)
+    sql = (f"SELECT {select}, report_count AS reports FROM {COMPACTED_TABLE} WHERE {where} "
+           f"UNION ALL SELECT {select}, 1 AS reports FROM {TABLE_NAME} WHERE {where} "
+           f"AND id > (SELECT COALESCE(MAX(last_id), 0) FROM {COMPACTED_TABLE})")
+    if newest:
+        sql += ' ORDER BY "timestamp" DESC'
+    if limit is not None:
+        sql += f" LIMIT {int(limit)}"
+    if offset:
+        sql += f" OFFSET {int(offset)}"
+    return sql, params + params
+
+
+def build_raw_after(after_id: int, limit: int, placeholder: str = "%s",
+                    timestamp_expr: str = '"timestamp"', unsettled_expr: Optional[str] = None,
+                    grace: float = 0.0) -> Tuple[str, List[Any]]:
+    """
+    Filas crudas normalizadas (`PAGE_COLUMNS`) con id mayor que `after_id`, en
+    orden de id. Con `unsettled_expr` (filas insertadas hace menos de `grace`
+    segundos) se detiene antes del primer id reciente: con varios escritores
+    los ids no se confirman en orden y uno menor aún puede estar en vuelo; si
+    se compactara lo posterior, `MAX(last_id)` lo saltaría para siempre.
+    """
+    where, params = build_where(None, placeholder)
+    params.append(int(after_id))
+    sql = f"SELECT {_select_list(timestamp_expr)}, id FROM {TABLE_NAME} WHERE {where} AND id > {placeholder}"
+    if unsettled_expr is not None:
+        sql += (f" AND id < COALESCE((SELECT MIN(id) FROM {TABLE_NAME} "
+                f"WHERE id > {placeholder} AND {unsettled_expr}), {MAX_ID})")
+        params.extend([int(after_id), grace])
+    return f"{sql} ORDER BY id LIMIT {int(limit)}", params
+
+
+def build_bins_upsert(placeholder: str = "%s") -> str:
+    """INSERT de grupos completos que sustituye al grupo con la misma clave (SQLite y PostgreSQL)."""
+    columns = ", ".join(f'"{c}"' for c in BIN_COLUMNS)
+    marks = ", ".join([placeholder] * len(BIN_COLUMNS))
+    updates = ", ".join(f'"{c}" = excluded."{c}"' for c in BIN_COLUMNS if c not in BIN_KEY)
+    return (f"INSERT INTO {COMPACTED_TABLE} ({columns}) VALUES ({marks}) "
+            f"ON CONFLICT ({', '.join(BIN_KEY)}) DO UPDATE SET {updates}")
+
+
+class SignalDataSource(ABC):
+    """Contrato de una fuente de datos de señales. Las filas salen normalizadas."""
+
+    name = "abstract"
+    # Operadores de predicado que la fuente evalúa (el resto queda residual)
+    pushdown_ops = DEFAULT_PUSHDOWN
+    # Guarda la tabla compactada (`fetch_raw_after`, `read_bins`, `write_bins`...)
+    supports_compaction = False
+
+    @abstractmethod
+    def fetch_signals(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        """Filas sin filtrar, paginadas por limit/offset."""
+
+    @abstractmethod
+    def fetch_filtered(self, predicates: Sequence[Predicate]) -> List[Dict[str, Any]]:
+        """Filas que cumplen los predicados empujados."""
+
+    def fetch_columns(self, predicates: Optional[Sequence[Predicate]] = None,
+                      limit: Optional[int] = None, offset: int = 0, newest: bool = False) -> ColumnBuffers:
+        """
+        Lectura masiva en buffers por columna; con `newest`, de la fila más
+        nueva a la más vieja. Por defecto transpone filas (sin orden propio).
+        """
+        rows = self.fetch_filtered(predicates) if predicates else self.fetch_signals(limit or 500000, offset)
+        buffers = ColumnBuffers()
+        buffers.extend_rows([row.get(c) for c in SIGNAL_COLUMNS] for row in rows)
+        return buffers
+
+    def fetch_batch(self, predicates: Optional[Sequence[Predicate]] = None,
+                    limit: Optional[int] = None, offset: int = 0, newest: bool = False) -> SignalBatch:
+        """Lectura en un `SignalBatch` columnar (camino de análisis)."""
+        return self.fetch_columns(predicates, limit, offset, newest).to_batch()
+
+    def fetch_page(self, predicates: Optional[Sequence[Predicate]], limit: int,
+                   after: Optional[PageKey] = None) -> Tuple[SignalBatch, Optional[PageKey]]:
+        """Página por keyset (timestamp, id) tras `after`: lote + clave de su última fila."""
+        raise NotImplementedError(f"{self.name} source does not support keyset pages")
+
+    def fetch_compacted(self, predicates: Optional[Sequence[Predicate]] = None,
+                        limit: Optional[int] = None, offset: int = 0, newest: bool = False) -> SignalBatch:
+        """
+        Camino de análisis: grupos compactados + filas crudas aún sin compactar,
+        con los reportes de cada fila en la columna `reports`. Sin tabla
+        compactada, las filas crudas.
+        """
+        return self.fetch_batch(predicates, limit, offset, newest)
+
+    def fetch_raw_after(self, after_id: int, limit: int, grace: float = 0.0) -> ColumnBuffers:
+        """Filas crudas (`PAGE_COLUMNS`) tras `after_id` en orden de id, sin llegar a las de hace menos de `grace` s."""
+        raise NotImplementedError(f"{self.name} source does not support compaction")
+
+    def compaction_state(self) -> Dict[str, int]:
+        """Grupos compactados, reportes que representan y último id crudo compactado."""
+        raise NotImplementedError(f"{self.name} source does not support compaction")
+
+    def read_bins(self, first_window: int, last_window: int) -> List[Tuple[Any, ...]]:
+        """Grupos (tuplas en el orden de `BIN_COLUMNS`) de las ventanas entre `first_window` y `last_window`."""
+        raise NotImplementedError(f"{self.name} source does not support compaction")
+
+    def write_bins(self, bins: Sequence[Sequence[Any]]) -> int:
+        """Escribe grupos completos en una transacción (sustituye los de la misma clave)."""
+        raise NotImplementedError(f"{self.name} source does not support compaction")
+
+    def clear_bins(self):
+        """Vacía la tabla compactada (las filas crudas no se tocan)."""
+        raise NotImplementedError(f"{self.name} source does not support compaction")
+
+    @abstractmethod
+    def count(self) -> int:
+        """Total exacto de filas en la tabla."""
+
+    def change_marker(self) -> str:
+        """Marca que cambia con las escrituras en la tabla (watermark). Por defecto, el conteo."""
+        return str(self.count())
+
+    @abstractmethod
+    def unique_values(self, column: str) -> List[str]:
+        """Valores distintos no vacíos de una columna, ordenados."""
+
+    @abstractmethod
+    def insert_rows(self, rows: List[Dict[str, Any]]) -> int:
+        """Inserción masiva. Devuelve filas escritas; propaga errores."""
+
+    def close(self):
+        """Libera conexiones."""
+
+
+class SQLSignalSource(SignalDataSource):
+    """
+    Base de las fuentes SQL: genera las consultas y llena los buffers por
+    columna. Las subclases solo implementan cómo ejecutar y cómo insertar.
+    """
+
+    placeholder = "%s"
+    timestamp_expr = '"timestamp"'
+    supports_compaction = True
+    # Predicado de filas insertadas hace menos de la gracia (un parámetro, en segundos);
+    # None si los ids se confirman en orden (un solo escritor, como SQLite)
+    unsettled_expr: Optional[str] = None
+    track_updates = True  # Lee `CHANGES_TABLE`; pasa a False si no existe
+
+    @abstractmethod
+    def _stream(self, sql: str, params: List[Any]) -> Iterable[Tuple[Any, ...]]:
+        """Ejecuta un SELECT y genera tuplas sin materializar el resultado completo."""
+
+    @abstractmethod
+    def _execute_many(self, sql: str, rows: Iterable[Sequence[Any]]):
+        """Ejecuta una sentencia de escritura por fila, todas en una transacción."""
+
+    def _finish(self, buffers: ColumnBuffers) -> ColumnBuffers:
+        """Ajustes de tipos por columna tras la lectura (p. ej. timestamps)."""
+        return buffers
+
+    def _read_columns(self, sql: str, params: List[Any],
+                      columns: Sequence[str] = SIGNAL_COLUMNS) -> ColumnBuffers:
+        """Ejecuta el SELECT normalizado y llena los buffers de `columns`."""
+        buffers = ColumnBuffers(columns)
+        buffers.extend_rows(self._stream(sql, params))
+        return self._finish(buffers)
+
+    def fetch_columns(self, predicates: Optional[Sequence[Predicate]] = None,
+                      limit: Optional[int] = None, offset: int = 0, newest: bool = False) -> ColumnBuffers:
+        sql, params = build_select(predicates, limit, offset, self.placeholder, self.timestamp_expr, newest)
+        return self._read_columns(sql, params)
+
+    def fetch_page(self, predicates: Optional[Sequence[Predicate]], limit: int,
+                   after: Optional[PageKey] = None) -> Tuple[SignalBatch, Optional[PageKey]]:
+        sql, params = build_page_select(predicates, limit, after, self.placeholder, self.timestamp_expr)
+        buffers = self._read_columns(sql, params, PAGE_COLUMNS)
+        columns = buffers.as_dict()
+        last = (columns["timestamp"][-1], columns["id"][-1]) if len(buffers) else None
+        return buffers.to_batch(), last
+
+    def fetch_compacted(self, predicates: Optional[Sequence[Predicate]] = None,
+                        limit: Optional[int] = None, offset: int = 0, newest: bool = False) -> SignalBatch:
+        sql, params = build_compacted_select(predicates, limit, offset, self.placeholder,
+                                             self.timestamp_expr, newest)
+        return self._read_columns(sql, params, COMPACTED_COLUMNS).to_batch()
+
+    def fetch_raw_after(self, after_id: int, limit: int, grace: float = 0.0) -> ColumnBuffers:
+        sql, params = build_raw_after(after_id, limit, self.placeholder, self.timestamp_expr,
+                                      self.unsettled_expr, grace)
+        return self._read_columns(sql, params, PAGE_COLUMNS)
+
+    def compaction_state(self) -> Dict[str, int]:
+        sql = (f"SELECT COUNT(*), COALESCE(SUM(report_count), 0), COALESCE(MAX(last_id), 0) "
+               f"FROM {COMPACTED_TABLE}")
+        for bins, reports, last_id in self._stream(sql, []):
+            return {"bins": int(bins), "reports": int(reports), "last_id": int(last_id)}
+        return {"bins": 0, "reports": 0, "last_id": 0}
+
+    def read_bins(self, first_window: int, last_window: int) -> List[Tuple[Any, ...]]:
+        columns = ", ".join(f'"{c}"' for c in BIN_COLUMNS)
+        sql = (f"SELECT {columns} FROM {COMPACTED_TABLE} "
+               f"WHERE window_start >= {self.placeholder} AND window_start <= {self.placeholder}")
+        return list(self._stream(sql, [first_window, last_window]))
+
+    def write_bins(self, bins: Sequence[Sequence[Any]]) -> int:
+        if bins:
+            self._execute_many(build_bins_upsert(self.placeholder), bins)
+        return len(bins)
+
+    def clear_bins(self):
+        self._execute_many(f"DELETE FROM {COMPACTED_TABLE}", [()])
+
+    def fetch_signals(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        return self.fetch_columns(None, limit, offset).to_rows()
+
+    def fetch_filtered(self, predicates: Sequence[Predicate]) -> List[Dict[str, Any]]:
+        return self.fetch_columns(predicates).to_rows()
+
+    def count(self) -> int:
+        for (total,) in self._stream(f"SELECT COUNT(*) FROM {TABLE_NAME}", []):
+            return int(total)
+        return 0
+
+    def change_marker(self) -> str:
+        """
+        Conteo, MAX(id) y versión de `CHANGES_TABLE`: un borrado cambia el
+        conteo, un borrado + inserción el id máximo y un UPDATE la versión.
+        """
+        marker = "0.0"
+        for total, max_id in self._stream(f"SELECT COUNT(*), COALESCE(MAX(id), 0) FROM {TABLE_NAME}", []):
+            marker = f"{int(total)}.{int(max_id)}"
+        return f"{marker}.{self._update_version()}"
+
+    def _update_version(self) -> int:
+        if not self.track_updates:
+            return 0
+        try:
+            for (version,) in self._stream(f"SELECT version FROM {CHANGES_TABLE}", []):
+                return int(version)
+            return 0
+        except Exception as e:
+            # Sin la tabla (PostgreSQL sin migrar): los UPDATE externos no se detectan
+            self.track_updates = False
+            logger.warning(f"No {CHANGES_TABLE} table, external updates are not tracked: {e}")
+            return 0
+
+    def unique_values(self, column: str) -> List[str]:
+        if column not in DISTINCT_COLUMNS:
+            return []
+        sql = (f"SELECT DISTINCT {column} FROM {TABLE_NAME} "
+               f"WHERE {column} IS NOT NULL AND {column} <> '' ORDER BY 1")
+        return [value for (value,) in self._stream(sql, [])]
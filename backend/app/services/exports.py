@@ -0,0 +1,117 @@
+"""
+Exportaciones: estado y ficheros en disco (`EXPORT_DIR/<id>/`).
+
+El trabajo lo ejecuta Spark (`app.etl.exports`, en el proceso de cómputo con
+`serve.py`); los workers de la API solo leen `status.json` y sirven el zip,
+así que cualquier worker puede consultar o descargar cualquier exportación.
+"""
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone
+from app.config import config
+import json
+import os
+import re
+import secrets
+import shutil
+import threading
+import time
+
+FORMATS = ("parquet", "csv")
+PARTITION_COLUMNS = ("sim_operator", "network_type", "date")
+ACTIVE = ("queued", "running", "packaging")
+ARCHIVE = "export.zip"
+_ID = re.compile(r"^[0-9a-f]{16}$")
+
+
+def now_iso() -> str:
+    return datetime.now(timezone.utc).isoformat()
+
+
+class ExportStore:
+    """Un directorio por exportación: `status.json`, `data/` (salida de Spark) y `export.zip`."""
+
+    def __init__(self, directory: str, retention_hours: float):
+        self.directory = directory
+        self.retention = retention_hours * 3600
+        self._lock = threading.Lock()
+
+    def new_id(self) -> str:
+        return secrets.token_hex(8)
+
+    def path(self, export_id: str, *parts: str) -> Optional[str]:
+        """Ruta dentro de la exportación (None si el id no es válido)."""
+        if not _ID.match(export_id or ""):
+            return None
+        return os.path.join(self.directory, export_id, *parts)
+
+    def read(self, export_id: str) -> Optional[Dict[str, Any]]:
+        path = self.path(export_id, "status.json")
+        if path is None:
+            return None
+        try:
+            with open(path) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def create(self, **fields) -> Dict[str, Any]:
+        status = {"id": self.new_id(), "status": "queued", "created_at": now_iso(),
+                  "rows": 0, "progress": 0.0, **fields}
+        os.makedirs(self.path(status["id"]), exist_ok=True)
+        self._write(status)
+        return status
+
+    def update(self, export_id: str, **fields) -> Optional[Dict[str, Any]]:
+        """Lectura-modificación-escritura atómica del estado."""
+        with self._lock:
+            status = self.read(export_id)
+            if status is None:
+                return None
+            status.update(fields)
+            self._write(status)
+            return status
+
+    def _write(self, status: Dict[str, Any]):
+        path = self.path(status["id"], "status.json")
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            json.dump(status, f)
+        os.replace(tmp, path)
+
+    def archive(self, export_id: str) -> Optional[str]:
+        """Zip de una exportación terminada."""
+        status = self.read(export_id)
+        path = self.path(export_id, ARCHIVE)
+        if status is None or status["status"] != "done" or not os.path.exists(path):
+            return None
+        return path
+
+    def list(self) -> List[Dict[str, Any]]:
+        """Estados guardados, más recientes primero."""
+        try:
+            ids = os.listdir(self.directory)
+        except FileNotFoundError:
+            return []
+        statuses = [s for s in (self.read(i) for i in ids) if s is not None]
+        return sorted(statuses, key=lambda s: s["created_at"], reverse=True)
+
+    def remove(self, export_id: str):
+        path = self.path(export_id)
+        if path is not None:
+            shutil.rmtree(path, ignore_errors=True)
+
+    def expire(self):
+        """Borra las exportaciones terminadas hace más de `EXPORT_RETENTION_HOURS`."""
+        cutoff = time.time() - self.retention
+        for status in self.list():
+            if status["status"] in ACTIVE:
+                continue
+            try:
+                if os.path.getmtime(self.path(status["id"], "status.json")) < cutoff:
+                    self.remove(status["id"])
+            except FileNotFoundError:
+                continue
+
+
+# Singleton instance
+export_store = ExportStore(config.EXPORT_DIR, config.EXPORT_RETENTION_HOURS)
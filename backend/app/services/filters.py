@@ -0,0 +1,297 @@
+"""
+Compilador de filtros de señales.
+
+Todas las rutas construyen un `SignalFilter` (desde `FilterParams`, query
+params o el dict del WebSocket) y lo compilan a un `FilterPlan`:
+- `pushed`: predicados que resuelve la fuente de datos (SQL / PostgREST)
+- `residual`: lo que la fuente no puede evaluar; se aplica en Spark (o sobre
+  el `SignalBatch` si la ruta no usa Spark)
+
+Provincias y municipios no son columnas de la tabla: se resuelven con los
+límites de `boundaries` a un bbox (empujado) más un test de polígono (residual).
+
+Las fechas del filtro se pasan a UTC (las filas vienen en UTC) y, fuera de la
+fuente, se comparan como segundos: dos ISO con zonas distintas no se pueden
+comparar como texto (Santa Cruz es UTC-4).
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set
+from app.models.signal_batch import SignalBatch
+from app.services.boundaries import BBox, boundary_index, contains_any, union_bbox
+from app.services.point_store import epoch_seconds
+
+# Operadores que entienden todas las fuentes actuales
+DEFAULT_PUSHDOWN = frozenset({"in", ">=", "<="})
+
+# Claves heredadas del frontend -> campo canónico
+ALIASES = {
+    "empresas": "sim_operators",
+    "tipos_senal": "network_types",
+}
+
+LIST_FIELDS = ("sim_operators", "network_types", "device_names", "provincias", "municipios")
+SCALAR_FIELDS = ("fecha_inicio", "fecha_fin", "battery_min", "signal_min", "bbox")
+
+
+class Predicate:
+    """Condición sobre una columna: `in`, `>=`, `<=` o `within` (regiones)."""
+
+    __slots__ = ("column", "op", "value")
+
+    def __init__(self, column: str, op: str, value: Any):
+        self.column = column
+        self.op = op
+        self.value = value
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Predicate) and (self.column, self.op, self.value) == (other.column, other.op, other.value)
+
+    def __hash__(self) -> int:
+        return hash((self.column, self.op, self.value))
+
+    def __repr__(self) -> str:
+        if self.op == "in":
+            return f"{self.column} IN {list(self.value)}"
+        if self.op == "within":
+            return f"({self.column}) WITHIN {len(self.value)} region(s)"
+        return f"{self.column} {self.op} {self.value!r}"
+
+
+class FilterPlan:
+    """Resultado de compilar un filtro para una fuente concreta."""
+
+    def __init__(self, pushed: List[Predicate], residual: List[Predicate], matches_nothing: bool = False):
+        self.pushed = pushed
+        self.residual = residual
+        self.matches_nothing = matches_nothing
+
+    def describe(self) -> Dict[str, Any]:
+        """Plan legible (logs, depuración y pruebas)."""
+        return {
+            "pushed": [repr(p) for p in self.pushed],
+            "residual": [repr(p) for p in self.residual],
+            "matches_nothing": self.matches_nothing,
+        }
+
+
+def parse_bbox(value: str) -> BBox:
+    """'min_lng,min_lat,max_lng,max_lat' -> tupla. Lanza ValueError si es inválido."""
+    try:
+        parts = [float(v) for v in value.split(",")]
+    except ValueError:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    if len(parts) != 4 or parts[0] > parts[2] or parts[1] > parts[3]:
+        raise ValueError("bbox must be min_lng,min_lat,max_lng,max_lat")
+    return tuple(parts)
+
+
+class SignalFilter:
+    """Representación única de los filtros de señales."""
+
+    __slots__ = LIST_FIELDS + SCALAR_FIELDS
+
+    def __init__(self, **values):
+        for name in LIST_FIELDS:
+            items = values.get(name) or []
+            # Orden estable: misma clave de caché para el mismo conjunto
+            setattr(self, name, tuple(sorted({str(v) for v in items if v not in (None, "")})))
+        for name in SCALAR_FIELDS:
+            setattr(self, name, values.get(name))
+
+    @classmethod
+    def from_dict(cls, filters: Optional[Dict[str, Any]]) -> "SignalFilter":
+        """Acepta claves canónicas y heredadas (`empresas`, `tipos_senal`)."""
+        values: Dict[str, Any] = {}
+        for key, value in (filters or {}).items():
+            if value is None:
+                continue
+            name = ALIASES.get(key, key)
+            if name in LIST_FIELDS:
+                values[name] = list(values.get(name, [])) + (list(value) if isinstance(value, (list, tuple, set)) else [value])
+            elif name == "bbox" and isinstance(value, str):
+                values[name] = parse_bbox(value)
+            elif name == "bbox":
+                values[name] = tuple(float(v) for v in value)
+            elif name in SCALAR_FIELDS:
+                values[name] = value
+        return cls(**values)
+
+    @classmethod
+    def from_query(cls, provincia: Optional[str] = None, municipio: Optional[str] = None,
+                   empresa: Optional[str] = None, tipo_senal: Optional[str] = None,
+                   bbox: Optional[str] = None, fecha_inicio: Optional[datetime] = None,
+                   fecha_fin: Optional[datetime] = None) -> "SignalFilter":
+        """Desde los query params de las rutas GET."""
+        return cls.from_dict({
+            "provincias": [provincia] if provincia else None,
+            "municipios": [municipio] if municipio else None,
+            "empresas": [empresa] if empresa else None,
+            "tipos_senal": [tipo_senal] if tipo_senal else None,
+            "bbox": bbox,
+            "fecha_inicio": fecha_inicio,
+            "fecha_fin": fecha_fin,
+        })
+
+    @classmethod
+    def coerce(cls, filters: Any) -> "SignalFilter":
+        if isinstance(filters, SignalFilter):
+            return filters
+        if hasattr(filters, "model_dump"):
+            return cls.from_dict(filters.model_dump(exclude_none=True))
+        return cls.from_dict(filters)
+
+    def is_empty(self) -> bool:
+        return not any(getattr(self, name) for name in LIST_FIELDS) and \
+            all(getattr(self, name) is None for name in SCALAR_FIELDS)
+
+    def to_key(self) -> Dict[str, Any]:
+        """Dict canónico y serializable (claves de caché)."""
+        key: Dict[str, Any] = {}
+        for name in LIST_FIELDS:
+            if getattr(self, name):
+                key[name] = list(getattr(self, name))
+        for name in SCALAR_FIELDS:
+            value = getattr(self, name)
+            if value is not None:
+                key[name] = value.isoformat() if hasattr(value, "isoformat") else value
+        return key
+
+
+def _utc_iso(value: Any) -> Optional[str]:
+    """Fecha del filtro en UTC (sin zona se asume UTC). Lanza ValueError si no es ISO 8601."""
+    if value is None:
+        return None
+    try:
+        moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        raise ValueError("fecha_inicio/fecha_fin must be ISO 8601 dates")
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc).isoformat()
+
+
+def _range(predicates: List[Predicate], column: str, low: Any, high: Any):
+    if low is not None:
+        predicates.append(Predicate(column, ">=", low))
+    if high is not None:
+        predicates.append(Predicate(column, "<=", high))
+
+
+def compile_filter(signal_filter: SignalFilter, pushdown: FrozenSet[str] = DEFAULT_PUSHDOWN) -> FilterPlan:
+    """Traduce el filtro a predicados y los reparte entre la fuente y el residual."""
+    f = signal_filter
+    predicates: List[Predicate] = []
+
+    for column, values in (("sim_operator", f.sim_operators),
+                           ("network_type", f.network_types),
+                           ("device_name", f.device_names)):
+        if values:
+            predicates.append(Predicate(column, "in", values))
+
+    _range(predicates, "timestamp", _utc_iso(f.fecha_inicio), _utc_iso(f.fecha_fin))
+    if f.battery_min is not None:
+        predicates.append(Predicate("battery", ">=", int(f.battery_min)))
+    if f.signal_min is not None:
+        predicates.append(Predicate("signal", ">=", int(f.signal_min)))
+
+    if f.bbox is not None:
+        min_lng, min_lat, max_lng, max_lat = f.bbox
+        _range(predicates, "latitude", min_lat, max_lat)
+        _range(predicates, "longitude", min_lng, max_lng)
+
+    if f.provincias or f.municipios:
+        regions = boundary_index.find(f.provincias, f.municipios)
+        if not regions:
+            # Región desconocida: nada que leer (antes se leía la tabla completa)
+            return FilterPlan([], [], matches_nothing=True)
+        # bbox de la unión: aproximación que sí entiende la fuente
+        min_lng, min_lat, max_lng, max_lat = union_bbox(regions)
+        _range(predicates, "latitude", min_lat, max_lat)
+        _range(predicates, "longitude", min_lng, max_lng)
+        predicates.append(Predicate("latitude,longitude", "within", tuple(regions)))
+
+    pushed = [p for p in predicates if p.op in pushdown]
+    residual = [p for p in predicates if p.op not in pushdown]
+    return FilterPlan(pushed, residual)
+
+
+def _mask(batch: SignalBatch, predicate: Predicate) -> Iterable[bool]:
+    """Máscara por fila de un predicado sobre el lote."""
+    if predicate.op == "within":
+        regions = predicate.value
+        return map(lambda lat, lng: contains_any(regions, lat, lng),
+                   batch.numeric["latitude"], batch.numeric["longitude"])
+    if predicate.column in batch.codes:
+        allowed = _allowed_codes(batch, predicate)
+        return map(allowed.__contains__, batch.codes[predicate.column])
+    values, predicate = _comparable(batch, predicate)
+    return map(lambda value: _test(predicate, value), values)
+
+
+class _Seconds:
+    """Columna de fechas vista como segundos UTC (None si falta)."""
+
+    def __init__(self, values: Sequence[Any]):
+        self.values = values
+        # Almacén de puntos: la columna ya guarda segundos
+        self.seconds = getattr(values, "seconds", None)
+
+    def __getitem__(self, row: int) -> Optional[int]:
+        if self.seconds is not None:
+            return self.seconds[row] or None
+        return epoch_seconds(self.values[row]) or None
+
+    def __iter__(self) -> Iterable[Optional[int]]:
+        if self.seconds is not None:
+            return (s or None for s in self.seconds)
+        return (epoch_seconds(v) or None for v in self.values)
+
+
+def _comparable(batch: SignalBatch, predicate: Predicate):
+    """Columna y predicado que se pueden comparar: las fechas, como segundos UTC."""
+    if predicate.column != "timestamp":
+        return batch.column(predicate.column), predicate
+    bound = Predicate(predicate.column, predicate.op, epoch_seconds(predicate.value))
+    return _Seconds(batch.column(predicate.column)), bound
+
+
+def _allowed_codes(batch: SignalBatch, predicate: Predicate) -> Set[int]:
+    """Columna codificada: se evalúa sobre el diccionario, no sobre cada fila."""
+    dictionary = batch.dictionaries[predicate.column]
+    return {code for code, value in enumerate(dictionary) if _test(predicate, value)}
+
+
+def _test(predicate: Predicate, value: Any) -> bool:
+    if value is None:
+        return False
+    if predicate.op == "in":
+        return value in predicate.value
+    if predicate.op == ">=":
+        return value >= predicate.value
+    if predicate.op == "<=":
+        return value <= predicate.value
+    raise ValueError(f"Unsupported filter operator: {predicate.op}")
+
+
+def apply_to_batch(batch: SignalBatch, predicates: Sequence[Predicate]) -> SignalBatch:
+    """Aplica predicados residuales sobre la máscara de validez del lote (in place)."""
+    for predicate in predicates:
+        batch.valid = bytearray(v and k for v, k in zip(batch.valid, _mask(batch, predicate)))
+    return batch
+
+
+def select_rows(batch: SignalBatch, predicates: Sequence[Predicate], rows: List[int]) -> List[int]:
+    """Índices de `rows` que cumplen todos los predicados (sin recorrer el lote entero)."""
+    for predicate in predicates:
+        if predicate.op == "within":
+            regions = predicate.value
+            lat, lng = batch.numeric["latitude"], batch.numeric["longitude"]
+            rows = [r for r in rows if contains_any(regions, lat[r], lng[r])]
+        elif predicate.column in batch.codes:
+            allowed = _allowed_codes(batch, predicate)
+            codes = batch.codes[predicate.column]
+            rows = [r for r in rows if codes[r] in allowed]
+        else:
+            column, comparable = _comparable(batch, predicate)
+            rows = [r for r in rows if _test(comparable, column[r])]
+    return rows
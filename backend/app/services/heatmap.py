@@ -0,0 +1,234 @@
+"""
+Mapas de calor renderizados en el servidor sobre el almacén de puntos.
+
+En lugar de enviar cada punto al navegador (`leaflet.heat`), el servidor
+acumula los puntos del bbox en una rejilla de tamaño fijo y la suaviza con un
+núcleo gaussiano (aproximado con tres desenfoques de caja, cada uno O(celdas)
+con sumas acumuladas). La respuesta pesa lo mismo con mil puntos que con
+millones:
+
+- `density`: puntos por celda, suavizados (estimación de densidad por núcleo).
+- `signal` / `speed`: media ponderada por el núcleo; NaN donde no hay datos.
+
+La rejilla usa filas equiespaciadas en Web Mercator (como los píxeles del
+mapa), así que se puede superponer tal cual. Se entrega como float32 (fila
+norte primero) o como PNG RGBA con la misma paleta que la capa del frontend.
+"""
+from array import array
+from itertools import accumulate
+from typing import List, Optional, Sequence, Tuple
+from app.models.signal_batch import SignalBatch
+from app.services.boundaries import BBox
+from app.services.filters import Predicate, select_rows
+from app.services.point_store import StoreView
+import math
+import struct
+import zlib
+
+METRICS = ("density", "signal", "speed")
+MAX_GRID = 1024  # celdas por lado
+TILE_GRID = 128  # celdas por tesela de 256 px (el navegador la escala)
+MIN_WEIGHT = 1e-3  # peso del núcleo por debajo del cual una celda no tiene datos
+DENSITY_MAX = 20.0  # puntos por celda que saturan el color (escala logarítmica)
+
+# Rango de color de cada métrica (como HeatmapLayer.jsx)
+VALUE_RANGES = {"signal": (-100.0, -40.0), "speed": (0.0, 50.0)}
+GRADIENT = [
+    (0.0, (0x3b, 0x82, 0xf6)),  # Azul (bajo)
+    (0.3, (0x10, 0xb9, 0x81)),  # Verde
+    (0.5, (0xf5, 0x9e, 0x0b)),  # Amarillo
+    (0.7, (0xef, 0x44, 0x44)),  # Rojo
+    (1.0, (0xdc, 0x26, 0x26)),  # Rojo oscuro (alto)
+]
+MAX_LAT = 85.05112878  # límite de Web Mercator
+
+
+def mercator_y(lat: float) -> float:
+    lat = max(-MAX_LAT, min(MAX_LAT, lat))
+    return math.log(math.tan(math.pi / 4 + math.radians(lat) / 2))
+
+
+def mercator_lat(y: float) -> float:
+    return math.degrees(2 * math.atan(math.exp(y)) - math.pi / 2)
+
+
+def tile_bbox(z: int, x: int, y: int) -> BBox:
+    """Bbox (min_lng, min_lat, max_lng, max_lat) de la tesela XYZ."""
+    n = 2 ** z
+    lng0, lng1 = x / n * 360.0 - 180.0, (x + 1) / n * 360.0 - 180.0
+    lat1 = mercator_lat(math.pi * (1 - 2 * y / n))
+    lat0 = mercator_lat(math.pi * (1 - 2 * (y + 1) / n))
+    return lng0, lat0, lng1, lat1
+
+
+class Raster:
+    """Rejilla `width` x `height` (fila norte primero): peso del núcleo y, si aplica, valor medio."""
+
+    __slots__ = ("bbox", "width", "height", "metric", "weight", "value")
+
+    def __init__(self, bbox: BBox, width: int, height: int, metric: str,
+                 weight: List[float], value: Optional[List[float]]):
+        self.bbox = bbox
+        self.width = width
+        self.height = height
+        self.metric = metric
+        self.weight = weight
+        self.value = value
+
+    def cells(self) -> List[float]:
+        """Valores de la métrica por celda (densidad o media; NaN sin datos)."""
+        return self.weight if self.value is None else self.value
+
+    def range(self) -> Tuple[float, float]:
+        values = [v for v in self.cells() if v == v]  # sin NaN
+        return (min(values), max(values)) if values else (0.0, 0.0)
+
+    def to_float32(self) -> bytes:
+        return array("f", self.cells()).tobytes()
+
+    def to_png(self, density_max: float = DENSITY_MAX) -> bytes:
+        """PNG RGBA: color según la métrica, transparente donde no hay datos."""
+        ramp = RAMP
+        scale = len(ramp) - 1
+        rows = []
+        if self.value is None:
+            norm = math.log1p(density_max)
+            for y in range(self.height):
+                line = bytearray(b"\x00")  # filtro PNG: ninguno
+                for d in self.weight[y * self.width:(y + 1) * self.width]:
+                    t = min(1.0, math.log1p(d) / norm) if d > MIN_WEIGHT else 0.0
+                    line += ramp[int(t * scale)] + bytes((int(40 + 170 * t),)) if t > 0 else b"\x00\x00\x00\x00"
+                rows.append(bytes(line))
+        else:
+            low, high = VALUE_RANGES[self.metric]
+            span = high - low
+            for y in range(self.height):
+                start = y * self.width
+                line = bytearray(b"\x00")
+                for v, w in zip(self.value[start:start + self.width], self.weight[start:start + self.width]):
+                    if v != v:
+                        line += b"\x00\x00\x00\x00"
+                        continue
+                    t = min(1.0, max(0.0, (v - low) / span))
+                    line += ramp[int(t * scale)] + bytes((int(200 * min(1.0, w)),))
+                rows.append(bytes(line))
+        return _png(self.width, self.height, b"".join(rows))
+
+
+def render(view: StoreView, bbox: BBox, width: int, height: int, metric: str,
+           predicates: Sequence[Predicate] = (), region: Optional[BBox] = None,
+           sigma: float = 2.0) -> Raster:
+    """
+    Rejilla de la métrica sobre `bbox`. Se acumulan también los puntos de un
+    margen de 3 radios alrededor para que el suavizado no corte en los bordes
+    (las teselas vecinas encajan). `region` limita los puntos (bbox de las regiones
+    del filtro) y `predicates` son los filtros restantes.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    radius = _box_radius(sigma)
+    margin = 3 * radius
+    cols, lines = width + 2 * margin, height + 2 * margin
+    top = mercator_y(max_lat)
+    sx = width / (max_lng - min_lng)
+    sy = height / (top - mercator_y(min_lat))
+    x0 = min_lng - margin / sx
+    y0 = top + margin / sy
+
+    # Puntos del bbox ampliado por el margen
+    query = (x0, mercator_lat(y0 - lines / sy), x0 + cols / sx, mercator_lat(y0))
+    if region is not None:
+        query = (max(query[0], region[0]), max(query[1], region[1]),
+                 min(query[2], region[2]), min(query[3], region[3]))
+    rows = view.query(query) if query[0] <= query[2] and query[1] <= query[3] else []
+    if predicates:
+        rows = select_rows(view.batch, predicates, rows)
+
+    count, total = _bin(view.batch, rows, metric, x0, y0, sx, sy, cols, lines)
+    weight = _crop(_blur(count, cols, lines, radius), cols, margin, width, height)
+    if total is None:
+        return Raster(bbox, width, height, metric, weight, None)
+    sums = _crop(_blur(total, cols, lines, radius), cols, margin, width, height)
+    value = [s / w if w > MIN_WEIGHT else math.nan for s, w in zip(sums, weight)]
+    return Raster(bbox, width, height, metric, weight, value)
+
+
+def _bin(batch: SignalBatch, rows: Sequence[int], metric: str, x0: float, y0: float,
+         sx: float, sy: float, cols: int, lines: int) -> Tuple[List[float], Optional[List[float]]]:
+    """Conteo (y suma de la métrica) de los puntos por celda."""
+    lat, lng = batch.numeric["latitude"], batch.numeric["longitude"]
+    count = [0.0] * (cols * lines)
+    total = None if metric == "density" else [0.0] * (cols * lines)
+    values = batch.numeric[metric] if total is not None else None
+    floor, log, tan, radians, quarter = math.floor, math.log, math.tan, math.radians, math.pi / 4
+    for r in rows:
+        gx = floor((lng[r] - x0) * sx)
+        gy = floor((y0 - log(tan(quarter + radians(lat[r]) / 2))) * sy)
+        if 0 <= gx < cols and 0 <= gy < lines:
+            if values is not None:
+                v = values[r]
+                if metric == "signal" and v == 0:
+                    continue  # Sin lectura de señal (normalizada a 0)
+                total[gy * cols + gx] += v
+            count[gy * cols + gx] += 1.0
+    return count, total
+
+
+def _box_radius(sigma: float) -> int:
+    """Radio de caja tal que tres pasadas aproximan una gaussiana de `sigma` celdas."""
+    return max(1, round((math.sqrt(4 * sigma * sigma + 1) - 1) / 2))
+
+
+def _box_rows(rows: List[List[float]], radius: int) -> List[List[float]]:
+    """Media móvil de ancho 2r+1 por fila con sumas acumuladas (ceros fuera de la rejilla)."""
+    n = 2 * radius + 1
+    out = []
+    for row in rows:
+        size = len(row)
+        c = [0.0, *accumulate(row)]
+        out.append([(c[min(i + radius + 1, size)] - c[max(i - radius, 0)]) / n for i in range(size)])
+    return out
+
+
+def _blur(cells: List[float], cols: int, lines: int, radius: int) -> List[float]:
+    """Tres desenfoques de caja en cada eje (≈ núcleo gaussiano; conserva la masa)."""
+    rows = [cells[y * cols:(y + 1) * cols] for y in range(lines)]
+    for _ in range(3):
+        rows = _box_rows(rows, radius)
+    columns = [list(c) for c in zip(*rows)]
+    for _ in range(3):
+        columns = _box_rows(columns, radius)
+    return [v for row in zip(*columns) for v in row]
+
+
+def _crop(cells: List[float], cols: int, margin: int, width: int, height: int) -> List[float]:
+    out: List[float] = []
+    for y in range(margin, margin + height):
+        start = y * cols + margin
+        out.extend(cells[start:start + width])
+    return out
+
+
+def _ramp() -> List[bytes]:
+    """256 colores RGB interpolados de `GRADIENT`."""
+    ramp = []
+    for i in range(256):
+        t = i / 255
+        for (t0, c0), (t1, c1) in zip(GRADIENT, GRADIENT[1:]):
+            if t <= t1:
+                f = (t - t0) / (t1 - t0)
+                ramp.append(bytes(int(a + (b - a) * f) for a, b in zip(c0, c1)))
+                break
+    return ramp
+
+
+RAMP = _ramp()
+
+
+def _png(width: int, height: int, scanlines: bytes) -> bytes:
+    """PNG RGBA de 8 bits (scanlines ya con el byte de filtro)."""
+    def chunk(kind: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + kind + data + struct.pack(">I", zlib.crc32(kind + data))
+
+    header = struct.pack(">IIBBBBB", width, height, 8, 6, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header) + \
+        chunk(b"IDAT", zlib.compress(scanlines, 6)) + chunk(b"IEND", b"")
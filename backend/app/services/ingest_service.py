@@ -0,0 +1,436 @@
+"""
+Ingesta de reportes de dispositivos con escritura diferida (write-behind).
+
+Los reportes se validan con una ruta rápida (sin construir un `SignalData`
+por fila), actualizan los agregados en memoria al instante y se escriben en
+la base de datos por lotes desde una tarea en segundo plano.
+
+Un lote que falla se reintenta `INGEST_MAX_RETRIES` veces; después se parte
+en mitades para aislar las filas que la base de datos rechaza, que pasan a
+la lista de descartes (`dead_letter` en `stats`) y no bloquean a las demás.
+Como ya se contaron y publicaron, se restan de los agregados y se publica una
+corrección (`rejected` en el delta).
+
+Con varios workers (`COMPUTE_MODE=remote`) cada uno tiene su buffer, pero los
+deltas no se quedan en él: se publican en el proceso de cómputo, que lleva los
+agregados de todos y reparte cada delta a los suscriptores de todos los workers
+(`LiveHub` en `compute_server`). Así un cliente WebSocket recibe las señales de
+cualquier worker y `/ingest/stats` muestra los agregados globales. Si el proceso
+de cómputo no responde, el delta se reparte solo en el worker que lo recibió.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from collections import deque
+from app.config import config
+from app.etl.compute import Compute, compute
+from app.services.supabase_service import supabase_service
+import asyncio
+import logging
+import math
+import os
+import threading
+
+logger = logging.getLogger(__name__)
+
+MAX_REPORTED_ERRORS = 20
+HUB_RETRY_DELAY = 2.0
+INT4 = (-2 ** 31, 2 ** 31 - 1)
+AGGREGATE_COLUMNS = ("sim_operator", "network_type", "device_name")
+
+
+def _timestamp(value: Any) -> str:
+    """
+    Normaliza timestamps: ISO string, epoch (s o ms) o ausente (hora del
+    servidor). Los ISO sin zona se toman como UTC; lo que no se entiende se rechaza.
+    """
+    if value is None or value == "":
+        return datetime.now(timezone.utc).isoformat()
+    if isinstance(value, bool):
+        raise ValueError("invalid timestamp")
+    if isinstance(value, (int, float)):
+        seconds = value / 1000 if value > 1e11 else value
+        return datetime.fromtimestamp(seconds, tz=timezone.utc).isoformat()
+    if isinstance(value, str):
+        try:
+            moment = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            raise ValueError(f"invalid timestamp: {value[:40]!r}")
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return moment.isoformat()
+    raise ValueError("invalid timestamp")
+
+
+def _int4(value: Any, name: str) -> int:
+    """Entero de la columna int4 (vacío -> 0); fuera de rango se rechaza."""
+    if not value:
+        return 0
+    number = int(value)
+    if not INT4[0] <= number <= INT4[1]:
+        raise ValueError(f"{name} out of range")
+    return number
+
+
+def _float(value: Any, name: str) -> float:
+    """Real finito (vacío -> 0.0)."""
+    if not value:
+        return 0.0
+    number = float(value)
+    if not math.isfinite(number):
+        raise ValueError(f"{name} must be finite")
+    return number
+
+
+def validate_reports(reports: List[Dict[str, Any]], device_name: Optional[str] = None,
+                     device_id: Optional[str] = None) -> Tuple[List[Dict[str, Any]], int, List[Dict[str, Any]]]:
+    """
+    Valida y normaliza un lote de reportes.
+    Devuelve (filas válidas, número de rechazadas, primeros errores). Las filas
+    tienen el mismo formato que `SignalBatch.to_rows`.
+    """
+    valid = []
+    rejected = 0
+    errors = []
+    append = valid.append
+    default_name = str(device_name or "Unknown")
+
+    for index, row in enumerate(reports):
+        try:
+            get = row.get
+            lat = float(row["latitude"])
+            lng = float(row["longitude"])
+            if not (-90.0 <= lat <= 90.0 and -180.0 <= lng <= 180.0) or (lat == 0.0 and lng == 0.0):
+                raise ValueError("coordinates out of range")
+            operator = get("sim_operator")
+            network = get("network_type")
+            if not operator or not network:
+                raise ValueError("sim_operator and network_type are required")
+            # Mismas reglas que SignalBatch: valores vacíos -> 0. Nada que la
+            # base de datos vaya a rechazar: un lote con una fila inválida falla entero
+            name = get("device_name")
+            append({
+                "device_id": get("device_id") or device_id,
+                "device_name": str(name) if name else default_name,
+                "latitude": lat,
+                "longitude": lng,
+                "altitude": _float(get("altitude"), "altitude"),
+                "speed": _float(get("speed"), "speed"),
+                "battery": _int4(get("battery"), "battery"),
+                "signal": _int4(get("signal"), "signal"),
+                "sim_operator": str(operator),
+                "network_type": str(network),
+                "timestamp": _timestamp(get("timestamp")),
+            })
+        except (KeyError, TypeError, ValueError, AttributeError, OverflowError) as e:
+            rejected += 1
+            if len(errors) < MAX_REPORTED_ERRORS:
+                errors.append({"index": index, "error": f"missing {e}" if isinstance(e, KeyError) else str(e)})
+
+    return valid, rejected, errors
+
+
+class LiveAggregates:
+    """Contadores en memoria que se actualizan con cada lote ingerido."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.total = 0
+        self.by_operator: Dict[str, int] = {}
+        self.by_network: Dict[str, int] = {}
+        self.by_device: Dict[str, int] = {}
+        self.battery_sum = 0
+        self.signal_sum = 0
+        self.last_timestamp: Optional[str] = None
+
+    def update(self, rows: List[Dict[str, Any]]):
+        self.apply(self.summary(rows))
+
+    def remove(self, rows: List[Dict[str, Any]]):
+        """Descuenta filas ya contadas (rechazadas al escribir)."""
+        self.apply(self.summary([], rows))
+
+    @staticmethod
+    def summary(rows: List[Dict[str, Any]], removed: List[Dict[str, Any]] = ()) -> Dict[str, Any]:
+        """Delta neto (filas nuevas menos retiradas), serializable para `apply` en otro proceso."""
+        counts: Dict[str, Dict[str, int]] = {column: {} for column in AGGREGATE_COLUMNS}
+        battery = signal = 0
+        for sign, group in ((1, rows), (-1, removed)):
+            for row in group:
+                for column, values in counts.items():
+                    values[row[column]] = values.get(row[column], 0) + sign
+                battery += sign * row["battery"]
+                signal += sign * row["signal"]
+        return {
+            "total": len(rows) - len(removed),
+            "counts": counts,
+            "battery_sum": battery,
+            "signal_sum": signal,
+            "last_timestamp": rows[-1]["timestamp"] if rows else None,
+        }
+
+    def apply(self, summary: Dict[str, Any]):
+        with self._lock:
+            for counts, column in ((self.by_operator, "sim_operator"), (self.by_network, "network_type"),
+                                   (self.by_device, "device_name")):
+                for value, delta in summary["counts"].get(column, {}).items():
+                    count = counts.get(value, 0) + delta
+                    if count > 0:
+                        counts[value] = count
+                    else:
+                        counts.pop(value, None)
+            self.battery_sum += summary["battery_sum"]
+            self.signal_sum += summary["signal_sum"]
+            self.total += summary["total"]
+            if summary["last_timestamp"] is not None:
+                self.last_timestamp = summary["last_timestamp"]
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            total = self.total
+            return {
+                "total_signals": total,
+                "average_battery": round(self.battery_sum / total, 2) if total else 0,
+                "average_signal": round(self.signal_sum / total, 2) if total else 0,
+                "signals_by_company": dict(self.by_operator),
+                "signals_by_type": dict(self.by_network),
+                "devices": dict(self.by_device),
+                "last_timestamp": self.last_timestamp,
+            }
+
+
+class IngestService:
+    """
+    Buffer de escritura diferida.
+
+    `submit` es O(filas) y no toca la red: actualiza agregados y deja las
+    filas en dos colas, una para escribir en la base de datos por lotes y
+    otra para los deltas WebSocket. La tarea de fondo vacía ambas.
+
+    Con `hub` (el cliente remoto de cómputo) los deltas se publican en el
+    proceso de cómputo y llegan a los listeners por la suscripción, que corre
+    en un hilo propio y mantiene los agregados globales.
+    """
+
+    def __init__(self, writer: Callable[[List[Dict[str, Any]]], int], probe: Callable[[], Any],
+                 batch_size: int = None, flush_interval: float = None, max_buffer: int = None,
+                 max_retries: int = None, dead_letter_size: int = None, hub: Optional[Compute] = None):
+        self.writer = writer
+        self.probe = probe
+        self.batch_size = batch_size or config.INGEST_BATCH_SIZE
+        self.flush_interval = flush_interval or config.INGEST_FLUSH_INTERVAL
+        self.max_buffer = max_buffer or config.INGEST_MAX_BUFFER
+        self.max_retries = config.INGEST_MAX_RETRIES if max_retries is None else max_retries
+        self.aggregates = LiveAggregates()
+        self.hub = hub
+        self.listeners: List[Callable] = []
+        self.accepted = 0
+        self.written = 0
+        self.failed_writes = 0
+        self.dead_lettered = 0
+        # Últimas filas rechazadas por la base de datos, con su error (acotado)
+        self.dead_letter: deque = deque(maxlen=dead_letter_size or config.INGEST_DEAD_LETTER_SIZE)
+        self._retries = 0
+        self._pending: deque = deque()
+        self._deltas: List[Dict[str, Any]] = []
+        self._rejected: List[Dict[str, Any]] = []
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+        self._stopping = False
+        # Agregados de todos los workers (último delta del hub); None sin suscripción
+        self._shared: Optional[Dict[str, Any]] = None
+        self._feed: Optional[threading.Thread] = None
+        self._feed_stop = threading.Event()
+
+    @property
+    def buffered(self) -> int:
+        return len(self._pending)
+
+    def has_capacity(self, rows: int) -> bool:
+        return self.buffered + rows <= self.max_buffer
+
+    def add_listener(self, callback: Callable):
+        """
+        Registra un callback async `callback(delta)` para cada delta:
+        `{"count": filas nuevas, "rows": las últimas (hasta WS_DELTA_MAX_POINTS),
+        "rejected_count"/"rejected": lo mismo para filas ya publicadas que la base
+        de datos rechazó, "aggregates": agregados en vivo}`.
+        """
+        self.listeners.append(callback)
+
+    def submit(self, rows: List[Dict[str, Any]]) -> int:
+        """Acepta filas ya validadas. Devuelve cuántas quedaron encoladas."""
+        if not rows:
+            return 0
+        self.aggregates.update(rows)
+        self._pending.extend(rows)
+        self._deltas.extend(rows)
+        self.accepted += len(rows)
+        if self._wakeup is not None and self.buffered >= self.batch_size:
+            self._wakeup.set()
+        return len(rows)
+
+    def start(self):
+        """Arranca la tarea de fondo (llamar dentro del event loop)."""
+        if self._task is None:
+            self._stopping = False
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        if self.hub is not None and self._feed is None:
+            self._feed_stop.clear()
+            self._feed = threading.Thread(target=self._subscribe, args=(asyncio.get_running_loop(),),
+                                          name="ingest-live-feed", daemon=True)
+            self._feed.start()
+
+    async def stop(self):
+        """Detiene la tarea y escribe lo que quede en el buffer."""
+        if self._task is not None:
+            # No cancelar: dejar que termine la escritura en curso
+            self._stopping = True
+            self._wakeup.set()
+            await self._task
+            self._task = None
+        await self.flush()
+        if self._feed is not None:
+            self._feed_stop.set()
+            await asyncio.to_thread(self._feed.join)
+            self._feed = None
+            self._shared = None
+
+    async def flush(self):
+        """Publica deltas y escribe todo lo pendiente."""
+        await self._publish()
+        while self._pending:
+            if not await self._write_batch():
+                break
+
+    async def _run(self):
+        while not self._stopping:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self._publish()
+                while self._pending:
+                    if not await self._write_batch():
+                        break
+                    if self.buffered < self.batch_size:
+                        break
+            except Exception as e:
+                logger.error(f"Error in ingest flush loop: {e}")
+
+    async def _publish(self):
+        rows, self._deltas = self._deltas, []
+        rejected, self._rejected = self._rejected, []
+        if not (rows or rejected):
+            return
+        limit = config.WS_DELTA_MAX_POINTS
+        delta = {"count": len(rows), "rows": rows[-limit:],
+                 "rejected_count": len(rejected), "rejected": rejected[-limit:]}
+        if self.hub is not None:
+            try:
+                # Vuelve a este worker (y a los demás) por la suscripción
+                await asyncio.to_thread(self.hub.publish, {**delta, "summary": LiveAggregates.summary(rows, rejected)})
+                return
+            except Exception as e:
+                logger.warning(f"Live hub unavailable, publishing ingest delta to this worker only: {e}")
+        await self._dispatch({**delta, "aggregates": self.aggregates.snapshot()})
+
+    async def _dispatch(self, delta: Dict[str, Any]):
+        for callback in self.listeners:
+            try:
+                await callback(delta)
+            except Exception as e:
+                logger.error(f"Error publishing ingest delta: {e}")
+
+    def _subscribe(self, loop: asyncio.AbstractEventLoop):
+        """Hilo de suscripción al hub: reenvía cada delta al event loop; reconecta si se corta."""
+        while not self._feed_stop.is_set():
+            try:
+                for event in self.hub.subscribe(self._feed_stop):
+                    self._shared = event["aggregates"]
+                    if event["count"] or event["rejected_count"]:
+                        asyncio.run_coroutine_threadsafe(self._dispatch(event), loop)
+            except Exception as e:
+                logger.warning(f"Live hub subscription lost, retrying: {e}")
+            self._shared = None
+            self._feed_stop.wait(HUB_RETRY_DELAY)
+
+    def live_aggregates(self) -> Dict[str, Any]:
+        """Agregados de todos los workers si hay suscripción al hub; si no, los de este worker."""
+        shared = self._shared
+        return shared if shared is not None else self.aggregates.snapshot()
+
+    async def _write_batch(self) -> bool:
+        count = min(self.batch_size, len(self._pending))
+        batch = [self._pending.popleft() for _ in range(count)]
+        try:
+            written = await asyncio.to_thread(self.writer, batch)
+        except Exception as e:
+            self.failed_writes += 1
+            logger.error(f"Error writing ingest batch of {count} rows: {e}")
+            if self._retries < self.max_retries:
+                # Devolver el lote al frente del buffer y reintentar en el próximo ciclo
+                self._retries += 1
+                self._pending.extendleft(reversed(batch))
+                return False
+            return await self._isolate(batch)
+        self._retries = 0
+        self.written += written
+        logger.info(f"Ingest flush: wrote {written} rows (buffered: {self.buffered})")
+        return True
+
+    async def _isolate(self, batch: List[Dict[str, Any]]) -> bool:
+        """
+        El lote sigue fallando: si la base de datos responde (`probe`), el
+        problema son los datos y se escribe por mitades hasta aislar las filas
+        rechazadas; si no, el lote vuelve entero al buffer.
+        """
+        try:
+            await asyncio.to_thread(self.probe)
+        except Exception as e:
+            logger.error(f"Ingest store unavailable, keeping {len(batch)} rows buffered: {e}")
+            self._pending.extendleft(reversed(batch))
+            return False
+        written, dead = await asyncio.to_thread(self._write_split, batch)
+        self._retries = 0
+        self.written += written
+        self.dead_lettered += len(dead)
+        self.dead_letter.extend(dead)
+        logger.warning(f"Ingest flush: wrote {written} rows, {len(dead)} rejected rows moved to dead letter")
+        if dead:
+            # Ya se contaron y publicaron como señales: corregir agregados y clientes
+            rejected = [entry["row"] for entry in dead]
+            self.aggregates.remove(rejected)
+            self._rejected.extend(rejected)
+            await self._publish()
+        return True
+
+    def _write_split(self, batch: List[Dict[str, Any]]) -> Tuple[int, List[Dict[str, Any]]]:
+        try:
+            return self.writer(batch), []
+        except Exception as e:
+            if len(batch) == 1:
+                return 0, [{"row": batch[0], "error": str(e)}]
+        half = len(batch) // 2
+        written, dead = self._write_split(batch[:half])
+        more, more_dead = self._write_split(batch[half:])
+        return written + more, dead + more_dead
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "worker": os.getpid(),
+            "accepted": self.accepted,
+            "written": self.written,
+            "buffered": self.buffered,
+            "failed_writes": self.failed_writes,
+            "dead_letter": self.dead_lettered,
+            "live": "shared" if self._shared is not None else "local",
+        }
+
+
+# Singleton instance
+ingest_service = IngestService(writer=supabase_service.insert_signals,
+                               probe=lambda: supabase_service.source.count(),
+                               hub=compute if compute.mode == "remote" else None)
@@ -0,0 +1,39 @@
+"""
+Cursores opacos de `/signals`.
+
+Un cursor codifica la clave (timestamp, id) de la última fila entregada y una
+huella del filtro: la página siguiente empieza justo después de esa fila, así
+que cuesta lo mismo que la primera y no salta ni repite filas aunque lleguen
+inserciones. Un cliente que se desconecta reanuda con el último cursor.
+"""
+from typing import Any, Dict
+from app.services.data_source import PageKey
+import base64
+import hashlib
+import orjson
+
+VERSION = 1
+
+
+def _fingerprint(filter_key: Dict[str, Any]) -> str:
+    return hashlib.blake2b(orjson.dumps(filter_key, option=orjson.OPT_SORT_KEYS), digest_size=6).hexdigest()
+
+
+def encode_cursor(key: PageKey, filter_key: Dict[str, Any]) -> str:
+    """Cursor (base64url sin relleno) de la fila `key` para el filtro dado."""
+    raw = orjson.dumps([VERSION, key[0], key[1], _fingerprint(filter_key)])
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str, filter_key: Dict[str, Any]) -> PageKey:
+    """Clave (timestamp, id) del cursor; ValueError si no es válido o es de otro filtro."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        version, timestamp, last_id, fingerprint = orjson.loads(raw)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if version != VERSION or not isinstance(timestamp, str) or not isinstance(last_id, int):
+        raise ValueError("Invalid cursor")
+    if fingerprint != _fingerprint(filter_key):
+        raise ValueError("Cursor does not match the request filters")
+    return timestamp, last_id
@@ -0,0 +1,271 @@
+"""
+Consultas del mapa sobre el almacén de puntos (`app.services.point_store`).
+
+`/map/points` no recorre la tabla para devolver sus primeras `limit` filas:
+responde desde el almacén mapeado en memoria, ordenado por curva Z, y
+devuelve solo los puntos del viewport. Si son más de `limit`, devuelve una
+muestra estratificada por celda de pantalla (`SCREEN_CELL_PX` píxeles al
+zoom pedido) y operadora que conserva la distribución espacial: las zonas
+densas no tapan a las poco cubiertas.
+
+Al arrancar se abre el almacén de disco y se sirve sin ir a la red. Cada
+`MAP_INDEX_TTL` segundos se compara el conteo de la fuente con el del
+almacén y, si hubo escrituras externas, se reconstruye mientras las demás
+peticiones siguen usando la versión anterior. En la API lo hace una tarea de
+fondo (`start`), fuera del event loop; sin ella (proceso de cómputo,
+scripts), la primera consulta tras vencer el TTL. Las escrituras de la
+propia API se añaden al almacén sin reconstruirlo.
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from app.config import config
+from app.models.signal_batch import SignalBatch
+from app.services.boundaries import BBox
+from app.services.filters import SignalFilter, compile_filter, select_rows
+from app.services.point_store import PointStore, StoreView
+from app.services import heatmap
+from app.services.supabase_service import supabase_service
+from app import metrics
+import asyncio
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+WORLD: BBox = (-180.0, -90.0, 180.0, 90.0)
+TILE_SIZE = 256  # píxeles por tesela (Leaflet / Web Mercator)
+SCREEN_CELL_PX = 16
+
+POINT_COLUMNS = ("network_type", "sim_operator", "battery", "device_name", "signal", "speed")
+
+
+def screen_cell_deg(zoom: float) -> float:
+    """Grados de longitud que ocupa una celda de pantalla al zoom dado."""
+    return 360.0 / (TILE_SIZE * 2 ** zoom) * SCREEN_CELL_PX
+
+
+def points(batch: SignalBatch, rows: List[int]) -> List[Dict[str, Any]]:
+    """Filas -> formato de punto de `/map/points`."""
+    lat, lng = batch.numeric["latitude"], batch.numeric["longitude"]
+    columns = [(name, batch.column(name)) for name in POINT_COLUMNS]
+    return [
+        {"lat": lat[r], "lng": lng[r], **{name: column[r] for name, column in columns}}
+        for r in rows
+    ]
+
+
+def sample_rows(batch: SignalBatch, rows: List[int], cell_deg: float, limit: int, seed: int) -> List[int]:
+    """
+    Muestreo estratificado por celda (`cell_deg`) y operadora, solo si hay más
+    de `limit` filas: cada estrato aporta en proporción a su tamaño y al menos
+    un punto. Dentro del estrato se ordena por un hash de (seed, lat, lng): la
+    misma semilla da la misma muestra y un punto no cambia al desplazar el mapa.
+    """
+    if len(rows) <= limit:
+        return rows
+    lat, lng = batch.numeric["latitude"], batch.numeric["longitude"]
+    operators = batch.codes["sim_operator"]
+    floor = math.floor
+    strata: Dict[Tuple[int, int, int], List[Tuple[int, int]]] = {}
+    for r in rows:
+        key = (floor(lat[r] / cell_deg), floor(lng[r] / cell_deg), operators[r])
+        members = strata.get(key)
+        if members is None:
+            members = strata[key] = []
+        members.append((hash((seed, lat[r], lng[r])), r))
+
+    fraction = limit / len(rows)
+    picked: List[Tuple[int, int, int]] = []
+    for members in strata.values():
+        members.sort()
+        quota = max(1, math.ceil(len(members) * fraction))
+        picked.extend((rank, u, r) for rank, (u, r) in enumerate(members[:quota]))
+    if len(picked) > limit:
+        # Los mínimos por estrato exceden el presupuesto: primero los de menor rango
+        picked.sort()
+        del picked[limit:]
+    return sorted(r for _, _, r in picked)
+
+
+def split_plan(signal_filter: SignalFilter) -> Tuple[Optional[BBox], list]:
+    """
+    Compila el filtro entero como residual y separa los rangos de lat/lng
+    (bbox pedido y bbox de las regiones) en un único bbox para el almacén.
+    Devuelve (None, []) si el filtro no puede cumplirse.
+    """
+    plan = compile_filter(signal_filter, pushdown=frozenset())
+    if plan.matches_nothing:
+        return None, []
+    min_lng, min_lat, max_lng, max_lat = WORLD
+    predicates = []
+    for p in plan.residual:
+        if p.column == "latitude" and p.op == ">=":
+            min_lat = max(min_lat, p.value)
+        elif p.column == "latitude" and p.op == "<=":
+            max_lat = min(max_lat, p.value)
+        elif p.column == "longitude" and p.op == ">=":
+            min_lng = max(min_lng, p.value)
+        elif p.column == "longitude" and p.op == "<=":
+            max_lng = min(max_lng, p.value)
+        else:
+            predicates.append(p)
+    if min_lat > max_lat or min_lng > max_lng:
+        return None, []
+    return (min_lng, min_lat, max_lng, max_lat), predicates
+
+
+class PointIndex:
+    """Vista vigente del almacén compartida por todas las peticiones, con comprobación periódica."""
+
+    def __init__(self, store: PointStore, loader: Callable[[], SignalBatch], count: Callable[[], int],
+                 source: Callable[[], str], ttl: float, cell_deg: float, max_points: Optional[int] = None):
+        self.store = store
+        self.loader = loader
+        self.max_points = max_points
+        self.count = count
+        self.source = source
+        self.ttl = ttl
+        self.cell_deg = cell_deg
+        self._view: Optional[StoreView] = None
+        self._checked = -math.inf
+        self._rebuild = False
+        self._lock = threading.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    def _fresh(self) -> bool:
+        """Sin comprobar la fuente: la comprueba la tarea de fondo o aún no venció el TTL."""
+        return self._task is not None or time.monotonic() - self._checked < self.ttl
+
+    def view(self) -> StoreView:
+        """
+        Vista vigente. Se remapea si otro worker publicó una versión (append,
+        reconstrucción); sin tarea de fondo, si venció el TTL la comprueba una
+        sola petición y el resto sigue usando la anterior. Puede leer disco o
+        reconstruir: desde el event loop, con `asyncio.to_thread`.
+        """
+        view = self._view
+        if view is not None and not self.store.changed(view) and self._fresh():
+            return view
+        if not self._lock.acquire(blocking=view is None):
+            return view
+        try:
+            if self._view is view:
+                self._view = self._refresh(view)
+            return self._view
+        finally:
+            self._lock.release()
+
+    def refresh(self):
+        """Comprueba la frescura contra la fuente y reconstruye si hace falta (tarea de fondo)."""
+        with self._lock:
+            self._view = self._refresh(self._view, check=True)
+
+    def _refresh(self, view: Optional[StoreView], check: bool = False) -> StoreView:
+        source = self.source()
+        if not self._rebuild and (view is None or self.store.changed(view)):
+            opened = self.store.open()
+            if opened is not None and opened.source == source:
+                if view is None and not check:
+                    # Arranque en caliente: servir ya; la frescura se comprueba después
+                    logger.info(f"🗺️ Point store opened: {opened.rows} points")
+                    return opened
+                view = opened
+        if view is not None and not self._rebuild and not check and self._fresh():
+            return view
+
+        count = self.count()
+        self._checked = time.monotonic()
+        if view is not None and not self._rebuild and view.source_count == count:
+            return view
+        start = time.perf_counter()
+        with metrics.stage("index_build"):
+            built = self.store.rebuild(self.loader, source, count, view, force=self._rebuild,
+                                       max_rows=self.max_points)
+        self._rebuild = False
+        logger.info(f"🗺️ Point store built: {built.rows} points ({time.perf_counter() - start:.2f}s)")
+        return built
+
+    def start(self):
+        """Arranca la comprobación periódica de fondo (llamar dentro del event loop)."""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl)
+            try:
+                await asyncio.to_thread(self.refresh)
+            except Exception as e:
+                logger.error(f"Point store refresh failed: {e}")
+
+    def invalidate(self, rebuild: bool = True):
+        """
+        Olvida la vista: la próxima consulta reconstruye desde la fuente o,
+        con `rebuild=False`, reabre el almacén de disco (como tras un reinicio).
+        """
+        self._view = None
+        self._checked = -math.inf
+        self._rebuild = rebuild
+
+    def append(self, rows: List[Dict[str, Any]], inserted: int):
+        """Filas recién escritas en la fuente (ver `SupabaseService.add_write_listener`)."""
+        self.store.append(rows, inserted)
+
+    def query(self, signal_filter: SignalFilter, zoom: Optional[float], limit: int,
+              seed: int = 42, view: Optional[StoreView] = None) -> Dict[str, Any]:
+        """Puntos del viewport (`signal_filter.bbox`) que cumplen el filtro, dentro del presupuesto."""
+        bbox, predicates = split_plan(signal_filter)
+        if bbox is None:
+            return {"count": 0, "total": 0, "sampled": False, "points": []}
+
+        view = view or self.view()
+        with metrics.stage("index_query"):
+            rows = view.query(bbox)
+        with metrics.stage("filter"):
+            rows = select_rows(view.batch, predicates, rows)
+        total = len(rows)
+        # Estratos de una celda de pantalla al zoom pedido (o de `cell_deg`)
+        cell_deg = screen_cell_deg(zoom) if zoom is not None else self.cell_deg
+        with metrics.stage("sample"):
+            rows = sample_rows(view.batch, rows, cell_deg, limit, seed)
+        return {
+            "count": len(rows),
+            "total": total,
+            "sampled": len(rows) < total,
+            "points": points(view.batch, rows),
+        }
+
+    def heatmap(self, signal_filter: SignalFilter, bbox: BBox, width: int, height: int,
+                metric: str, sigma: float, view: Optional[StoreView] = None) -> heatmap.Raster:
+        """Rejilla de densidad o de media de `metric` sobre `bbox` (ver `app.services.heatmap`)."""
+        region, predicates = split_plan(signal_filter)
+        if region is None:
+            region, predicates = (0.0, 0.0, -1.0, -1.0), []  # Filtro imposible: rejilla vacía
+        view = view or self.view()
+        with metrics.stage("heatmap"):
+            return heatmap.render(view, bbox, width, height, metric, predicates, region, sigma)
+
+
+# Singleton instance
+point_index = PointIndex(
+    PointStore(config.POINT_STORE_DIR, config.POINT_STORE_COMPACT_ROWS),
+    # Con más filas que el tope se quedan las más recientes
+    loader=lambda: supabase_service.read_signal_batch(limit=config.MAP_INDEX_MAX_POINTS, compacted=True,
+                                                      newest=True),
+    count=supabase_service.get_total_count,
+    source=lambda: supabase_service.source.name,
+    ttl=config.MAP_INDEX_TTL,
+    cell_deg=config.MAP_INDEX_CELL_DEG,
+    max_points=config.MAP_INDEX_MAX_POINTS,
+)
+supabase_service.add_write_listener(point_index.append)
@@ -0,0 +1,410 @@
+"""
+Almacén de puntos del mapa persistente y mapeado en memoria.
+
+Los puntos se guardan en disco (`POINT_STORE_DIR`) como columnas de ancho fijo
+(lat/lng/velocidad float64, señal y batería int16, timestamp en segundos y
+códigos de operadora/red/dispositivo), ordenadas por la curva Z (Morton) de
+su celda. Cada worker mapea los ficheros con `mmap` y consulta vistas
+(`memoryview`) sin copiarlas: un viewport se traduce a unos pocos rangos de
+la curva que se localizan por búsqueda binaria.
+
+Las filas nuevas (`append`) se añaden al final sin ordenar y se recorren
+aparte hasta superar `POINT_STORE_COMPACT_ROWS`; entonces se reordena todo
+(`compact`) sin volver a leer la fuente. `manifest.json` se sustituye de
+forma atómica y fija qué filas son visibles, así que quien lee nunca ve una
+escritura a medias. Tras un reinicio el almacén se abre sin ir a la red.
+"""
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from itertools import compress
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+from app.models.signal_batch import SignalBatch
+from app.services.boundaries import BBox
+import json
+import logging
+import mmap
+import os
+import secrets
+import threading
+
+try:
+    import fcntl
+except ImportError:  # Windows: un solo proceso, basta el lock de hilos
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+CURVE_BITS = 16  # por eje: celdas de ~0.0055° x 0.0027°
+CURVE_SIZE = 1 << CURVE_BITS
+MAX_RANGES = 64  # rangos de la curva por consulta (los del borde se filtran punto a punto)
+MANIFEST = "manifest.json"
+
+# (columna, typecode) en el orden de los ficheros
+STORE_COLUMNS = (
+    ("key", "Q"),
+    ("latitude", "d"),
+    ("longitude", "d"),
+    ("speed", "d"),
+    ("signal", "h"),
+    ("battery", "h"),
+    ("timestamp", "q"),
+    ("sim_operator", "H"),
+    ("network_type", "H"),
+    ("device_name", "I"),
+)
+NUMERIC = ("latitude", "longitude", "speed", "signal", "battery")
+CODES = ("sim_operator", "network_type", "device_name")
+INT16 = (-32768, 32767)
+
+# Entrelazado de bits (Morton) con tabla de 8 bits
+_SPREAD = [sum(((v >> i) & 1) << (2 * i) for i in range(8)) for v in range(256)]
+
+
+def _spread(v: int) -> int:
+    return _SPREAD[v & 0xFF] | _SPREAD[v >> 8] << 16
+
+
+def _cell(value: float, low: float, span: float) -> int:
+    c = int((value - low) / span * CURVE_SIZE)
+    return 0 if c < 0 else CURVE_SIZE - 1 if c >= CURVE_SIZE else c
+
+
+def curve_key(lat: float, lng: float) -> int:
+    """Posición en la curva Z de la celda que contiene el punto."""
+    return _spread(_cell(lng, -180.0, 360.0)) | _spread(_cell(lat, -90.0, 180.0)) << 1
+
+
+def curve_ranges(bbox: BBox, max_ranges: int = MAX_RANGES) -> List[Tuple[int, int, bool]]:
+    """
+    Rangos [lo, hi] de la curva que cubren el bbox, por niveles del quadtree.
+    `exact` indica que todas las celdas del rango están dentro del bbox; los
+    demás (borde, o al agotar `max_ranges`) se comprueban punto a punto.
+    """
+    min_lng, min_lat, max_lng, max_lat = bbox
+    x0, x1 = _cell(min_lng, -180.0, 360.0), _cell(max_lng, -180.0, 360.0)
+    y0, y1 = _cell(min_lat, -90.0, 180.0), _cell(max_lat, -90.0, 180.0)
+    # Celdas enteramente dentro: las del borde solo si el bbox llega al límite del mundo
+    ix0, ix1 = (0 if min_lng <= -180.0 else x0 + 1), (CURVE_SIZE - 1 if max_lng >= 180.0 else x1 - 1)
+    iy0, iy1 = (0 if min_lat <= -90.0 else y0 + 1), (CURVE_SIZE - 1 if max_lat >= 90.0 else y1 - 1)
+
+    ranges: List[Tuple[int, int, bool]] = []
+    nodes = [(0, 0)]
+    bits = CURVE_BITS
+    while nodes:
+        side = 1 << bits
+        partial = []
+        for x, y in nodes:
+            if x > x1 or x + side - 1 < x0 or y > y1 or y + side - 1 < y0:
+                continue
+            lo = _spread(x) | _spread(y) << 1
+            if ix0 <= x and x + side - 1 <= ix1 and iy0 <= y and y + side - 1 <= iy1:
+                ranges.append((lo, lo + side * side - 1, True))
+            else:
+                partial.append((x, y))
+        if bits == 0 or len(ranges) + 4 * len(partial) > max_ranges:
+            ranges.extend((lo, lo + side * side - 1, False)
+                          for lo in (_spread(x) | _spread(y) << 1 for x, y in partial))
+            break
+        half = side >> 1
+        nodes = [(x + dx, y + dy) for x, y in partial for dx in (0, half) for dy in (0, half)]
+        bits -= 1
+
+    ranges.sort()
+    merged: List[Tuple[int, int, bool]] = []
+    for lo, hi, exact in ranges:
+        if merged and merged[-1][1] + 1 == lo and merged[-1][2] == exact:
+            merged[-1] = (merged[-1][0], hi, exact)
+        else:
+            merged.append((lo, hi, exact))
+    return merged
+
+
+def epoch_seconds(value: Any) -> int:
+    """Timestamp ISO (o datetime) -> segundos UTC; 0 si falta o no se entiende."""
+    if not value:
+        return 0
+    try:
+        moment = value if isinstance(value, datetime) else datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return 0
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return int(moment.timestamp())
+
+
+def _clamp16(value: int) -> int:
+    return INT16[0] if value < INT16[0] else INT16[1] if value > INT16[1] else value
+
+
+class IsoColumn:
+    """Columna de timestamps (segundos) vista como texto ISO, sin materializarla."""
+
+    __slots__ = ("seconds",)
+
+    def __init__(self, seconds: Sequence[int]):
+        self.seconds = seconds
+
+    def __len__(self) -> int:
+        return len(self.seconds)
+
+    def __getitem__(self, row: int) -> Optional[str]:
+        value = self.seconds[row]
+        return datetime.fromtimestamp(value, tz=timezone.utc).isoformat() if value else None
+
+    def __iter__(self) -> Iterator[Optional[str]]:
+        return (self[row] for row in range(len(self.seconds)))
+
+
+class StoreView:
+    """Instantánea mapeada del almacén: columnas como `memoryview` y un `SignalBatch` sobre ellas."""
+
+    def __init__(self, manifest: Dict[str, Any], columns: Dict[str, memoryview], mtime_ns: int):
+        self.manifest = manifest
+        self.columns = columns
+        self.mtime_ns = mtime_ns
+        self.rows = manifest["rows"]
+        self.sorted_rows = manifest["sorted_rows"]
+        self.source = manifest["source"]
+        self.source_count = manifest["source_count"]
+        self.complete = manifest.get("complete", True)  # False: la fuente tenía más filas que el tope
+        # Cambia con cada reconstrucción, compactación o append (ETags)
+        self.version = f"{manifest['build']}:{self.rows}"
+        self.batch = SignalBatch.from_buffers(
+            {
+                "size": self.rows,
+                "numeric": {name: columns[name].format for name in NUMERIC},
+                "codes": {name: columns[name].format for name in CODES},
+                "dictionaries": manifest["dictionaries"],
+                "text": {"timestamp": IsoColumn(columns["timestamp"])},
+            },
+            [b"\x01" * self.rows] + [columns[name].cast("B") for name in NUMERIC + CODES],
+        )
+
+    def query(self, bbox: BBox) -> List[int]:
+        """Filas dentro del bbox: rangos de la curva en la parte ordenada + recorrido de la cola."""
+        min_lng, min_lat, max_lng, max_lat = bbox
+        lat, lng = self.columns["latitude"], self.columns["longitude"]
+        keys = self.columns["key"][:self.sorted_rows]
+        rows: List[int] = []
+        for lo, hi, exact in curve_ranges(bbox):
+            start, end = bisect_left(keys, lo), bisect_right(keys, hi)
+            if exact:
+                rows.extend(range(start, end))
+            else:
+                rows.extend(r for r in range(start, end)
+                            if min_lat <= lat[r] <= max_lat and min_lng <= lng[r] <= max_lng)
+        rows.extend(r for r in range(self.sorted_rows, self.rows)
+                    if min_lat <= lat[r] <= max_lat and min_lng <= lng[r] <= max_lng)
+        return rows
+
+
+class PointStore:
+    """Ficheros de columnas por generación + manifiesto; escrituras serializadas entre procesos."""
+
+    def __init__(self, directory: str, compact_rows: int):
+        self.directory = directory
+        self.compact_rows = compact_rows
+        self._lock = threading.Lock()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _manifest(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(MANIFEST)) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _mtime(self) -> int:
+        try:
+            return os.stat(self._path(MANIFEST)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def changed(self, view: StoreView) -> bool:
+        """Otro proceso (o hilo) publicó un manifiesto nuevo."""
+        return self._mtime() != view.mtime_ns
+
+    def open(self) -> Optional[StoreView]:
+        """Mapea la versión publicada (None si no hay almacén)."""
+        for _ in range(3):
+            mtime = self._mtime()
+            manifest = self._manifest()
+            if manifest is None:
+                return None
+            try:
+                columns = {name: self._map(manifest, name, typecode) for name, typecode in STORE_COLUMNS}
+            except FileNotFoundError:
+                continue  # Otra generación se publicó entre leer el manifiesto y mapear
+            return StoreView(manifest, columns, mtime)
+        return None
+
+    def _map(self, manifest: Dict[str, Any], name: str, typecode: str) -> memoryview:
+        with open(self._path(f"{manifest['generation']}.{name}"), "rb") as f:
+            size = os.fstat(f.fileno()).st_size
+            buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        # Solo las filas publicadas (puede haber restos de un append interrumpido)
+        return memoryview(buffer)[:manifest["rows"] * array(typecode).itemsize].cast(typecode)
+
+    # --- Escritura ---
+
+    def build(self, batch: SignalBatch, source: str, source_count: int, complete: bool = True) -> StoreView:
+        """Nueva generación desde un lote de la fuente (solo filas con coordenadas)."""
+        with self._locked():
+            return self._build(batch, source, source_count, complete)
+
+    def _build(self, batch: SignalBatch, source: str, source_count: int, complete: bool = True) -> StoreView:
+        rows = list(compress(range(batch.size), batch.valid))
+        lat, lng = batch.numeric["latitude"], batch.numeric["longitude"]
+        keys = [curve_key(lat[r], lng[r]) for r in rows]
+        order = sorted(range(len(rows)), key=keys.__getitem__)
+        picked = [rows[i] for i in order]
+
+        columns: Dict[str, array] = {"key": array("Q", [keys[i] for i in order])}
+        for name in ("latitude", "longitude", "speed"):
+            values = batch.numeric[name]
+            columns[name] = array("d", [values[r] for r in picked])
+        for name in ("signal", "battery"):
+            values = batch.numeric[name]
+            columns[name] = array("h", [_clamp16(values[r]) for r in picked])
+        timestamps = batch.text["timestamp"]
+        columns["timestamp"] = array("q", [epoch_seconds(timestamps[r]) for r in picked])
+        for name, typecode in STORE_COLUMNS[-3:]:
+            codes = batch.codes[name]
+            columns[name] = array(typecode, [codes[r] for r in picked])
+
+        return self._publish(columns, {
+            "source": source,
+            "source_count": source_count,
+            "complete": complete,
+            "dictionaries": {name: list(batch.dictionaries[name]) for name in CODES},
+        })
+
+    def rebuild(self, loader: Callable[[], SignalBatch], source: str, source_count: int,
+                seen: Optional[StoreView], force: bool = False, max_rows: Optional[int] = None) -> StoreView:
+        """
+        Reconstruye desde la fuente salvo que otro worker ya lo haya hecho para
+        el mismo conteo (la lectura se hace con el lock: el resto espera y
+        reutiliza el resultado). Si la fuente falla el error se propaga; si
+        devuelve un lote vacío se conserva la anterior. Un lote de `max_rows`
+        filas (el tope del loader) deja el almacén incompleto: faltan las más antiguas.
+        """
+        with self._locked():
+            current = self._manifest()
+            if not force and current is not None and (seen is None or current["build"] != seen.manifest["build"]) \
+                    and current["source"] == source and current["source_count"] == source_count:
+                return self.open()
+            batch = loader()
+            if not batch and seen is not None:
+                logger.warning("Point store rebuild skipped: source returned no points")
+                return seen
+            return self._build(batch, source, source_count, max_rows is None or batch.size < max_rows)
+
+    def append(self, rows: List[Dict[str, Any]], inserted: int):
+        """Añade filas (formato `SignalBatch.to_rows`) al final, sin ordenar; compacta si la cola crece."""
+        batch = SignalBatch.from_rows(rows)
+        with self._locked():
+            manifest = self._manifest()
+            if manifest is None:
+                return  # Sin almacén: la próxima construcción ya las leerá de la fuente
+            picked = list(compress(range(batch.size), batch.valid))
+            lat, lng = batch.numeric["latitude"], batch.numeric["longitude"]
+            columns: Dict[str, array] = {
+                "key": array("Q", [curve_key(lat[r], lng[r]) for r in picked]),
+                "latitude": array("d", [lat[r] for r in picked]),
+                "longitude": array("d", [lng[r] for r in picked]),
+                "speed": array("d", [batch.numeric["speed"][r] for r in picked]),
+                "signal": array("h", [_clamp16(batch.numeric["signal"][r]) for r in picked]),
+                "battery": array("h", [_clamp16(batch.numeric["battery"][r]) for r in picked]),
+                "timestamp": array("q", [epoch_seconds(batch.text["timestamp"][r]) for r in picked]),
+            }
+            for name, typecode in STORE_COLUMNS[-3:]:
+                # Los diccionarios solo crecen: los códigos ya escritos no cambian
+                dictionary = manifest["dictionaries"][name]
+                index = {value: code for code, value in enumerate(dictionary)}
+                values = batch.dictionaries[name]
+                remap = [index.setdefault(value, len(index)) for value in values]
+                dictionary.extend(list(index)[len(dictionary):])
+                codes = batch.codes[name]
+                columns[name] = array(typecode, [remap[codes[r]] for r in picked])
+
+            generation, count = manifest["generation"], manifest["rows"]
+            for name, typecode in STORE_COLUMNS:
+                with open(self._path(f"{generation}.{name}"), "r+b") as f:
+                    # Descarta restos de un append interrumpido (no publicados)
+                    f.truncate(count * columns[name].itemsize)
+                    f.seek(0, os.SEEK_END)
+                    columns[name].tofile(f)
+            manifest["rows"] = count + len(picked)
+            manifest["source_count"] += inserted
+            self._write_manifest(manifest)
+
+            if manifest["rows"] - manifest["sorted_rows"] > self.compact_rows:
+                self._compact(manifest)
+
+    def _compact(self, manifest: Dict[str, Any]):
+        """Reordena la cola en una generación nueva, desde los propios ficheros."""
+        view = self.open()
+        keys = view.columns["key"]
+        order = sorted(range(view.rows), key=keys.__getitem__)
+        columns = {name: array(typecode, [view.columns[name][r] for r in order])
+                   for name, typecode in STORE_COLUMNS}
+        self._publish(columns, {"complete": manifest.get("complete", True),
+                                **{k: manifest[k] for k in ("source", "source_count", "dictionaries")}})
+        logger.info(f"🗺️ Point store compacted: {view.rows} points")
+
+    def _publish(self, columns: Dict[str, array], manifest: Dict[str, Any]) -> StoreView:
+        """Escribe una generación nueva, la publica y borra la anterior (las vistas abiertas siguen válidas)."""
+        previous = self._manifest()
+        generation = previous["generation"] + 1 if previous else 1
+        for name, _ in STORE_COLUMNS:
+            with open(self._path(f"{generation}.{name}"), "wb") as f:
+                columns[name].tofile(f)
+        rows = len(columns["key"])
+        self._write_manifest({
+            **manifest,
+            "generation": generation,
+            "build": secrets.token_hex(8),
+            "rows": rows,
+            "sorted_rows": rows,
+        })
+        for entry in os.scandir(self.directory):
+            if entry.name.split(".", 1)[0].isdigit() and not entry.name.startswith(f"{generation}."):
+                try:
+                    os.remove(entry.path)
+                except OSError:
+                    pass  # Windows: aún mapeado por una vista; se borra en la próxima generación
+        return self.open()
+
+    def _write_manifest(self, manifest: Dict[str, Any]):
+        tmp = self._path(f"{MANIFEST}.{os.getpid()}.tmp")
+        with open(tmp, "w") as f:
+            json.dump(manifest, f)
+        os.replace(tmp, self._path(MANIFEST))
+
+    def _locked(self) -> "_StoreLock":
+        return _StoreLock(self)
+
+
+class _StoreLock:
+    """Lock de hilos + `flock` del directorio (workers de `serve.py`)."""
+
+    def __init__(self, store: PointStore):
+        self.store = store
+        self.file = None
+
+    def __enter__(self):
+        self.store._lock.acquire()
+        os.makedirs(self.store.directory, exist_ok=True)
+        if fcntl is not None:
+            self.file = open(self.store._path("lock"), "w")
+            fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *exc):
+        if self.file is not None:
+            fcntl.flock(self.file, fcntl.LOCK_UN)
+            self.file.close()
+        self.store._lock.release()
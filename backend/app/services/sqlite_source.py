@@ -0,0 +1,105 @@
+"""
+Sustituto local de PostgreSQL basado en SQLite.
+
+Ejecuta las mismas consultas SQL que `PostgresSource` (filtros incluidos)
+sobre una base en memoria o en archivo. Pensado para pruebas, benchmarks y
+desarrollo sin conexión; no requiere dependencias externas.
+"""
+from typing import Any, Dict, Iterable, List, Sequence, Tuple
+from app.services.data_source import SQLSignalSource, CHANGES_TABLE, COMPACTED_TABLE, INSERT_COLUMNS, TABLE_NAME
+import logging
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_id TEXT,
+    device_name TEXT,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    altitude DOUBLE PRECISION,
+    speed DOUBLE PRECISION,
+    battery INTEGER,
+    signal INTEGER,
+    sim_operator TEXT,
+    network_type TEXT,
+    "timestamp" TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_timestamp ON {TABLE_NAME} ("timestamp");
+CREATE TABLE IF NOT EXISTS {COMPACTED_TABLE} (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    device_name TEXT NOT NULL,
+    sim_operator TEXT NOT NULL,
+    network_type TEXT NOT NULL,
+    window_start INTEGER NOT NULL,
+    cell_lat INTEGER NOT NULL,
+    cell_lng INTEGER NOT NULL,
+    latitude DOUBLE PRECISION,
+    longitude DOUBLE PRECISION,
+    altitude DOUBLE PRECISION,
+    speed DOUBLE PRECISION,
+    battery INTEGER,
+    signal INTEGER,
+    "timestamp" TEXT,
+    report_count INTEGER NOT NULL,
+    latitude_sum DOUBLE PRECISION,
+    longitude_sum DOUBLE PRECISION,
+    altitude_sum DOUBLE PRECISION,
+    speed_sum DOUBLE PRECISION,
+    signal_sum INTEGER,
+    signal_min INTEGER,
+    signal_max INTEGER,
+    last_timestamp TEXT,
+    last_id INTEGER NOT NULL,
+    UNIQUE (device_name, sim_operator, network_type, window_start, cell_lat, cell_lng)
+);
+CREATE INDEX IF NOT EXISTS idx_{COMPACTED_TABLE}_window ON {COMPACTED_TABLE} (window_start);
+CREATE INDEX IF NOT EXISTS idx_{COMPACTED_TABLE}_last_id ON {COMPACTED_TABLE} (last_id);
+CREATE TABLE IF NOT EXISTS {CHANGES_TABLE} (version INTEGER NOT NULL);
+INSERT INTO {CHANGES_TABLE} (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM {CHANGES_TABLE});
+CREATE TRIGGER IF NOT EXISTS {TABLE_NAME}_updated AFTER UPDATE ON {TABLE_NAME}
+BEGIN
+    UPDATE {CHANGES_TABLE} SET version = version + 1;
+END;
+"""
+
+
+class SQLiteSource(SQLSignalSource):
+    """Fuente SQLite con el mismo SQL que PostgreSQL."""
+
+    name = "sqlite"
+    placeholder = "?"
+
+    def __init__(self, path: str = ":memory:"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.executescript(SCHEMA)
+        self._lock = threading.Lock()
+        logger.info(f"SQLite data source ready at {path}")
+
+    def _stream(self, sql: str, params: List[Any]) -> Iterable[Tuple[Any, ...]]:
+        # Materializa bajo el lock: la conexión es compartida entre hilos
+        with self._lock:
+            return self.conn.execute(sql, params).fetchall()
+
+    def _execute_many(self, sql: str, rows: Iterable[Sequence[Any]]):
+        with self._lock, self.conn:
+            self.conn.executemany(sql, rows)
+
+    def insert_rows(self, rows: List[Dict[str, Any]]) -> int:
+        if not rows:
+            return 0
+        columns = ", ".join(f'"{c}"' for c in INSERT_COLUMNS)
+        marks = ", ".join("?" * len(INSERT_COLUMNS))
+        with self._lock, self.conn:
+            self.conn.executemany(
+                f"INSERT INTO {TABLE_NAME} ({columns}) VALUES ({marks})",
+                ([row.get(c) for c in INSERT_COLUMNS] for row in rows),
+            )
+        return len(rows)
+
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,175 @@
+"""
+Catálogo de estadísticas para estimar cuántas filas lee una consulta.
+
+Como `ANALYZE` de una base de datos: se analiza una muestra de hasta
+`STATS_SAMPLE_ROWS` filas del almacén de puntos (ya mapeado en memoria por
+todos los workers, sin ir a la fuente) y se guarda, por columna:
+- categóricas (operadora, red, dispositivo): fracción de filas de cada valor
+- numéricas (fecha, latitud, longitud, batería, señal): valores de la
+  muestra ordenados, un histograma equi-profundo exacto para rangos
+
+La selectividad de un filtro es el producto de la de cada predicado
+(independencia) y las filas estimadas, la selectividad por el conteo actual.
+Los rangos de fecha cuentan también lo que la muestra no ve: las filas
+añadidas tras el análisis (más nuevas que ella) y, si el almacén solo tiene
+las más recientes (`MAP_INDEX_MAX_POINTS`), las anteriores que faltan.
+Los totales se leen de la vista vigente en cada estimación; la muestra solo
+se rehace si el almacén se reconstruye o sus filas cambian más de
+`STATS_REFRESH_FRACTION` (las escrituras pequeñas no la invalidan).
+"""
+from bisect import bisect_left, bisect_right
+from typing import Any, Callable, Dict, List, Optional
+from app.config import config
+from app.services.filters import Predicate, SignalFilter, compile_filter
+from app.services.point_index import point_index
+from app.services.point_store import CODES, StoreView, epoch_seconds
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+RANGE_COLUMNS = ("timestamp", "latitude", "longitude", "battery", "signal")
+
+
+class Estimate:
+    """Filas estimadas de un filtro: crudas (`locations`) y las que lee el análisis."""
+
+    __slots__ = ("selectivity", "rows", "scan_rows")
+
+    def __init__(self, selectivity: float, rows: int, scan_rows: int):
+        self.selectivity = selectivity
+        self.rows = rows
+        self.scan_rows = scan_rows
+
+    def describe(self) -> Dict[str, Any]:
+        return {"selectivity": round(self.selectivity, 6), "rows": self.rows, "scan_rows": self.scan_rows}
+
+
+class TableStats:
+    """Estadísticas de una muestra del almacén (una versión de la construcción)."""
+
+    def __init__(self, view: StoreView, sample_rows: int):
+        self.build = view.manifest["build"]
+        self.analyzed_rows = view.rows
+        step = max(1, view.rows // max(1, sample_rows))
+        rows = range(0, view.rows, step)
+        self.sample = len(rows)
+
+        batch = view.batch
+        self.fractions: Dict[str, Dict[Any, float]] = {}
+        for column in CODES:
+            codes, dictionary = batch.codes[column], batch.dictionaries[column]
+            counts: Dict[int, int] = {}
+            for r in rows:
+                code = codes[r]
+                counts[code] = counts.get(code, 0) + 1
+            self.fractions[column] = {dictionary[code]: n / self.sample for code, n in counts.items()}
+
+        self.sorted: Dict[str, List[float]] = {}
+        for column in RANGE_COLUMNS:
+            values = view.columns[column]
+            self.sorted[column] = sorted(values[r] for r in rows if column != "timestamp" or values[r])
+
+    def selectivity(self, predicates: List[Predicate], view: Optional[StoreView] = None) -> float:
+        """Fracción estimada de filas (de la tabla entera si se da la `view` vigente) que cumplen los predicados."""
+        if not self.sample:
+            return 1.0
+        floor = 1.0 / (self.sample + 1)  # Nunca cero: un valor puede faltar en la muestra
+        result = 1.0
+        for predicate in predicates:
+            if view is not None and predicate.column == "timestamp":
+                fraction = self._time_fraction(predicate, view)
+            else:
+                fraction = self._fraction(predicate)
+            result *= max(floor, fraction)
+        return result
+
+    def _time_fraction(self, predicate: Predicate, view: StoreView) -> float:
+        values = self.sorted["timestamp"]
+        if not values or predicate.op not in (">=", "<="):
+            return self._fraction(predicate)
+        bound = epoch_seconds(predicate.value)
+        # Lo añadido tras el análisis es posterior a la muestra
+        appended = max(0, view.rows - self.analyzed_rows) / max(1, view.rows)
+        fraction = self._fraction(predicate) * (1.0 - appended)
+        if predicate.op == ">=" or bound >= values[-1]:
+            fraction += appended
+        if view.complete or view.rows >= view.source_count:
+            return fraction
+        # Almacén parcial: lo que falta (aprox., filas del almacén frente a reportes crudos) es anterior
+        stored = view.rows / view.source_count
+        fraction *= stored
+        if predicate.op == "<=" or bound < values[0]:
+            fraction += 1.0 - stored
+        return fraction
+
+    def _fraction(self, predicate: Predicate) -> float:
+        if predicate.op == "in":
+            fractions = self.fractions.get(predicate.column)
+            if fractions is None:
+                return 1.0
+            return min(1.0, sum(fractions.get(value, 0.0) for value in predicate.value))
+        values = self.sorted.get(predicate.column)
+        if values is None or not values:
+            # `within` (polígonos): su bbox ya va como rangos de latitud/longitud
+            return 1.0
+        bound = epoch_seconds(predicate.value) if predicate.column == "timestamp" else predicate.value
+        if predicate.op == ">=":
+            return (len(values) - bisect_left(values, bound)) / len(values)
+        if predicate.op == "<=":
+            return bisect_right(values, bound) / len(values)
+        return 1.0
+
+    def stale(self, view: StoreView, refresh_fraction: float) -> bool:
+        if view.manifest["build"] != self.build:
+            return True
+        return abs(view.rows - self.analyzed_rows) > refresh_fraction * max(1, self.analyzed_rows)
+
+
+class StatsCatalog:
+    """Estadísticas de la vista vigente del almacén de puntos, reanalizadas solo si cambió bastante."""
+
+    def __init__(self, view: Callable[[], StoreView], sample_rows: int, refresh_fraction: float):
+        self.view = view
+        self.sample_rows = sample_rows
+        self.refresh_fraction = refresh_fraction
+        self._stats: Optional[TableStats] = None
+        self._lock = threading.Lock()
+
+    def stats(self, view: Optional[StoreView] = None) -> TableStats:
+        view = view or self.view()
+        stats = self._stats
+        if stats is not None and not stats.stale(view, self.refresh_fraction):
+            return stats
+        with self._lock:
+            if self._stats is stats:
+                self._stats = TableStats(view, self.sample_rows)
+                logger.info(f"📊 Stats catalog analyzed {self._stats.sample} of {view.rows} rows")
+            return self._stats
+
+    def estimate(self, signal_filter: SignalFilter) -> Estimate:
+        """Selectividad del filtro y filas estimadas (crudas y de la tabla que leen los análisis)."""
+        plan = compile_filter(signal_filter)
+        if plan.matches_nothing:
+            return Estimate(0.0, 0, 0)
+        view = self.view()
+        selectivity = self.stats(view).selectivity(plan.pushed + plan.residual, view)
+        # `source_count`: reportes crudos; `rows`: filas del almacén (compactadas) que lee Spark.
+        # Con el almacén incompleto no se sabe cuántas lee: como mucho los reportes crudos
+        scanned = view.rows if view.complete else view.source_count
+        return Estimate(selectivity, round(selectivity * view.source_count), round(selectivity * scanned))
+
+    def describe(self) -> Dict[str, Any]:
+        stats = self._stats
+        if stats is None:
+            return {"analyzed": False}
+        return {
+            "analyzed": True,
+            "sample": stats.sample,
+            "analyzed_rows": stats.analyzed_rows,
+            "values": {column: len(fractions) for column, fractions in stats.fractions.items()},
+        }
+
+
+# Singleton instance
+stats_catalog = StatsCatalog(point_index.view, config.STATS_SAMPLE_ROWS, config.STATS_REFRESH_FRACTION)
@@ -1,47 +1,210 @@
 """
 Cliente de Supabase para manejo de datos.
+
+`SupabaseService` es la fachada que usan rutas y WebSocket; el acceso real lo
+hace una `SignalDataSource` elegida con `DATA_SOURCE`:
+- `supabase`: API REST de Supabase (PostgREST, por defecto)
+- `postgres`: PostgreSQL directo con pool y COPY binario
+- `sqlite`: sustituto local para pruebas y benchmarks
 """
 from supabase import create_client, Client
 from app.config import config
-from typing import List, Dict, Any
+from app import metrics
+from app.shared_cache import dataset_version
+from app.services.data_source import PageKey, SignalDataSource, CHANGES_TABLE, TABLE_NAME, SIGNAL_COLUMNS
+from app.models.signal_batch import SignalBatch
+from app.services.filters import FilterPlan, Predicate, SignalFilter, apply_to_batch, compile_filter
+from typing import Callable, List, Dict, Any, Optional, Sequence, Tuple, Union
 import logging
+import threading
+import time
 
 logger = logging.getLogger(__name__)
 
+SELECT_COLUMNS = ",".join(SIGNAL_COLUMNS)
+
+
+class SupabaseRestSource(SignalDataSource):
+    """Fuente vía API REST de Supabase (PostgREST + JSON)."""
+
+    name = "supabase"
+    track_updates = True  # Lee `CHANGES_TABLE`; pasa a False si no existe
 
-class SupabaseService:
-    """Servicio para interactuar con Supabase - KISS: operaciones esenciales."""
-    
     def __init__(self):
         self.client: Client = create_client(
             config.SUPABASE_URL,
             config.SUPABASE_KEY
         )
-        self.table_name = "locations"  # Tabla de ubicaciones/señales
-    
+        self.table_name = TABLE_NAME
+
+    def fetch_signals(self, limit: int, offset: int = 0) -> List[Dict[str, Any]]:
+        return self.fetch_batch(None, limit, offset).to_rows()
+
+    def fetch_filtered(self, predicates: Sequence[Predicate]) -> List[Dict[str, Any]]:
+        return self.fetch_batch(predicates).to_rows()
+
+    def fetch_batch(self, predicates: Optional[Sequence[Predicate]] = None,
+                    limit: Optional[int] = None, offset: int = 0, newest: bool = False) -> SignalBatch:
+        if predicates:
+            data = self._fetch_filtered(predicates, limit, offset, newest)
+        else:
+            data = self._fetch_range(limit or 500000, offset, newest)
+        with metrics.stage("normalize"):
+            # Normalización columnar: tipos por columna, texto por diccionario
+            return SignalBatch.from_rows(data)
+
+    def fetch_page(self, predicates: Optional[Sequence[Predicate]], limit: int,
+                   after: Optional[PageKey] = None) -> Tuple[SignalBatch, Optional[PageKey]]:
+        query = self._apply_predicates(self.client.table(self.table_name).select(f"{SELECT_COLUMNS},id"),
+                                       predicates or [])
+        if after is not None:
+            # Keyset (timestamp, id) > after; valores entre comillas (llevan ':' y '+')
+            timestamp, last_id = after
+            query = query.or_(f'timestamp.gt."{timestamp}",'
+                              f'and(timestamp.eq."{timestamp}",id.gt.{int(last_id)})')
+        response = query.order("timestamp").order("id").limit(limit).execute()
+        data = response.data
+        last = (data[-1]["timestamp"], data[-1]["id"]) if data else None
+        with metrics.stage("normalize"):
+            return SignalBatch.from_rows(data), last
+
+    def _fetch_range(self, limit: int, offset: int, newest: bool = False) -> List[Dict[str, Any]]:
+        logger.debug(f"Fetching signals from Supabase table '{self.table_name}' "
+                     f"(range {offset}-{offset + limit - 1})")
+
+        # Optimización: Seleccionar solo columnas necesarias y usar range para paginación
+        # Supabase range es inclusivo [start, end]
+        start = offset
+        end = offset + limit - 1
+
+        query = self.client.table(self.table_name).select(SELECT_COLUMNS)
+        if newest:
+            query = query.order("id", desc=True)
+        response = query.range(start, end).execute()
+
+        logger.info(f"Fetched {len(response.data)} signals from database (range={start}-{end})")
+        return response.data
+
+    def _fetch_filtered(self, predicates: Sequence[Predicate], limit: Optional[int] = None,
+                        offset: int = 0, newest: bool = False) -> List[Dict[str, Any]]:
+        # Solo las columnas que usa el lote (antes select("*"))
+        query = self.client.table(self.table_name).select(SELECT_COLUMNS)
+
+        query = self._apply_predicates(query, predicates)
+        if newest:
+            query = query.order("id", desc=True)
+        if limit is not None:
+            query = query.range(offset, offset + limit - 1)
+
+        response = query.execute()
+        logger.info(f"Fetched {len(response.data)} filtered signals")
+        return response.data
+
+    @staticmethod
+    def _apply_predicates(query, predicates: Sequence[Predicate]):
+        """Predicados empujados por el compilador de filtros (nombres reales de columnas)."""
+        for predicate in predicates:
+            if predicate.op == "in":
+                query = query.in_(predicate.column, list(predicate.value))
+            elif predicate.op == ">=":
+                query = query.gte(predicate.column, predicate.value)
+            elif predicate.op == "<=":
+                query = query.lte(predicate.column, predicate.value)
+            else:
+                raise ValueError(f"Operator {predicate.op} cannot be pushed to PostgREST")
+        return query
+
+    def count(self) -> int:
+        # count='exact', head=True hace un SELECT COUNT(*) rápido sin traer datos
+        response = self.client.table(self.table_name)\
+            .select("*", count="exact", head=True)\
+            .execute()
+        return response.count
+
+    def change_marker(self) -> str:
+        """Conteo, id máximo y versión de `CHANGES_TABLE` (si existe), como en las fuentes SQL."""
+        response = self.client.table(self.table_name).select("id").order("id", desc=True).limit(1).execute()
+        max_id = response.data[0]["id"] if response.data else 0
+        version = 0
+        if self.track_updates:
+            try:
+                response = self.client.table(CHANGES_TABLE).select("version").limit(1).execute()
+                version = response.data[0]["version"] if response.data else 0
+            except Exception as e:
+                self.track_updates = False
+                logger.warning(f"No {CHANGES_TABLE} table, external updates are not tracked: {e}")
+        return f"{self.count()}.{max_id}.{version}"
+
+    def unique_values(self, column: str) -> List[str]:
+        response = self.client.table(self.table_name)\
+            .select(column)\
+            .execute()
+
+        values = set()
+        for row in response.data:
+            if row.get(column):
+                values.add(row[column])
+
+        return sorted(list(values))
+
+    def insert_rows(self, rows: List[Dict[str, Any]], chunk_size: int = 5000) -> int:
+        """Inserta filas en bloque (un INSERT por chunk)."""
+        inserted = 0
+        for start in range(0, len(rows), chunk_size):
+            chunk = rows[start:start + chunk_size]
+            self.client.table(self.table_name).insert(chunk, returning="minimal").execute()
+            inserted += len(chunk)
+        return inserted
+
+
+def create_data_source(kind: str = None) -> SignalDataSource:
+    """Construye la fuente de datos configurada."""
+    kind = kind or config.DATA_SOURCE
+    if kind == "postgres":
+        from app.services.postgres_source import PostgresSource
+        return PostgresSource(config.DATABASE_URL, config.DB_POOL_MIN_SIZE, config.DB_POOL_MAX_SIZE)
+    if kind == "sqlite":
+        from app.services.sqlite_source import SQLiteSource
+        return SQLiteSource(config.SQLITE_PATH)
+    if kind == "supabase":
+        return SupabaseRestSource()
+    raise ValueError(f"Unknown DATA_SOURCE: {kind}")
+
+
+class SupabaseService:
+    """Servicio de datos de señales - KISS: operaciones esenciales sobre una fuente intercambiable."""
+
+    def __init__(self, source: Optional[SignalDataSource] = None):
+        self.source = source or create_data_source()
+        self.table_name = TABLE_NAME  # Tabla de ubicaciones/señales
+        # Watermark del dataset: marca de cambios de la fuente (refrescada cada
+        # WATERMARK_TTL s, detecta escrituras externas) + versión de escrituras
+        # (compartida entre workers si hay caché compartida)
+        self._counted: Optional[tuple] = None  # (fuente, marca, instante)
+        self._watermark_lock = threading.Lock()
+        self._write_listeners: List[Callable[[List[Dict[str, Any]], int], None]] = []
+
+    def watermark(self) -> str:
+        """Versión del dataset para ETags y claves de caché; cambia con cada escritura."""
+        counted = self._counted
+        if counted is None or counted[0] is not self.source or \
+                time.monotonic() - counted[2] > config.WATERMARK_TTL:
+            with self._watermark_lock:
+                if self._counted is counted:
+                    self._counted = (self.source, self._change_marker(), time.monotonic())
+                counted = self._counted
+        return f"{self.source.name}:{counted[1]}:{dataset_version.current()}"
+
     def get_all_signals(self, limit: int = 500000, offset: int = 0) -> List[Dict[str, Any]]:
         """Obtiene TODAS las señales con límite y offset configurables."""
         try:
             # Limitar máximo a 500000 para evitar timeout pero permitir grandes cargas
             if limit > 500000:
                 limit = 500000
-                
-            print(f"🔍 [DEBUG] Fetching signals from Supabase table '{self.table_name}'")
-            print(f"🔍 [DEBUG] Range: {offset} to {offset + limit - 1}")
-            
-            # Optimización: Seleccionar solo columnas necesarias y usar range para paginación
-            # Supabase range es inclusivo [start, end]
-            start = offset
-            end = offset + limit - 1
-            
-            response = self.client.table(self.table_name)\
-                .select("latitude,longitude,signal,sim_operator,network_type,device_name,speed,battery,altitude,timestamp")\
-                .range(start, end)\
-                .execute()
-            
-            print(f"✅ [DEBUG] Fetched {len(response.data)} signals from database")
-            logger.info(f"Fetched {len(response.data)} signals from database (range={start}-{end})")
-            return self._normalize_data(response.data)
+            with metrics.stage("fetch"):
+                rows = self.source.fetch_signals(limit, offset)
+            metrics.ROWS_FETCHED.labels(source=self.source.name).inc(len(rows))
+            return rows
         except Exception as e:
             print(f"❌ [ERROR] Error fetching signals: {e}")
             print(f"❌ [ERROR] Error type: {type(e).__name__}")
@@ -49,95 +212,119 @@ class SupabaseService:
             traceback.print_exc()
             logger.error(f"Error fetching signals: {e}")
             return []
-    
-    def _normalize_data(self, data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
-        """Normaliza tipos de datos para compatibilidad con Spark."""
-        # Optimización: Usar list comprehension que es más rápido que append en loop
-        return [
-            {
-                **row,
-                'speed': float(row.get('speed', 0.0) or 0.0),
-                'altitude': float(row.get('altitude', 0.0) or 0.0),
-                'latitude': float(row['latitude']),
-                'longitude': float(row['longitude']),
-                'battery': int(row.get('battery', 0) or 0),
-                'signal': int(row.get('signal', 0) or 0),
-                'sim_operator': str(row.get('sim_operator') or 'Unknown'),
-                'network_type': str(row.get('network_type') or 'Unknown'),
-                'device_name': str(row.get('device_name') or 'Unknown'),
-            }
-            for row in data
-            if row.get('latitude') and row.get('longitude')
-        ]
-    
-    def get_signals_with_filters(self, filters: Dict[str, Any]) -> List[Dict[str, Any]]:
-        """Obtiene señales aplicando filtros."""
+
+    def compile_filters(self, filters: Any) -> FilterPlan:
+        """Compila filtros (dict, FilterParams o SignalFilter) para la fuente actual."""
+        return compile_filter(SignalFilter.coerce(filters), self.source.pushdown_ops)
+
+    def get_signals_with_filters(self, filters: Any) -> List[Dict[str, Any]]:
+        """Obtiene señales aplicando filtros (empujados + residuales)."""
+        return self.get_signal_batch(filters).to_rows()
+
+    def get_signal_batch(self, filters: Union[FilterPlan, Any] = None, limit: Optional[int] = None,
+                         offset: int = 0, apply_residual: bool = True, compacted: bool = False,
+                         newest: bool = False) -> SignalBatch:
+        """
+        Lectura en formato `SignalBatch` (columnas tipadas, texto por diccionario).
+        Con `apply_residual=False` el llamador aplica `plan.residual` (p. ej. en Spark).
+        Con `compacted=True` (camino de análisis, si `ANALYTICS_COMPACTED`) lee
+        la tabla compactada; cada fila trae en `reports` los reportes que representa.
+        Con `newest=True` las filas llegan de la más nueva a la más vieja: un
+        `limit` se queda con las recientes. Si la lectura falla devuelve un lote vacío.
+        """
         try:
-            query = self.client.table(self.table_name).select("*")
-            
-            # Aplicar filtros - usando nombres reales de columnas
-            if filters.get("sim_operators"):
-                query = query.in_("sim_operator", filters["sim_operators"])
-            if filters.get("network_types"):
-                query = query.in_("network_type", filters["network_types"])
-            if filters.get("device_names"):
-                query = query.in_("device_name", filters["device_names"])
-            
-            # Filtros de tiempo
-            if filters.get("fecha_inicio"):
-                query = query.gte("timestamp", filters["fecha_inicio"])
-            if filters.get("fecha_fin"):
-                query = query.lte("timestamp", filters["fecha_fin"])
-            
-            # Filtros numéricos
-            if filters.get("battery_min"):
-                query = query.gte("battery", filters["battery_min"])
-            if filters.get("signal_min"):
-                query = query.gte("signal", filters["signal_min"])
-            
-            # Sin límite - procesar todos los datos que cumplan los filtros
-            response = query.execute()
-            logger.info(f"Fetched {len(response.data)} filtered signals")
-            return self._normalize_data(response.data)
+            return self.read_signal_batch(filters, limit, offset, apply_residual, compacted, newest)
         except Exception as e:
-            logger.error(f"Error fetching filtered signals: {e}")
-            return []
-    
-    def subscribe_to_changes(self, callback):
-        """Suscribe a cambios en tiempo real."""
+            logger.error(f"Error fetching signal batch: {e}")
+            return SignalBatch.empty()
+
+    def read_signal_batch(self, filters: Union[FilterPlan, Any] = None, limit: Optional[int] = None,
+                          offset: int = 0, apply_residual: bool = True, compacted: bool = False,
+                          newest: bool = False) -> SignalBatch:
+        """Como `get_signal_batch`, pero propaga los errores de la fuente (p. ej. al cargar el dataset de Spark)."""
+        plan = filters if isinstance(filters, FilterPlan) else self.compile_filters(filters)
+        if plan.matches_nothing:
+            return SignalBatch.empty()
+        if limit is not None and limit > 500000:
+            limit = 500000
+        with metrics.stage("fetch"):
+            if compacted and config.ANALYTICS_COMPACTED:
+                batch = self._fetch_compacted(plan, limit, offset, newest)
+            else:
+                batch = self.source.fetch_batch(plan.pushed, limit, offset, newest)
+        if apply_residual and plan.residual:
+            with metrics.stage("filter"):
+                apply_to_batch(batch, plan.residual)
+        metrics.ROWS_FETCHED.labels(source=self.source.name).inc(len(batch))
+        return batch
+
+    def _fetch_compacted(self, plan: FilterPlan, limit: Optional[int], offset: int,
+                         newest: bool = False) -> SignalBatch:
         try:
-            # Supabase realtime subscription
-            self.client.table(self.table_name)\
-                .on("INSERT", callback)\
-                .subscribe()
+            return self.source.fetch_compacted(plan.pushed, limit, offset, newest)
         except Exception as e:
-            logger.error(f"Error subscribing to changes: {e}")
+            # Sin tabla compactada (p. ej. PostgreSQL sin migrar): filas crudas
+            logger.warning(f"Compacted read failed, falling back to raw rows: {e}")
+            return self.source.fetch_batch(plan.pushed, limit, offset, newest)
+
+    def get_signal_page(self, filters: Any, limit: int,
+                        after: Optional[PageKey] = None) -> Tuple[SignalBatch, Optional[PageKey]]:
+        """
+        Página por keyset (timestamp, id) tras `after` (residual aplicado).
+        Devuelve el lote y la clave de la última fila leída, o None si no hay
+        más páginas. Propaga errores: el cliente reintenta con el mismo cursor.
+        """
+        plan = self.compile_filters(filters)
+        if plan.matches_nothing:
+            return SignalBatch.empty(), None
+        limit = min(limit, 500000)
+        with metrics.stage("fetch"):
+            batch, last = self.source.fetch_page(plan.pushed, limit, after)
+        fetched = batch.size
+        if plan.residual:
+            with metrics.stage("filter"):
+                apply_to_batch(batch, plan.residual)
+        metrics.ROWS_FETCHED.labels(source=self.source.name).inc(len(batch))
+        # Página incompleta: no quedan filas tras ella
+        return batch, last if fetched == limit else None
+
+    def add_write_listener(self, callback: Callable[[List[Dict[str, Any]], int], None]):
+        """Registra `callback(rows, inserted)`, llamado tras cada escritura correcta."""
+        self._write_listeners.append(callback)
+
+    def insert_signals(self, rows: List[Dict[str, Any]]) -> int:
+        """Inserta filas en bloque. Propaga errores al llamador."""
+        inserted = self.source.insert_rows(rows)
+        # Agrupadas: un flujo de ingesta constante no recarga el dataset en cada lote
+        dataset_version.bump(coalesce=True)
+        for callback in self._write_listeners:
+            try:
+                callback(rows, inserted)
+            except Exception as e:
+                logger.error(f"Error in write listener: {e}")
+        return inserted
+
+    def _change_marker(self) -> str:
+        try:
+            with metrics.stage("count"):
+                return self.source.change_marker()
+        except Exception as e:
+            logger.error(f"Error reading change marker: {e}")
+            return "0"
 
     def get_total_count(self) -> int:
         """Obtiene el conteo total exacto de registros en la tabla."""
         try:
-            # count='exact', head=True hace un SELECT COUNT(*) rápido sin traer datos
-            response = self.client.table(self.table_name)\
-                .select("*", count="exact", head=True)\
-                .execute()
-            return response.count
+            with metrics.stage("count"):
+                return self.source.count()
         except Exception as e:
             logger.error(f"Error getting total count: {e}")
             return 0
-    
+
     def get_unique_values(self, column: str) -> List[str]:
         """Obtiene valores únicos de una columna para filtros."""
         try:
-            response = self.client.table(self.table_name)\
-                .select(column)\
-                .execute()
-            
-            values = set()
-            for row in response.data:
-                if row.get(column):
-                    values.add(row[column])
-            
-            return sorted(list(values))
+            return self.source.unique_values(column)
         except Exception as e:
             logger.error(f"Error fetching unique values for {column}: {e}")
             return []
@@ -0,0 +1,308 @@
+"""
+Topología de polígonos para simplificar límites sin abrir huecos entre vecinos.
+
+Los anillos se cortan en arcos en los vértices donde cambia el vecino (como
+TopoJSON): una frontera compartida por dos distritos es un solo arco que
+ambos referencian (`~i` si lo recorren al revés). Cada arco se simplifica una
+vez (Douglas-Peucker) y los dos lados siguen coincidiendo. Sobre los mismos
+arcos se disuelven regiones (municipios, provincias): los arcos internos, que
+aparecen dos veces en el grupo, desaparecen.
+
+Coordenadas (lng, lat); exteriores antihorarios y huecos horarios (RFC 7946).
+"""
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+import math
+
+Point = Tuple[float, float]
+Ring = List[Point]
+# Anillo / polígono / multipolígono como referencias a arcos
+ArcRing = List[int]
+ArcPolygon = List[ArcRing]
+
+COORD_DIGITS = 7  # ~1 cm: une vértices que difieren solo por redondeo
+
+
+def ring_area(ring: Sequence[Point]) -> float:
+    """Área con signo (fórmula del cordón); positiva si es antihorario."""
+    return sum(x0 * y1 - x1 * y0 for (x0, y0), (x1, y1) in zip(ring, ring[1:])) / 2
+
+
+def ring_contains(ring: Sequence[Point], x: float, y: float) -> bool:
+    inside = False
+    for (xi, yi), (xj, yj) in zip(ring, ring[1:]):
+        if (yi > y) != (yj > y) and x < (xj - xi) * (y - yi) / (yj - yi) + xi:
+            inside = not inside
+    return inside
+
+
+def bbox_of(rings: Iterable[Sequence[Point]]) -> Tuple[float, float, float, float]:
+    xs, ys = [], []
+    for ring in rings:
+        xs.extend(p[0] for p in ring)
+        ys.extend(p[1] for p in ring)
+    return min(xs), min(ys), max(xs), max(ys)
+
+
+def centroid(polygons: Sequence[Sequence[Ring]]) -> Point:
+    """Centroide de área (huecos restan); si el área es nula, media de los vértices exteriores."""
+    area = cx = cy = 0.0
+    for polygon in polygons:
+        for ring in polygon:
+            for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+                cross = x0 * y1 - x1 * y0
+                area += cross
+                cx += (x0 + x1) * cross
+                cy += (y0 + y1) * cross
+    if abs(area) < 1e-18:
+        points = [p for polygon in polygons for p in polygon[0]]
+        return sum(p[0] for p in points) / len(points), sum(p[1] for p in points) / len(points)
+    return cx / (3 * area), cy / (3 * area)
+
+
+def normalize_polygons(geometry: Dict[str, Any]) -> List[List[Ring]]:
+    """Polygon/MultiPolygon GeoJSON -> polígonos con anillos cerrados, sin vértices repetidos y orientados."""
+    coords = geometry.get("coordinates") or []
+    if geometry.get("type") == "Polygon":
+        coords = [coords]
+    elif geometry.get("type") != "MultiPolygon":
+        return []
+    polygons = []
+    for polygon in coords:
+        rings = []
+        for i, raw in enumerate(polygon):
+            ring: Ring = []
+            for p in raw:
+                point = (round(float(p[0]), COORD_DIGITS), round(float(p[1]), COORD_DIGITS))
+                if not ring or ring[-1] != point:
+                    ring.append(point)
+            if ring[0] != ring[-1]:
+                ring.append(ring[0])
+            if len(ring) < 4:
+                continue  # Anillo degenerado
+            if (ring_area(ring) > 0) != (i == 0):
+                ring.reverse()
+            rings.append(ring)
+        if rings and ring_area(rings[0]) > 0:
+            polygons.append(rings)
+    return polygons
+
+
+class Topology:
+    """Arcos compartidos (`arcs`) y, por objeto, sus geometrías como referencias a arcos."""
+
+    def __init__(self):
+        self.arcs: List[List[Point]] = []
+        self._index: Dict[Tuple[Point, ...], int] = {}
+
+    def arc_points(self, ref: int) -> List[Point]:
+        return self.arcs[ref] if ref >= 0 else self.arcs[~ref][::-1]
+
+    def ring_points(self, ring: ArcRing) -> Ring:
+        points: Ring = []
+        for ref in ring:
+            arc = self.arc_points(ref)
+            points.extend(arc if not points else arc[1:])
+        return points
+
+    @classmethod
+    def build(cls, polygon_sets: Sequence[Sequence[List[Ring]]]) -> Tuple["Topology", List[List[ArcPolygon]]]:
+        """Topología de varios multipolígonos; devuelve también cada uno como arcos."""
+        topology = cls()
+        rings = [ring for polygons in polygon_sets for polygon in polygons for ring in polygon]
+        junctions = _junctions(rings)
+        encoded = [
+            [[topology._ring(ring, junctions) for ring in polygon] for polygon in polygons]
+            for polygons in polygon_sets
+        ]
+        return topology, encoded
+
+    def _ring(self, ring: Ring, junctions: set) -> ArcRing:
+        """Corta el anillo en sus uniones y registra (o reutiliza) cada arco."""
+        points = ring[:-1]
+        cuts = [i for i, p in enumerate(points) if p in junctions]
+        if not cuts:
+            # Anillo sin uniones: un arco cerrado, empezando por su menor vértice
+            start = points.index(min(points))
+            rotated = points[start:] + points[:start]
+            return [self._arc(rotated + [rotated[0]])]
+        rotated = points[cuts[0]:] + points[:cuts[0]] + [points[cuts[0]]]
+        offsets = [i - cuts[0] for i in cuts] + [len(points)]
+        return [self._arc(rotated[a:b + 1]) for a, b in zip(offsets, offsets[1:])]
+
+    def _arc(self, points: List[Point]) -> int:
+        key = tuple(points)
+        if key in self._index:
+            return self._index[key]
+        reverse = key[::-1]
+        if reverse in self._index:
+            return ~self._index[reverse]
+        self._index[key] = len(self.arcs)
+        self.arcs.append(points)
+        return len(self.arcs) - 1
+
+    def dissolve(self, members: Sequence[Sequence[ArcPolygon]], min_width: float = 0.0) -> List[ArcPolygon]:
+        """
+        Une multipolígonos vecinos: descarta los arcos que aparecen dos veces
+        (fronteras internas) y encadena el resto en anillos, que se clasifican
+        por orientación (exteriores / huecos) y se asignan a su exterior. Los
+        anillos de anchura media (2·área/perímetro) menor que `min_width` son
+        rendijas o solapes entre vecinos que no coinciden exactamente: se descartan.
+        """
+        uses: Dict[int, int] = {}
+        refs: List[int] = []
+        for polygons in members:
+            for polygon in polygons:
+                for ring in polygon:
+                    for ref in ring:
+                        index = ref if ref >= 0 else ~ref
+                        uses[index] = uses.get(index, 0) + 1
+                        refs.append(ref)
+        remaining = [ref for ref in refs if uses[ref if ref >= 0 else ~ref] == 1]
+
+        starts: Dict[Point, List[int]] = {}
+        for ref in remaining:
+            starts.setdefault(self.arc_points(ref)[0], []).append(ref)
+        rings: List[ArcRing] = []
+        for ref in remaining:
+            candidates = starts.get(self.arc_points(ref)[0])
+            if not candidates or ref not in candidates:
+                continue  # Ya encadenado
+            ring = []
+            first = self.arc_points(ref)[0]
+            while ref is not None:
+                starts[self.arc_points(ref)[0]].remove(ref)
+                ring.append(ref)
+                end = self.arc_points(ref)[-1]
+                ref = starts[end][0] if end != first and starts.get(end) else None
+            points = self.ring_points(ring)
+            perimeter = sum(math.dist(a, b) for a, b in zip(points, points[1:]))
+            if perimeter and 2 * abs(ring_area(points)) / perimeter >= min_width:
+                rings.append(ring)
+
+        exteriors = [[ring] for ring in rings if ring_area(self.ring_points(ring)) > 0]
+        for ring in rings:
+            points = self.ring_points(ring)
+            if ring_area(points) > 0:
+                continue
+            x, y = points[0]
+            for polygon in exteriors:
+                if ring_contains(self.ring_points(polygon[0]), x, y):
+                    polygon.append(ring)
+                    break
+        return exteriors
+
+    def polygons_points(self, polygons: Sequence[ArcPolygon]) -> List[List[Ring]]:
+        return [[self.ring_points(ring) for ring in polygon] for polygon in polygons]
+
+    def importance(self) -> List[List[float]]:
+        """Por arco, la tolerancia máxima a la que Douglas-Peucker conserva cada vértice."""
+        return [_dp_importance(arc) for arc in self.arcs]
+
+    def simplified(self, tolerance: float, importance: List[List[float]],
+                   rings: Iterable[ArcRing]) -> List[List[Point]]:
+        """
+        Arcos simplificados a `tolerance`. Si un anillo quedaría con menos de
+        tres vértices distintos, se le devuelven sus vértices más importantes
+        (en todos los anillos que comparten esos arcos, así siguen encajando).
+        """
+        threshold = [tolerance] * len(self.arcs)
+        for ring in rings:
+            while True:
+                kept = sum(sum(1 for w in importance[r if r >= 0 else ~r] if w >= threshold[r if r >= 0 else ~r]) - 1
+                           for r in ring)
+                if kept >= 3:
+                    break
+                candidates = [(w, r if r >= 0 else ~r) for r in ring
+                              for w in importance[r if r >= 0 else ~r] if w < threshold[r if r >= 0 else ~r]]
+                if not candidates:
+                    break
+                w, index = max(candidates)
+                threshold[index] = w
+        return [[p for p, w in zip(arc, weights) if w >= t]
+                for arc, weights, t in zip(self.arcs, importance, threshold)]
+
+
+def _junctions(rings: Sequence[Ring]) -> set:
+    """Vértices donde un anillo se encuentra con otro con vecinos distintos (o varias veces)."""
+    neighbors: Dict[Point, Tuple[Point, Point]] = {}
+    junctions = set()
+    for ring in rings:
+        points = ring[:-1]
+        n = len(points)
+        for i, p in enumerate(points):
+            pair = (points[i - 1], points[(i + 1) % n])
+            seen = neighbors.get(p)
+            if seen is None:
+                neighbors[p] = pair
+            elif seen != pair and seen != pair[::-1]:
+                junctions.add(p)
+    return junctions
+
+
+def _dp_importance(points: List[Point]) -> List[float]:
+    """
+    Douglas-Peucker iterativo que guarda, por vértice, la distancia con la que
+    se eligió (acotada por la de su segmento padre): simplificar a una
+    tolerancia es quedarse con los vértices de importancia >= tolerancia.
+    """
+    n = len(points)
+    weights = [0.0] * n
+    weights[0] = weights[-1] = math.inf
+    if n <= 2:
+        return weights
+    closed = points[0] == points[-1]
+    stack = [(0, n - 1, math.inf)]
+    if closed:
+        # Arco cerrado: el vértice más lejano del inicio parte el anillo en dos
+        x0, y0 = points[0]
+        far = max(range(1, n - 1), key=lambda i: (points[i][0] - x0) ** 2 + (points[i][1] - y0) ** 2)
+        weights[far] = math.inf
+        stack = [(0, far, math.inf), (far, n - 1, math.inf)]
+    while stack:
+        a, b, parent = stack.pop()
+        if b - a < 2:
+            continue
+        (ax, ay), (bx, by) = points[a], points[b]
+        dx, dy = bx - ax, by - ay
+        length = math.hypot(dx, dy)
+        best, best_d = a + 1, -1.0
+        for i in range(a + 1, b):
+            px, py = points[i]
+            d = abs(dx * (ay - py) - dy * (ax - px)) / length if length else math.hypot(px - ax, py - ay)
+            if d > best_d:
+                best, best_d = i, d
+        weights[best] = min(best_d, parent)
+        stack.append((a, best, weights[best]))
+        stack.append((best, b, weights[best]))
+    return weights
+
+
+def quantize(arcs: Sequence[Sequence[Point]], bbox: Tuple[float, float, float, float],
+             step: float) -> Tuple[Dict[str, List[float]], List[List[List[int]]]]:
+    """
+    Transformación TopoJSON (`scale`, `translate`) con celdas de `step` grados
+    y arcos en enteros codificados por deltas; se quitan vértices que caen en
+    la misma celda que el anterior (cada arco conserva sus dos extremos).
+    """
+    x0, y0 = bbox[0], bbox[1]
+    encoded = []
+    for arc in arcs:
+        cells = [(round((x - x0) / step), round((y - y0) / step)) for x, y in arc]
+        kept = [cells[0]]
+        for c in cells[1:-1]:
+            if c != kept[-1]:
+                kept.append(c)
+        kept.append(cells[-1])
+        deltas = [list(kept[0])]
+        deltas.extend([b[0] - a[0], b[1] - a[1]] for a, b in zip(kept, kept[1:]))
+        encoded.append(deltas)
+    return {"scale": [step, step], "translate": [x0, y0]}, encoded
+
+
+def geometry(polygons: List[ArcPolygon], properties: Dict[str, Any],
+             bbox: Optional[Tuple[float, float, float, float]] = None) -> Dict[str, Any]:
+    """Geometría TopoJSON `MultiPolygon` (referencias a arcos) con sus propiedades."""
+    result: Dict[str, Any] = {"type": "MultiPolygon", "arcs": polygons, "properties": properties}
+    if bbox is not None:
+        result["bbox"] = [round(v, COORD_DIGITS) for v in bbox]
+    return result
@@ -0,0 +1,303 @@
+"""
+Caché compartida entre workers: memoria compartida (`/dev/shm`) o ficheros mapeados.
+
+Cada entrada es un fichero con una cabecera JSON y secciones binarias
+alineadas. Se escribe en un temporal y se publica con `os.replace` (atómico:
+un lector ve la entrada entera o no la ve) y se lee con `mmap`, así que todos
+los workers obtienen `memoryview` sobre las mismas páginas, sin copiarlas.
+La llena un solo worker (`fill`): los demás esperan a que aparezca.
+
+La versión del dataset (`dataset_version`) también vive en el directorio:
+una escritura en cualquier worker la cambia y vacía la caché. Como forma
+parte del watermark, ETags y claves cambian a la vez en todos los workers.
+"""
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from app.config import config
+from app import metrics
+import hashlib
+import json
+import logging
+import math
+import mmap
+import os
+import secrets
+import struct
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+MAGIC = b"SGC1"
+_PREFIX = struct.Struct("<4sI")  # magia + longitud de la cabecera JSON
+ALIGN = 8  # las secciones empiezan alineadas para poder verlas como arrays de 'd'
+SUFFIX = ".entry"
+FILL_WAIT = 30.0  # segundos máximos esperando a que otro worker llene la entrada
+FILL_POLL = 0.05
+
+
+class SharedEntry:
+    """Entrada leída: metadatos + secciones (`memoryview` sobre el fichero mapeado)."""
+
+    __slots__ = ("meta", "sections")
+
+    def __init__(self, meta: Dict[str, Any], sections: Sequence[memoryview]):
+        self.meta = meta
+        self.sections = sections
+
+
+class SharedCache:
+    """Entradas clave -> (metadatos, secciones) en un directorio compartido por los workers."""
+
+    def __init__(self, directory: str, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, hashlib.blake2b(key.encode(), digest_size=16).hexdigest() + SUFFIX)
+
+    def get(self, key: str, max_age: Optional[float] = None) -> Optional[SharedEntry]:
+        """Entrada mapeada o None (inexistente, de otra clave o más antigua que `max_age`)."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                view = memoryview(mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ))
+        except (FileNotFoundError, ValueError):
+            return None
+        try:
+            magic, header_len = _PREFIX.unpack_from(view)
+            header = json.loads(bytes(view[_PREFIX.size:_PREFIX.size + header_len])) if magic == MAGIC else {}
+        except (struct.error, ValueError):
+            return None  # Fichero ajeno o truncado
+        if header.get("key") != key:
+            return None
+        if max_age is not None and time.time() - header["created"] > max_age:
+            return None
+        base = _align(_PREFIX.size + header_len)
+        sections = [view[base + start:base + start + length] for start, length in header["sections"]]
+        return SharedEntry(header["meta"], sections)
+
+    def put(self, key: str, sections: Sequence[bytes], meta: Optional[Dict[str, Any]] = None) -> SharedEntry:
+        """Publica la entrada y la devuelve mapeada (o en memoria si no cabe o falla la escritura)."""
+        meta = meta or {}
+        layout: List[Tuple[int, int]] = []  # (offset desde el inicio de los datos, longitud)
+        size = 0
+        for section in sections:
+            layout.append((size, len(section)))
+            size = _align(size + len(section))
+        header = json.dumps({"key": key, "created": time.time(), "meta": meta, "sections": layout},
+                            default=str).encode()
+        base = _align(_PREFIX.size + len(header))
+        if base + size > self.max_bytes:
+            return SharedEntry(meta, [memoryview(s) for s in sections])
+
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{secrets.token_hex(4)}.tmp"
+        try:
+            with open(tmp, "wb") as f:
+                f.write(_PREFIX.pack(MAGIC, len(header)))
+                f.write(header)
+                for (start, _), section in zip(layout, sections):
+                    f.seek(base + start)
+                    f.write(section)
+                f.truncate(base + size)
+            os.replace(tmp, path)
+        except OSError as e:
+            logger.warning(f"Shared cache write failed ({e}); serving from memory")
+            _remove(tmp)
+            return SharedEntry(meta, [memoryview(s) for s in sections])
+        self._evict()
+        return self.get(key) or SharedEntry(meta, [memoryview(s) for s in sections])
+
+    def fill(self, key: str, producer: Callable[[], Tuple[Sequence[bytes], Dict[str, Any]]],
+             max_age: Optional[float] = None) -> SharedEntry:
+        """
+        Entrada de la caché o, si falta, la calcula `producer` en un solo worker
+        (fichero `.lock` exclusivo con el token de su dueño); los demás esperan
+        a que se publique.
+        """
+        entry = self.get(key, max_age)
+        if entry is not None:
+            metrics.cache_result("shared", "hit")
+            return entry
+        lock = self._path(key) + ".lock"
+        token = f"{os.getpid()}.{secrets.token_hex(8)}"
+        deadline = time.monotonic() + FILL_WAIT
+        while not _try_lock(lock, token):
+            if time.monotonic() > deadline or _age(lock) > FILL_WAIT:
+                _take_lock(lock, token)  # Dueño caído o demasiado lento: el lock pasa a este worker
+                break
+            time.sleep(FILL_POLL)
+            entry = self.get(key, max_age)
+            if entry is not None:
+                metrics.cache_result("shared", "hit")
+                return entry
+        try:
+            entry = self.get(key, max_age)
+            if entry is not None:
+                metrics.cache_result("shared", "hit")
+                return entry
+            metrics.cache_result("shared", "miss")
+            sections, meta = producer()
+            return self.put(key, sections, meta)
+        finally:
+            _unlock(lock, token)
+
+    def _entries(self) -> List[os.DirEntry]:
+        try:
+            return [e for e in os.scandir(self.directory) if e.name.endswith(SUFFIX)]
+        except FileNotFoundError:
+            return []
+
+    def _evict(self):
+        """Acota el tamaño total: se descartan las entradas más antiguas."""
+        entries = []
+        for e in self._entries():
+            try:
+                stat = e.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, e.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            _remove(path)
+            total -= size
+        metrics.CACHE_ENTRIES.labels(cache="shared").set(len(self._entries()))
+
+    def clear(self):
+        """Borra todas las entradas (los workers que ya las mapearon conservan su vista)."""
+        for e in self._entries():
+            _remove(e.path)
+        metrics.CACHE_ENTRIES.labels(cache="shared").set(0)
+
+    def stats(self) -> Dict[str, Any]:
+        sizes = []
+        for e in self._entries():
+            try:
+                sizes.append(e.stat().st_size)
+            except FileNotFoundError:
+                continue
+        return {"entries": len(sizes), "bytes": sum(sizes), "max_bytes": self.max_bytes}
+
+
+class DatasetVersion:
+    """
+    Versión del dataset que cambia con cada escritura. Con caché compartida es
+    un token en un fichero del directorio (visible para todos los workers) y
+    cambiarlo vacía la caché; sin ella, un contador de este proceso.
+
+    `bump(coalesce=True)` (ingesta) cambia la versión como mucho una vez cada
+    `min_interval` segundos: las escrituras que llegan antes quedan pendientes
+    y se publican juntas al cumplirse el intervalo.
+    """
+
+    def __init__(self, cache: Optional[SharedCache] = None, min_interval: float = 0.0):
+        self.cache = cache
+        self.path = os.path.join(cache.directory, "VERSION") if cache is not None else None
+        self.min_interval = min_interval
+        self._writes = 0
+        self._bumped_at = 0.0
+        self._timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+    def current(self) -> str:
+        if self.path is None:
+            return str(self._writes)
+        try:
+            with open(self.path) as f:
+                return f.read()
+        except FileNotFoundError:
+            return self.bump()
+
+    def bump(self, coalesce: bool = False) -> str:
+        with self._lock:
+            wait = self.min_interval - self._since_bump() if coalesce else 0.0
+            if wait <= 0:
+                return self._bump()
+            if self._timer is None:
+                self._timer = threading.Timer(wait, self._publish)
+                self._timer.daemon = True
+                self._timer.start()
+        return self.current()
+
+    def _publish(self):
+        with self._lock:
+            self._timer = None
+            self._bump()
+
+    def _since_bump(self) -> float:
+        # Con caché compartida cuenta la última publicación de cualquier worker
+        if self.path is None:
+            return time.time() - self._bumped_at
+        try:
+            return time.time() - os.stat(self.path).st_mtime
+        except FileNotFoundError:
+            return math.inf
+
+    def _bump(self) -> str:
+        self._writes += 1
+        self._bumped_at = time.time()
+        if self.path is None:
+            return str(self._writes)
+        token = secrets.token_hex(8)
+        tmp = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp, "w") as f:
+            f.write(token)
+        os.replace(tmp, self.path)
+        self.cache.clear()
+        return token
+
+
+def _align(offset: int) -> int:
+    return (offset + ALIGN - 1) // ALIGN * ALIGN
+
+
+def _try_lock(path: str, token: str) -> bool:
+    try:
+        fd = os.open(path, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(token)
+    return True
+
+
+def _take_lock(path: str, token: str):
+    """Sustituye el lock (exista o no) por uno de `token`, de forma atómica."""
+    tmp = f"{path}.{token}.tmp"
+    with open(tmp, "w") as f:
+        f.write(token)
+    os.replace(tmp, path)
+
+
+def _unlock(path: str, token: str):
+    """Borra el lock solo si sigue siendo de `token`: otro worker pudo quedárselo tras `FILL_WAIT`."""
+    try:
+        with open(path) as f:
+            owner = f.read()
+    except FileNotFoundError:
+        return
+    if owner == token:
+        _remove(path)
+
+
+def _age(path: str) -> float:
+    try:
+        return time.time() - os.stat(path).st_mtime
+    except FileNotFoundError:
+        return 0.0
+
+
+def _remove(path: str):
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+# Singleton instances
+shared_cache = SharedCache(config.SHARED_CACHE_DIR, config.SHARED_CACHE_MAX_BYTES) \
+    if config.SHARED_CACHE_ENABLED else None
+dataset_version = DatasetVersion(shared_cache, config.DATASET_VERSION_INTERVAL)
@@ -0,0 +1,61 @@
+"""
+Compara dos resultados de `benchmarks.run` y marca regresiones.
+
+Uso:
+    python -m benchmarks.compare results/base.json results/new.json --threshold 1.15
+
+Sale con código 1 si algún escenario empeora más que el umbral (mediana).
+"""
+from typing import Any, Dict, List, Tuple
+import argparse
+import json
+import sys
+
+
+def load(path: str) -> Dict[str, Any]:
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float) -> Tuple[List[Tuple], List[Tuple]]:
+    """Devuelve (todas las filas, regresiones) como (tamaño, escenario, base, nuevo, ratio)."""
+    rows, regressions = [], []
+    for size, scenarios in new["results"].items():
+        base_scenarios = base["results"].get(size, {})
+        for name, stats in scenarios.items():
+            if name not in base_scenarios:
+                continue
+            before = base_scenarios[name]["median_s"]
+            after = stats["median_s"]
+            ratio = after / before if before else float("inf")
+            row = (size, name, before, after, ratio)
+            rows.append(row)
+            if ratio > threshold:
+                regressions.append(row)
+    return rows, regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara resultados de benchmarks")
+    parser.add_argument("base")
+    parser.add_argument("new")
+    parser.add_argument("--threshold", type=float, default=1.15, help="Ratio de mediana considerado regresión")
+    args = parser.parse_args()
+
+    base, new = load(args.base), load(args.new)
+    rows, regressions = compare(base, new, args.threshold)
+
+    print(f"base: {base['meta']['commit']}  new: {new['meta']['commit']}")
+    print(f"{'size':>9}  {'scenario':<45} {'base ms':>10} {'new ms':>10} {'ratio':>7}")
+    for size, name, before, after, ratio in rows:
+        flag = "  ⚠️" if ratio > args.threshold else ""
+        print(f"{size:>9}  {name:<45} {before * 1000:>10.2f} {after * 1000:>10.2f} {ratio:>7.2f}{flag}")
+
+    if regressions:
+        print(f"\n❌ {len(regressions)} regression(s) above {args.threshold:.2f}x")
+        sys.exit(1)
+    print("\n✅ No regressions")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,214 @@
+"""
+Generador sintético de filas de la tabla `locations` para Santa Cruz.
+
+Simula dispositivos que se mueven alrededor de los centros poblados del
+departamento y reportan cada pocos segundos: operadora, tipo de red, señal,
+velocidad, batería y altura. Es determinista por semilla.
+
+Uso:
+    python -m benchmarks.generator --rows 100000 --output signals.sqlite
+"""
+from typing import Any, Dict, Iterator, List
+from datetime import datetime, timedelta, timezone
+import argparse
+import math
+import random
+
+# Límites aproximados del departamento de Santa Cruz
+SANTA_CRUZ_BOUNDS = {
+    "min_lat": -20.5,
+    "max_lat": -13.5,
+    "min_lon": -64.5,
+    "max_lon": -57.5,
+}
+
+# (lat, lng, radio en grados, peso)
+HOTSPOTS = [
+    (-17.7833, -63.1821, 0.08, 0.70),  # Santa Cruz de la Sierra
+    (-17.3387, -63.2505, 0.03, 0.08),  # Montero
+    (-17.5103, -63.1647, 0.03, 0.06),  # Warnes
+    (-17.7539, -62.9969, 0.02, 0.04),  # Cotoca
+    (-17.8944, -63.3228, 0.02, 0.04),  # La Guardia
+    (-16.3833, -60.9500, 0.03, 0.03),  # San Ignacio de Velasco
+    (-18.3333, -59.7500, 0.03, 0.02),  # Roboré
+    (None, None, None, 0.03),          # Zona rural (todo el departamento)
+]
+
+OPERATORS = [("ENTEL", 0.45), ("TIGO", 0.35), ("VIVA", 0.20)]
+
+# Rango de señal (dBm) por tipo de red
+SIGNAL_RANGES = {"WiFi": (-80, -35), "4G": (-115, -70), "3G": (-110, -75)}
+
+START_TIME = datetime(2025, 10, 1, tzinfo=timezone.utc)
+REPORT_INTERVAL_S = 5
+METERS_PER_DEGREE = 111320.0
+
+SIZES = {
+    "10k": 10_000,
+    "100k": 100_000,
+    "1m": 1_000_000,
+    "10m": 10_000_000,
+}
+
+
+def parse_size(value: str) -> int:
+    """Acepta '10k', '1m', '250000'."""
+    value = value.strip().lower()
+    if value in SIZES:
+        return SIZES[value]
+    if value.endswith("k"):
+        return int(float(value[:-1]) * 1_000)
+    if value.endswith("m"):
+        return int(float(value[:-1]) * 1_000_000)
+    return int(value)
+
+
+def _weighted(rng: random.Random, choices):
+    r = rng.random()
+    acc = 0.0
+    for value, weight in choices:
+        acc += weight
+        if r <= acc:
+            return value
+    return choices[-1][0]
+
+
+class _Device:
+    """Estado de un dispositivo simulado (posición, batería, modo de movimiento)."""
+
+    __slots__ = ("name", "device_id", "operator", "lat", "lng", "heading", "speed",
+                 "battery", "network", "center", "time")
+
+    def __init__(self, rng: random.Random, index: int):
+        self.name = f"device-{index:05d}"
+        self.device_id = f"{rng.getrandbits(64):016x}"
+        self.operator = _weighted(rng, OPERATORS)
+        hotspot = _weighted(rng, [((h[0], h[1], h[2]), h[3]) for h in HOTSPOTS])
+        if hotspot[0] is None:
+            self.lat = rng.uniform(SANTA_CRUZ_BOUNDS["min_lat"], SANTA_CRUZ_BOUNDS["max_lat"])
+            self.lng = rng.uniform(SANTA_CRUZ_BOUNDS["min_lon"], SANTA_CRUZ_BOUNDS["max_lon"])
+            self.center = (self.lat, self.lng, 0.2)
+        else:
+            self.lat = rng.gauss(hotspot[0], hotspot[2] / 2)
+            self.lng = rng.gauss(hotspot[1], hotspot[2] / 2)
+            self.center = hotspot
+        self.heading = rng.uniform(0, 2 * math.pi)
+        self.speed = 0.0
+        self.battery = rng.randint(20, 100)
+        self.network = "4G"
+        # Los dispositivos empiezan a reportar en momentos distintos del primer día
+        self.time = START_TIME + timedelta(seconds=rng.randint(0, 86400))
+
+    def step(self, rng: random.Random) -> Dict[str, Any]:
+        # Cambiar de modo: quieto, caminando o en vehículo
+        if rng.random() < 0.02:
+            mode = rng.random()
+            self.speed = 0.0 if mode < 0.4 else (rng.uniform(2, 6) if mode < 0.7 else rng.uniform(15, 60))
+        self.heading += rng.gauss(0, 0.3)
+
+        # Volver hacia el centro si se aleja demasiado
+        c_lat, c_lng, radius = self.center
+        if abs(self.lat - c_lat) > radius or abs(self.lng - c_lng) > radius:
+            self.heading = math.atan2(c_lat - self.lat, c_lng - self.lng)
+
+        distance = self.speed / 3.6 * REPORT_INTERVAL_S / METERS_PER_DEGREE
+        self.lat = min(max(self.lat + distance * math.sin(self.heading), SANTA_CRUZ_BOUNDS["min_lat"]),
+                       SANTA_CRUZ_BOUNDS["max_lat"])
+        self.lng = min(max(self.lng + distance * math.cos(self.heading), SANTA_CRUZ_BOUNDS["min_lon"]),
+                       SANTA_CRUZ_BOUNDS["max_lon"])
+
+        # WiFi solo cuando está quieto o caminando
+        if rng.random() < 0.05:
+            if self.speed < 6 and rng.random() < 0.5:
+                self.network = "WiFi"
+            else:
+                self.network = "4G" if rng.random() < 0.78 else "3G"
+        elif self.network == "WiFi" and self.speed > 6:
+            self.network = "4G"
+
+        # Batería: descarga lenta, recarga ocasional
+        if rng.random() < 0.01:
+            self.battery = max(1, self.battery - 1)
+        if self.battery < 15 and rng.random() < 0.05:
+            self.battery = 100
+
+        # Señal: peor lejos del centro poblado
+        low, high = SIGNAL_RANGES[self.network]
+        far = min(1.0, math.hypot(self.lat - c_lat, self.lng - c_lng) / max(radius, 1e-6))
+        signal = int(rng.uniform(low, high) - far * 10)
+
+        self.time += timedelta(seconds=REPORT_INTERVAL_S + rng.randint(0, 3))
+        if rng.random() < 0.002:
+            # Pausa: el dispositivo deja de reportar unas horas
+            self.time += timedelta(seconds=rng.randint(3600, 12 * 3600))
+        return {
+            "device_id": self.device_id,
+            "device_name": self.name,
+            "latitude": round(self.lat, 6),
+            "longitude": round(self.lng, 6),
+            "altitude": round(rng.gauss(416, 15), 1),
+            "speed": round(self.speed + (rng.gauss(0, 0.5) if self.speed else 0.0), 2),
+            "battery": self.battery,
+            "signal": signal,
+            "sim_operator": self.operator,
+            "network_type": self.network,
+            "timestamp": self.time.isoformat(),
+        }
+
+
+def iter_rows(count: int, seed: int = 42, devices: int = None, chunk_size: int = 50_000) -> Iterator[List[Dict[str, Any]]]:
+    """Genera `count` filas en bloques de `chunk_size` (no carga todo en memoria)."""
+    rng = random.Random(seed)
+    devices = devices or max(10, min(5000, count // 500))
+    fleet = [_Device(rng, i) for i in range(devices)]
+
+    chunk: List[Dict[str, Any]] = []
+    produced = 0
+    while produced < count:
+        for device in fleet:
+            chunk.append(device.step(rng))
+            produced += 1
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+            if produced >= count:
+                break
+    if chunk:
+        yield chunk
+
+
+def generate_rows(count: int, seed: int = 42, devices: int = None) -> List[Dict[str, Any]]:
+    """Lista completa de filas (para tamaños que caben en memoria)."""
+    rows: List[Dict[str, Any]] = []
+    for chunk in iter_rows(count, seed, devices):
+        rows.extend(chunk)
+    return rows
+
+
+def write_sqlite(path: str, count: int, seed: int = 42) -> int:
+    """Crea (o completa) una base SQLite con el esquema de `locations`."""
+    from app.services.sqlite_source import SQLiteSource
+
+    source = SQLiteSource(path)
+    try:
+        written = 0
+        for chunk in iter_rows(count, seed):
+            written += source.insert_rows(chunk)
+        return written
+    finally:
+        source.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Genera señales sintéticas de Santa Cruz")
+    parser.add_argument("--rows", default="100k", help="10k, 100k, 1m, 10m o un número")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", required=True, help="Archivo SQLite de salida")
+    args = parser.parse_args()
+
+    written = write_sqlite(args.output, parse_size(args.rows), args.seed)
+    print(f"✅ {written} filas escritas en {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,88 @@
+"""
+Benchmark de la ruta de ingesta: validación rápida vs. SignalData por fila.
+
+Uso:
+    python -m benchmarks.ingest_throughput --rows 100000
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import time
+
+os.environ.setdefault("SUPABASE_URL", "http://localhost:54321")
+os.environ.setdefault("SUPABASE_KEY", "header.payload.signature")
+
+from app.models.signal import SignalData
+from app.services.ingest_service import IngestService, validate_reports
+
+
+def _reports(count: int):
+    rng = random.Random(11)
+    return [
+        {
+            "latitude": -17.78 + rng.uniform(-0.2, 0.2),
+            "longitude": -63.18 + rng.uniform(-0.2, 0.2),
+            "altitude": rng.uniform(380, 450),
+            "speed": rng.uniform(0, 60),
+            "battery": rng.randint(5, 100),
+            "signal": rng.randint(-110, -50),
+            "sim_operator": rng.choice(["ENTEL", "TIGO", "VIVA"]),
+            "network_type": rng.choice(["WiFi", "4G", "3G"]),
+            "device_name": f"device-{rng.randint(1, 200)}",
+            "timestamp": f"2025-10-09T{(i // 3600) % 24:02d}:{(i // 60) % 60:02d}:{i % 60:02d}+00:00",
+        }
+        for i in range(count)
+    ]
+
+
+def _rate(rows: int, seconds: float) -> int:
+    return int(rows / seconds) if seconds else 0
+
+
+async def _submit(rows, batch: int) -> float:
+    written = []
+    service = IngestService(writer=lambda chunk: written.append(len(chunk)) or len(chunk), probe=lambda: None,
+                            batch_size=5000, flush_interval=0.05, max_buffer=len(rows) + 1)
+    service.start()
+    start = time.perf_counter()
+    for i in range(0, len(rows), batch):
+        service.submit(rows[i:i + batch])
+        await asyncio.sleep(0)
+    await service.stop()
+    elapsed = time.perf_counter() - start
+    assert sum(written) == len(rows)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Throughput de la ruta de ingesta")
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--batch", type=int, default=1000, help="Reportes por petición")
+    args = parser.parse_args()
+
+    reports = _reports(args.rows)
+
+    start = time.perf_counter()
+    for row in reports:
+        SignalData(**row).model_dump()
+    pydantic_s = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rows, rejected, _ = validate_reports(reports)
+    fast_s = time.perf_counter() - start
+
+    submit_s = asyncio.run(_submit(rows, args.batch))
+
+    print(json.dumps({
+        "rows": args.rows,
+        "signaldata_rows_per_s": _rate(args.rows, pydantic_s),
+        "validate_rows_per_s": _rate(args.rows, fast_s),
+        "submit_and_flush_rows_per_s": _rate(args.rows, submit_s),
+        "rejected": rejected,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,633 @@
+"""
+Prueba de carga de la API real con una fuente de datos en memoria.
+
+Arranca la app FastAPI (uvicorn) en un proceso aparte, con `StandInSource`
+como fuente de `SupabaseService`: SQLite en memoria cargado con el generador
+sintético y latencia de red simulada. Contra ella lanza a la vez:
+- miles de clientes WebSocket (`/api/ws/signals`) que piden `refresh` con
+  filtros variados cada pocos segundos, y
+- tráfico REST del dashboard (`POST /dashboard`, `/analytics/aggregate`,
+  `/map/points`, `/signals`...) con una mezcla de filtros realista.
+
+Informa percentiles de latencia y throughput por escenario y, segundo a
+segundo, el lag del event loop del servidor, su memoria (RSS) y los
+clientes conectados. El JSON de salida sigue el formato de `benchmarks.run`,
+así que `benchmarks.compare` marca las regresiones entre commits.
+
+Uso:
+    python -m benchmarks.load_test --rows 100k --ws-clients 2000 --rest-concurrency 32 --duration 60
+    python -m benchmarks.load_test --mix points=4,signals=2,options=1 --ws-clients 500
+    python -m benchmarks.load_test --target http://localhost:8000 --ws-clients 1000
+    python -m benchmarks.compare results/load-abc1234.json results/load-def5678.json
+"""
+from typing import Any, Callable, Dict, List, Optional, Tuple
+from collections import defaultdict
+from urllib.parse import urlencode
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+PROBE_INTERVAL_S = 0.01  # Sueño del sondeo de lag del event loop
+WS_REPLY_TIMEOUT_S = 60.0
+
+# Viewports del mapa (Santa Cruz de la Sierra y alrededores) con su zoom
+VIEWPORTS = [
+    ((-63.30, -17.90, -63.05, -17.70), 12),
+    ((-63.19, -17.80, -63.15, -17.77), 15),
+    ((-63.40, -18.00, -62.90, -17.50), 11),
+    ((-63.35, -17.45, -63.15, -17.25), 12),  # Montero
+]
+OPERATORS = ["ENTEL", "TIGO", "VIVA"]
+NETWORKS = ["4G", "WiFi", "3G"]
+PROVINCES = ["Andres Ibañez", "Warnes", "Obispo Santistevan"]
+
+
+# --- Mezcla de filtros ---
+
+def _no_filter(rng: random.Random) -> Dict[str, Any]:
+    return {}
+
+
+def _operator(rng: random.Random) -> Dict[str, Any]:
+    return {"empresas": [rng.choice(OPERATORS)]}
+
+
+def _operator_network(rng: random.Random) -> Dict[str, Any]:
+    return {"empresas": [rng.choice(OPERATORS)], "tipos_senal": [rng.choice(NETWORKS)]}
+
+
+def _province(rng: random.Random) -> Dict[str, Any]:
+    return {"provincias": [rng.choice(PROVINCES)]}
+
+
+def _time_range(rng: random.Random) -> Dict[str, Any]:
+    # El generador empieza el 2025-10-01: ventanas de unas horas del primer día
+    start = rng.randint(0, 18)
+    return {"fecha_inicio": f"2025-10-01T{start:02d}:00:00+00:00",
+            "fecha_fin": f"2025-10-01T{start + rng.randint(1, 6):02d}:00:00+00:00"}
+
+
+# (peso, nombre, generador): lo que más se pide es el dashboard sin filtros y por operadora
+FILTER_MIX: List[Tuple[float, str, Callable[[random.Random], Dict[str, Any]]]] = [
+    (0.35, "none", _no_filter),
+    (0.25, "operator", _operator),
+    (0.15, "operator+network", _operator_network),
+    (0.15, "province", _province),
+    (0.10, "time_range", _time_range),
+]
+
+
+def pick_filters(rng: random.Random) -> Dict[str, Any]:
+    """Filtros del frontend (cuerpo de `POST`/`refresh`) según `FILTER_MIX`."""
+    weights = [weight for weight, _, _ in FILTER_MIX]
+    return rng.choices(FILTER_MIX, weights)[0][2](rng)
+
+
+def query_params(filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Los mismos filtros como query params de las rutas GET (un valor por lista)."""
+    params: Dict[str, Any] = {}
+    for key, param in (("provincias", "provincia"), ("empresas", "empresa"), ("tipos_senal", "tipo_senal")):
+        if filters.get(key):
+            params[param] = filters[key][0]
+    for key in ("fecha_inicio", "fecha_fin"):
+        if filters.get(key):
+            params[key] = filters[key]
+    return params
+
+
+# --- Registro de resultados ---
+
+def _pct(values: List[float], p: float) -> Optional[float]:
+    return values[min(len(values) - 1, int(len(values) * p))] if values else None
+
+
+def summarize(latencies: List[float], errors: int, elapsed: float) -> Dict[str, Any]:
+    """Resumen de un escenario en segundos (`median_s` es lo que compara `benchmarks.compare`)."""
+    values = sorted(latencies)
+    result: Dict[str, Any] = {
+        "requests": len(values),
+        "errors": errors,
+        "throughput_rps": round(len(values) / elapsed, 2) if elapsed else None,
+    }
+    if values:
+        result.update({
+            "min_s": round(values[0], 6),
+            "median_s": round(_pct(values, 0.50), 6),
+            "p90_s": round(_pct(values, 0.90), 6),
+            "p95_s": round(_pct(values, 0.95), 6),
+            "p99_s": round(_pct(values, 0.99), 6),
+            "max_s": round(values[-1], 6),
+        })
+    return result
+
+
+class Recorder:
+    """Latencias por escenario y cubetas por segundo para la línea de tiempo."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.started_wall = time.time()
+        self.latencies: Dict[str, List[float]] = defaultdict(list)
+        self.errors: Dict[str, int] = defaultdict(int)
+        self.error_samples: Dict[str, str] = {}
+        self.seconds: Dict[int, Dict[str, Any]] = defaultdict(
+            lambda: {"requests": 0, "errors": 0, "ws_updates": 0, "latencies": []})
+        self.ws_connected = 0
+        self.ws_bytes = 0
+        self.elapsed = 0.0
+
+    def _bucket(self) -> Dict[str, Any]:
+        return self.seconds[int(time.perf_counter() - self.started)]
+
+    def ok(self, name: str, seconds: float):
+        self.latencies[name].append(seconds)
+        bucket = self._bucket()
+        if name == "ws.refresh":
+            bucket["ws_updates"] += 1
+        elif not name.startswith("ws."):
+            bucket["requests"] += 1
+            bucket["latencies"].append(seconds)
+
+    def error(self, name: str, detail: str):
+        self.errors[name] += 1
+        self.error_samples.setdefault(name, detail[:200])
+        self._bucket()["errors"] += 1
+
+    def timeline(self, server: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Segundo a segundo: tráfico del cliente + muestras del servidor."""
+        rows: Dict[int, Dict[str, Any]] = {}
+        for second, bucket in sorted(self.seconds.items()):
+            latencies = sorted(bucket["latencies"])
+            rows[second] = {
+                "t": second,
+                "requests": bucket["requests"],
+                "errors": bucket["errors"],
+                "ws_updates": bucket["ws_updates"],
+                "rest_p99_ms": round(_pct(latencies, 0.99) * 1000, 2) if latencies else None,
+            }
+        for sample in server:
+            second = int(sample["time"] - self.started_wall)
+            if second >= 0:
+                row = rows.setdefault(second, {"t": second})
+                row.update({k: v for k, v in sample.items() if k != "time"})
+        return [rows[second] for second in sorted(rows)]
+
+
+# --- Clientes ---
+
+def _frame_type(frame: Any) -> str:
+    """Tipo del mensaje sin parsear el cuerpo (`type` es la primera clave que envía el servidor)."""
+    head = frame[:48] if isinstance(frame, str) else frame[:48].decode("utf-8", "ignore")
+    head = head.replace(" ", "")
+    start = head.find('"type":"')
+    if start < 0:
+        return ""
+    start += len('"type":"')
+    return head[start:head.find('"', start)]
+
+
+async def ws_client(url: str, recorder: Recorder, rng: random.Random, interval: float, stop: asyncio.Event):
+    """Un dashboard conectado: espera el `initial` y pide `refresh` cada ~`interval` s."""
+    import websockets
+
+    start = time.perf_counter()
+    connected = False
+    try:
+        async with websockets.connect(url, max_size=None, open_timeout=WS_REPLY_TIMEOUT_S,
+                                      ping_interval=None, close_timeout=1) as ws:
+            while _frame_type(await asyncio.wait_for(ws.recv(), WS_REPLY_TIMEOUT_S)) != "initial":
+                pass
+            recorder.ok("ws.connect", time.perf_counter() - start)
+            connected = True
+            recorder.ws_connected += 1
+            try:
+                while not stop.is_set():
+                    try:
+                        await asyncio.wait_for(stop.wait(), interval * rng.uniform(0.5, 1.5))
+                        break
+                    except asyncio.TimeoutError:
+                        pass
+                    sent = time.perf_counter()
+                    await ws.send(json.dumps({"action": "refresh", "filters": pick_filters(rng)}))
+                    deadline = sent + WS_REPLY_TIMEOUT_S
+                    while True:
+                        frame = await asyncio.wait_for(ws.recv(), max(deadline - time.perf_counter(), 0.001))
+                        recorder.ws_bytes += len(frame)
+                        if _frame_type(frame) == "update":
+                            recorder.ok("ws.refresh", time.perf_counter() - sent)
+                            break
+            finally:
+                recorder.ws_connected -= 1
+    except asyncio.CancelledError:
+        raise
+    except Exception as e:
+        if not stop.is_set():
+            recorder.error("ws.refresh" if connected else "ws.connect", f"{type(e).__name__}: {e}")
+
+
+async def _dashboard(client, base: str, rng: random.Random, recorder: Recorder):
+    """`POST /dashboard` en streaming: tiempo hasta la primera sección y total."""
+    start = time.perf_counter()
+    first = None
+    async with client.stream("POST", f"{base}/api/dashboard?points_limit=20000", json=pick_filters(rng)) as response:
+        if response.status_code != 200:
+            await response.aread()
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:120]}")
+        async for line in response.aiter_lines():
+            if not line:
+                continue
+            if first is None:
+                first = time.perf_counter() - start
+            if line.startswith('{"section":"error"'):
+                raise RuntimeError(line[:160])
+    if first is not None:
+        recorder.ok("rest.dashboard.first_section", first)
+    return time.perf_counter() - start
+
+
+def _get(path: str, extra: Callable[[random.Random], Dict[str, Any]] = lambda rng: {}, filtered: bool = True):
+    async def request(client, base: str, rng: random.Random, recorder: Recorder):
+        params = {**extra(rng), **(query_params(pick_filters(rng)) if filtered else {})}
+        url = f"{base}{path}" + (f"?{urlencode(params)}" if params else "")
+        start = time.perf_counter()
+        response = await client.get(url)
+        if response.status_code >= 400:
+            raise RuntimeError(f"HTTP {response.status_code}: {response.text[:120]}")
+        return time.perf_counter() - start
+    return request
+
+
+async def _aggregate(client, base: str, rng: random.Random, recorder: Recorder):
+    start = time.perf_counter()
+    response = await client.post(f"{base}/api/analytics/aggregate", json=pick_filters(rng))
+    if response.status_code >= 400:
+        raise RuntimeError(f"HTTP {response.status_code}: {response.text[:120]}")
+    return time.perf_counter() - start
+
+
+def _viewport(rng: random.Random) -> Dict[str, Any]:
+    bbox, zoom = rng.choice(VIEWPORTS)
+    return {"bbox": ",".join(str(v) for v in bbox), "zoom": zoom}
+
+
+def _heatmap_viewport(rng: random.Random) -> Dict[str, Any]:
+    bbox, _ = rng.choice(VIEWPORTS)
+    return {"bbox": ",".join(str(v) for v in bbox), "metric": rng.choice(["density", "signal"])}
+
+
+# Escenarios REST: nombre -> petición. Cada uno devuelve su latencia en segundos
+SCENARIOS: Dict[str, Callable] = {
+    "dashboard": _dashboard,
+    "aggregate": _aggregate,
+    "points": _get("/api/map/points", _viewport),
+    "heatmap": _get("/api/map/heatmap", _heatmap_viewport),
+    "signals": _get("/api/signals", lambda rng: {"limit": 1000}),
+    "timeseries": _get("/api/analytics/timeseries", lambda rng: {"interval": rng.choice(["hour", "day"])}),
+    "options": _get("/api/filters/options", filtered=False),
+}
+DEFAULT_MIX = "dashboard=2,aggregate=1,points=4,heatmap=2,signals=2,timeseries=1,options=1"
+
+
+def parse_mix(value: str) -> Dict[str, float]:
+    """'points=4,signals=2' -> pesos por escenario."""
+    mix: Dict[str, float] = {}
+    for item in filter(None, (part.strip() for part in value.split(","))):
+        name, _, weight = item.partition("=")
+        if name not in SCENARIOS:
+            raise ValueError(f"Unknown scenario: {name} (known: {', '.join(SCENARIOS)})")
+        mix[name] = float(weight or 1)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+async def rest_worker(client, base: str, recorder: Recorder, rng: random.Random,
+                      mix: Dict[str, float], think: float, stop: asyncio.Event):
+    """Un usuario del dashboard: petición, pausa de `think` s (exponencial), repetir."""
+    names, weights = list(mix), list(mix.values())
+    while not stop.is_set():
+        name = rng.choices(names, weights)[0]
+        try:
+            recorder.ok(f"rest.{name}", await SCENARIOS[name](client, base, rng, recorder))
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            recorder.error(f"rest.{name}", f"{type(e).__name__}: {e}")
+        if think:
+            try:
+                await asyncio.wait_for(stop.wait(), rng.expovariate(1 / think))
+            except asyncio.TimeoutError:
+                pass
+
+
+async def run_load(args, base: str, mix: Dict[str, float]) -> Recorder:
+    import httpx
+
+    recorder = Recorder()
+    stop = asyncio.Event()
+    ws_url = base.replace("http", "ws", 1) + "/api/ws/signals"
+    rng = random.Random(args.seed)
+    tasks: List[asyncio.Task] = []
+
+    limits = httpx.Limits(max_connections=max(args.rest_concurrency, 1), max_keepalive_connections=args.rest_concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=httpx.Timeout(WS_REPLY_TIMEOUT_S * 2)) as client:
+        for _ in range(args.rest_concurrency if mix else 0):
+            tasks.append(asyncio.create_task(rest_worker(
+                client, base, recorder, random.Random(rng.random()), mix, args.think_time, stop)))
+
+        # Rampa de conexiones WebSocket repartida en `ramp` segundos
+        ramp_step = args.ramp / args.ws_clients if args.ws_clients else 0
+        for _ in range(args.ws_clients):
+            tasks.append(asyncio.create_task(ws_client(
+                ws_url, recorder, random.Random(rng.random()), args.refresh_interval, stop)))
+            if ramp_step:
+                await asyncio.sleep(ramp_step)
+
+        remaining = args.duration - (time.perf_counter() - recorder.started)
+        while remaining > 0:
+            await asyncio.sleep(min(remaining, 5))
+            elapsed = time.perf_counter() - recorder.started
+            requests = sum(len(v) for k, v in recorder.latencies.items() if k.startswith("rest."))
+            print(f"  {elapsed:6.1f}s  ws={recorder.ws_connected:<6} rest={requests:<8} "
+                  f"errors={sum(recorder.errors.values())}", file=sys.stderr)
+            remaining = args.duration - elapsed
+
+        recorder.elapsed = time.perf_counter() - recorder.started
+        stop.set()
+        done, pending = await asyncio.wait(tasks, timeout=10)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+    return recorder
+
+
+# --- Servidor (proceso aparte) ---
+
+def _rss_mb() -> Optional[float]:
+    """Memoria residente del proceso en MiB (Linux: /proc; si no, el pico de getrusage)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return round(int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2 ** 20, 1)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return round(peak / (2 ** 20 if sys.platform == "darwin" else 2 ** 10), 1)
+    except ImportError:
+        return None
+
+
+async def _probe(path: str, interval: float):
+    """
+    Lag del event loop: lo que tarda de más un `sleep` corto. Cada `interval`
+    segundos escribe una línea JSON con p50/p99/máx del lag, la RSS y el
+    estado de las colas WebSocket.
+    """
+    from app.api.websocket import manager
+
+    loop = asyncio.get_running_loop()
+    lags: List[float] = []
+    flush_at = loop.time() + interval
+    with open(path, "a", buffering=1) as out:
+        while True:
+            start = loop.time()
+            await asyncio.sleep(PROBE_INTERVAL_S)
+            now = loop.time()
+            lags.append(max(now - start - PROBE_INTERVAL_S, 0.0))
+            if now >= flush_at:
+                lags.sort()
+                stats = manager.stats()
+                out.write(json.dumps({
+                    "time": time.time(),
+                    "loop_lag_p50_ms": round(_pct(lags, 0.50) * 1000, 3),
+                    "loop_lag_p99_ms": round(_pct(lags, 0.99) * 1000, 3),
+                    "loop_lag_max_ms": round(lags[-1] * 1000, 3),
+                    "rss_mb": _rss_mb(),
+                    "ws_clients": len(manager.channels),
+                    "ws_queue_max": stats["queue_depth_max"],
+                    "ws_dropped": stats["dropped"],
+                }) + "\n")
+                lags = []
+                flush_at = now + interval
+
+
+def serve(args):
+    """Proceso servidor: la app real con `StandInSource` y el sondeo de lag."""
+    scratch = tempfile.mkdtemp(prefix="load-test-")
+    os.environ["DATA_SOURCE"] = "sqlite"
+    os.environ["SQLITE_PATH"] = ":memory:"
+    for name in ("POINT_STORE_DIR", "COVERAGE_DIR", "EXPORT_DIR"):
+        os.environ[name] = os.path.join(scratch, name.lower())
+
+    import logging
+    import uvicorn
+    from benchmarks.generator import iter_rows
+    from benchmarks.standin import StandInSource
+    from main import app
+    from app.services.supabase_service import supabase_service
+    from app.services.point_index import point_index
+
+    source = StandInSource(args.source_latency_ms / 1000)
+    for chunk in iter_rows(args.rows, args.seed):
+        source.insert_rows(chunk)
+    supabase_service.source = source
+    point_index.invalidate()
+    logging.getLogger().setLevel(logging.WARNING)
+
+    server = uvicorn.Server(uvicorn.Config(
+        app, host="127.0.0.1", port=args.port, log_level="warning", access_log=False,
+        backlog=max(2048, args.ws_clients), ws_max_size=1 << 24,
+    ))
+
+    async def main():
+        probe = asyncio.create_task(_probe(args.timeline, args.sample_interval))
+        try:
+            await server.serve()
+        finally:
+            probe.cancel()
+
+    asyncio.run(main())
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_ready(base: str, timeout: float, process: Optional[subprocess.Popen]):
+    import httpx
+
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if httpx.get(f"{base}/api/health", timeout=5).status_code == 200:
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.5)
+    raise RuntimeError(f"Server at {base} not ready after {timeout:.0f}s")
+
+
+def raise_fd_limit():
+    """Miles de sockets: sube el límite de descriptores al máximo permitido."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY:
+            hard = max(soft, 65536)
+        resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError):
+        pass
+
+
+def _read_timeline(path: str) -> List[Dict[str, Any]]:
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def report(args, recorder: Recorder, server: List[Dict[str, Any]], mix: Dict[str, float]) -> Dict[str, Any]:
+    from benchmarks.run import metadata
+
+    elapsed = recorder.elapsed
+    scenarios = {
+        f"load.{name}": summarize(recorder.latencies.get(name, []), recorder.errors.get(name, 0), elapsed)
+        for name in sorted(set(recorder.latencies) | set(recorder.errors))
+    }
+    if server:
+        lags = sorted(sample["loop_lag_p99_ms"] / 1000 for sample in server)
+        scenarios["load.server.loop_lag_p99"] = summarize(lags, 0, 0)
+    rss = [sample["rss_mb"] for sample in server if sample.get("rss_mb") is not None]
+    return {
+        "meta": {
+            **metadata(args.seed),
+            "kind": "load",
+            "target": args.target or "standin",
+            "rows": args.rows,
+            "ws_clients": args.ws_clients,
+            "refresh_interval_s": args.refresh_interval,
+            "rest_concurrency": args.rest_concurrency,
+            "think_time_s": args.think_time,
+            "mix": mix,
+            "filter_mix": {name: weight for weight, name, _ in FILTER_MIX},
+            "duration_s": round(elapsed, 3),
+            "source_latency_ms": args.source_latency_ms,
+        },
+        "results": {str(args.rows): scenarios},
+        "server": {
+            "rss_start_mb": rss[0] if rss else None,
+            "rss_peak_mb": max(rss) if rss else None,
+            "rss_end_mb": rss[-1] if rss else None,
+            "loop_lag_max_ms": max((s["loop_lag_max_ms"] for s in server), default=None),
+            "ws_clients_peak": max((s["ws_clients"] for s in server), default=None),
+        },
+        "ws": {"bytes_received": recorder.ws_bytes},
+        "errors": dict(recorder.error_samples),
+        "timeline": recorder.timeline(server),
+    }
+
+
+def print_report(results: Dict[str, Any]):
+    print(f"{'scenario':<40} {'reqs':>8} {'err':>6} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for size, scenarios in results["results"].items():
+        for name, stats in scenarios.items():
+            cells = [f"{stats[k] * 1000:>9.1f}" if stats.get(k) is not None else f"{'-':>9}"
+                     for k in ("median_s", "p95_s", "p99_s", "max_s")]
+            rps = f"{stats['throughput_rps']:>8.1f}" if stats.get("throughput_rps") is not None else f"{'-':>8}"
+            print(f"{name:<40} {stats['requests']:>8} {stats['errors']:>6} {rps} {' '.join(cells)}")
+    server = results["server"]
+    if server["rss_peak_mb"] is not None:
+        print(f"\nserver: rss {server['rss_start_mb']} -> peak {server['rss_peak_mb']} MiB, "
+              f"loop lag max {server['loop_lag_max_ms']} ms, ws peak {server['ws_clients_peak']}")
+    for name, detail in results["errors"].items():
+        print(f"⚠️  {name}: {detail}")
+
+
+def main():
+    from benchmarks.generator import parse_size
+
+    parser = argparse.ArgumentParser(description="Prueba de carga WebSocket + REST contra la API real")
+    parser.add_argument("--rows", type=parse_size, default=parse_size("20k"), help="Filas del dataset sintético")
+    parser.add_argument("--ws-clients", type=int, default=1000)
+    parser.add_argument("--refresh-interval", type=float, default=5.0, help="Segundos entre refresh por cliente WS")
+    parser.add_argument("--rest-concurrency", type=int, default=16, help="Usuarios REST simultáneos")
+    parser.add_argument("--think-time", type=float, default=0.5, help="Pausa media entre peticiones REST (s)")
+    parser.add_argument("--mix", default=DEFAULT_MIX, help=f"Pesos REST ({', '.join(SCENARIOS)})")
+    parser.add_argument("--duration", type=float, default=60, help="Segundos de carga (incluye la rampa)")
+    parser.add_argument("--ramp", type=float, default=10, help="Segundos para conectar todos los clientes WS")
+    parser.add_argument("--sample-interval", type=float, default=1.0, help="Segundos entre muestras del servidor")
+    parser.add_argument("--source-latency-ms", type=float, default=20, help="Latencia simulada por consulta")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--target", help="URL de una API ya arrancada (sin sustituto ni muestras del servidor)")
+    parser.add_argument("--output", help="Archivo JSON (por defecto results/load-<commit>.json)")
+    parser.add_argument("--serve", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--port", type=int, default=0, help=argparse.SUPPRESS)
+    parser.add_argument("--timeline", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    raise_fd_limit()
+    if args.serve:
+        serve(args)
+        return
+
+    try:
+        mix = parse_mix(args.mix)
+    except ValueError as e:
+        parser.error(str(e))
+
+    process = None
+    timeline = os.path.join(tempfile.mkdtemp(prefix="load-test-"), "server.jsonl")
+    if args.target:
+        base = args.target.rstrip("/")
+    else:
+        port = _free_port()
+        base = f"http://127.0.0.1:{port}"
+        process = subprocess.Popen([
+            sys.executable, "-m", "benchmarks.load_test", "--serve", "--port", str(port),
+            "--rows", str(args.rows), "--seed", str(args.seed), "--ws-clients", str(args.ws_clients),
+            "--source-latency-ms", str(args.source_latency_ms),
+            "--sample-interval", str(args.sample_interval), "--timeline", timeline,
+        ], cwd=os.path.dirname(BENCH_DIR))
+
+    try:
+        print(f"⏳ Waiting for {base}", file=sys.stderr)
+        _wait_ready(base, 300, process)
+        print(f"🚀 {args.ws_clients} WebSocket clients + {args.rest_concurrency} REST users for "
+              f"{args.duration:.0f}s", file=sys.stderr)
+        recorder = asyncio.run(run_load(args, base, mix))
+    finally:
+        if process is not None:
+            process.terminate()
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    results = report(args, recorder, _read_timeline(timeline), mix)
+    print_report(results)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        suffix = "-dirty" if results["meta"]["dirty"] else ""
+        output = os.path.join(RESULTS_DIR, f"load-{results['meta']['commit']}{suffix}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
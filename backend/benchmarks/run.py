@@ -0,0 +1,267 @@
+"""
+Suite de benchmarks por escenario.
+
+Carga un dataset sintético en el sustituto SQLite (sin red), mide cada
+método de `SparkETLService` y cada endpoint de la API, y guarda los
+resultados en JSON etiquetados con el commit actual.
+
+Uso:
+    python -m benchmarks.run --sizes 10k,100k --groups source,spark,api
+    python -m benchmarks.compare results/abc1234.json results/def5678.json
+"""
+from typing import Any, Callable, Dict, List
+from datetime import datetime, timezone
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+DATA_DIR = os.path.join(BENCH_DIR, ".data")
+RESULTS_DIR = os.path.join(BENCH_DIR, "results")
+
+# La fuente de datos se sustituye antes de importar la app
+os.environ["DATA_SOURCE"] = "sqlite"
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("POINT_STORE_DIR", os.path.join(DATA_DIR, "point-store"))
+
+from benchmarks.generator import parse_size, write_sqlite  # noqa: E402
+from app.services.sqlite_source import SQLiteSource  # noqa: E402
+from app.services.filters import SignalFilter, compile_filter  # noqa: E402
+
+
+def _git(*args: str) -> str:
+    try:
+        return subprocess.check_output(["git", *args], cwd=BENCH_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return ""
+
+
+def metadata(seed: int) -> Dict[str, Any]:
+    return {
+        "commit": _git("rev-parse", "--short", "HEAD") or "unknown",
+        "dirty": bool(_git("status", "--porcelain", "--untracked-files=no")),
+        "timestamp": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "seed": seed,
+    }
+
+
+def measure(fn: Callable[[], Any], repeats: int, warmup: int = 1, rows: int = None) -> Dict[str, Any]:
+    """Ejecuta `fn` varias veces y resume los tiempos en segundos."""
+    for _ in range(warmup):
+        fn()
+    times: List[float] = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    result = {
+        "repeats": repeats,
+        "min_s": round(times[0], 6),
+        "median_s": round(statistics.median(times), 6),
+        "p95_s": round(times[min(len(times) - 1, int(len(times) * 0.95))], 6),
+        "max_s": round(times[-1], 6),
+    }
+    if rows:
+        result["rows"] = rows
+        result["rows_per_s"] = int(rows / result["median_s"]) if result["median_s"] else None
+    return result
+
+
+def prepare_dataset(size: int, seed: int) -> str:
+    """Genera (una sola vez) el archivo SQLite del tamaño pedido."""
+    os.makedirs(DATA_DIR, exist_ok=True)
+    path = os.path.join(DATA_DIR, f"signals_{size}_{seed}.sqlite")
+    if not os.path.exists(path):
+        print(f"⏳ Generating {size} rows -> {path}", file=sys.stderr)
+        tmp = path + ".tmp"
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        write_sqlite(tmp, size, seed)
+        os.replace(tmp, path)
+    return path
+
+
+def bench_source(source: SQLiteSource, size: int, repeats: int) -> Dict[str, Any]:
+    """Lectura desde la fuente de datos (filas dict vs. columnas)."""
+    filters = compile_filter(SignalFilter(sim_operators=["TIGO"], network_types=["4G"])).pushed
+    return {
+        "source.fetch_signals": measure(lambda: source.fetch_signals(size), repeats, rows=size),
+        "source.fetch_columns": measure(lambda: source.fetch_columns(None, size), repeats, rows=size),
+        "source.fetch_batch": measure(lambda: source.fetch_batch(None, size), repeats, rows=size),
+        "source.fetch_filtered": measure(lambda: source.fetch_filtered(filters), repeats),
+        "source.count": measure(source.count, repeats),
+        "source.unique_values": measure(lambda: source.unique_values("device_name"), repeats),
+    }
+
+
+def bench_spark(source: SQLiteSource, size: int, repeats: int) -> Dict[str, Any]:
+    """Cada método de SparkETLService sobre el mismo DataFrame."""
+    from app.etl.spark_pipeline import spark_etl_service as etl
+
+    rows = source.fetch_signals(size)
+    batch = source.fetch_batch(None, size)
+    df = etl.create_dataframe(rows)
+    # Sin pushdown: todo el filtro se evalúa en Spark
+    filters = compile_filter(SignalFilter(sim_operators=["ENTEL", "VIVA"], network_types=["4G"]),
+                             pushdown=frozenset()).residual
+
+    scenarios = {
+        "create_dataframe": (lambda: etl.create_dataframe(rows), size),
+        "create_dataframe_batch": (lambda: etl.create_dataframe(batch), size),
+        "filter_dataframe": (lambda: etl.filter_dataframe(df, filters).count(), size),
+        "calculate_statistics": (lambda: etl.calculate_statistics(df), size),
+        "aggregate_by_company": (lambda: etl.aggregate_by_company(df), size),
+        "aggregate_by_signal_type": (lambda: etl.aggregate_by_signal_type(df), size),
+        "aggregate_by_geography": (lambda: etl.aggregate_by_geography(df), size),
+        "time_series_aggregation": (lambda: etl.time_series_aggregation(df, "hour"), size),
+        "get_geographic_points": (lambda: etl.get_geographic_points(df, 60000), size),
+        "get_geographic_points_first": (lambda: etl.get_geographic_points(df, 60000, sampling="first"), size),
+        "analyze_speed_by_operator": (lambda: etl.analyze_speed_by_operator(df), size),
+        "analyze_signal_by_district": (lambda: etl.analyze_signal_by_district(df), size),
+        "analyze_coverage_by_operator": (lambda: etl.analyze_coverage_by_operator(df), size),
+        "analyze_by_district": (lambda: etl.analyze_by_district(df), size),
+    }
+    return {f"spark.{name}": measure(fn, repeats, rows=n) for name, (fn, n) in scenarios.items()}
+
+
+def bench_api(size: int, repeats: int) -> Dict[str, Any]:
+    """Cada endpoint REST con TestClient (sin servidor ni red)."""
+    from fastapi.testclient import TestClient
+    from main import app
+    from app.api import routes
+    from app.services.point_index import point_index
+    from app.services.supabase_service import supabase_service
+    from app.services.pagination import encode_cursor
+    from benchmarks.generator import generate_rows
+
+    client = TestClient(app)
+    ingest_payload = {"reports": generate_rows(1000, seed=7)}
+
+    def call(method: str, url: str, body: Any = None, cold: bool = True):
+        def run():
+            if cold:
+                routes._cache.clear()
+                routes._points_cache.clear()
+                routes._heatmap_cache.clear()
+            response = client.request(method, url, json=body)
+            response.raise_for_status()
+        return run
+
+    def revalidate(url: str):
+        """Petición repetida con la ETag de la anterior (debe responder 304)."""
+        etag = client.get(url).headers["etag"]
+
+        def run():
+            response = client.get(url, headers={"If-None-Match": etag})
+            assert response.status_code == 304, response.status_code
+        return run
+
+    def rebuild_index(fn, rebuild: bool = True):
+        def run():
+            point_index.invalidate(rebuild)
+            fn()
+        return run
+
+    def last_page_cursor(rows: int) -> str:
+        """Cursor de la última página de `rows` filas (la más cara por offset)."""
+        _, last = supabase_service.get_signal_page(SignalFilter(), max(size - rows, 1))
+        return encode_cursor(last, SignalFilter().to_key())
+
+    # Con el lifespan de la app: arranca la tarea que escribe la ingesta (si no, /ingest solo llena el buffer)
+    with client:
+        scenarios = {
+            "GET /health": call("GET", "/api/health"),
+            "GET /signals": call("GET", f"/api/signals?limit={min(size, 300000)}"),
+            "GET /signals?empresa": call("GET", "/api/signals?empresa=TIGO"),
+            "GET /signals?provincia": call("GET", "/api/signals?provincia=Andres+Iba%C3%B1ez"),
+            "GET /signals last page (offset)": call("GET", f"/api/signals?limit=1000&offset={max(size - 1000, 1)}"),
+            "GET /signals last page (cursor)": call("GET", f"/api/signals?limit=1000&cursor={last_page_cursor(1000)}"),
+            "POST /analytics/aggregate (cold)": call("POST", "/api/analytics/aggregate", {}),
+            "POST /analytics/aggregate (cached)": call("POST", "/api/analytics/aggregate", {}, cold=False),
+            "POST /analytics/aggregate (filtered)": call("POST", "/api/analytics/aggregate",
+                                                         {"sim_operators": ["TIGO"], "network_types": ["4G"]}),
+            "GET /map/points": call("GET", "/api/map/points"),
+            "GET /map/points (index build)": rebuild_index(call("GET", "/api/map/points")),
+            "GET /map/points (warm start)": rebuild_index(call("GET", "/api/map/points"), rebuild=False),
+            "GET /map/points?bbox&zoom=15": call("GET", "/api/map/points?bbox=-63.19,-17.80,-63.15,-17.77&zoom=15"),
+            "GET /map/points?bbox&zoom=12": call("GET", "/api/map/points?bbox=-63.30,-17.90,-63.05,-17.70&zoom=12"),
+            "GET /map/points?bbox&zoom=12 (cached)": call("GET", "/api/map/points?bbox=-63.30,-17.90,-63.05,-17.70&zoom=12",
+                                                          cold=False),
+            "GET /map/points (304)": revalidate("/api/map/points?bbox=-63.30,-17.90,-63.05,-17.70&zoom=12"),
+            "GET /map/heatmap 256x256": call("GET", "/api/map/heatmap?bbox=-63.40,-18.00,-62.90,-17.50"),
+            "GET /map/heatmap 256x256 (signal)": call("GET", "/api/map/heatmap?bbox=-63.40,-18.00,-62.90,-17.50"
+                                                            "&metric=signal"),
+            "GET /map/heatmap tile z12": call("GET", "/api/map/heatmap/12/1329/2253.png"),
+            "GET /analytics/timeseries": call("GET", "/api/analytics/timeseries?interval=hour"),
+            "GET /filters/options": call("GET", "/api/filters/options"),
+            "POST /ingest (1k reports)": call("POST", "/api/ingest", ingest_payload),
+        }
+        return {f"api.{name}": measure(fn, repeats) for name, fn in scenarios.items()}
+
+
+GROUPS = ("source", "spark", "api")
+
+
+def run(sizes: List[int], groups: List[str], repeats: int, seed: int) -> Dict[str, Any]:
+    from app.services.supabase_service import supabase_service
+    from app.services.point_index import point_index
+
+    results: Dict[str, Any] = {"meta": metadata(seed), "results": {}}
+    for size in sizes:
+        path = prepare_dataset(size, seed)
+        source = SQLiteSource(path)
+        supabase_service.source = source  # stub de la fuente para rutas y WebSocket
+        point_index.invalidate()
+        size_results: Dict[str, Any] = {}
+        try:
+            if "source" in groups:
+                size_results.update(bench_source(source, size, repeats))
+            if "spark" in groups:
+                size_results.update(bench_spark(source, size, repeats))
+            if "api" in groups:
+                size_results.update(bench_api(size, repeats))
+        finally:
+            source.close()
+        results["results"][str(size)] = size_results
+        print(f"✓ size={size}: {len(size_results)} scenarios", file=sys.stderr)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmarks por escenario")
+    parser.add_argument("--sizes", default="10k", help="Lista separada por comas: 10k,100k,1m,10m")
+    parser.add_argument("--groups", default=",".join(GROUPS), help="source,spark,api")
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="Archivo JSON (por defecto results/<commit>.json)")
+    args = parser.parse_args()
+
+    groups = [g.strip() for g in args.groups.split(",") if g.strip()]
+    unknown = set(groups) - set(GROUPS)
+    if unknown:
+        parser.error(f"Unknown groups: {', '.join(sorted(unknown))}")
+
+    sizes = [parse_size(s) for s in args.sizes.split(",")]
+    results = run(sizes, groups, args.repeats, args.seed)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        suffix = "-dirty" if results["meta"]["dirty"] else ""
+        output = os.path.join(RESULTS_DIR, f"{results['meta']['commit']}{suffix}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2)
+    print(f"✅ Results written to {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,83 @@
+"""
+Benchmark de normalización: lista de dicts (`{**row, ...}` por fila) vs.
+`SignalBatch` columnar. Mide tiempo y memoria retenida (tracemalloc).
+
+Uso:
+    python -m benchmarks.signal_batch --rows 100000
+"""
+from typing import Any, Dict, List
+import argparse
+import json
+import time
+import tracemalloc
+
+import orjson
+
+from app.models.signal_batch import SignalBatch
+from benchmarks.generator import generate_rows
+
+
+def normalize_rows(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Normalización por fila previa a SignalBatch (referencia)."""
+    return [
+        {
+            **row,
+            'speed': float(row.get('speed', 0.0) or 0.0),
+            'altitude': float(row.get('altitude', 0.0) or 0.0),
+            'latitude': float(row['latitude']),
+            'longitude': float(row['longitude']),
+            'battery': int(row.get('battery', 0) or 0),
+            'signal': int(row.get('signal', 0) or 0),
+            'sim_operator': str(row.get('sim_operator') or 'Unknown'),
+            'network_type': str(row.get('network_type') or 'Unknown'),
+            'device_name': str(row.get('device_name') or 'Unknown'),
+        }
+        for row in data
+        if row.get('latitude') and row.get('longitude')
+    ]
+
+
+def _measure(fn, payload: bytes):
+    """(segundos, bytes retenidos por el resultado) partiendo del JSON crudo."""
+    data = orjson.loads(payload)
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    result = fn(data)
+    elapsed = time.perf_counter() - start
+    del data  # Solo cuenta lo que retiene el resultado
+    retained = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    return elapsed, retained, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normalización por filas vs. SignalBatch")
+    parser.add_argument("--rows", type=int, default=100000)
+    args = parser.parse_args()
+
+    # Mismo camino que PostgREST: bytes JSON -> dicts crudos -> normalización
+    source = generate_rows(args.rows, seed=3)
+    for row in source:
+        row.pop("device_id")
+    payload = orjson.dumps(source)
+    del source
+
+    rows_s, rows_mem, rows = _measure(normalize_rows, payload)
+    batch_s, batch_mem, batch = _measure(SignalBatch.from_rows, payload)
+    columns = list(rows[0]) if rows else []
+    assert batch.to_rows() == [{c: row[c] for c in columns} for row in rows]
+
+    print(json.dumps({
+        "rows": args.rows,
+        "list_of_dicts_ms": round(rows_s * 1000, 1),
+        "signal_batch_ms": round(batch_s * 1000, 1),
+        "list_of_dicts_mb": round(rows_mem / 1e6, 1),
+        "signal_batch_mb": round(batch_mem / 1e6, 1),
+        "signal_batch_nbytes_mb": round(batch.nbytes() / 1e6, 1),
+        "memory_ratio": round(rows_mem / batch_mem, 1) if batch_mem else None,
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
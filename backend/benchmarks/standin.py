@@ -0,0 +1,28 @@
+"""
+Sustituto en memoria de la fuente de datos para pruebas de carga.
+
+Se importa después de fijar el entorno (`DATA_SOURCE`, directorios de
+datos), porque importa la app.
+"""
+from typing import Any, Iterable, List, Tuple
+from app.services.sqlite_source import SQLiteSource
+import time
+
+
+class StandInSource(SQLiteSource):
+    """
+    Fuente de `SupabaseService` en memoria: SQLite en memoria (el mismo SQL
+    que PostgreSQL) más `latency` segundos por consulta que simulan la red.
+    La espera bloquea el hilo, como el cliente síncrono de Supabase.
+    """
+
+    name = "standin"
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(":memory:")
+        self.latency = latency
+
+    def _stream(self, sql: str, params: List[Any]) -> Iterable[Tuple[Any, ...]]:
+        if self.latency:
+            time.sleep(self.latency)
+        return super()._stream(sql, params)
@@ -0,0 +1,163 @@
+"""
+Benchmark de fan-out WebSocket con clientes simulados.
+
+Compara el broadcast secuencial anterior (send_json cliente por cliente)
+con las colas por cliente de ConnectionManager. Una fracción de los clientes
+es lenta para medir cuánto afecta al resto.
+
+Uso:
+    python -m benchmarks.ws_fanout --clients 1000 --messages 50
+"""
+from typing import Dict, List
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+
+from app.api.connections import ConnectionManager, supported_encodings
+
+
+class SimulatedSocket:
+    """WebSocket falso: cada envío tarda `delay` segundos y registra la latencia."""
+
+    def __init__(self, delay: float):
+        self.delay = delay
+        self.latencies: List[float] = []
+        self.sent_at: float = 0.0
+
+    async def accept(self):
+        pass
+
+    async def close(self, code: int = 1000):
+        pass
+
+    async def _send(self, frame):
+        if self.delay:
+            await asyncio.sleep(self.delay)
+        else:
+            await asyncio.sleep(0)
+        self.latencies.append(time.perf_counter() - self.sent_at)
+
+    async def send_text(self, frame: str):
+        await self._send(frame)
+
+    async def send_bytes(self, frame: bytes):
+        await self._send(frame)
+
+    async def send_json(self, message: dict):
+        await self._send(json.dumps(message))
+
+
+def _payload(rows: int) -> dict:
+    rng = random.Random(7)
+    return {
+        "type": "new_signal",
+        "data": [
+            {
+                "latitude": -17.78 + rng.random() / 10,
+                "longitude": -63.18 + rng.random() / 10,
+                "signal": rng.randint(-110, -50),
+                "sim_operator": rng.choice(["ENTEL", "TIGO", "VIVA"]),
+                "network_type": rng.choice(["WiFi", "4G", "3G"]),
+            }
+            for _ in range(rows)
+        ],
+    }
+
+
+def _make_clients(count: int, slow_ratio: float, slow_delay: float) -> List[SimulatedSocket]:
+    slow = int(count * slow_ratio)
+    return [SimulatedSocket(slow_delay if i < slow else 0.0) for i in range(count)]
+
+
+def _summary(clients: List[SimulatedSocket], elapsed: float) -> Dict[str, float]:
+    fast = [lat for c in clients if not c.delay for lat in c.latencies]
+    every = [lat for c in clients for lat in c.latencies]
+    fast.sort()
+    every.sort()
+
+    def pct(values, p):
+        return round(values[min(len(values) - 1, int(len(values) * p))] * 1000, 3) if values else None
+
+    return {
+        "elapsed_s": round(elapsed, 3),
+        "deliveries": len(every),
+        "fast_p50_ms": pct(fast, 0.50),
+        "fast_p99_ms": pct(fast, 0.99),
+        "all_p99_ms": pct(every, 0.99),
+        "all_mean_ms": round(statistics.mean(every) * 1000, 3) if every else None,
+    }
+
+
+async def run_legacy(clients: List[SimulatedSocket], message: dict, messages: int, interval: float):
+    """Broadcast anterior: await secuencial y json por cliente."""
+    start = time.perf_counter()
+    for _ in range(messages):
+        now = time.perf_counter()
+        for c in clients:
+            c.sent_at = now
+            await c.send_json(message)
+        await asyncio.sleep(interval)
+    return time.perf_counter() - start
+
+
+async def run_queued(clients: List[SimulatedSocket], message: dict, messages: int,
+                     interval: float, encoding: str, coalesce: bool):
+    """Broadcast con colas por cliente."""
+    manager = ConnectionManager(max_pending=64)
+    for c in clients:
+        await manager.connect(c, encoding=encoding)
+
+    start = time.perf_counter()
+    for _ in range(messages):
+        now = time.perf_counter()
+        for c in clients:
+            c.sent_at = now
+        await manager.broadcast(message, key="snapshot" if coalesce else None)
+        await asyncio.sleep(interval)
+
+    # Esperar a que se vacíen las colas
+    while any(ch.pending or ch.sending for ch in manager.channels.values()):
+        await asyncio.sleep(0.001)
+    elapsed = time.perf_counter() - start
+    stats = manager.stats()
+    for c in clients:
+        manager.disconnect(c)
+    return elapsed, stats
+
+
+async def main_async(args) -> Dict[str, dict]:
+    message = _payload(args.rows)
+    results = {}
+
+    clients = _make_clients(args.clients, args.slow_ratio, args.slow_delay)
+    results["legacy_sequential"] = _summary(clients, await run_legacy(clients, message, args.messages, args.interval))
+
+    for encoding in supported_encodings():
+        for coalesce in (False, True):
+            clients = _make_clients(args.clients, args.slow_ratio, args.slow_delay)
+            elapsed, stats = await run_queued(clients, message, args.messages, args.interval, encoding, coalesce)
+            name = f"queued_{encoding}" + ("_coalesced" if coalesce else "")
+            results[name] = {**_summary(clients, elapsed), "coalesced": stats["coalesced"], "dropped": stats["dropped"]}
+
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fan-out WebSocket con clientes simulados")
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--messages", type=int, default=20)
+    parser.add_argument("--rows", type=int, default=50, help="Filas por mensaje")
+    parser.add_argument("--interval", type=float, default=0.01, help="Segundos entre broadcasts")
+    parser.add_argument("--slow-ratio", type=float, default=0.01)
+    parser.add_argument("--slow-delay", type=float, default=0.05)
+    args = parser.parse_args()
+
+    results = asyncio.run(main_async(args))
+    print(json.dumps({"clients": args.clients, "messages": args.messages, "results": results}, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,43 @@
+"""
+Paso de construcción de los límites del mapa (`GET /api/boundaries`).
+
+Lee los distritos (`BOUNDARIES_PATH`) y, si se indica, las provincias de un
+GeoJSON nacional (p. ej. geoBoundaries BOL ADM2), de las que se quedan las de
+Santa Cruz por centroide de área y bbox. Escribe un TopoJSON cuantizado y
+simplificado por nivel de zoom en `BOUNDARY_LEVELS_DIR` (ver
+`app.services.boundary_levels`). La API también lo construye al primer uso si
+falta, pero así el arranque no paga ese coste.
+
+Uso:
+    python build_boundaries.py
+    python build_boundaries.py --provinces ../frontend/public/geoBoundaries-BOL-ADM2.geojson
+"""
+import argparse
+import logging
+
+from app.config import config
+from app.services.boundary_levels import build
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("build_boundaries")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Límites simplificados por nivel de zoom")
+    parser.add_argument("--districts", default=config.BOUNDARIES_PATH)
+    parser.add_argument("--provinces", default=config.BOUNDARY_PROVINCES_PATH or None,
+                        help="GeoJSON nacional del que extraer las provincias de Santa Cruz")
+    parser.add_argument("--out", default=config.BOUNDARY_LEVELS_DIR)
+    args = parser.parse_args()
+
+    index = build(args.districts, args.out, args.provinces)
+    logger.info(f"✓ {index['arcs']} arcs, {index['points']} points at full resolution")
+    for level in index["levels"]:
+        logger.info(f"  z{level['zoom']}: {level['points']} points, {level['bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
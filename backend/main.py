@@ -2,11 +2,19 @@
 Aplicación principal FastAPI.
 Punto de entrada del backend.
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from app.api import routes, websocket
+from fastapi.responses import FileResponse
+from app.api import routes, websocket, ingest, profiles, exports, metrics as metrics_api
 from app.config import config
+from app import metrics, profiling
+from app.services.ingest_service import ingest_service
+from app.services.point_index import point_index
+from app.etl.compute import compute
+import asyncio
 import logging
+import os
+import time
 import uvicorn
 
 # Configurar logging
@@ -30,11 +38,79 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Profile-Id", "X-Profile-Url", "ETag", "Content-Range", "Accept-Ranges",
+                    "X-Heatmap-Width", "X-Heatmap-Height", "X-Heatmap-Bbox", "X-Heatmap-Range",
+                    "X-Coverage-Width", "X-Coverage-Height", "X-Coverage-Bbox", "X-Coverage-Range"],
 )
 
+@app.middleware("http")
+async def request_profiling(request: Request, call_next):
+    """Perfilado opt-in (`X-Profile: 1` o `?profile=1`), ver app.profiling."""
+    mode = profiling.requested_mode(request.headers, request.query_params)
+    if mode is None:
+        return await call_next(request)
+
+    session = profiling.start(request.method, request.url.path)
+    try:
+        response = await call_next(request)
+    except Exception:
+        await asyncio.to_thread(profiling.finish, session, 500)
+        raise
+
+    # call_next vuelve con la cabecera: un stream (p. ej. /dashboard, o los
+    # trabajos del proceso de cómputo) sigue calculándose mientras se envía el cuerpo
+    if mode == "download":
+        try:
+            async for _ in response.body_iterator:
+                pass
+        finally:
+            path = await asyncio.to_thread(profiling.finish, session, response.status_code)
+        return FileResponse(path, media_type="application/zip", filename=os.path.basename(path))
+
+    async def profiled_body(body):
+        try:
+            async for chunk in body:
+                yield chunk
+        except BaseException:
+            # Conexión cortada (cancelación): cerrar la sesión sin esperarla
+            asyncio.get_running_loop().run_in_executor(None, profiling.finish, session, response.status_code)
+            raise
+        # Antes del final del cuerpo: X-Profile-Url ya se puede descargar
+        await asyncio.to_thread(profiling.finish, session, response.status_code)
+
+    response.body_iterator = profiled_body(response.body_iterator)
+    response.headers["X-Profile-Id"] = session.id
+    response.headers["X-Profile-Url"] = f"/api/debug/profiles/{session.id}"
+    return response
+
+
+@app.middleware("http")
+async def request_metrics(request: Request, call_next):
+    """Latencia por endpoint (plantilla de ruta, no URL concreta)."""
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        route = request.scope.get("route")
+        metrics.REQUEST_LATENCY.labels(
+            method=request.method,
+            route=getattr(route, "path", "unmatched"),
+            status=str(status),
+        ).observe(time.perf_counter() - start)
+
+
+metrics.INGEST_BUFFERED.set_function(lambda: ingest_service.buffered)
+
 # Incluir routers
 app.include_router(routes.router, prefix="/api", tags=["API"])
 app.include_router(websocket.router, prefix="/api", tags=["WebSocket"])
+app.include_router(ingest.router, prefix="/api", tags=["Ingest"])
+app.include_router(exports.router, prefix="/api", tags=["Exports"])
+app.include_router(profiles.router, prefix="/api", tags=["Debug"])
+app.include_router(metrics_api.router, tags=["Metrics"])
 
 
 @app.on_event("startup")
@@ -49,8 +125,21 @@ async def startup_event():
         logger.error(f"✗ Configuration error: {e}")
         raise
     
-    logger.info(f"✓ Supabase URL: {config.SUPABASE_URL}")
-    logger.info("✓ Spark ETL initialized")
+    logger.info(f"✓ Data source: {config.DATA_SOURCE}")
+    if config.DATA_SOURCE == "supabase":
+        logger.info(f"✓ Supabase URL: {config.SUPABASE_URL}")
+    if config.COMPUTE_MODE == "remote":
+        logger.info(f"✓ Spark jobs sent to compute process at {config.COMPUTE_SOCKET}")
+    else:
+        logger.info("✓ Spark ETL runs in this process (started on first job)")
+    
+    ingest_service.add_listener(websocket.broadcast_signal_batch)
+    ingest_service.start()
+    logger.info("✓ Ingest write-behind buffer started")
+    point_index.start()
+    logger.info(f"✓ Point store freshness checked every {config.MAP_INDEX_TTL:g}s in the background")
+    if config.PROFILING_ENABLED:
+        logger.info(f"✓ On-demand profiling enabled (artifacts in {config.PROFILING_DIR})")
     logger.info(f"✓ Server running on {config.API_HOST}:{config.API_PORT}")
 
 
@@ -58,9 +147,11 @@ async def startup_event():
 async def shutdown_event():
     """Evento de cierre de la aplicación."""
     logger.info("Shutting down Santa Cruz Signal Analytics API")
-    from app.etl.spark_pipeline import spark_etl_service
-    spark_etl_service.stop()
-    logger.info("✓ Spark session stopped")
+    await ingest_service.stop()
+    logger.info("✓ Ingest buffer flushed")
+    await point_index.stop()
+    compute.stop()
+    logger.info("✓ Compute stopped")
 
 
 @app.get("/")
@@ -74,8 +165,8 @@ async def root():
 
 
 if __name__ == "__main__":
-    # Optimización: Usar workers para concurrencia si no estamos en modo reload
-    # Nota: reload y workers son incompatibles en uvicorn
+    # Desarrollo: un worker con reload y Spark en el mismo proceso.
+    # Producción (varios workers + un proceso de cómputo Spark): python serve.py
     uvicorn.run(
         "main:app",
         host=config.API_HOST,
@@ -0,0 +1,102 @@
+"""
+Modo producción: un proceso de cómputo con la única SparkSession y varios
+workers de uvicorn sin Spark que le envían trabajos por un socket Unix.
+
+La memoria de la JVM (driver de 4 GB) no se multiplica por worker: la
+concurrencia de la API escala con `--workers` y la de Spark con
+`COMPUTE_CONCURRENCY`. Si el proceso de cómputo termina, se reinicia.
+Los workers comparten agregados y puntos del mapa por `app.shared_cache`, y
+la ingesta en vivo (deltas WebSocket y agregados) por el proceso de cómputo.
+
+Uso:
+    python serve.py --workers 4
+"""
+import argparse
+import logging
+import os
+import secrets
+import subprocess
+import sys
+import threading
+import time
+
+# Antes de importar la app: los workers heredan el modo, la clave del socket
+# y la caché compartida
+os.environ["COMPUTE_MODE"] = "remote"
+os.environ.setdefault("COMPUTE_AUTHKEY", secrets.token_hex(16))
+os.environ.setdefault("SHARED_CACHE_ENABLED", "true")
+
+import uvicorn  # noqa: E402
+from app.config import config  # noqa: E402
+from app.etl.compute import compute  # noqa: E402
+from app.shared_cache import dataset_version  # noqa: E402
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger("serve")
+
+RESTART_DELAY = 2.0
+
+
+def start_compute() -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "-m", "app.etl.compute_server"],
+                            cwd=os.path.dirname(os.path.abspath(__file__)))
+
+
+def wait_ready(process: subprocess.Popen, timeout: float) -> bool:
+    """Espera a que el proceso de cómputo responda `health` (arrancar Spark tarda)."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            return False
+        if compute.health().get("status") == "ok":
+            return True
+        time.sleep(0.5)
+    return False
+
+
+def supervise(holder: dict, stopping: threading.Event):
+    """Reinicia el proceso de cómputo si termina inesperadamente."""
+    while not stopping.wait(1.0):
+        process = holder["process"]
+        if process.poll() is not None:
+            logger.error(f"✗ Compute process exited with code {process.returncode}, restarting")
+            time.sleep(RESTART_DELAY)
+            holder["process"] = start_compute()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="API con varios workers + proceso de cómputo Spark")
+    parser.add_argument("--workers", type=int, default=config.API_WORKERS)
+    parser.add_argument("--host", default=config.API_HOST)
+    parser.add_argument("--port", type=int, default=config.API_PORT)
+    parser.add_argument("--startup-timeout", type=float, default=120.0)
+    args = parser.parse_args()
+
+    # Versión nueva al arrancar: no reutilizar entradas de una ejecución anterior
+    dataset_version.bump()
+    holder = {"process": start_compute()}
+    if not wait_ready(holder["process"], args.startup_timeout):
+        holder["process"].terminate()
+        sys.exit("✗ Compute process did not become healthy")
+    logger.info(f"✓ Compute process ready (pid {holder['process'].pid})")
+
+    stopping = threading.Event()
+    threading.Thread(target=supervise, args=(holder, stopping), daemon=True).start()
+    try:
+        uvicorn.run("main:app", host=args.host, port=args.port, workers=args.workers, log_level="info")
+    finally:
+        stopping.set()
+        process = holder["process"]
+        process.terminate()
+        try:
+            process.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            process.kill()
+        logger.info("✓ Compute process stopped")
+
+
+if __name__ == "__main__":
+    main()
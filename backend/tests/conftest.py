@@ -0,0 +1,13 @@
+"""
+Configuración común de las pruebas: fuente SQLite en memoria y sin Spark.
+
+Se fija antes de importar `app` (la configuración se lee al importar).
+"""
+import os
+import tempfile
+
+os.environ.setdefault("DATA_SOURCE", "sqlite")
+os.environ.setdefault("SQLITE_PATH", ":memory:")
+os.environ.setdefault("SPARK_METRICS_LISTENER", "false")
+os.environ.setdefault("SHARED_CACHE_ENABLED", "false")
+os.environ.setdefault("POINT_STORE_DIR", os.path.join(tempfile.mkdtemp(prefix="signal-tests-"), "point-store"))
@@ -0,0 +1,31 @@
+"""
+Turnos de admisión: la respuesta en streaming devuelve el turno aunque el
+cliente se vaya antes de empezar a leer.
+"""
+import asyncio
+import pytest
+from app.etl.compute import Closing
+from app.services.admission import QUEUED, Ticket
+
+
+def test_response_releases_the_slot_and_closes_an_unstarted_stream():
+    released, closed = [], []
+    ticket = Ticket("dashboard", None, 1.0, QUEUED)
+    ticket._release = lambda: released.append(1)
+
+    def lines():
+        yield b"{}\n"
+
+    response = ticket.response(Closing(lines(), lambda: closed.append(1)), "application/x-ndjson")
+
+    async def receive():
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        raise OSError("client gone")
+
+    scope = {"type": "http", "asgi": {"spec_version": "2.4"}, "method": "GET", "path": "/"}
+    with pytest.raises(Exception):
+        asyncio.run(response(scope, receive, send))
+    assert released == [1]
+    assert closed == [1]
@@ -0,0 +1,67 @@
+"""
+Perfilado en modo remoto: el proceso de cómputo ejecuta el trabajo bajo su
+propia sesión y los planes vuelven a la sesión del worker (sin Spark: los
+trabajos de prueba anotan el plan como lo hace `SparkETLService`).
+"""
+import os
+import tempfile
+import threading
+from multiprocessing.connection import Listener
+from types import SimpleNamespace
+from app import profiling
+from app.etl.compute import INTERACTIVE, LANES, RemoteCompute
+from app.etl.compute_server import ComputeServer
+
+
+def annotate(method):
+    session = profiling.current()
+    if session is None:
+        return
+    call = session.begin_call(method)
+    session.add_plan(f"== Physical Plan ==\n{method}")
+    call["seconds"] = 0.001
+
+
+def aggregate():
+    annotate("aggregate")
+    return {"total": 1}
+
+
+def dashboard():
+    annotate("dashboard")
+    yield {"section": "summary"}
+    annotate("dashboard_series")
+    yield {"section": "series"}
+
+
+def start_server():
+    address = os.path.join(tempfile.mkdtemp(prefix="compute-test-"), "compute.sock")
+    server = ComputeServer(address, None, concurrency=1, queue_size=4)
+    server.jobs = SimpleNamespace(JOBS={"aggregate": aggregate}, STREAMS={"dashboard": dashboard},
+                                  use_pool=lambda lane: None)
+    for lane in LANES:
+        threading.Thread(target=server._work, args=(lane,), daemon=True).start()
+    listener = Listener(address, family="AF_UNIX")
+
+    def accept():
+        while True:
+            threading.Thread(target=server._handle, args=(listener.accept(),), daemon=True).start()
+
+    threading.Thread(target=accept, daemon=True).start()
+    return RemoteCompute(address, None, timeout=10)
+
+
+def test_remote_jobs_return_their_plans_to_the_profiled_request():
+    compute = start_server()
+    assert compute.run("aggregate") == b'{"total":1}'  # Sin perfilar: sin sesión en el proceso de cómputo
+
+    session = profiling.start("GET", "/api/dashboard")
+    try:
+        assert compute.run("aggregate", INTERACTIVE) == b'{"total":1}'
+        lines = list(compute.stream("dashboard"))
+    finally:
+        profiling.collect(session)
+
+    assert len(lines) == 2
+    assert [call["method"] for call in session.spark_calls] == ["aggregate", "dashboard", "dashboard_series"]
+    assert "== Physical Plan ==\ndashboard_series" in session.plans_text()
@@ -0,0 +1,163 @@
+"""
+Compilación de filtros (`compile_filter`): qué predicados se empujan a cada
+fuente y cuáles quedan como residuales.
+"""
+from datetime import datetime, timezone
+import pytest
+from app.models.signal_batch import SignalBatch
+from app.services.boundaries import boundary_index, union_bbox
+from app.services.filters import (
+    DEFAULT_PUSHDOWN, Predicate, SignalFilter, apply_to_batch, compile_filter, select_rows,
+)
+from app.services.postgres_source import PostgresSource
+from app.services.sqlite_source import SQLiteSource
+from app.services.supabase_service import SupabaseRestSource
+
+SOURCES = [SupabaseRestSource, PostgresSource, SQLiteSource]
+
+# Solo IN: rangos y polígonos quedan residuales (una fuente más limitada)
+IN_ONLY = frozenset({"in"})
+
+
+def split(predicates, pushdown):
+    """Reparto esperado de `predicates` según los operadores de la fuente."""
+    return ([p for p in predicates if p.op in pushdown], [p for p in predicates if p.op not in pushdown])
+
+
+def assert_plan(signal_filter, expected, pushdown):
+    plan = compile_filter(signal_filter, pushdown)
+    pushed, residual = split(expected, pushdown)
+    assert not plan.matches_nothing
+    assert plan.pushed == pushed
+    assert plan.residual == residual
+
+
+@pytest.fixture(params=[source.pushdown_ops for source in SOURCES] + [IN_ONLY],
+                ids=[source.__name__ for source in SOURCES] + ["in-only"])
+def pushdown(request):
+    return request.param
+
+
+def test_sources_push_in_and_ranges():
+    for source in SOURCES:
+        assert source.pushdown_ops == DEFAULT_PUSHDOWN == frozenset({"in", ">=", "<="})
+
+
+def test_empty_filter_has_no_predicates(pushdown):
+    plan = compile_filter(SignalFilter(), pushdown)
+    assert (plan.pushed, plan.residual, plan.matches_nothing) == ([], [], False)
+
+
+def test_operator_and_network_filters_are_sorted_in_lists(pushdown):
+    signal_filter = SignalFilter.from_dict({
+        "empresas": ["TIGO", "ENTEL", "TIGO"],
+        "tipos_senal": ["4G"],
+        "device_names": ["SM-A135M"],
+    })
+    assert_plan(signal_filter, [
+        Predicate("sim_operator", "in", ("ENTEL", "TIGO")),
+        Predicate("network_type", "in", ("4G",)),
+        Predicate("device_name", "in", ("SM-A135M",)),
+    ], pushdown)
+
+
+def test_bbox_becomes_latitude_and_longitude_ranges(pushdown):
+    signal_filter = SignalFilter.from_dict({"bbox": "-63.19,-17.80,-63.15,-17.77"})
+    assert_plan(signal_filter, [
+        Predicate("latitude", ">=", -17.80),
+        Predicate("latitude", "<=", -17.77),
+        Predicate("longitude", ">=", -63.19),
+        Predicate("longitude", "<=", -63.15),
+    ], pushdown)
+
+
+def test_time_range_and_minimums_are_ranges(pushdown):
+    start = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    end = datetime(2025, 1, 31, 23, 59, tzinfo=timezone.utc)
+    signal_filter = SignalFilter(fecha_inicio=start, fecha_fin=end, battery_min="20", signal_min=-100)
+    assert_plan(signal_filter, [
+        Predicate("timestamp", ">=", "2025-01-01T00:00:00+00:00"),
+        Predicate("timestamp", "<=", "2025-01-31T23:59:00+00:00"),
+        Predicate("battery", ">=", 20),
+        Predicate("signal", ">=", -100),
+    ], pushdown)
+
+
+def test_open_time_range_only_bounds_one_side(pushdown):
+    signal_filter = SignalFilter(fecha_fin="2025-02-01T00:00:00+00:00")
+    assert_plan(signal_filter, [Predicate("timestamp", "<=", "2025-02-01T00:00:00+00:00")], pushdown)
+
+
+def test_provincia_pushes_its_bbox_and_keeps_the_polygon_residual(pushdown):
+    regions = boundary_index.find(["Andres Ibañez"])
+    assert regions
+    min_lng, min_lat, max_lng, max_lat = union_bbox(regions)
+    # Sin tildes ni mayúsculas, como llega de la URL
+    signal_filter = SignalFilter.from_dict({"provincias": ["andres ibanez"], "empresas": ["TIGO"]})
+    plan = compile_filter(signal_filter, pushdown)
+    expected = [
+        Predicate("sim_operator", "in", ("TIGO",)),
+        Predicate("latitude", ">=", min_lat),
+        Predicate("latitude", "<=", max_lat),
+        Predicate("longitude", ">=", min_lng),
+        Predicate("longitude", "<=", max_lng),
+        Predicate("latitude,longitude", "within", tuple(regions)),
+    ]
+    pushed, residual = split(expected, pushdown)
+    assert plan.pushed == pushed
+    assert plan.residual == residual
+    # Ninguna fuente evalúa polígonos
+    assert plan.residual[-1].op == "within"
+
+
+def test_municipio_narrows_the_regions(pushdown):
+    regions = boundary_index.find(None, ["Capital (Santa Cruz de la Sierra)"])
+    plan = compile_filter(SignalFilter.from_dict({"municipios": ["capital (santa cruz de la sierra)"]}), pushdown)
+    assert plan.residual[-1] == Predicate("latitude,longitude", "within", tuple(regions))
+
+
+def test_unknown_region_matches_nothing(pushdown):
+    signal_filter = SignalFilter.from_dict({"provincias": ["Atlantis"], "empresas": ["TIGO"]})
+    plan = compile_filter(signal_filter, pushdown)
+    assert plan.matches_nothing
+    assert (plan.pushed, plan.residual) == ([], [])
+
+
+def test_describe_lists_both_sides():
+    signal_filter = SignalFilter.from_dict({"empresas": ["TIGO"], "provincias": ["Andres Ibañez"]})
+    described = compile_filter(signal_filter, IN_ONLY).describe()
+    assert described["pushed"] == ["sim_operator IN ['TIGO']"]
+    assert described["residual"][-1].endswith("region(s)")
+    assert len(described["residual"]) == 5
+    assert described["matches_nothing"] is False
+
+
+def test_invalid_bbox_is_rejected():
+    with pytest.raises(ValueError):
+        SignalFilter.from_dict({"bbox": "-63.15,-17.77,-63.19,-17.80"})
+
+
+def test_dates_with_an_offset_are_compared_in_utc(pushdown):
+    # Santa Cruz (UTC-4): las 08:00 locales son las 12:00 UTC
+    signal_filter = SignalFilter(fecha_inicio="2024-01-01T08:00:00-04:00", fecha_fin=datetime(2024, 1, 1, 9))
+    assert_plan(signal_filter, [
+        Predicate("timestamp", ">=", "2024-01-01T12:00:00+00:00"),
+        Predicate("timestamp", "<=", "2024-01-01T09:00:00+00:00"),
+    ], pushdown)
+
+
+def test_residual_dates_compare_instants_not_text():
+    batch = SignalBatch.from_rows([
+        {"latitude": -17.78, "longitude": -63.18, "timestamp": "2024-01-01T11:00:00+00:00"},  # 07:00 local
+        {"latitude": -17.78, "longitude": -63.18, "timestamp": "2024-01-01T08:30:00-04:00"},  # 12:30 UTC
+        {"latitude": -17.78, "longitude": -63.18, "timestamp": None},
+    ])
+    plan = compile_filter(SignalFilter(fecha_inicio="2024-01-01T08:00:00-04:00"), IN_ONLY)
+    apply_to_batch(batch, plan.residual)
+    assert list(batch.valid) == [0, 1, 0]
+    assert select_rows(batch, plan.residual, [0, 1, 2]) == [1]
+
+
+def test_invalid_date_is_rejected():
+    with pytest.raises(ValueError):
+        compile_filter(SignalFilter(fecha_inicio="yesterday"))
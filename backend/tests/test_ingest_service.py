@@ -0,0 +1,103 @@
+"""
+Ingesta con escritura diferida: las filas que la base de datos rechaza se
+descuentan de los agregados en vivo y se publican como corrección; con varios
+workers, los deltas y los agregados se reparten a través del hub.
+"""
+import asyncio
+import queue
+import orjson
+from app.etl.compute_server import LiveHub
+from app.services.ingest_service import IngestService, validate_reports
+
+
+def reports(*operators):
+    return [{"latitude": -17.78, "longitude": -63.18, "signal": -80, "battery": 50,
+             "sim_operator": operator, "network_type": "4G", "device_name": "device"}
+            for operator in operators]
+
+
+def test_rejected_row_is_subtracted_and_published_as_a_correction():
+    def writer(batch):
+        if any(row["sim_operator"] == "BAD" for row in batch):
+            raise ValueError("violates check constraint")
+        return len(batch)
+
+    deltas = []
+
+    async def listener(delta):
+        deltas.append(delta)
+
+    service = IngestService(writer, probe=lambda: 0, batch_size=10, max_retries=0)
+    service.add_listener(listener)
+    rows, rejected, _ = validate_reports(reports("TIGO", "BAD", "ENTEL"))
+    assert rejected == 0
+    service.submit(rows)
+    asyncio.run(service.flush())
+
+    assert [d["count"] for d in deltas] == [3, 0]
+    assert [row["sim_operator"] for row in deltas[1]["rejected"]] == ["BAD"]
+    aggregates = service.aggregates.snapshot()
+    assert aggregates == deltas[1]["aggregates"]
+    assert aggregates["total_signals"] == 2
+    assert aggregates["signals_by_company"] == {"TIGO": 1, "ENTEL": 1}
+    assert aggregates["average_signal"] == -80
+    stats = service.stats()
+    assert (stats["written"], stats["dead_letter"], stats["buffered"]) == (2, 1, 0)
+
+
+class InProcessHub:
+    """`RemoteCompute.publish/subscribe` sin socket, sobre el `LiveHub` del proceso de cómputo."""
+
+    def __init__(self):
+        self.live = LiveHub()
+
+    def publish(self, delta):
+        self.live.publish(orjson.loads(orjson.dumps(delta)))
+
+    def subscribe(self, stopping):
+        pending, current = self.live.subscribe()
+        try:
+            yield orjson.loads(current)
+            while not stopping.is_set():
+                try:
+                    yield orjson.loads(pending.get(timeout=0.05))
+                except queue.Empty:
+                    pass
+        finally:
+            self.live.unsubscribe(pending)
+
+
+def test_deltas_reach_every_worker_through_the_hub():
+    hub = InProcessHub()
+    workers = [IngestService(lambda batch: len(batch), probe=lambda: 0, hub=hub) for _ in range(2)]
+    received = [[], []]
+    for worker, deltas in zip(workers, received):
+        async def listener(delta, deltas=deltas):
+            deltas.append(delta)
+        worker.add_listener(listener)
+
+    async def main():
+        for worker in workers:
+            worker.start()
+        while hub.live.stats()["subscribers"] < 2:
+            await asyncio.sleep(0.01)
+        workers[0].submit(validate_reports(reports("TIGO", "ENTEL"))[0])
+        workers[1].submit(validate_reports(reports("TIGO"))[0])
+        await workers[0].flush()
+        await workers[1].flush()
+        while not all(len(deltas) == 2 for deltas in received):
+            await asyncio.sleep(0.01)
+        snapshots = [worker.live_aggregates() for worker in workers]
+        for worker in workers:
+            await worker.stop()
+        return snapshots
+
+    snapshots = asyncio.run(main())
+    for deltas in received:
+        assert [d["count"] for d in deltas] == [2, 1]
+        assert deltas[-1]["aggregates"]["signals_by_company"] == {"TIGO": 2, "ENTEL": 1}
+    assert snapshots[0] == snapshots[1]
+    assert snapshots[0]["total_signals"] == 3
+    # Cada worker conserva sus propios agregados como respaldo sin hub
+    assert workers[1].aggregates.snapshot()["total_signals"] == 1
+    assert hub.live.stats()["subscribers"] == 0
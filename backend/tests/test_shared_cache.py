@@ -0,0 +1,76 @@
+"""
+Caché compartida: publicación de entradas y lock de llenado entre workers.
+"""
+import os
+import time
+import pytest
+from app import shared_cache as module
+from app.shared_cache import SharedCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return SharedCache(str(tmp_path), 1 << 20)
+
+
+def test_put_and_get_round_trip(cache):
+    cache.put("k", [b"abc", b"de"], {"rows": 2})
+    entry = cache.get("k")
+    assert entry.meta == {"rows": 2}
+    assert [bytes(s) for s in entry.sections] == [b"abc", b"de"]
+    assert cache.get("other") is None
+
+
+def test_fill_computes_once_and_removes_its_lock(cache):
+    calls = []
+
+    def producer():
+        calls.append(1)
+        return [b"x"], {}
+
+    assert bytes(cache.fill("k", producer).sections[0]) == b"x"
+    assert bytes(cache.fill("k", producer).sections[0]) == b"x"
+    assert calls == [1]
+    assert not os.path.exists(cache._path("k") + ".lock")
+
+
+def test_owner_does_not_remove_a_lock_taken_over_by_a_waiter(cache, monkeypatch):
+    lock = cache._path("k") + ".lock"
+    monkeypatch.setattr(module, "FILL_WAIT", 0.0)
+
+    def slow_owner():
+        # Mientras el dueño calcula, otro worker se cansa de esperar y se queda el lock
+        module._take_lock(lock, "waiter")
+        return [b"x"], {}
+
+    cache.fill("k", slow_owner)
+    with open(lock) as f:
+        assert f.read() == "waiter"
+
+
+def test_waiter_takes_over_a_stale_lock(cache, monkeypatch):
+    lock = cache._path("k") + ".lock"
+    assert module._try_lock(lock, "dead-owner")
+    assert not module._try_lock(lock, "other")
+    monkeypatch.setattr(module, "FILL_WAIT", 0.0)
+    time.sleep(0.01)
+    entry = cache.fill("k", lambda: ([b"y"], {}))
+    assert bytes(entry.sections[0]) == b"y"
+    # El lock era del que lo tomó: al terminar lo borra
+    assert not os.path.exists(lock)
+
+
+def test_coalesced_bumps_publish_once_per_interval(cache):
+    version = module.DatasetVersion(cache, min_interval=0.2)
+    first = version.bump()
+    cache.put("k", [b"x"], {})
+    # Dentro del intervalo: la versión y la caché no cambian hasta que vence
+    assert version.bump(coalesce=True) == first
+    assert version.bump(coalesce=True) == first
+    assert cache.get("k") is not None
+    time.sleep(0.4)
+    assert version.current() != first
+    assert cache.get("k") is None
+    # Sin agrupar (compactación): en el acto
+    second = version.current()
+    assert version.bump() != second
@@ -0,0 +1,168 @@
+"""
+SQLiteSource como sustituto de PostgreSQL: el SQL de `data_source` y los
+viajes de ida y vuelta insert/count/select.
+"""
+import pytest
+from app.services.data_source import build_page_select, build_select, build_where
+from app.services.filters import Predicate
+from app.services.sqlite_source import SQLiteSource
+
+BASE_CLAUSES = "latitude IS NOT NULL AND longitude IS NOT NULL AND latitude <> 0 AND longitude <> 0"
+
+
+def report(i, **overrides):
+    row = {
+        "device_id": f"dev-{i % 3}",
+        "device_name": f"device-{i % 3}",
+        "latitude": -17.78 + i * 0.001,
+        "longitude": -63.18 + i * 0.001,
+        "altitude": 400.0,
+        "speed": float(i),
+        "battery": 50 + i,
+        "signal": -80 - i,
+        "sim_operator": "TIGO" if i % 2 else "ENTEL",
+        "network_type": "4G" if i % 3 else "5G",
+        "timestamp": f"2025-01-01T00:{i:02d}:00+00:00",
+    }
+    row.update(overrides)
+    return row
+
+
+@pytest.fixture
+def source():
+    source = SQLiteSource(":memory:")
+    yield source
+    source.close()
+
+
+def test_build_where_without_predicates_only_drops_missing_coordinates():
+    where, params = build_where(None, "?")
+    assert where == BASE_CLAUSES
+    assert params == []
+
+
+def test_build_where_parametrizes_pushed_predicates():
+    where, params = build_where([
+        Predicate("sim_operator", "in", ("TIGO", "ENTEL")),
+        Predicate("timestamp", ">=", "2025-01-01T00:00:00"),
+        Predicate("battery", "<=", 80),
+    ], "?")
+    assert where == (BASE_CLAUSES + ' AND sim_operator IN (?, ?) AND "timestamp" >= ? AND battery <= ?')
+    assert params == ["TIGO", "ENTEL", "2025-01-01T00:00:00", 80]
+
+
+def test_build_where_rejects_operators_sql_cannot_evaluate():
+    with pytest.raises(ValueError):
+        build_where([Predicate("latitude", "within", ())], "?")
+
+
+def test_build_select_orders_limits_and_offsets():
+    sql, params = build_select([Predicate("network_type", "in", ("4G",))], limit=10, offset=20, placeholder="?")
+    assert "FROM locations WHERE" in sql
+    assert sql.endswith("ORDER BY id LIMIT 10 OFFSET 20")
+    assert params == ["4G"]
+
+
+def test_build_page_select_continues_after_the_keyset():
+    sql, params = build_page_select(None, 5, ("2025-01-01T00:00:00+00:00", 7), "?")
+    assert '("timestamp", id) > (?, ?)' in sql
+    assert sql.endswith('ORDER BY "timestamp", id LIMIT 5')
+    assert params == ["2025-01-01T00:00:00+00:00", 7]
+
+
+def test_insert_and_count_round_trip(source):
+    assert source.count() == 0
+    assert source.insert_rows([report(i) for i in range(10)]) == 10
+    assert source.insert_rows([]) == 0
+    assert source.count() == 10
+
+
+def test_select_normalizes_missing_values(source):
+    source.insert_rows([report(1, sim_operator="", battery=None, speed=None, device_name=None)])
+    (row,) = source.fetch_signals(10)
+    assert row["sim_operator"] == "Unknown"
+    assert row["device_name"] == "Unknown"
+    assert row["battery"] == 0
+    assert row["speed"] == 0.0
+
+
+def test_rows_without_coordinates_are_not_read(source):
+    source.insert_rows([report(1), report(2, latitude=0, longitude=0), report(3, latitude=None)])
+    assert source.count() == 3
+    assert len(source.fetch_batch()) == 1
+
+
+def test_pushed_predicates_filter_in_sql(source):
+    rows = [report(i) for i in range(12)]
+    source.insert_rows(rows)
+    predicates = [
+        Predicate("sim_operator", "in", ("TIGO",)),
+        Predicate("battery", ">=", 55),
+        Predicate("timestamp", "<=", "2025-01-01T00:09:00+00:00"),
+    ]
+    batch = source.fetch_batch(predicates)
+    expected = [r for r in rows if r["sim_operator"] == "TIGO" and r["battery"] >= 55
+                and r["timestamp"] <= "2025-01-01T00:09:00+00:00"]
+    assert len(batch) == len(expected)
+    assert sorted(batch.column("battery")) == sorted(r["battery"] for r in expected)
+
+
+def test_limit_and_offset_page_in_id_order(source):
+    source.insert_rows([report(i) for i in range(10)])
+    first = source.fetch_batch(limit=4)
+    second = source.fetch_batch(limit=4, offset=4)
+    assert list(first.column("speed")) == [0.0, 1.0, 2.0, 3.0]
+    assert list(second.column("speed")) == [4.0, 5.0, 6.0, 7.0]
+
+
+def test_keyset_pages_cover_every_row_once(source):
+    # Timestamps repetidos: el id desempata
+    source.insert_rows([report(i, timestamp=f"2025-01-01T00:0{i // 3}:00+00:00") for i in range(10)])
+    seen, after = [], None
+    while True:
+        batch, after = source.fetch_page(None, 3, after)
+        seen.extend(batch.column("speed"))
+        if after is None or len(batch) < 3:
+            break
+    assert sorted(seen) == [float(i) for i in range(10)]
+
+
+def test_unique_values_only_for_known_columns(source):
+    source.insert_rows([report(i) for i in range(4)] + [report(9, sim_operator="")])
+    assert source.unique_values("sim_operator") == ["ENTEL", "TIGO"]
+    assert source.unique_values("latitude; DROP TABLE locations") == []
+
+
+def test_newest_reads_keep_the_most_recent_rows(source):
+    source.insert_rows([report(i) for i in range(10)])
+    sql, _ = build_select(None, 3, newest=True)
+    assert sql.endswith("ORDER BY id DESC LIMIT 3")
+    batch = source.fetch_batch(None, 3, newest=True)
+    assert batch.column("timestamp") == [f"2025-01-01T00:{i:02d}:00+00:00" for i in (9, 8, 7)]
+    compacted = source.fetch_compacted(None, 3, newest=True)
+    assert list(compacted.column("timestamp")) == batch.column("timestamp")
+
+
+def test_change_marker_sees_updates_and_replaced_rows(source):
+    source.insert_rows([report(i) for i in range(3)])
+    marker = source.change_marker()
+    assert marker == source.change_marker()
+
+    source._execute_many("UPDATE locations SET battery = 1 WHERE id = ?", [(1,)])
+    updated = source.change_marker()
+    assert updated != marker
+
+    # Borrar y volver a insertar deja el mismo conteo, pero no el mismo id máximo
+    source._execute_many("DELETE FROM locations WHERE id = ?", [(3,)])
+    source.insert_rows([report(3)])
+    assert source.count() == 3
+    assert source.change_marker() != updated
+
+
+def test_raw_after_stops_before_the_first_unsettled_row(source):
+    source.insert_rows([report(i) for i in range(6)])
+    # Como PostgreSQL con `ingested_at`: la fila 4 sigue dentro de la gracia
+    source.unsettled_expr = "id = 4 AND ? >= 0"
+    assert list(source.fetch_raw_after(1, 10, grace=60).as_dict()["id"]) == [2, 3]
+    source.unsettled_expr = None
+    assert list(source.fetch_raw_after(1, 10).as_dict()["id"]) == [2, 3, 4, 5, 6]
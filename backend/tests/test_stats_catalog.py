@@ -0,0 +1,56 @@
+"""
+Catálogo de estadísticas: selectividad de rangos de fecha sobre la tabla
+entera, no solo sobre la muestra del almacén de puntos.
+"""
+import pytest
+from app.models.signal_batch import SignalBatch
+from app.services.filters import Predicate
+from app.services.point_store import PointStore
+from app.services.stats_catalog import TableStats
+
+
+def report(minute):
+    return {
+        "device_name": "device", "latitude": -17.78, "longitude": -63.18, "speed": 0.0,
+        "battery": 50, "signal": -80, "sim_operator": "TIGO", "network_type": "4G",
+        "timestamp": f"2025-01-01T00:{minute:02d}:00+00:00",
+    }
+
+
+def since(minute):
+    return Predicate("timestamp", ">=", f"2025-01-01T00:{minute:02d}:00+00:00")
+
+
+def until(minute):
+    return Predicate("timestamp", "<=", f"2025-01-01T00:{minute:02d}:00+00:00")
+
+
+@pytest.fixture
+def store(tmp_path):
+    return PointStore(str(tmp_path), compact_rows=1000)
+
+
+def test_complete_store_uses_the_sample(store):
+    view = store.build(SignalBatch.from_rows([report(m) for m in range(10, 20)]), "sqlite", 10)
+    stats = TableStats(view, 100)
+    assert stats.selectivity([since(15)], view) == pytest.approx(0.5)
+    assert stats.selectivity([until(5)], view) == pytest.approx(1 / 11)  # suelo
+
+
+def test_partial_store_counts_the_missing_older_rows(store):
+    # El almacén tiene las 10 más recientes de 40 reportes
+    view = store.build(SignalBatch.from_rows([report(m) for m in range(30, 40)]), "sqlite", 40, complete=False)
+    stats = TableStats(view, 100)
+    assert stats.selectivity([until(5)], view) == pytest.approx(0.75)
+    assert stats.selectivity([since(5)], view) == pytest.approx(1.0)
+    assert stats.selectivity([since(35)], view) == pytest.approx(0.125)
+
+
+def test_rows_appended_after_the_analysis_are_the_newest(store):
+    view = store.build(SignalBatch.from_rows([report(m) for m in range(10, 20)]), "sqlite", 10)
+    stats = TableStats(view, 100)
+    store.append([report(m) for m in range(50, 60)], 10)
+    view = store.open()
+    assert not stats.stale(view, 2.0)
+    assert stats.selectivity([since(45)], view) == pytest.approx(0.5)
+    assert stats.selectivity([until(15)], view) == pytest.approx(0.3)
@@ -35,20 +35,26 @@ function App() {
   const [wsConnected, setWsConnected] = useState(false);
   const [lastUpdate, setLastUpdate] = useState(new Date());
 
-  // Control de carga incremental
+  // Control de carga de puntos por viewport
   const loadIdRef = useRef(0);
-  const lastOffsetRef = useRef(0); // Tracking del último offset cargado
+  const viewportRef = useRef(null); // Último viewport del mapa: { bbox, zoom }
+  const viewportTimerRef = useRef(null);
+  const selectedFiltersRef = useRef(selectedFilters);
+  const dashboardAbortRef = useRef(null); // Stream de /dashboard en curso
 
-  // Cargar opciones de filtros al iniciar y configurar auto-refresh
   useEffect(() => {
-    loadFilterOptions();
+    selectedFiltersRef.current = selectedFilters;
+  }, [selectedFilters]);
+
+  // Cargar el dashboard (incluye opciones de filtros) al iniciar y configurar auto-refresh
+  useEffect(() => {
     loadInitialData();
     setupWebSocket();
 
     // Auto-refresh desactivado para evitar saturación
     // const refreshInterval = setInterval(() => {
     //   console.log('🔄 Auto-refreshing data...');
-    //   loadData(true); // true = modo actualización (append)
+    //   loadData();
     // }, 10000);
 
     return () => {
@@ -57,25 +63,14 @@ function App() {
     };
   }, []);
 
-  // NO recargar datos cuando cambien los filtros - solo refrescar stats
+  // Al cambiar filtros: refrescar stats y los puntos del viewport (consulta barata)
   useEffect(() => {
     if (!loading && selectedFilters) {
-      // Solo recargar estadísticas, NO los puntos del mapa
-      loadStats();
+      loadDashboard();
+      loadMapPoints();
     }
   }, [selectedFilters]);
 
-  const loadFilterOptions = async () => {
-    try {
-      const response = await ApiService.getFilterOptions();
-      if (response.success) {
-        setFilterOptions(response);
-      }
-    } catch (error) {
-      console.error('Error loading filter options:', error);
-    }
-  };
-
   const loadInitialData = async () => {
     setLoading(true);
     try {
@@ -93,147 +88,95 @@ function App() {
     }
   };
 
-  const loadStats = async () => {
+  // Stats, opciones de filtros y muestra del mapa en una sola petición:
+  // el backend lee los datos una vez y envía cada sección en cuanto está lista
+  const loadDashboard = async () => {
+    // Preparar filtros activos
+    const activeFilters = {};
+    Object.entries(selectedFiltersRef.current).forEach(([key, value]) => {
+      if (value && value.length > 0) {
+        activeFilters[key] = value;
+      }
+    });
+
+    // Cancelar el stream anterior (filtros ya obsoletos)
+    dashboardAbortRef.current?.abort();
+    const controller = new AbortController();
+    dashboardAbortRef.current = controller;
+    // La muestra general solo se pinta si el viewport aún no trajo sus puntos
+    const loadId = loadIdRef.current;
+
+    console.log('🔄 Cargando dashboard...', activeFilters);
     try {
-      // Preparar filtros activos
-      const activeFilters = {};
-      Object.entries(selectedFilters).forEach(([key, value]) => {
-        if (value && value.length > 0) {
-          activeFilters[key] = value;
+      await ApiService.streamDashboard(activeFilters, (section, data) => {
+        if (section === 'facets') {
+          setFilterOptions(prev => prev || { success: true, ...data });
+        } else if (section === 'stats') {
+          console.log('✅ Datos de stats recibidos:', {
+            total_signals: data.total_signals,
+            signals_by_company: data.signals_by_company,
+            signal_heatmap: data.signal_heatmap?.length || 0
+          });
+          setStats(data);
+        } else if (section === 'points' && loadId === loadIdRef.current) {
+          setMapPoints(data.points);
         }
-      });
-
-      console.log('📊 Recargando solo estadísticas...');
-      const statsResponse = await ApiService.getAggregatedData(activeFilters);
-      if (statsResponse.success) {
-        setStats(statsResponse);
-      }
+      }, { signal: controller.signal });
     } catch (error) {
-      console.error('Error loading stats:', error);
+      if (error.name === 'AbortError') return;
+      console.error('❌ Error loading dashboard:', error);
+      // Continuar con valores por defecto si falla
+      setStats(prev => prev || {
+        success: true,
+        total_signals: 0,
+        signals_by_company: {},
+        signals_by_type: {},
+        signal_heatmap: []
+      });
     }
   };
 
-  const loadData = async (isUpdate = false) => {
-    try {
-      // Incrementar ID de carga para invalidar cargas anteriores
-      const currentLoadId = ++loadIdRef.current;
+  // Pide al backend solo los puntos visibles (bbox + zoom), con presupuesto de densidad
+  const loadMapPoints = async () => {
+    const viewport = viewportRef.current;
+    if (!viewport) return; // El mapa aún no notificó su viewport
 
-      // Preparar filtros activos
-      const activeFilters = {};
-      Object.entries(selectedFilters).forEach(([key, value]) => {
-        if (value && value.length > 0) {
-          activeFilters[key] = value;
-        }
-      });
+    // Incrementar ID de carga para descartar respuestas de viewports anteriores
+    const currentLoadId = ++loadIdRef.current;
+    const filters = selectedFiltersRef.current;
+    const mapFilters = { bbox: viewport.bbox, zoom: viewport.zoom };
+    if (filters.provincias?.length > 0) mapFilters.provincia = filters.provincias[0];
+    if (filters.municipios?.length > 0) mapFilters.municipio = filters.municipios[0];
+    if (filters.empresas?.length > 0) mapFilters.empresa = filters.empresas[0];
+    if (filters.tipos_senal?.length > 0) mapFilters.tipo_senal = filters.tipos_senal[0];
 
-      // Cargar estadísticas agregadas en segundo plano (no bloquear)
-      console.log('🔄 Iniciando carga de estadísticas...');
-      console.log('Filtros activos:', activeFilters);
-
-      // Cargar stats de forma asíncrona sin bloquear el resto
-      ApiService.getAggregatedData(activeFilters)
-        .then(statsResponse => {
-          console.log('📊 Respuesta de estadísticas:', statsResponse);
-          if (statsResponse.success) {
-            console.log('✅ Datos de stats recibidos:', {
-              total_signals: statsResponse.total_signals,
-              signals_by_company: statsResponse.signals_by_company,
-              signal_heatmap: statsResponse.signal_heatmap?.length || 0
-            });
-            setStats(statsResponse);
-          } else {
-            console.error('❌ Error: statsResponse.success is false');
-          }
-        })
-        .catch(error => {
-          console.error('❌ Error loading stats:', error);
-          // Continuar con valores por defecto si falla
-          setStats({
-            success: true,
-            total_signals: 0,
-            signals_by_company: {},
-            signals_by_type: {},
-            signal_heatmap: []
-          });
-        });
-
-      // Cargar puntos del mapa
-      const mapFilters = {};
-      if (activeFilters.provincias && activeFilters.provincias.length > 0) {
-        mapFilters.provincia = activeFilters.provincias[0];
-      }
-      if (activeFilters.municipios && activeFilters.municipios.length > 0) {
-        mapFilters.municipio = activeFilters.municipios[0];
+    try {
+      const response = await ApiService.getMapPoints(mapFilters);
+      if (response.success && currentLoadId === loadIdRef.current) {
+        setMapPoints(response.points);
+        if (response.sampled) {
+          console.log(`🗺️ ${response.count} de ${response.total} puntos en el viewport (muestreados)`);
+        }
       }
+    } catch (error) {
+      console.error('❌ Error cargando puntos del mapa:', error);
+    }
+  };
 
-      // Si hay filtros activos, cargar normal (menos datos)
-      if (Object.keys(mapFilters).length > 0) {
-        const mapResponse = await ApiService.getSignals(mapFilters);
-        if (mapResponse.success) {
-          if (currentLoadId === loadIdRef.current) {
-            setMapPoints(mapResponse.data);
-          }
-        }
-      } else {
-        // Carga incremental optimizada para 500k+ registros
-        let offset = lastOffsetRef.current;
-
-        if (isUpdate && currentLoadId === loadIdRef.current) {
-          console.log(`📊 Actualizando datos: continuando desde offset ${offset}`);
-        } else if (currentLoadId === loadIdRef.current) {
-          setMapPoints([]);
-          offset = 0;
-          lastOffsetRef.current = 0;
-          console.log('🔄 Reiniciando carga desde 0');
-        }
+  const handleViewportChange = (viewport) => {
+    viewportRef.current = viewport;
+    // Una sola petición cuando el usuario deja de desplazar/hacer zoom
+    clearTimeout(viewportTimerRef.current);
+    viewportTimerRef.current = setTimeout(loadMapPoints, 250);
+  };
 
-        const CHUNK_SIZE = 25000; // 25k por petición para balance velocidad/tamaño
-        const MAX_RECORDS = 500000; // Límite total a cargar
-        let loadedCount = 0;
-
-        const loadNextBatch = async () => {
-          if (currentLoadId !== loadIdRef.current) return;
-          if (offset >= MAX_RECORDS) {
-            console.log('✅ Alcanzado límite de 500k registros');
-            return;
-          }
-
-          try {
-            console.log(`📦 Cargando batch: offset=${offset}, limit=${CHUNK_SIZE}`);
-            const response = await ApiService.getSignals({}, offset, CHUNK_SIZE);
-
-            if (currentLoadId !== loadIdRef.current) return;
-
-            if (response.success && response.data.length > 0) {
-              setMapPoints(prev => [...prev, ...response.data]);
-              loadedCount += response.data.length;
-              offset += response.data.length;
-              lastOffsetRef.current = offset;
-
-              console.log(`✅ Cargados ${response.data.length} registros. Total: ${loadedCount}/${MAX_RECORDS}`);
-
-              // Si recibimos datos completos y no alcanzamos el límite, continuar
-              if (response.data.length === CHUNK_SIZE && offset < MAX_RECORDS) {
-                // Continuar inmediatamente sin espera
-                setTimeout(loadNextBatch, 50);
-              } else {
-                console.log('🏁 Carga finalizada');
-              }
-            } else {
-              console.log('🏁 No hay más datos disponibles');
-            }
-          } catch (error) {
-            console.error(`❌ Error cargando batch:`, error);
-            // Reintentar después de 3 segundos
-            if (offset < MAX_RECORDS) {
-              setTimeout(loadNextBatch, 3000);
-            }
-          }
-        };
-
-        // Iniciar carga
-        loadNextBatch();
-      }
+  const loadData = async () => {
+    try {
+      // Cargar el dashboard en segundo plano (no bloquear)
+      loadDashboard();
+
+      // Cargar puntos del viewport actual
+      loadMapPoints();
 
       setLastUpdate(new Date());
     } catch (error) {
@@ -260,8 +203,8 @@ function App() {
     // Listener para nuevos datos
     WebSocketService.on('update', (data) => {
       console.log('Nuevos datos recibidos:', data.length);
-      // Recargar datos cuando lleguen actualizaciones (modo append)
-      loadData(true);
+      // Recargar stats y puntos del viewport cuando lleguen actualizaciones
+      loadData();
     });
 
     // Listener para nueva señal individual
@@ -278,6 +221,26 @@ function App() {
         municipio: signal.municipio
       }]);
     });
+
+    // Listener para lotes de señales ingeridas (POST /ingest)
+    WebSocketService.on('new_signals', (points) => {
+      setMapPoints(prev => [...prev, ...points]);
+      setLastUpdate(new Date());
+    });
+
+    // Corrección: quitar los puntos que la base de datos rechazó al escribir
+    WebSocketService.on('rejected_signals', (points) => {
+      const sameAs = (a, b) => ['lat', 'lng', 'device_name', 'sim_operator', 'network_type', 'signal', 'battery']
+        .every(key => a[key] === b[key]);
+      setMapPoints(prev => {
+        const remaining = [...prev];
+        points.forEach(point => {
+          const index = remaining.findLastIndex(candidate => sameAs(candidate, point));
+          if (index >= 0) remaining.splice(index, 1);
+        });
+        return remaining;
+      });
+    });
   };
 
   const handleFilterChange = (newFilters) => {
@@ -294,7 +257,7 @@ function App() {
       });
       WebSocketService.requestRefresh(activeFilters);
     } else {
-      loadData(true); // true = modo actualización (append)
+      loadData();
     }
   };
 
@@ -361,7 +324,7 @@ function App() {
             <MapView
               points={mapPoints}
               selectedFilters={selectedFilters}
-              heatmapData={stats?.signal_heatmap || []}
+              onViewportChange={handleViewportChange}
             />
           </div>
 
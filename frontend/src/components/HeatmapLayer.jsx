@@ -1,59 +1,30 @@
 /**
- * HeatmapLayer Component - Capa de mapa de calor para señal/velocidad
+ * HeatmapLayer Component - Capa de mapa de calor para señal/velocidad/densidad
+ *
+ * Las teselas las renderiza el backend (/map/heatmap/{z}/{x}/{y}.png) sobre
+ * todos los puntos: el navegador no recibe ni procesa puntos individuales.
  */
 import { useEffect } from 'react';
 import { useMap } from 'react-leaflet';
 import L from 'leaflet';
-import 'leaflet.heat';
+import ApiService from '../services/api';
 
-export default function HeatmapLayer({ heatmapData, metric = 'signal' }) {
+export default function HeatmapLayer({ filters = {}, metric = 'signal' }) {
     const map = useMap();
+    const url = ApiService.getHeatmapTileUrl(filters, metric);
 
     useEffect(() => {
-        if (!heatmapData || heatmapData.length === 0) return;
-
-        // Preparar datos para el mapa de calor
-        const heatData = heatmapData.map(point => {
-            // Normalizar el valor según la métrica
-            let intensity;
-            if (metric === 'signal') {
-                // Señal: -40 (excelente) a -100 (pobre)
-                // Normalizar a 0-1
-                intensity = Math.max(0, Math.min(1, (point.signal + 100) / 60));
-            } else if (metric === 'speed') {
-                // Velocidad: normalizar basado en máximo esperado de 50 m/s
-                intensity = Math.min(1, point.speed / 50);
-            } else {
-                intensity = 0.5;
-            }
-
-            const lat = point.latitude || point.lat;
-            const lng = point.longitude || point.lng;
-
-            if (!lat || !lng) return null;
-
-            return [lat, lng, intensity];
-        }).filter(p => p !== null);
-
-        // Crear capa de mapa de calor
-        const heatLayer = L.heatLayer(heatData, {
-            radius: 25,
-            blur: 35,
-            maxZoom: 17,
-            max: 1.0,
-            gradient: {
-                0.0: '#3b82f6',  // Azul (bajo)
-                0.3: '#10b981',  // Verde
-                0.5: '#f59e0b',  // Amarillo
-                0.7: '#ef4444',  // Rojo
-                1.0: '#dc2626'   // Rojo oscuro (alto)
-            }
+        // Teselas PNG con ETag: el navegador revalida y reutiliza las que no cambiaron
+        const heatLayer = L.tileLayer(url, {
+            opacity: 0.8,
+            maxZoom: 19,
+            zIndex: 10
         }).addTo(map);
 
         return () => {
             map.removeLayer(heatLayer);
         };
-    }, [map, heatmapData, metric]);
+    }, [map, url]);
 
     return null;
 }
@@ -2,10 +2,12 @@
  * Map Component - Mapa interactivo con Leaflet
  * Visualiza puntos de señales en Santa Cruz
  */
-import { useEffect, useState, useRef } from 'react';
-import { MapContainer, TileLayer, CircleMarker, Popup, GeoJSON, useMap } from 'react-leaflet';
+import { useEffect, useRef, useState } from 'react';
+import { MapContainer, TileLayer, CircleMarker, Popup, GeoJSON, useMapEvents } from 'react-leaflet';
 import HeatmapLayer from './HeatmapLayer';
 import ClusterLayer from './ClusterLayer';
+import ApiService from '../services/api';
+import { toFeatureCollection } from '../services/topology';
 import 'leaflet/dist/leaflet.css';
 
 // Configuración del mapa centrado en Santa Cruz, Bolivia
@@ -21,70 +23,71 @@ const SIGNAL_COLORS = {
     'default': '#6b7280'
 };
 
-// Componente para ajustar vista del mapa
-function MapBounds({ points }) {
-    const map = useMap();
-    const hasFittedRef = useRef(false);
+// bbox ('min_lng,min_lat,max_lng,max_lat') y zoom del viewport actual
+const viewportOf = (map) => {
+    const b = map.getBounds();
+    return {
+        bbox: [b.getWest(), b.getSouth(), b.getEast(), b.getNorth()].map(v => v.toFixed(5)).join(','),
+        zoom: map.getZoom()
+    };
+};
+
+// Notifica el viewport al montar y al terminar cada desplazamiento/zoom
+function MapViewport({ onChange }) {
+    const map = useMapEvents({
+        moveend: () => onChange(viewportOf(map))
+    });
 
     useEffect(() => {
-        // Solo ajustar vista si hay puntos y no se ha ajustado antes (o si los puntos se reiniciaron)
-        if (points && points.length > 0) {
-            // Si es la primera carga significativa (ej. > 0 puntos), ajustamos
-            // Pero si estamos cargando incrementalmente, no queremos reajustar cada 5 segundos
-
-            // Estrategia: Ajustar solo si no hemos ajustado, o si los puntos cambiaron drásticamente (filtro nuevo)
-            // Como detectamos filtro nuevo? points.length suele bajar a 0 o cambiar mucho.
-            // Pero aquí points crece.
-
-            if (!hasFittedRef.current) {
-                const bounds = points
-                    .map(p => {
-                        const lat = p.latitude || p.lat;
-                        const lng = p.longitude || p.lng;
-                        return (lat && lng) ? [lat, lng] : null;
-                    })
-                    .filter(b => b !== null);
-
-                if (bounds.length > 0) {
-                    map.fitBounds(bounds, { padding: [50, 50], maxZoom: 14 });
-                    hasFittedRef.current = true;
-                }
-            }
-        } else if (points && points.length === 0) {
-            // Resetear flag si los puntos se limpian (cambio de filtro)
-            hasFittedRef.current = false;
-        }
-    }, [points, map]);
+        onChange(viewportOf(map));
+    }, [map]);
+
+    return null;
+}
+
+// Notifica el zoom al montar y al terminar cada cambio de zoom
+function MapZoom({ onChange }) {
+    const map = useMapEvents({
+        zoomend: () => onChange(map.getZoom())
+    });
+
+    useEffect(() => {
+        onChange(map.getZoom());
+    }, [map]);
 
     return null;
 }
 
-export default function MapView({ points = [], selectedFilters, heatmapData = [] }) {
+export default function MapView({ points = [], selectedFilters, onViewportChange }) {
     const [districtsData, setDistrictsData] = useState(null);
     const [provincesData, setProvincesData] = useState(null);
     const [municipiosData, setMunicipiosData] = useState(null);
     const [showHeatmap, setShowHeatmap] = useState(true);
-    const [heatmapMetric, setHeatmapMetric] = useState('signal'); // 'signal' or 'speed'
-
-    // Cargar datos de distritos
-    useEffect(() => {
-        fetch('/santa-cruz-districts.geojson')
-            .then(response => response.json())
-            .then(data => setDistrictsData(data))
-            .catch(error => console.error('Error loading districts:', error));
-
-        // Cargar datos de provincias
-        fetch('/santa-cruz-provinces.geojson')
-            .then(response => response.json())
-            .then(data => setProvincesData(data))
-            .catch(error => console.error('Error loading provinces:', error));
-
-        // Cargar datos de municipios
-        fetch('/santa_cruz_municipios.geojson')
-            .then(response => response.json())
-            .then(data => setMunicipiosData(data))
-            .catch(error => console.error('Error loading municipios:', error));
-    }, []);
+    const [heatmapMetric, setHeatmapMetric] = useState('signal'); // 'signal', 'speed' or 'density'
+
+    const [boundaryZoom, setBoundaryZoom] = useState(null);
+    const boundaryLevel = useRef(null);
+
+    // Cargar distritos/municipios/provincias simplificados para el zoom;
+    // solo se vuelve a pedir al salir del rango de zoom del nivel cargado
+    const loadBoundaries = (zoom) => {
+        const level = boundaryLevel.current;
+        if (level && zoom >= level.min_zoom && (level.max_zoom === null || zoom <= level.max_zoom)) return;
+        boundaryLevel.current = { min_zoom: zoom, max_zoom: zoom };  // evita repetir la petición en curso
+
+        ApiService.getBoundaries(zoom)
+            .then(topology => {
+                boundaryLevel.current = topology.level;
+                setDistrictsData(toFeatureCollection(topology, 'distritos'));
+                setMunicipiosData(toFeatureCollection(topology, 'municipios'));
+                setProvincesData(toFeatureCollection(topology, 'provincias'));
+                setBoundaryZoom(topology.level.zoom);
+            })
+            .catch(error => {
+                boundaryLevel.current = null;
+                console.error('Error loading boundaries:', error);
+            });
+    };
 
     // Función para obtener color basado en intensidad de señal (COLORES MÁS VIBRANTES)
     const getSignalColor = (signal) => {
@@ -110,10 +113,13 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
         ? points.filter(p => p.sim_operator === selectedFilters.selectedOperator)
         : points;
 
-    // Filtrar heatmap por operadora
-    const filteredHeatmap = selectedFilters?.selectedOperator
-        ? heatmapData.filter(h => h.operator === selectedFilters.selectedOperator)
-        : heatmapData;
+    // Filtros del mapa de calor (el backend filtra al renderizar las teselas)
+    const heatmapFilters = {
+        provincia: selectedFilters?.provincias?.[0],
+        municipio: selectedFilters?.municipios?.[0],
+        empresa: selectedFilters?.selectedOperator || selectedFilters?.empresas?.[0],
+        tipo_senal: selectedFilters?.tipos_senal?.[0]
+    };
 
     // Paleta de colores para provincias
     const PROVINCE_COLORS = {
@@ -213,10 +219,10 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
     // Función helper para verificar si un punto está dentro de un polígono
     const isPointInPolygon = (point, geometry) => {
         try {
-            if (!point || !point.latitude || !point.longitude) return false;
-
-            const lat = point.latitude;
-            const lng = point.longitude;
+            // Filas de /signals (latitude/longitude) o puntos de /map/points (lat/lng)
+            const lat = point?.latitude ?? point?.lat;
+            const lng = point?.longitude ?? point?.lng;
+            if (!lat || !lng) return false;
 
             // Manejar tanto Polygon como MultiPolygon
             let coordinates = geometry.coordinates;
@@ -274,7 +280,7 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
     };
 
     // Calcular estadísticas del distrito
-    const calculateDistrictStats = (districtGeometry) => {
+    const calculateDistrictStats = (districtGeometry, bbox) => {
         console.log('🔍 Calculando estadísticas del distrito...');
         console.log('Total de puntos disponibles:', points.length);
 
@@ -302,14 +308,19 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
         }
 
         // Primero usar bounding box para filtro rápido
-        const bounds = getDistrictBounds(districtGeometry);
+        // (bbox precalculado por /api/boundaries si viene en la feature)
+        const bounds = bbox
+            ? { minLng: bbox[0], minLat: bbox[1], maxLng: bbox[2], maxLat: bbox[3] }
+            : getDistrictBounds(districtGeometry);
         console.log('📦 Bounds del distrito:', bounds);
 
         // Filtrar por bounding box primero (mucho más rápido)
-        const pointsInBounds = points.filter(p =>
-            p.latitude >= bounds.minLat && p.latitude <= bounds.maxLat &&
-            p.longitude >= bounds.minLng && p.longitude <= bounds.maxLng
-        );
+        const pointsInBounds = points.filter(p => {
+            const lat = p.latitude ?? p.lat;
+            const lng = p.longitude ?? p.lng;
+            return lat >= bounds.minLat && lat <= bounds.maxLat &&
+                lng >= bounds.minLng && lng <= bounds.maxLng;
+        });
 
         console.log(`📍 Puntos en bounding box: ${pointsInBounds.length} de ${points.length}`);
 
@@ -410,11 +421,11 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
     };
 
     const onEachDistrict = (feature, layer) => {
-        const { distrito, nombreciud, shapeName } = feature.properties;
-        const displayName = shapeName || nombreciud || distrito || 'Distrito Desconocido';
+        const { distrito, nombreciud, shapeName, provincia } = feature.properties;
+        const displayName = shapeName || nombreciud || distrito || provincia || 'Distrito Desconocido';
 
         // Calcular estadísticas del distrito
-        const stats = calculateDistrictStats(feature.geometry);
+        const stats = calculateDistrictStats(feature.geometry, feature.bbox);
 
         console.log(`📊 Estadísticas para ${displayName}:`, stats);
 
@@ -496,7 +507,7 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
     };
 
     const onEachMunicipio = (feature, layer) => {
-        const { municipal_id, intersects_with } = feature.properties;
+        const { municipio, provincia } = feature.properties;
 
         layer.bindPopup(`
             <div style="font-family: sans-serif;">
@@ -504,10 +515,10 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
                     Municipio
                 </h3>
                 <p style="margin: 4px 0; color: #333; font-size: 12px;">
-                    <strong>ID:</strong> ${municipal_id}
+                    <strong>Nombre:</strong> ${municipio}
                 </p>
                 <p style="margin: 4px 0; color: #333; font-size: 12px;">
-                    <strong>Provincia:</strong> ${intersects_with}
+                    <strong>Provincia:</strong> ${provincia}
                 </p>
             </div>
         `);
@@ -535,7 +546,7 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
                 {/* Capa de distritos/provincias/zonas */}
                 {shouldShowLayer && selectedFilters?.layer === 'distritos' && districtsData && (
                     <GeoJSON
-                        key="districts"
+                        key={`districts-${boundaryZoom}`}
                         data={districtsData}
                         style={getGeoStyle}
                         onEachFeature={onEachDistrict}
@@ -544,7 +555,7 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
 
                 {shouldShowLayer && selectedFilters?.layer === 'provincias' && provincesData && (
                     <GeoJSON
-                        key="provinces"
+                        key={`provinces-${boundaryZoom}`}
                         data={provincesData}
                         style={getGeoStyle}
                         onEachFeature={onEachDistrict}
@@ -553,7 +564,7 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
 
                 {shouldShowLayer && selectedFilters?.layer === 'municipios' && municipiosData && (
                     <GeoJSON
-                        key="municipios"
+                        key={`municipios-${boundaryZoom}`}
                         data={municipiosData}
                         style={getGeoStyle}
                         onEachFeature={onEachMunicipio}
@@ -562,7 +573,7 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
 
                 {shouldShowLayer && selectedFilters?.layer === 'zonas' && districtsData && (
                     <GeoJSON
-                        key="zones"
+                        key={`zones-${boundaryZoom}`}
                         data={districtsData}
                         style={getGeoStyle}
                         onEachFeature={onEachDistrict}
@@ -570,14 +581,15 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
                 )}
 
                 {/* Mapa de calor de señal/velocidad */}
-                {showHeatmap && filteredHeatmap.length > 0 && (
+                {showHeatmap && (
                     <HeatmapLayer
-                        heatmapData={filteredHeatmap}
+                        filters={heatmapFilters}
                         metric={heatmapMetric}
                     />
                 )}
 
-                {filteredPoints.length > 0 && <MapBounds points={filteredPoints} />}
+                {onViewportChange && <MapViewport onChange={onViewportChange} />}
+                <MapZoom onChange={loadBoundaries} />
 
                 {/* Capa de Clusters para puntos (Optimizado para 300k+) */}
                 {filteredPoints.length > 0 && (
@@ -671,7 +683,7 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
                                 />
                                 <span>Señal</span>
                             </label>
-                            <label style={{ display: 'flex', alignItems: 'center', gap: '8px', cursor: 'pointer' }}>
+                            <label style={{ display: 'flex', alignItems: 'center', gap: '8px', marginBottom: '4px', cursor: 'pointer' }}>
                                 <input
                                     type="radio"
                                     name="heatmap-metric"
@@ -680,6 +692,15 @@ export default function MapView({ points = [], selectedFilters, heatmapData = []
                                 />
                                 <span>Velocidad</span>
                             </label>
+                            <label style={{ display: 'flex', alignItems: 'center', gap: '8px', cursor: 'pointer' }}>
+                                <input
+                                    type="radio"
+                                    name="heatmap-metric"
+                                    checked={heatmapMetric === 'density'}
+                                    onChange={() => setHeatmapMetric('density')}
+                                />
+                                <span>Densidad</span>
+                            </label>
                         </div>
                     )}
                 </div>
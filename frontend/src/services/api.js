@@ -15,14 +15,15 @@ class ApiService {
                 'Content-Type': 'application/json'
             }
         });
+        this.aggregateCache = new Map(); // filtros -> { etag, data }
     }
 
-    // Obtener todas las señales
-    async getSignals(filters = {}, offset = 0, limit = 25000) {
+    // Obtener una página de señales (cursor = next_cursor de la página anterior)
+    async getSignals(filters = {}, cursor = null, limit = 25000) {
         try {
             const params = new URLSearchParams();
-            params.append('offset', offset);
             params.append('limit', limit);
+            if (cursor) params.append('cursor', cursor);
 
             Object.entries(filters).forEach(([key, value]) => {
                 if (value) params.append(key, value);
@@ -36,10 +37,34 @@ class ApiService {
         }
     }
 
-    // Obtener datos agregados
+    // Carga masiva por páginas. onPage(page, nextCursor) recibe cada página;
+    // guardando nextCursor se puede reanudar tras una desconexión (opts.cursor)
+    async loadSignals(filters = {}, { cursor = null, limit = 25000, onPage } = {}) {
+        let next = cursor;
+        do {
+            const page = await this.getSignals(filters, next, limit);
+            next = page.next_cursor;
+            if (onPage) onPage(page, next);
+        } while (next);
+    }
+
+    // Obtener datos agregados (revalida con ETag: 304 si no cambiaron)
     async getAggregatedData(filters = {}) {
         try {
-            const response = await this.client.post('/analytics/aggregate', filters);
+            // El navegador no cachea POST: guardamos la última respuesta por filtro
+            const key = JSON.stringify(filters);
+            const cached = this.aggregateCache.get(key);
+            const response = await this.client.post('/analytics/aggregate', filters, {
+                headers: cached ? { 'If-None-Match': cached.etag } : {},
+                validateStatus: status => (status >= 200 && status < 300) || status === 304
+            });
+            if (response.status === 304 && cached) {
+                return cached.data;
+            }
+            const etag = response.headers['etag'];
+            if (etag) {
+                this.aggregateCache.set(key, { etag, data: response.data });
+            }
             return response.data;
         } catch (error) {
             console.error('Error fetching aggregated data:', error);
@@ -47,12 +72,59 @@ class ApiService {
         }
     }
 
-    // Obtener puntos para el mapa
+    // Dashboard completo en una petición (NDJSON): onSection(name, data) recibe
+    // cada sección (facets, stats, points, timeseries) en cuanto llega
+    async streamDashboard(filters = {}, onSection, { interval = 'hour', pointsLimit = 60000, signal } = {}) {
+        const params = new URLSearchParams({ interval, points_limit: pointsLimit });
+        const response = await fetch(`${API_BASE_URL}/dashboard?${params.toString()}`, {
+            method: 'POST',
+            headers: { 'Content-Type': 'application/json' },
+            body: JSON.stringify(filters),
+            signal
+        });
+        if (!response.ok) {
+            throw new Error(`Dashboard request failed: ${response.status}`);
+        }
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        for (;;) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+            let newline;
+            while ((newline = buffer.indexOf('\n')) >= 0) {
+                const line = buffer.slice(0, newline);
+                buffer = buffer.slice(newline + 1);
+                if (!line) continue;
+                const section = JSON.parse(line);
+                if (section.section === 'error') {
+                    throw new Error(section.error);
+                }
+                onSection(section.section, section.data);
+            }
+        }
+    }
+
+    // URL de teselas del mapa de calor renderizado en el servidor (plantilla {z}/{x}/{y})
+    getHeatmapTileUrl(filters = {}, metric = 'signal') {
+        const params = new URLSearchParams({ metric });
+        ['provincia', 'municipio', 'empresa', 'tipo_senal'].forEach(key => {
+            if (filters[key]) params.append(key, filters[key]);
+        });
+        return `${API_BASE_URL}/map/heatmap/{z}/{x}/{y}.png?${params.toString()}`;
+    }
+
+    // Obtener puntos del viewport (bbox + zoom) para el mapa
     async getMapPoints(filters = {}) {
         try {
             const params = new URLSearchParams();
-            if (filters.provincia) params.append('provincia', filters.provincia);
-            if (filters.municipio) params.append('municipio', filters.municipio);
+            ['provincia', 'municipio', 'empresa', 'tipo_senal', 'bbox', 'zoom', 'limit'].forEach(key => {
+                if (filters[key] !== undefined && filters[key] !== null && filters[key] !== '') {
+                    params.append(key, filters[key]);
+                }
+            });
 
             const response = await this.client.get(`/map/points?${params.toString()}`);
             return response.data;
@@ -76,6 +148,17 @@ class ApiService {
         }
     }
 
+    // Límites (TopoJSON) simplificados para el zoom; level.min_zoom/max_zoom dicen hasta dónde sirven
+    async getBoundaries(zoom) {
+        try {
+            const response = await this.client.get(`/boundaries?zoom=${Math.round(zoom)}`);
+            return response.data;
+        } catch (error) {
+            console.error('Error fetching boundaries:', error);
+            throw error;
+        }
+    }
+
     // Obtener opciones de filtros
     async getFilterOptions() {
         try {
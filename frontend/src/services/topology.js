@@ -0,0 +1,45 @@
+/**
+ * TopoJSON -> GeoJSON (lo que sirve GET /api/boundaries)
+ * Arcos cuantizados y codificados por deltas; ~i = arco i recorrido al revés.
+ */
+
+const decodeArcs = (topology) => {
+    const [sx, sy] = topology.transform.scale;
+    const [tx, ty] = topology.transform.translate;
+    return topology.arcs.map(arc => {
+        let x = 0;
+        let y = 0;
+        return arc.map(([dx, dy]) => {
+            x += dx;
+            y += dy;
+            return [x * sx + tx, y * sy + ty];
+        });
+    });
+};
+
+const ringOf = (arcs, refs) => {
+    const ring = [];
+    refs.forEach(ref => {
+        const points = ref >= 0 ? arcs[ref] : arcs[~ref].slice().reverse();
+        ring.push(...(ring.length ? points.slice(1) : points));
+    });
+    return ring;
+};
+
+// FeatureCollection de un objeto de la topología (p. ej. 'distritos')
+export function toFeatureCollection(topology, name) {
+    const arcs = decodeArcs(topology);
+    const geometries = topology.objects[name]?.geometries || [];
+    return {
+        type: 'FeatureCollection',
+        features: geometries.map(geometry => ({
+            type: 'Feature',
+            bbox: geometry.bbox,
+            properties: geometry.properties,
+            geometry: {
+                type: 'MultiPolygon',
+                coordinates: geometry.arcs.map(polygon => polygon.map(refs => ringOf(arcs, refs)))
+            }
+        }))
+    };
+}
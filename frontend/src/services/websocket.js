@@ -40,6 +40,17 @@ class WebSocketService {
                         case 'new_signal':
                             this.notifyListeners('new_signal', data.data);
                             break;
+                        case 'new_signals':
+                            // Delta de ingesta: lote de puntos nuevos
+                            this.notifyListeners('new_signals', data.data);
+                            break;
+                        case 'rejected_signals':
+                            // Puntos ya publicados que la base de datos rechazó
+                            this.notifyListeners('rejected_signals', data.data);
+                            break;
+                        case 'live_stats':
+                            this.notifyListeners('live_stats', data.data);
+                            break;
                         case 'ping':
                             // Heartbeat - responder con pong
                             this.send({ action: 'pong' });
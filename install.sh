@@ -31,6 +31,10 @@ if [ ! -f ".env" ]; then
     echo "⚠️  Recuerda configurar las credenciales en backend/.env"
 fi
 
+# Límites del mapa simplificados por nivel de zoom (GET /api/boundaries)
+echo "Construyendo límites del mapa..."
+python build_boundaries.py
+
 echo "✓ Backend instalado correctamente"
 
 # Frontend